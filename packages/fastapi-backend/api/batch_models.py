@@ -0,0 +1,25 @@
+from pydantic import Field
+from typing import List, Optional, Dict, Any, Literal
+
+from .models import StockValuationRequest
+
+# --- Batch Valuation Models ---
+
+# 批量估值不使用的单只股票请求字段 (敏感性分析、LLM 分析) 以及批量任务自身的控制字段
+_NON_ASSUMPTION_FIELDS = {
+    'ts_code', 'sensitivity_analysis', 'request_llm_summary',
+    'llm_provider', 'llm_model_id', 'llm_api_base_url', 'llm_temperature', 'llm_top_p', 'llm_max_tokens',
+    'ts_codes', 'chunk_size', 'max_workers', 'output_format',
+}
+
+class BatchValuationRequest(StockValuationRequest):
+    """批量估值请求：所有股票共用同一组 DCF 假设；不执行敏感性分析和 LLM 分析。"""
+    ts_code: Optional[str] = Field(None, alias='stock_code', description="批量估值不使用此字段，股票列表见 ts_codes")
+    ts_codes: Optional[List[str]] = Field(None, min_length=1, description="股票代码列表，留空则估值 stock_basic.feather 中的全部股票")
+    chunk_size: int = Field(200, ge=1, le=5000, description="每块的股票数 (每块一次批量查询、一个进程池任务)")
+    max_workers: Optional[int] = Field(None, ge=1, le=256, description="工作进程数，留空则使用 BATCH_VALUATION_WORKERS")
+    output_format: Literal["parquet", "feather"] = Field("parquet", description="结果文件格式")
+
+    def assumptions_dict(self) -> Dict[str, Any]:
+        """返回传给 ValuationService.run_single_valuation 的估值假设 (不含股票代码和批量控制字段)。"""
+        return self.model_dump(exclude=_NON_ASSUMPTION_FIELDS)
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field, ConfigDict, field_validator
-from typing import Dict, Any, Optional, List, Union
+from typing import Dict, Any, Optional, List, Union, Literal
 from decimal import Decimal # Ensure Decimal is imported
 import math
 from .sensitivity_models import SensitivityAnalysisRequest, SensitivityAnalysisResult # Import new models
@@ -167,6 +167,13 @@ class StockValuationResponse(BaseModel):
 
 # --- Stock Screener API Models ---
 
+class ApiScreenerFilterModel(BaseModel):
+    """针对快照中任意列的通用筛选条件：min/max 为闭区间 (仅数值列)，values 为 IN 条件；同时给出时需同时满足。"""
+    column: str = Field(..., description="列名 (例如 'dv_ttm'、'turnover_rate'、'area')")
+    min: Optional[float] = Field(None, description="最小值 (含)")
+    max: Optional[float] = Field(None, description="最大值 (含)")
+    values: Optional[List[Union[float, str]]] = Field(None, min_length=1, description="取值列表 (IN)")
+
 class ApiStockScreenerRequestModel(BaseModel):
     # 基础财务指标
     pe_min: Optional[float] = Field(None, description="最小市盈率 (PE)")
@@ -188,10 +195,38 @@ class ApiStockScreenerRequestModel(BaseModel):
     industry: Optional[str] = Field(None, description="行业筛选")
     act_ent_type: Optional[str] = Field(None, description="实际控制人企业性质")
 
+    # DCF 内在价值指标 (来自最新一次全市场批量估值，未估值或估值失败的股票不满足这些条件)
+    dcf_value_per_share_min: Optional[float] = Field(None, description="最小 DCF 每股价值")
+    dcf_value_per_share_max: Optional[float] = Field(None, description="最大 DCF 每股价值")
+    dcf_upside_min: Optional[float] = Field(None, description="最小 DCF 上涨空间 (每股价值 / 收盘价 - 1，小数)")
+    dcf_upside_max: Optional[float] = Field(None, description="最大 DCF 上涨空间 (小数)")
+    dcf_implied_pe_min: Optional[float] = Field(None, description="最小 DCF 隐含市盈率")
+    dcf_implied_pe_max: Optional[float] = Field(None, description="最大 DCF 隐含市盈率")
+    dcf_tv_to_ev_min: Optional[float] = Field(None, description="最小终值现值占企业价值比例 (小数)")
+    dcf_tv_to_ev_max: Optional[float] = Field(None, description="最大终值现值占企业价值比例 (小数)")
+
+    # 通用筛选条件 (任意列的区间/IN 条件，与上面的固定字段一起按 AND 合并)
+    filters: Optional[List[ApiScreenerFilterModel]] = Field(None, description="通用筛选条件列表")
+
+    # 分面计数 (分类列，例如 ['industry', 'act_ent_type'])：每列的计数应用除该列以外的全部筛选条件
+    facets: Optional[List[str]] = Field(None, description="需要返回分面计数的分类列")
+
+    # 排序参数 (数值列；NaN 始终排在最后，留空则按快照顺序)
+    sort_by: Optional[str] = Field(None, description="排序列名 (例如 'pe_ttm'、'total_market_cap'、'dcf_upside')")
+    sort_order: Literal['asc', 'desc'] = Field('asc', description="排序方向")
+
+    # 响应格式：json (默认) 或 arrow (Arrow IPC 流，分页和统计字段在 schema metadata 中)
+    response_format: Literal['json', 'arrow'] = Field('json', description="响应格式")
+
     # 分页参数
     page: Optional[int] = Field(1, ge=1, description="当前页码")
     page_size: Optional[int] = Field(20, ge=1, le=100, description="每页记录数")
 
+class ApiStockScreenerExportRequestModel(ApiStockScreenerRequestModel):
+    """导出全部筛选结果 (筛选和排序条件同 /screener/stocks；忽略分页和 response_format)。"""
+    format: Literal['csv', 'ndjson', 'arrow'] = Field('csv', description="导出格式")
+    chunk_size: int = Field(1000, ge=1, le=20000, description="每次编码并发送的候选行数")
+
 class ApiScreenedStockModel(BaseModel):
     ts_code: str
     name: Optional[str] = None
@@ -215,6 +250,22 @@ class ApiScreenedStockModel(BaseModel):
     float_share: Optional[float] = None
     free_share: Optional[float] = None
     circ_mv: Optional[float] = None
+    # DCF 内在价值指标 (最新一次全市场批量估值)
+    dcf_value_per_share: Optional[float] = None
+    dcf_upside: Optional[float] = None
+    dcf_implied_pe: Optional[float] = None
+    dcf_tv_to_ev: Optional[float] = None
+    dcf_wacc: Optional[float] = None
+    dcf_base_report_date: Optional[str] = None
+    # 历史财务比率 (报表库全市场截面计算，报表库未构建时为空)
+    hist_revenue_cagr: Optional[float] = None
+    hist_operating_margin: Optional[float] = None
+    hist_cogs_to_revenue: Optional[float] = None
+    hist_capex_to_revenue: Optional[float] = None
+    hist_nwc_to_revenue: Optional[float] = None
+    hist_receivable_days: Optional[float] = None
+    hist_inventory_days: Optional[float] = None
+    hist_effective_tax_rate: Optional[float] = None
 
     # 配置模型
     model_config = ConfigDict(
@@ -239,6 +290,8 @@ class ApiStockScreenerResponseModel(BaseModel):
     page: Optional[int] = None
     page_size: Optional[int] = None
     last_data_update_time: Optional[str] = None
+    last_dcf_update_time: Optional[str] = Field(None, description="DCF 列所用批量估值结果的生成时间")
+    facets: Optional[Dict[str, Dict[str, int]]] = Field(None, description="分面计数: 列名 -> {类别: 股票数}")
 
 class ApiUpdateScreenerDataRequestModel(BaseModel):
     data_type: str = Field(..., description="'basic', 'daily', or 'all'") # Literal['basic', 'daily', 'all'] would be better if using newer Pydantic/Python
@@ -0,0 +1,113 @@
+from pydantic import BaseModel, Field, field_validator, model_validator
+from typing import List, Optional, Dict, Literal
+
+from .models import StockValuationRequest, StockBasicInfoModel
+from .sensitivity_models import MetricType, OPERATING_DRIVER_PARAMETERS
+
+# --- Monte Carlo Parameters ---
+
+# WACC 输入 (按 WaccCalculator 的口径逐路径重新计算 WACC)；'wacc' 表示直接对 WACC 抽样
+MONTE_CARLO_WACC_PARAMETERS = (
+    MetricType.WACC.value,
+    "beta",
+    "risk_free_rate",
+    "market_risk_premium",
+    "size_premium",
+    "cost_of_debt",
+    "target_debt_ratio",
+)
+
+# 终值参数 (只有与基础估值终值方法一致的参数生效)
+MONTE_CARLO_TERMINAL_PARAMETERS = (
+    MetricType.TERMINAL_EBITDA_MULTIPLE.value,
+    MetricType.TERMINAL_GROWTH_RATE.value,
+)
+
+SUPPORTED_MONTE_CARLO_PARAMETERS = MONTE_CARLO_WACC_PARAMETERS + MONTE_CARLO_TERMINAL_PARAMETERS + OPERATING_DRIVER_PARAMETERS
+
+# --- Monte Carlo Models ---
+
+class DistributionSpec(BaseModel):
+    """单个参数的概率分布定义"""
+    distribution: Literal["normal", "lognormal", "uniform", "triangular"] = Field("normal", description="分布类型")
+    mean: Optional[float] = Field(None, description="均值 (normal/lognormal)，留空则使用基础估值的参数值")
+    std: Optional[float] = Field(None, ge=0, description="标准差 (normal/lognormal)")
+    low: Optional[float] = Field(None, description="下限 (uniform/triangular)")
+    high: Optional[float] = Field(None, description="上限 (uniform/triangular)")
+    mode: Optional[float] = Field(None, description="众数 (triangular)，留空则使用基础估值的参数值")
+    min_value: Optional[float] = Field(None, description="样本截断下限 (可选)")
+    max_value: Optional[float] = Field(None, description="样本截断上限 (可选)")
+
+    @model_validator(mode="after")
+    def check_distribution_parameters(self):
+        if self.distribution in ("normal", "lognormal") and self.std is None:
+            raise ValueError(f"{self.distribution} 分布需要提供 std")
+        if self.distribution in ("uniform", "triangular"):
+            if self.low is None or self.high is None:
+                raise ValueError(f"{self.distribution} 分布需要提供 low 和 high")
+            if self.low > self.high:
+                raise ValueError("low 不能大于 high")
+        if self.min_value is not None and self.max_value is not None and self.min_value > self.max_value:
+            raise ValueError("min_value 不能大于 max_value")
+        return self
+
+class MonteCarloConfig(BaseModel):
+    """蒙特卡洛模拟配置"""
+    num_simulations: int = Field(10000, ge=1, le=200000, description="模拟路径数")
+    seed: Optional[int] = Field(None, ge=0, description="随机种子 (相同种子和配置得到相同结果)，留空则随机生成并在结果中返回")
+    chunk_size: int = Field(20000, ge=100, le=100000, description="每批计算的路径数 (控制内存占用，不影响结果)")
+    histogram_bins: int = Field(50, ge=1, le=500, description="直方图分箱数")
+    percentiles: List[float] = Field(default_factory=lambda: [5.0, 10.0, 25.0, 50.0, 75.0, 90.0, 95.0], description="需要计算的百分位数 (0-100)")
+    distributions: Dict[str, DistributionSpec] = Field(..., min_length=1, description="参数名 -> 分布定义，参数名见 SUPPORTED_MONTE_CARLO_PARAMETERS")
+
+    @field_validator("percentiles")
+    @classmethod
+    def check_percentiles(cls, v):
+        if any(p < 0 or p > 100 for p in v):
+            raise ValueError("百分位数必须在 0 到 100 之间")
+        return v
+
+    @field_validator("distributions")
+    @classmethod
+    def check_parameter_names(cls, v):
+        unsupported = sorted(set(v) - set(SUPPORTED_MONTE_CARLO_PARAMETERS))
+        if unsupported:
+            raise ValueError(f"不支持的模拟参数: {unsupported}，支持的参数: {list(SUPPORTED_MONTE_CARLO_PARAMETERS)}")
+        return v
+
+class MonteCarloValuationRequest(StockValuationRequest):
+    """蒙特卡洛估值请求：基础估值假设 + 模拟配置"""
+    monte_carlo: MonteCarloConfig = Field(..., description="蒙特卡洛模拟配置")
+
+class HistogramModel(BaseModel):
+    """直方图 (len(bin_edges) == len(counts) + 1)"""
+    bin_edges: List[float]
+    counts: List[int]
+
+class MonteCarloDistributionSummary(BaseModel):
+    """单个输出指标在所有有效路径上的分布统计"""
+    mean: float
+    std: float
+    min: float
+    max: float
+    percentiles: Dict[str, float] = Field(..., description="百分位数，键如 'p5'、'p50'")
+    histogram: HistogramModel
+
+class MonteCarloResult(BaseModel):
+    """蒙特卡洛模拟结果"""
+    num_simulations: int = Field(..., description="模拟路径数")
+    num_valid_paths: int = Field(..., description="得到有效每股价值的路径数")
+    seed: int = Field(..., description="实际使用的随机种子")
+    sampled_parameters: List[str] = Field(..., description="参与抽样的参数")
+    terminal_value_method: str = Field(..., description="终值计算方法")
+    latest_price: Optional[float] = Field(None, description="最新股价")
+    base_value_per_share: Optional[float] = Field(None, description="基础估值的每股价值")
+    probability_of_upside: Optional[float] = Field(None, description="每股价值高于最新股价的路径占比 (基于有效路径)")
+    statistics: Dict[str, MonteCarloDistributionSummary] = Field(..., description="输出指标 ('value_per_share', 'enterprise_value') 的分布统计")
+
+class MonteCarloValuationResponse(BaseModel):
+    """蒙特卡洛估值端点的响应模型"""
+    stock_info: StockBasicInfoModel = Field(..., description="股票基本信息")
+    monte_carlo_result: Optional[MonteCarloResult] = Field(None, description="蒙特卡洛模拟结果")
+    data_warnings: Optional[List[str]] = Field(None, description="数据处理和模拟过程中产生的警告信息列表")
+    error: Optional[str] = Field(default=None, description="高级别错误信息")
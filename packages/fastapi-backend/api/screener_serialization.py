@@ -0,0 +1,196 @@
+import io
+import json
+import typing
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from fastapi import Response
+
+from api.models import ApiScreenedStockModel
+
+try:
+    import orjson  # 可选依赖：更快的 JSON 编码
+except ImportError:  # pragma: no cover - 未安装时使用标准库 json
+    orjson = None
+
+# --- 筛选结果的批量序列化 ---
+# 筛选结果按列整体转换：非有限浮点数 (NaN/inf) 用向量化掩码替换为 None，列名按 ApiScreenedStockModel 的别名输出
+# (与 response_model 的默认 by_alias 输出一致)，然后直接编码为 JSON (安装了 orjson 时使用 orjson)，
+# 不再逐行构建 Pydantic 模型。也可以选择 Arrow IPC 流格式。
+
+ARROW_STREAM_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+# 导出格式 -> (媒体类型, 文件扩展名)
+EXPORT_FORMATS = {
+    'csv': ("text/csv; charset=utf-8", "csv"),
+    'ndjson': ("application/x-ndjson", "ndjson"),
+    'arrow': (ARROW_STREAM_MEDIA_TYPE, "arrow"),
+}
+
+
+def _screened_stock_fields() -> List[Tuple[str, bool]]:
+    """ApiScreenedStockModel 的输出列 (别名优先) 及其是否为浮点字段，按模型字段顺序。"""
+    fields = []
+    for name, field in ApiScreenedStockModel.model_fields.items():
+        is_float = float in typing.get_args(field.annotation) or field.annotation is float
+        fields.append((field.alias or name, is_float))
+    return fields
+
+
+SCREENED_STOCK_FIELDS = _screened_stock_fields()
+
+
+def _float_values(series: pd.Series) -> Tuple[np.ndarray, np.ndarray]:
+    """返回 float64 值和有限值掩码 (NaN/inf 视为缺失)。"""
+    values = pd.to_numeric(series, errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+    return values, np.isfinite(values)
+
+
+def _float_column(series: pd.Series) -> List[Optional[float]]:
+    values, finite = _float_values(series)
+    result = values.astype(object)
+    result[~finite] = None
+    return result.tolist()
+
+
+def _text_values(series: pd.Series) -> np.ndarray:
+    """返回 object 数组：缺失值为 None，其余转换为 str。"""
+    values = series.to_numpy(dtype=object)
+    missing = pd.isna(values)
+    result = np.empty(len(values), dtype=object)
+    result[missing] = None
+    present = ~missing
+    result[present] = [value if isinstance(value, str) else str(value) for value in values[present]]
+    return result
+
+
+def _text_column(series: pd.Series) -> List[Optional[str]]:
+    return _text_values(series).tolist()
+
+
+def screened_stock_columns(df: pd.DataFrame) -> Dict[str, List]:
+    """
+    按 ApiScreenedStockModel 的输出列从筛选结果中逐列提取值 (缺失列全部为 None，NaN/inf 为 None)。
+    Args:
+        df (pd.DataFrame): 当前页的筛选结果。
+    Returns:
+        Dict[str, List]: 输出列名 -> 值列表。
+    """
+    row_count = len(df)
+    columns = {}
+    for column, is_float in SCREENED_STOCK_FIELDS:
+        if column not in df.columns:
+            columns[column] = [None] * row_count
+        elif is_float:
+            columns[column] = _float_column(df[column])
+        else:
+            columns[column] = _text_column(df[column])
+    return columns
+
+
+def screened_stock_records(df: pd.DataFrame) -> List[Dict[str, Any]]:
+    """把筛选结果转换为响应中的记录列表 (与 ApiScreenedStockModel 的 JSON 输出一致)。"""
+    columns = screened_stock_columns(df)
+    names = list(columns)
+    return [dict(zip(names, row)) for row in zip(*columns.values())]
+
+
+def dumps(payload: Any) -> bytes:
+    """编码 JSON (优先使用 orjson)。"""
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, ensure_ascii=False, allow_nan=False, separators=(',', ':')).encode('utf-8')
+
+
+def screener_json_response(df: pd.DataFrame, **fields: Any) -> Response:
+    """
+    构建筛选 JSON 响应：results 为 df 各行的记录，其余字段 (total、page 等) 原样输出。
+    """
+    payload = {'results': screened_stock_records(df), **fields}
+    return Response(content=dumps(payload), media_type="application/json")
+
+
+def screened_stock_arrow_table(df: pd.DataFrame, metadata: Optional[Dict[str, Any]] = None) -> pa.Table:
+    """
+    构建筛选结果的 Arrow 表 (列与 JSON 输出相同，直接由 NumPy 数组构建)；元数据的值按 JSON 编码存入 schema metadata。
+    """
+    arrays = {}
+    for column, is_float in SCREENED_STOCK_FIELDS:
+        if column not in df.columns:
+            arrays[column] = pa.nulls(len(df), type=pa.float64() if is_float else pa.string())
+        elif is_float:
+            values, finite = _float_values(df[column])
+            arrays[column] = pa.array(values, mask=~finite, type=pa.float64())
+        else:
+            arrays[column] = pa.array(_text_values(df[column]), type=pa.string())
+    table = pa.table(arrays)
+    if metadata:
+        table = table.replace_schema_metadata({key: dumps(value) for key, value in metadata.items()})
+    return table
+
+
+def screener_arrow_response(df: pd.DataFrame, **fields: Any) -> Response:
+    """
+    构建 Arrow IPC 流格式的筛选响应；total、page 等字段写入 schema metadata，total 同时放在 X-Total-Count 头中。
+    """
+    table = screened_stock_arrow_table(df, metadata=fields)
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    headers = {'X-Total-Count': str(fields['total'])} if 'total' in fields else None
+    return Response(content=sink.getvalue(), media_type=ARROW_STREAM_MEDIA_TYPE, headers=headers)
+
+
+# --- 流式导出 ---
+# 以下生成器按块把快照中的命中行编码为 CSV / NDJSON / Arrow IPC 流，每块编码完成后立即产出字节，
+# 供 StreamingResponse 分块发送；内存占用只与块大小有关。
+
+def iter_csv(df: pd.DataFrame, position_chunks: Iterable[np.ndarray]) -> Iterator[bytes]:
+    """CSV 导出 (UTF-8 带 BOM，便于 Excel 正确识别中文；缺失值为空)。"""
+    header = pd.DataFrame(columns=[column for column, _ in SCREENED_STOCK_FIELDS])
+    yield header.to_csv(index=False).encode('utf-8-sig')
+    for positions in position_chunks:
+        chunk = pd.DataFrame(screened_stock_columns(df.iloc[positions]))
+        yield chunk.to_csv(index=False, header=False).encode('utf-8')
+
+
+def iter_ndjson(df: pd.DataFrame, position_chunks: Iterable[np.ndarray]) -> Iterator[bytes]:
+    """NDJSON 导出：每行一条记录，字段与 /screener/stocks 的 results 相同。"""
+    for positions in position_chunks:
+        records = screened_stock_records(df.iloc[positions])
+        yield b"".join(dumps(record) + b"\n" for record in records)
+
+
+def iter_arrow(df: pd.DataFrame, position_chunks: Iterable[np.ndarray], metadata: Optional[Dict[str, Any]] = None) -> Iterator[bytes]:
+    """Arrow IPC 流导出：每块一个 record batch (schema 与分页接口的 Arrow 响应相同)。"""
+    sink = io.BytesIO()
+    schema = screened_stock_arrow_table(df.iloc[0:0], metadata=metadata).schema
+    writer = pa.ipc.new_stream(sink, schema)
+    for positions in position_chunks:
+        for batch in screened_stock_arrow_table(df.iloc[positions]).to_batches():
+            writer.write_batch(batch)
+        yield sink.getvalue()
+        sink.seek(0)
+        sink.truncate()
+    writer.close()
+    yield sink.getvalue()
+
+
+def iter_export(export_format: str, df: pd.DataFrame, position_chunks: Iterable[np.ndarray],
+                metadata: Optional[Dict[str, Any]] = None) -> Iterator[bytes]:
+    """
+    按导出格式返回字节块生成器。
+    Args:
+        export_format (str): 'csv'、'ndjson' 或 'arrow'。
+        df (pd.DataFrame): 快照数据。
+        position_chunks (Iterable[np.ndarray]): 分块的命中行位置。
+        metadata (Dict): 写入 Arrow schema metadata 的字段 (仅 arrow)。
+    """
+    if export_format == 'csv':
+        return iter_csv(df, position_chunks)
+    if export_format == 'ndjson':
+        return iter_ndjson(df, position_chunks)
+    if export_format == 'arrow':
+        return iter_arrow(df, position_chunks, metadata=metadata)
+    raise ValueError(f"不支持的导出格式: {export_format}")
@@ -11,6 +11,15 @@ class MetricType(Enum):
     TERMINAL_GROWTH_RATE = "perpetual_growth_rate"
     TERMINAL_EBITDA_MULTIPLE = "exit_multiple" # Renamed from EXIT_MULTIPLE, value is "exit_multiple"
 
+    # Operating driver parameters for Sensitivity Axes (value matches the StockValuationRequest field name)
+    CAGR_DECAY_RATE = "cagr_decay_rate"
+    TARGET_OPERATING_MARGIN = "target_operating_margin"
+    TARGET_CAPEX_RATIO = "target_capex_to_revenue_ratio"
+    TARGET_AR_DAYS = "target_accounts_receivable_days"
+    TARGET_INVENTORY_DAYS = "target_inventory_days"
+    TARGET_AP_DAYS = "target_accounts_payable_days"
+    TARGET_TAX_RATE = "target_effective_tax_rate"
+
     # Output Metrics (keys for result_tables and for identifying parameters in DcfForecastDetails)
     VALUE_PER_SHARE = "value_per_share" # Matches DcfForecastDetails.value_per_share
     ENTERPRISE_VALUE = "enterprise_value"
@@ -26,6 +35,17 @@ class MetricType(Enum):
     EV_EBITDA_TERMINAL = "ev_ebitda_terminal" # This is also from DcfForecastDetails, often used as base for exit_multiple axis
 
 
+# 经营驱动因素轴: 变化这些参数需要重新进行财务预测 (由批量预测器一次性完成)
+OPERATING_DRIVER_PARAMETERS = (
+    MetricType.CAGR_DECAY_RATE.value,
+    MetricType.TARGET_OPERATING_MARGIN.value,
+    MetricType.TARGET_CAPEX_RATIO.value,
+    MetricType.TARGET_AR_DAYS.value,
+    MetricType.TARGET_INVENTORY_DAYS.value,
+    MetricType.TARGET_AP_DAYS.value,
+    MetricType.TARGET_TAX_RATE.value,
+)
+
 # --- Sensitivity Analysis Models ---
 
 SUPPORTED_SENSITIVITY_OUTPUT_METRICS = Literal[
@@ -39,7 +59,7 @@ SUPPORTED_SENSITIVITY_OUTPUT_METRICS = Literal[
 
 class SensitivityAxisInput(BaseModel): # 重命名以区分，并对应计划
     """定义敏感性分析的一个轴的输入配置"""
-    parameter_name: str = Field(..., description="要变化的参数名 (例如 'wacc', 'exit_multiple', 'perpetual_growth_rate')")
+    parameter_name: str = Field(..., description="要变化的参数名 (例如 'wacc', 'exit_multiple', 'perpetual_growth_rate'，或经营驱动因素如 'target_operating_margin', 'cagr_decay_rate')")
     values: List[float] = Field(..., description="该参数要测试的值列表 (对于非WACC轴，或WACC轴的初始列表)")
     step: Optional[float] = Field(None, description="该轴的步长 (主要用于WACC轴的后端重新生成)")
     points: Optional[int] = Field(None, description="该轴的点数 (主要用于WACC轴的后端重新生成)")
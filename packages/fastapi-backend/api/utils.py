@@ -14,7 +14,7 @@ except ImportError:
 # Attempt to import models for type hinting
 try:
     from api.models import DcfForecastDetails # For type hinting
-    from api.sensitivity_models import SensitivityAxisInput, MetricType # For type hinting
+    from api.sensitivity_models import SensitivityAxisInput, MetricType, OPERATING_DRIVER_PARAMETERS # For type hinting
 except ImportError:
     class DcfForecastDetails: pass # type: ignore
     class SensitivityAxisInput: pass # type: ignore
@@ -23,6 +23,7 @@ except ImportError:
         TERMINAL_GROWTH_RATE = "perpetual_growth_rate"
         TERMINAL_EBITDA_MULTIPLE = "exit_multiple"
         # Add other metric types if needed for fallback logic
+    OPERATING_DRIVER_PARAMETERS = () # type: ignore
 
 logger = logging.getLogger(__name__) # This logger will be for utils.py
 # The regenerate_axis_if_needed function will accept a logger instance from the caller.
@@ -137,54 +138,42 @@ def build_historical_financial_summary(processed_data_container: DataProcessor)
     }
     num_years_to_display = 5
 
+    # 从对齐宽表中只取各报表需要展示的字段，不再复制和排序整张报表
+    panel = processed_data_container.get_statement_panel()
     for report_type, items_map in core_items_config.items():
         df = processed_data_container.processed_data.get(report_type)
         
         if df is not None and not df.empty:
-            df_for_years = df.copy()
-            if 'end_date' in df_for_years.columns:
-                df_for_years['end_date'] = pd.to_datetime(df_for_years['end_date'])
-                df_for_years = df_for_years.set_index('end_date')
-            
-            if df_for_years.index.name == 'end_date':
-                df_for_years = df_for_years.sort_index(ascending=False)
-            else:
+            if not panel.has_table(report_type):
                 logger.warning(f"Skipping report_type {report_type} for historical summary due to missing 'end_date' index.")
                 continue
+            available_columns = panel.columns(report_type)
+            needed_columns = set(items_map.values()) | {"total_revenue", "oper_cost"}
+            df_for_years = panel.select({report_type: [col for col in available_columns if col in needed_columns]})
 
-            annual_report_dates = sorted(
-                [date for date in df_for_years.index.unique() if date.month == 12],
-                reverse=True
-            )
+            # 宽表按报告期升序排列
+            annual_report_dates = [date for date in df_for_years.index[::-1] if date.month == 12]
             display_dates = annual_report_dates[:num_years_to_display]
             if len(display_dates) < num_years_to_display: # Fallback if not enough annual reports
-                all_report_dates = sorted(df_for_years.index.unique(), reverse=True)
-                display_dates = all_report_dates[:num_years_to_display]
+                display_dates = list(df_for_years.index[::-1][:num_years_to_display])
 
             display_years_str = [date.strftime('%Y') for date in display_dates]
+            display_rows = df_for_years.loc[display_dates]
 
             for display_name, actual_col_name in items_map.items():
                 item_data = {"科目": display_name, "报表类型": report_type.replace("_", " ").title()}
                 
                 if report_type == "income_statement" and actual_col_name == "gross_profit":
-                    if "total_revenue" in df_for_years.columns and "oper_cost" in df_for_years.columns:
-                        for i, date_obj in enumerate(display_dates):
-                            year_str = display_years_str[i]
-                            row = df_for_years[df_for_years.index == date_obj]
-                            if not row.empty:
-                                revenue = row["total_revenue"].iloc[0]
-                                cost = row["oper_cost"].iloc[0]
-                                item_data[year_str] = float(Decimal(str(revenue)) - Decimal(str(cost))) if pd.notna(revenue) and pd.notna(cost) else None
-                            else: item_data[year_str] = None
+                    if "total_revenue" in display_rows.columns and "oper_cost" in display_rows.columns:
+                        for year_str, revenue, cost in zip(display_years_str, display_rows["total_revenue"], display_rows["oper_cost"]):
+                            item_data[year_str] = float(Decimal(str(revenue)) - Decimal(str(cost))) if pd.notna(revenue) and pd.notna(cost) else None
                     else: 
                         for year_str in display_years_str: item_data[year_str] = None
-                elif actual_col_name in df_for_years.columns:
-                    for i, date_obj in enumerate(display_dates):
-                        year_str = display_years_str[i]
-                        row = df_for_years[df_for_years.index == date_obj]
-                        if not row.empty and pd.notna(row[actual_col_name].iloc[0]):
+                elif actual_col_name in display_rows.columns:
+                    for year_str, value in zip(display_years_str, display_rows[actual_col_name]):
+                        if pd.notna(value):
                             try:
-                                item_data[year_str] = float(Decimal(str(row[actual_col_name].iloc[0])))
+                                item_data[year_str] = float(Decimal(str(value)))
                             except InvalidOperation: item_data[year_str] = None
                         else: item_data[year_str] = None
                 else:
@@ -239,6 +228,9 @@ def regenerate_axis_if_needed(
                 center_val = 8.0 # Default exit multiple
                 logger_obj.info(f"Using hardcoded default center value {center_val} for {param_name} axis for {'row' if is_row_axis else 'column'}.")
                 sensitivity_warnings_list.append(f"{param_name}轴缺少基准值和请求值，使用默认中心值 {center_val}。")
+        elif param_name in OPERATING_DRIVER_PARAMETERS:
+            # 经营驱动因素以请求中的假设值为中心
+            center_val = base_req_dict.get(param_name)
         
         if center_val is not None:
             try:
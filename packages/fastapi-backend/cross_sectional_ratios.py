@@ -0,0 +1,164 @@
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from statement_columns import STATEMENT_TABLES
+from statement_panel import StatementPanel
+
+# --- 全市场历史比率 (截面计算) ---
+# 输入为全部股票清洗后的长格式年度报表 (每张表含 ts_code、end_date 列，例如报表库中的分桶数据)，
+# 用 groupby / 数组运算一次算出每只股票的历史比率中位数、周转天数、有效税率和收入 CAGR，
+# 口径与 DataProcessor.calculate_historical_ratios_and_turnovers 对单只股票的计算相同，结果为 股票 x 比率 的表。
+# 清洗后的报表中股票已有的列不含缺失值，因此某只股票在某列上为 NaN 即视为该股票的报表没有这一列。
+
+# 与 DataProcessor.historical_ratios 的键及顺序一致
+RATIO_COLUMNS = [
+    'cogs_to_revenue_ratio', 'sga_rd_to_revenue_ratio', 'operating_margin_median', 'da_to_revenue_ratio',
+    'capex_to_revenue_ratio', 'accounts_receivable_days', 'inventory_days', 'accounts_payable_days',
+    'other_current_assets_to_revenue_ratio', 'other_current_liabilities_to_revenue_ratio', 'nwc_to_revenue_ratio',
+    'last_historical_nwc', 'effective_tax_rate', 'historical_revenue_cagr',
+]
+
+INCOME_COLUMNS = ['total_revenue', 'revenue', 'oper_cost', 'sell_exp', 'admin_exp', 'rd_exp',
+                  'operate_profit', 'ebit', 'income_tax', 'total_profit']
+DA_COLUMNS = ['depr_fa_coga_dpba', 'amort_intang_assets']
+CAPEX_COLUMN = 'c_pay_acq_const_fiolta'
+OTHER_CURRENT_ASSET_COLUMNS = ['prepayment', 'oth_cur_assets']
+OTHER_CURRENT_LIABILITY_COLUMNS = ['payroll_payable', 'taxes_payable', 'oth_payable']
+NWC_COLUMNS = ['total_cur_assets', 'money_cap', 'total_cur_liab', 'st_borr', 'non_cur_liab_due_1y']
+BALANCE_COLUMNS = ['accounts_receiv_bill', 'inventories', 'accounts_pay', *OTHER_CURRENT_ASSET_COLUMNS,
+                   'contract_liab', 'adv_receipts', *OTHER_CURRENT_LIABILITY_COLUMNS, *NWC_COLUMNS]
+
+
+def _numeric_fields(panel: StatementPanel, fields: Dict[str, List[str]], rows: Optional[List[str]] = None) -> pd.DataFrame:
+    """从宽表中取字段并转换为 float64；报表中没有的字段为 NaN。"""
+    existing = {table: [column for column in columns if column in panel.columns(table)] for table, columns in fields.items()}
+    df = panel.select(existing, rows=rows)
+    df = df.apply(lambda column: pd.to_numeric(column, errors='coerce')).astype('float64')
+    return df.reindex(columns=[column for columns in fields.values() for column in columns])
+
+
+def _per_stock(mask: pd.Series) -> pd.Series:
+    """按股票判断 mask 是否有任一行为 True，并广播回各行。"""
+    return mask.groupby(level='ts_code').transform('any')
+
+
+def _ratio_values(numerator: pd.Series, denominator: pd.Series, days_in_year: Optional[int] = None) -> pd.Series:
+    """
+    逐行计算比率 (或周转天数)，规则与 DataProcessor._calculate_median_ratios 相同：
+    分母为零或负值的行剔除，周转天数只保留 [0, days_in_year * 10) 内的值；无效行为 NaN。
+    """
+    positive_denominator = denominator.where(denominator > 0)
+    if days_in_year:
+        values = numerator * days_in_year / positive_denominator
+        return values.where((values >= 0) & (values < days_in_year * 10))
+    return numerator / positive_denominator
+
+
+def _revenue_cagr(revenue: pd.Series) -> pd.Series:
+    """
+    各股票的收入 CAGR：优先 3 年 (最近 4 个报告期，时间跨度超过 2.5 年)，否则使用全部年份 (跨度超过 0.9 年)，
+    起止收入须为正。
+    """
+    revenue = revenue.dropna()
+    grouped = revenue.groupby(level='ts_code')
+    from_end = grouped.cumcount(ascending=False)
+    from_start = grouped.cumcount()
+
+    def endpoint(mask: pd.Series) -> pd.DataFrame:
+        rows = revenue[mask.to_numpy()]
+        return pd.DataFrame({'revenue': rows.to_numpy(), 'date': rows.index.get_level_values('end_date')},
+                            index=rows.index.get_level_values('ts_code'))
+
+    last = endpoint(from_end == 0)
+    # 至少 4 个 / 2 个报告期才计算 3 年 / 全部年份 CAGR
+    fourth_last = endpoint(from_end == 3).reindex(last.index)
+    first = endpoint((from_start == 0) & (from_end >= 1)).reindex(last.index)
+
+    def cagr(start: pd.DataFrame, min_days: float) -> pd.Series:
+        days = (last['date'] - start['date']).dt.days
+        years = days / 365.25
+        valid = (days > min_days) & (start['revenue'] > 0) & (last['revenue'] > 0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            result = (last['revenue'] / start['revenue']) ** (1 / years) - 1
+        return result.where(valid)
+
+    return cagr(fourth_last, 365 * 2.5).combine_first(cagr(first, 365 * 0.9))
+
+
+def calculate_cross_sectional_ratios(statements: Dict[str, pd.DataFrame]) -> pd.DataFrame:
+    """
+    一次计算全部股票的历史比率 (口径同 DataProcessor.calculate_historical_ratios_and_turnovers)。
+    Args:
+        statements (Dict[str, pd.DataFrame]): 'balance_sheet'、'income_statement'、'cash_flow' -> 全部股票清洗后的
+            长格式报表 (含 ts_code、end_date 列，或以二者为索引)；同一股票同一报告期保留最后一条。
+    Returns:
+        pd.DataFrame: 以 ts_code 为索引、RATIO_COLUMNS 为列的 float64 表 (无法计算的比率为 NaN)；
+            只包含三张报表都有数据的股票。
+    """
+    panel = StatementPanel(statements, keys=['ts_code', 'end_date'])
+    if not all(panel.has_table(table) for table in STATEMENT_TABLES):
+        return pd.DataFrame(columns=RATIO_COLUMNS, index=pd.Index([], name='ts_code'), dtype='float64')
+    stock_sets = [set(panel.select({table: []}).index.get_level_values('ts_code')) for table in STATEMENT_TABLES]
+    stocks = sorted(set.intersection(*stock_sets))
+
+    # 利润表的报告期 (现金流量表字段按报告期左连接)
+    income = _numeric_fields(panel, {'income_statement': INCOME_COLUMNS, 'cash_flow': DA_COLUMNS + [CAPEX_COLUMN]},
+                             rows=['income_statement'])
+    # 资产负债表的报告期，以及资产负债表与利润表共同的报告期
+    balance = _numeric_fields(panel, {'balance_sheet': BALANCE_COLUMNS})
+    joined = _numeric_fields(panel, {'balance_sheet': BALANCE_COLUMNS, 'income_statement': ['total_revenue', 'revenue', 'oper_cost']})
+    revenue = income['total_revenue']
+
+    values = {}
+    values['cogs_to_revenue_ratio'] = _ratio_values(income['oper_cost'], revenue)
+    sga_rd_exp = income['sell_exp'].fillna(0) + income['admin_exp'].fillna(0) + income['rd_exp'].fillna(0)
+    values['sga_rd_to_revenue_ratio'] = _ratio_values(sga_rd_exp, revenue)
+    operating_profit = income['operate_profit'].where(_per_stock(income['operate_profit'].notna()), income['ebit'])
+    values['operating_margin_median'] = _ratio_values(operating_profit, revenue)
+
+    # D&A：总折旧摊销全为零或收入全为无效值/非正数的股票不计算
+    total_da = income[DA_COLUMNS].sum(axis=1, skipna=True)
+    da_eligible = _per_stock(total_da.ne(0)) & _per_stock(revenue.notna()) & _per_stock(~(revenue <= 0))
+    values['da_to_revenue_ratio'] = _ratio_values(total_da, revenue).where(da_eligible)
+
+    # 现金流量表有 Capex 列的股票 (没有该列的股票不计算)
+    if CAPEX_COLUMN in panel.columns('cash_flow'):
+        capex = panel.select({'cash_flow': [CAPEX_COLUMN]})[CAPEX_COLUMN]
+        capex_stocks = capex.index.get_level_values('ts_code')[capex.notna().to_numpy()]
+        has_capex = income.index.get_level_values('ts_code').isin(capex_stocks)
+    else:
+        has_capex = np.zeros(len(income), dtype=bool)
+    values['capex_to_revenue_ratio'] = _ratio_values(income[CAPEX_COLUMN].abs().fillna(0), revenue).where(has_capex)
+
+    values['accounts_receivable_days'] = _ratio_values(joined['accounts_receiv_bill'], joined['revenue'], 360)
+    values['inventory_days'] = _ratio_values(joined['inventories'], joined['oper_cost'], 360)
+    values['accounts_payable_days'] = _ratio_values(joined['accounts_pay'], joined['oper_cost'], 360)
+
+    other_ca = joined[OTHER_CURRENT_ASSET_COLUMNS].sum(axis=1, min_count=1)
+    values['other_current_assets_to_revenue_ratio'] = _ratio_values(other_ca, joined['total_revenue'])
+    # 有合同负债的股票用合同负债，否则用预收款项
+    advance = joined['contract_liab'].where(_per_stock(joined['contract_liab'].notna()), joined['adv_receipts'])
+    other_cl = pd.concat([advance, joined[OTHER_CURRENT_LIABILITY_COLUMNS]], axis=1).sum(axis=1, min_count=1)
+    values['other_current_liabilities_to_revenue_ratio'] = _ratio_values(other_cl, joined['total_revenue'])
+
+    # NWC = 流动资产合计 - 货币资金 - (流动负债合计 - 短期借款 - 一年内到期的非流动负债)，缺少任一项的股票为 NaN
+    nwc = (balance['total_cur_assets'] - balance['money_cap']) - \
+          (balance['total_cur_liab'] - balance['st_borr'] - balance['non_cur_liab_due_1y'])
+    values['nwc_to_revenue_ratio'] = _ratio_values(nwc.reindex(joined.index), joined['total_revenue'])
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        tax_rate = income['income_tax'] / income['total_profit'].replace(0, np.nan)
+    values['effective_tax_rate'] = tax_rate.where((tax_rate >= 0) & (tax_rate <= 1))
+
+    # 各比率的逐行值对齐到同一 (股票, 报告期) 索引后一次按股票取中位数
+    medians = pd.DataFrame(values).groupby(level='ts_code').median()
+    result = medians.reindex(index=stocks)
+    nwc_codes = nwc.index.get_level_values('ts_code')
+    last_nwc = pd.Series(nwc.to_numpy()[~nwc_codes.duplicated(keep='last')], index=nwc_codes.unique())
+    result['last_historical_nwc'] = last_nwc.reindex(stocks)
+    result['historical_revenue_cagr'] = _revenue_cagr(revenue).reindex(stocks)
+    result = result.reindex(columns=RATIO_COLUMNS).astype('float64')
+    result.index.name = 'ts_code'
+    return result
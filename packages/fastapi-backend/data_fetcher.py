@@ -1,14 +1,134 @@
 import os
+import threading
 from abc import ABC, abstractmethod
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Tuple
 from dotenv import load_dotenv
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, text, bindparam
+from sqlalchemy.engine import Engine
 import pandas as pd
 from decimal import Decimal
+import statement_columns
+from env_utils import env_int, env_flag
 # import configparser # 不再需要
 
 load_dotenv() # 加载 .env 文件中的环境变量
 
+# --- Shared Engine Registry ---
+# 每个 create_engine 都会建立独立的连接池。按数据库 URL 缓存引擎，使同一进程内的所有
+# fetcher 复用已建立的连接，避免每次请求都重新进行 TCP 握手和认证。
+_engine_registry: Dict[str, Engine] = {}
+_engine_registry_lock = threading.Lock()
+
+def get_database_url() -> str:
+    """根据环境变量构建数据库连接 URL。"""
+    db_user = os.getenv('DB_USER', 'default_user')
+    db_password = os.getenv('DB_PASSWORD', 'default_password')
+    db_host = os.getenv('DB_HOST', 'localhost')
+    db_port = os.getenv('DB_PORT', '5432')
+    db_name = os.getenv('DB_NAME', 'postgres')
+
+    if db_user == 'default_user' or db_password == 'default_password':
+        print("警告：未能从环境变量加载数据库用户名或密码。请确保已创建并正确配置 .env 文件。")
+
+    return f'postgresql://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}'
+
+def get_shared_engine(db_url: Optional[str] = None) -> Engine:
+    """
+    获取进程内共享的数据库引擎 (按 URL 缓存)，首次创建时进行一次连接测试。
+    连接池参数可通过环境变量调整:
+        DB_POOL_SIZE (默认 5), DB_MAX_OVERFLOW (默认 10), DB_POOL_TIMEOUT (秒, 默认 30),
+        DB_POOL_RECYCLE (秒, 默认 1800), DB_POOL_PRE_PING (默认 true)。
+    Args:
+        db_url (Optional[str]): 数据库连接 URL，默认由环境变量构建。
+
+    Returns:
+        Engine: SQLAlchemy 引擎。
+    """
+    url = db_url or get_database_url()
+    engine = _engine_registry.get(url)
+    if engine is not None:
+        return engine
+
+    with _engine_registry_lock:
+        engine = _engine_registry.get(url)
+        if engine is None:
+            engine = create_engine(
+                url,
+                # 连接池参数按 SQLAlchemy 的约定取值 (例如 max_overflow=-1 不限制、pool_recycle=-1 不回收)，不检查范围
+                pool_size=env_int('DB_POOL_SIZE', 5, min_value=None),
+                max_overflow=env_int('DB_MAX_OVERFLOW', 10, min_value=None),
+                pool_timeout=env_int('DB_POOL_TIMEOUT', 30, min_value=None),
+                pool_recycle=env_int('DB_POOL_RECYCLE', 1800, min_value=None),
+                pool_pre_ping=env_flag('DB_POOL_PRE_PING', True),
+            )
+
+            # 连接测试只在引擎首次创建时进行
+            try:
+                with engine.connect() as connection:
+                    print("数据库连接测试成功！")
+            except Exception as e:
+                print(f"数据库连接测试失败: {e}")
+                # 不抛出异常，由后续查询逻辑处理连接错误
+
+            _engine_registry[url] = engine
+    return engine
+
+def dispose_engines(close: bool = True):
+    """
+    释放所有共享引擎的连接池。
+    Args:
+        close (bool): 是否关闭已建立的连接并清空缓存。
+    """
+    with _engine_registry_lock:
+        for engine in _engine_registry.values():
+            engine.dispose(close=close)
+        if close:
+            _engine_registry.clear()
+
+def _reset_engines_after_fork():
+    """子进程不能复用父进程的数据库连接 (进程池以 fork 方式启动时)。fork 时锁可能处于持有状态，需重建。"""
+    global _engine_registry_lock
+    _engine_registry_lock = threading.Lock()
+    for engine in list(_engine_registry.values()):
+        engine.dispose(close=False)
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_engines_after_fork)
+
+# A 股最早的年报年份，用于不限年限的年报查询
+FIRST_ANNUAL_REPORT_YEAR = 1990
+
+def _statement_frame(records: List[Dict[str, Any]]) -> pd.DataFrame:
+    """
+    将报表查询结果 (逐行 _asdict() 或 json_agg 解析后的对象列表) 转换为 DataFrame，保证各获取途径的列类型一致：
+    NUMERIC 列 (psycopg2 返回 Decimal) 和 JSON 数值列 (int/float) 统一为 float64，end_date 转换为 datetime。
+    否则 Decimal 对象列会被 DataProcessor.clean_data 视为非数值列而跳过清洗，同一只股票的结果取决于走了哪条查询途径。
+    """
+    df = pd.DataFrame(records)
+    if df.empty:
+        return df
+    for col in df.columns:
+        if col == 'end_date' or pd.api.types.is_bool_dtype(df[col]):
+            continue
+        if pd.api.types.is_numeric_dtype(df[col]):
+            df[col] = df[col].astype('float64')
+        elif df[col].map(lambda v: isinstance(v, (Decimal, int, float)) and not isinstance(v, bool)).any():
+            df[col] = pd.to_numeric(df[col], errors='coerce').astype('float64')
+    df['end_date'] = pd.to_datetime(df['end_date'])
+    return df
+
+def _annual_end_dates(start_year: int, end_year: Optional[int] = None) -> List[str]:
+    """
+    生成 [start_year, end_year] 区间内各年年报的报告期 (YYYYMMDD)。
+    报表查询以 end_date IN (...) 代替 EXTRACT(MONTH/YEAR FROM end_date::timestamp)，
+    谓词直接作用于 end_date 列，可以使用 (ts_code, end_date) 复合索引。
+    """
+    last_year = end_year if end_year is not None else pd.Timestamp.now().year
+    return [f"{year}1231" for year in range(start_year, last_year + 1)]
+
+# information_schema 查询结果缓存 (按数据库 URL 和表名)，用于将投影列裁剪为表中实际存在的列
+_table_columns_cache: Dict[Tuple[str, str], List[str]] = {}
+
 # --- Base Class Definition ---
 class BaseDataFetcher(ABC):
     """Abstract base class for data fetchers for different markets."""
@@ -17,29 +137,9 @@ class BaseDataFetcher(ABC):
         self.ts_code = ts_code
         self.engine = self._create_engine()
 
-    def _create_engine(self):
-        """Creates the database engine using environment variables."""
-        db_user = os.getenv('DB_USER', 'default_user')
-        db_password = os.getenv('DB_PASSWORD', 'default_password')
-        db_host = os.getenv('DB_HOST', 'localhost')
-        db_port = os.getenv('DB_PORT', '5432')
-        db_name = os.getenv('DB_NAME', 'postgres')
-
-        if db_user == 'default_user' or db_password == 'default_password':
-            print("警告：未能从环境变量加载数据库用户名或密码。请确保已创建并正确配置 .env 文件。")
-              
-        engine = create_engine(f'postgresql://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}')
-         
-        # 添加连接测试 (整体修正缩进)
-        try:
-            with engine.connect() as connection:
-                print("数据库连接测试成功！")
-        except Exception as e:
-            print(f"数据库连接测试失败: {e}")
-            # 可以在这里决定是否抛出异常，或者仅打印错误让后续逻辑处理
-            # raise e # 如果希望连接失败时阻止程序继续
-
-        return engine
+    def _create_engine(self) -> Engine:
+        """Returns the process-wide pooled database engine."""
+        return get_shared_engine()
 
     @abstractmethod
     def get_stock_info(self) -> Dict[str, Any]:
@@ -107,9 +207,20 @@ class AshareDataFetcher(BaseDataFetcher):
         # 移除 valuation_metrics 相关定义，改用 specific 方法
         # self.valuation_metrics_table = 'valuation_metrics' 
         # self.valuation_metrics_fields = [...] 
+
+        # 各报表只查询 DataProcessor、各计算器和响应构建实际使用的列 (列清单见 statement_columns.py)
+        self.valuation_statement_columns = {
+            self.balance_sheet_table: statement_columns.REQUIRED_STATEMENT_COLUMNS['balance_sheet'],
+            self.income_statement_table: statement_columns.REQUIRED_STATEMENT_COLUMNS['income_statement'],
+            self.cash_flow_table: statement_columns.REQUIRED_STATEMENT_COLUMNS['cash_flow'],
+        }
+        # prefetch_valuation_data 的结果，键为 (方法名, 参数...)，各 getter 优先读取
+        self._prefetched: Dict[Tuple, Any] = {}
     
     def get_stock_info(self):
         """获取股票基本信息"""
+        if ('stock_info',) in self._prefetched:
+            return self._prefetched[('stock_info',)]
         with self.engine.connect() as conn:
             # required_fields 现在由 self.stock_basic_fields 动态确定
             required_fields = self.stock_basic_fields
@@ -143,6 +254,8 @@ class AshareDataFetcher(BaseDataFetcher):
     
     def get_latest_price(self):
         """获取最新收盘价"""
+        if ('latest_price',) in self._prefetched:
+            return self._prefetched[('latest_price',)]
         with self.engine.connect() as conn:
             fields_str = ', '.join(self.daily_quotes_fields)
             query = text(f"SELECT {fields_str} FROM {self.daily_quotes_table} WHERE ts_code = :ts_code ORDER BY trade_date DESC LIMIT 1")
@@ -187,10 +300,11 @@ class AshareDataFetcher(BaseDataFetcher):
                 JOIN {self.cash_flow_table} c ON i.ts_code = c.ts_code AND i.end_date = c.end_date
                 JOIN {self.balance_sheet_table} b ON i.ts_code = b.ts_code AND i.end_date = b.end_date
                 WHERE i.ts_code = :ts_code 
-                AND EXTRACT(MONTH FROM i.end_date::timestamp) = 12
+                AND i.end_date IN :annual_end_dates
                 ORDER BY i.end_date DESC
-            """)
-            result = conn.execute(query, {'ts_code': self.ts_code})
+            """).bindparams(bindparam('annual_end_dates', expanding=True))
+            result = conn.execute(query, {'ts_code': self.ts_code,
+                                          'annual_end_dates': _annual_end_dates(FIRST_ANNUAL_REPORT_YEAR)})
             # 去重，保证每年只有一条数据
             data = []
             years_seen = set()
@@ -239,6 +353,8 @@ class AshareDataFetcher(BaseDataFetcher):
         Returns:
             pd.DataFrame: 包含TTM股息数据的DataFrame。
         """
+        if ('dividends_ttm', valuation_date) in self._prefetched:
+            return self._prefetched[('dividends_ttm', valuation_date)]
         print(f"Fetching TTM dividends for {self.ts_code} up to {valuation_date}...")
         with self.engine.connect() as conn:
             # 将估值日期字符串转换为 datetime 对象，然后计算12个月前的日期
@@ -365,6 +481,8 @@ class AshareDataFetcher(BaseDataFetcher):
         Returns:
             Dict[str, Optional[float]]: 包含 'pe' 和 'pb' 的字典。
         """
+        if ('latest_pe_pb', valuation_date) in self._prefetched:
+            return self._prefetched[('latest_pe_pb', valuation_date)]
         print(f"Fetching latest PE/PB for {self.ts_code} up to {valuation_date or 'latest'}...")
         pe_pb_data = {'pe': None, 'pb': None}
         with self.engine.connect() as conn:
@@ -412,6 +530,8 @@ class AshareDataFetcher(BaseDataFetcher):
         Returns:
             Optional[float]: 总股本，如果找不到则返回 None。
         """
+        if ('latest_total_shares', valuation_date) in self._prefetched:
+            return self._prefetched[('latest_total_shares', valuation_date)]
         print(f"Fetching latest total shares for {self.ts_code} up to {valuation_date or 'latest'}...")
         total_shares = None
         with self.engine.connect() as conn:
@@ -452,53 +572,368 @@ class AshareDataFetcher(BaseDataFetcher):
 
     def get_raw_financial_data(self, years: int = 5) -> Dict[str, pd.DataFrame]:
         """
-        获取指定年限的原始财务报表数据 (年度报告)。
-        返回包含 balance_sheet, income_statement, cash_flow DataFrame 的字典。
+        获取指定年限的原始财务报表数据 (年度报告)，只查询列清单中的列。
+        返回包含 balance_sheet, income_statement, cash_flow DataFrame 的字典 (数值列为 float64，与预取结果一致)。
         """
+        if ('raw_financial_data', years) in self._prefetched:
+            return self._prefetched[('raw_financial_data', years)]
         raw_data = {}
         current_year = pd.Timestamp.now().year
         start_year = current_year - years
+        params = {'ts_code': self.ts_code, 'annual_end_dates': _annual_end_dates(start_year, current_year)}
 
         with self.engine.connect() as conn:
-            # 获取资产负债表
-            bs_query = text(f"""
-                SELECT * FROM {self.balance_sheet_table}
-                WHERE ts_code = :ts_code 
-                AND EXTRACT(MONTH FROM end_date::timestamp) = 12
-                AND EXTRACT(YEAR FROM end_date::timestamp) >= :start_year
-                ORDER BY end_date DESC
-            """)
-            bs_result = conn.execute(bs_query, {'ts_code': self.ts_code, 'start_year': start_year})
-            raw_data['balance_sheet'] = pd.DataFrame([row._asdict() for row in bs_result])
-            if not raw_data['balance_sheet'].empty:
-                 raw_data['balance_sheet']['end_date'] = pd.to_datetime(raw_data['balance_sheet']['end_date'])
+            projected_columns = self._get_existing_columns(conn, self.valuation_statement_columns)
+            for key, table_name in [('balance_sheet', self.balance_sheet_table),
+                                    ('income_statement', self.income_statement_table),
+                                    ('cash_flow', self.cash_flow_table)]:
+                query = text(f"""
+                    SELECT {', '.join(projected_columns[table_name])} FROM {table_name}
+                    WHERE ts_code = :ts_code
+                    AND end_date IN :annual_end_dates
+                    ORDER BY end_date DESC
+                """).bindparams(bindparam('annual_end_dates', expanding=True))
+                result = conn.execute(query, params)
+                raw_data[key] = _statement_frame([row._asdict() for row in result])
 
+        print(f"Fetched raw financial data for {self.ts_code} for the last {years} years.")
+        return raw_data
 
-            # 获取利润表
-            is_query = text(f"""
-                SELECT * FROM {self.income_statement_table}
-                WHERE ts_code = :ts_code
-                AND EXTRACT(MONTH FROM end_date::timestamp) = 12
-                AND EXTRACT(YEAR FROM end_date::timestamp) >= :start_year
-                ORDER BY end_date DESC
-            """)
-            is_result = conn.execute(is_query, {'ts_code': self.ts_code, 'start_year': start_year})
-            raw_data['income_statement'] = pd.DataFrame([row._asdict() for row in is_result])
-            if not raw_data['income_statement'].empty:
-                 raw_data['income_statement']['end_date'] = pd.to_datetime(raw_data['income_statement']['end_date'])
-
-            # 获取现金流量表
-            cf_query = text(f"""
-                SELECT * FROM {self.cash_flow_table}
-                WHERE ts_code = :ts_code
-                AND EXTRACT(MONTH FROM end_date::timestamp) = 12
-                AND EXTRACT(YEAR FROM end_date::timestamp) >= :start_year
-                ORDER BY end_date DESC
-            """)
-            cf_result = conn.execute(cf_query, {'ts_code': self.ts_code, 'start_year': start_year})
-            raw_data['cash_flow'] = pd.DataFrame([row._asdict() for row in cf_result])
-            if not raw_data['cash_flow'].empty:
-                 raw_data['cash_flow']['end_date'] = pd.to_datetime(raw_data['cash_flow']['end_date'])
+    def _get_existing_columns(self, conn, requested_by_table: Dict[str, List[str]]) -> Dict[str, List[str]]:
+        """
+        将各表的投影列裁剪为表中实际存在的列。
+        表结构通过一次 information_schema 查询获取，并按进程缓存。
+        """
+        url = str(self.engine.url)
+        missing_tables = [t for t in requested_by_table if (url, t) not in _table_columns_cache]
+        if missing_tables:
+            result = conn.execute(
+                text("SELECT table_name, column_name FROM information_schema.columns WHERE table_name = ANY(:table_names)"),
+                {'table_names': missing_tables}
+            )
+            found: Dict[str, List[str]] = {t: [] for t in missing_tables}
+            for table_name, column_name in result:
+                found.setdefault(table_name, []).append(column_name)
+            for table_name, columns in found.items():
+                _table_columns_cache[(url, table_name)] = columns
 
-        print(f"Fetched raw financial data for {self.ts_code} for the last {years} years.")
+        projected = {}
+        for table_name, requested in requested_by_table.items():
+            existing = set(_table_columns_cache.get((url, table_name), []))
+            # 无法获取表结构时使用请求的列，由查询本身报错
+            projected[table_name] = [col for col in requested if col in existing] if existing else requested
+        return projected
+
+    def _latest_report_end_date_sql(self) -> str:
+        """三张年度报表中最新报告期的 SQL 表达式 (仅访问 (ts_code, end_date) 索引)。"""
+        subqueries = [
+            f"(SELECT MAX(end_date) FROM {table_name} WHERE ts_code = :ts_code AND end_date IN :annual_end_dates)"
+            for table_name in (self.balance_sheet_table, self.income_statement_table, self.cash_flow_table)
+        ]
+        return f"GREATEST({', '.join(subqueries)})"
+
+    @staticmethod
+    def _normalize_report_date(value: Any) -> Optional[str]:
+        """将报告期统一为 'YYYY-MM-DD' 字符串，无效时返回 None。"""
+        if value is None or pd.isna(value):
+            return None
+        try:
+            return pd.to_datetime(str(value)).strftime('%Y-%m-%d')
+        except (ValueError, TypeError):
+            return None
+
+    def get_latest_report_end_date(self, years: int = 5) -> Optional[str]:
+        """
+        获取指定年限内三张年度报表的最新报告期，用于判断已处理的报表数据是否仍然有效。
+        Args:
+            years (int): 报表回溯年数，与 get_raw_financial_data(years) 一致。
+        Returns:
+            Optional[str]: 最新报告期 (YYYY-MM-DD)，没有报表数据或查询失败时返回 None。
+        """
+        if ('latest_report_end_date', years) in self._prefetched:
+            return self._prefetched[('latest_report_end_date', years)]
+        current_year = pd.Timestamp.now().year
+        params = {'ts_code': self.ts_code, 'annual_end_dates': _annual_end_dates(current_year - years, current_year)}
+        try:
+            with self.engine.connect() as conn:
+                query = text(f"SELECT {self._latest_report_end_date_sql()} AS latest_end_date").bindparams(
+                    bindparam('annual_end_dates', expanding=True))
+                latest_end_date = conn.execute(query, params).scalar()
+        except Exception as e:
+            print(f"Error fetching latest report end date for {self.ts_code}: {e}")
+            return None
+        return self._normalize_report_date(latest_end_date)
+
+    def get_latest_report_end_dates(self, years: int = 5, ts_codes: Optional[List[str]] = None) -> Dict[str, str]:
+        """
+        批量获取各股票在指定年限内三张年度报表的最新报告期 (与 self.ts_code 无关，用于离线构建报表库)。
+        Args:
+            years (int): 报表回溯年数。
+            ts_codes (Optional[List[str]]): 股票代码列表，为空时返回全部股票。
+        Returns:
+            Dict[str, str]: ts_code -> 最新报告期 (YYYY-MM-DD)。
+        """
+        current_year = pd.Timestamp.now().year
+        params: Dict[str, Any] = {'annual_end_dates': _annual_end_dates(current_year - years, current_year)}
+        code_condition = ""
+        bind_params = [bindparam('annual_end_dates', expanding=True)]
+        if ts_codes is not None:
+            if not ts_codes:
+                return {}
+            code_condition = "AND ts_code IN :ts_codes"
+            params['ts_codes'] = list(ts_codes)
+            bind_params.append(bindparam('ts_codes', expanding=True))
+        union_sql = " UNION ALL ".join(
+            f"SELECT ts_code, end_date FROM {table_name} WHERE end_date IN :annual_end_dates {code_condition}"
+            for table_name in (self.balance_sheet_table, self.income_statement_table, self.cash_flow_table)
+        )
+        query = text(f"""
+            SELECT ts_code, MAX(end_date) AS latest_end_date
+            FROM ({union_sql}) AS statement_dates
+            GROUP BY ts_code
+        """).bindparams(*bind_params)
+        with self.engine.connect() as conn:
+            result = conn.execute(query, params)
+            latest_dates = {ts_code: self._normalize_report_date(end_date) for ts_code, end_date in result}
+        return {ts_code: end_date for ts_code, end_date in latest_dates.items() if end_date is not None}
+
+    def get_raw_financial_data_for_codes(self, ts_codes: List[str], years: int = 5) -> Dict[str, pd.DataFrame]:
+        """
+        批量获取多只股票的年度报表 (与 self.ts_code 无关，用于离线构建报表库)。
+        与 prefetch_valuation_data 一样只投影估值实际使用的列，列类型由 _statement_frame 统一 (数值列为 float64)。
+        Args:
+            ts_codes (List[str]): 股票代码列表。
+            years (int): 报表回溯年数，与 get_raw_financial_data(years) 一致。
+        Returns:
+            Dict[str, pd.DataFrame]: 'balance_sheet', 'income_statement', 'cash_flow' -> 按 (ts_code, end_date DESC) 排序的 DataFrame。
+        """
+        current_year = pd.Timestamp.now().year
+        params = {'ts_codes': list(ts_codes), 'annual_end_dates': _annual_end_dates(current_year - years, current_year)}
+        raw_data = {}
+        with self.engine.connect() as conn:
+            projected_columns = self._get_existing_columns(conn, self.valuation_statement_columns)
+            for key, table_name in [('balance_sheet', self.balance_sheet_table),
+                                    ('income_statement', self.income_statement_table),
+                                    ('cash_flow', self.cash_flow_table)]:
+                query = text(f"""
+                    SELECT {', '.join(projected_columns[table_name])} FROM {table_name}
+                    WHERE ts_code IN :ts_codes
+                    AND end_date IN :annual_end_dates
+                    ORDER BY ts_code, end_date DESC
+                """).bindparams(bindparam('ts_codes', expanding=True), bindparam('annual_end_dates', expanding=True))
+                result = conn.execute(query, params)
+                raw_data[key] = _statement_frame([row._asdict() for row in result])
         return raw_data
+
+    def get_market_data_for_codes(self, ts_codes: List[str], valuation_date: Optional[str] = None,
+                                  ttm_valuation_date: Optional[str] = None) -> Dict[str, pd.DataFrame]:
+        """
+        批量获取多只股票的估值市场数据 (与 self.ts_code 无关，用于批量估值)，口径与
+        get_stock_info、get_latest_price、get_latest_pe_pb、get_latest_total_shares 和 get_dividends_ttm 相同。
+        Args:
+            ts_codes (List[str]): 股票代码列表。
+            valuation_date (Optional[str]): 估值基准日期，PE/PB/总股本取该日期或之前的最新记录。
+            ttm_valuation_date (Optional[str]): TTM 股息基准日期 (YYYY-MM-DD)，为空时不获取股息。
+        Returns:
+            Dict[str, pd.DataFrame]: 'stock_basic' (stock_basic_fields)、'latest_price' (ts_code, close)、
+                                     'valuation_metrics' (ts_code, pe, pb, total_share) 和 'dividends' (dividend_fields)。
+        """
+        params: Dict[str, Any] = {'ts_codes': list(ts_codes)}
+        vm_date_condition = ""
+        if valuation_date:
+            vm_date_condition = "AND trade_date <= :valuation_date"
+            params['valuation_date'] = valuation_date
+        queries = {
+            'stock_basic': f"""
+                SELECT {', '.join(self.stock_basic_fields)} FROM {self.stock_basic_table}
+                WHERE ts_code IN :ts_codes
+            """,
+            'latest_price': f"""
+                SELECT DISTINCT ON (ts_code) ts_code, close FROM {self.daily_quotes_table}
+                WHERE ts_code IN :ts_codes
+                ORDER BY ts_code, trade_date DESC
+            """,
+            'valuation_metrics': f"""
+                SELECT DISTINCT ON (ts_code) ts_code, pe, pb, total_share FROM valuation_metrics
+                WHERE ts_code IN :ts_codes {vm_date_condition}
+                ORDER BY ts_code, trade_date DESC
+            """,
+        }
+        if ttm_valuation_date:
+            ttm_dt = pd.to_datetime(ttm_valuation_date)
+            params['div_start_date'] = (ttm_dt - pd.DateOffset(months=12)).strftime('%Y%m%d')
+            params['div_end_date'] = ttm_dt.strftime('%Y%m%d')
+            queries['dividends'] = f"""
+                SELECT {', '.join(self.dividend_fields)} FROM {self.dividend_table}
+                WHERE ts_code IN :ts_codes
+                  AND ann_date >= :div_start_date
+                  AND ann_date <= :div_end_date
+                  AND div_proc IN ('实施', '完成', '预案')
+                ORDER BY ts_code, ann_date DESC
+            """
+
+        market_data = {}
+        with self.engine.connect() as conn:
+            for key, sql in queries.items():
+                result = conn.execute(text(sql).bindparams(bindparam('ts_codes', expanding=True)), params)
+                market_data[key] = pd.DataFrame([row._asdict() for row in result])
+
+        for key, columns in [('stock_basic', self.stock_basic_fields), ('latest_price', ['ts_code', 'close']),
+                             ('valuation_metrics', ['ts_code', 'pe', 'pb', 'total_share']),
+                             ('dividends', self.dividend_fields)]:
+            if market_data.get(key) is None or market_data[key].empty:
+                market_data[key] = pd.DataFrame(columns=columns)
+        for col in ['close', 'pe', 'pb', 'total_share']:
+            for key in ('latest_price', 'valuation_metrics'):
+                if col in market_data[key].columns:
+                    market_data[key][col] = pd.to_numeric(market_data[key][col], errors='coerce')
+        dividends = market_data['dividends']
+        if not dividends.empty:
+            dividends['cash_div_tax'] = pd.to_numeric(dividends['cash_div_tax'], errors='coerce')
+            dividends['ann_date'] = pd.to_datetime(dividends['ann_date'], format='%Y%m%d', errors='coerce')
+            dividends['end_date'] = pd.to_datetime(dividends['end_date'], format='%Y%m%d', errors='coerce')
+        return market_data
+
+    def prefetch_valuation_data(self, years: int = 5, valuation_date: Optional[str] = None,
+                                ttm_valuation_date: Optional[str] = None,
+                                include_statements: bool = True) -> bool:
+        """
+        在单个连接上用一条 CTE 查询 (一次往返) 预取估值流程所需的全部数据：
+        股票基本信息、最新收盘价、最新 PE/PB/总股本、TTM 股息、最新报告期以及三张年度报表 (仅投影实际使用的列)。
+        结果缓存在实例中，随后 get_stock_info、get_latest_price、get_latest_pe_pb、get_latest_total_shares、
+        get_dividends_ttm、get_latest_report_end_date 和 get_raw_financial_data 以相同参数调用时直接返回缓存，不再访问数据库。
+        Args:
+            years (int): 报表回溯年数，与 get_raw_financial_data(years) 一致。
+            valuation_date (Optional[str]): 估值基准日期，与 get_latest_pe_pb/get_latest_total_shares 一致。
+            ttm_valuation_date (Optional[str]): TTM 股息基准日期 (YYYY-MM-DD)，与 get_dividends_ttm 一致。
+            include_statements (bool): 是否预取报表明细。已缓存处理后报表数据时可设为 False，只取最新报告期。
+        Returns:
+            bool: 预取成功返回 True；失败时返回 False，各 getter 将回退为单独查询。
+        """
+        current_year = pd.Timestamp.now().year
+        params: Dict[str, Any] = {'ts_code': self.ts_code,
+                                  'annual_end_dates': _annual_end_dates(current_year - years, current_year)}
+
+        vm_date_condition = ""
+        if valuation_date:
+            vm_date_condition = "AND trade_date <= :valuation_date"
+            params['valuation_date'] = valuation_date
+
+        ttm_dt = pd.to_datetime(ttm_valuation_date) if ttm_valuation_date else None
+        if ttm_dt is not None:
+            params['div_start_date'] = (ttm_dt - pd.DateOffset(months=12)).strftime('%Y%m%d')
+            params['div_end_date'] = ttm_dt.strftime('%Y%m%d')
+
+        try:
+            with self.engine.connect() as conn:
+                statement_ctes = []
+                projected_columns = self._get_existing_columns(conn, self.valuation_statement_columns) if include_statements else {}
+                for table_name, columns in projected_columns.items():
+                    cols_str = ', '.join(columns)
+                    statement_ctes.append(f"""
+                    {table_name}_rows AS (
+                        SELECT {cols_str} FROM {table_name}
+                        WHERE ts_code = :ts_code
+                        AND end_date IN :annual_end_dates
+                    )""")
+
+                dividend_cte = f"""
+                    dividend_rows AS (
+                        SELECT {', '.join(self.dividend_fields)} FROM {self.dividend_table}
+                        WHERE ts_code = :ts_code
+                          AND ann_date >= :div_start_date
+                          AND ann_date <= :div_end_date
+                          AND div_proc IN ('实施', '完成', '预案')
+                    )""" if ttm_dt is not None else """
+                    dividend_rows AS (SELECT NULL::text AS ann_date WHERE FALSE)"""
+
+                statement_columns = ''.join(
+                    f"""
+                        (SELECT json_agg(t ORDER BY t.end_date DESC) FROM {table_name}_rows t) AS {key},"""
+                    for key, table_name in [('balance_sheet', self.balance_sheet_table),
+                                            ('income_statement', self.income_statement_table),
+                                            ('cash_flow', self.cash_flow_table)]
+                ) if include_statements else ''
+
+                query = text(f"""
+                    WITH
+                    basic_row AS (
+                        SELECT {', '.join(self.stock_basic_fields)} FROM {self.stock_basic_table}
+                        WHERE ts_code = :ts_code LIMIT 1
+                    ),
+                    price_row AS (
+                        SELECT close FROM {self.daily_quotes_table}
+                        WHERE ts_code = :ts_code ORDER BY trade_date DESC LIMIT 1
+                    ),
+                    metrics_row AS (
+                        SELECT pe, pb, total_share FROM valuation_metrics
+                        WHERE ts_code = :ts_code {vm_date_condition}
+                        ORDER BY trade_date DESC LIMIT 1
+                    ),
+                    {''.join(cte + ',' for cte in statement_ctes)}
+                    {dividend_cte}
+                    SELECT
+                        (SELECT row_to_json(b) FROM basic_row b) AS stock_basic,
+                        (SELECT close FROM price_row) AS latest_close,
+                        (SELECT row_to_json(m) FROM metrics_row m) AS valuation_metrics,
+                        {self._latest_report_end_date_sql()} AS latest_report_end_date,{statement_columns}
+                        (SELECT json_agg(d ORDER BY d.ann_date DESC) FROM dividend_rows d) AS dividends
+                """).bindparams(bindparam('annual_end_dates', expanding=True))
+                row = conn.execute(query, params).fetchone()
+        except Exception as e:
+            print(f"批量预取估值数据失败，将回退为逐项查询: {e}")
+            return False
+
+        if row is None:
+            return False
+        bundle = row._asdict()
+
+        # 股票基本信息
+        basic = bundle.get('stock_basic')
+        if basic:
+            info = {field: basic.get(field) for field in self.stock_basic_fields}
+            if pd.notna(info.get('list_date')):
+                try:
+                    info['list_date'] = pd.to_datetime(info['list_date']).strftime('%Y-%m-%d')
+                except Exception:
+                    info['list_date'] = None
+            else:
+                info['list_date'] = None
+        else:
+            info = {field: (self.ts_code if field == 'ts_code' else None) for field in self.stock_basic_fields}
+        self._prefetched[('stock_info',)] = info
+
+        # 最新价格 (无数据时不缓存，get_latest_price 保持原有的报错行为)
+        if bundle.get('latest_close') is not None:
+            self._prefetched[('latest_price',)] = float(bundle['latest_close'])
+
+        # PE/PB 与总股本
+        metrics = bundle.get('valuation_metrics') or {}
+        pe = pd.to_numeric(metrics.get('pe'), errors='coerce')
+        pb = pd.to_numeric(metrics.get('pb'), errors='coerce')
+        self._prefetched[('latest_pe_pb', valuation_date)] = {
+            'pe': None if pd.isna(pe) else pe,
+            'pb': None if pd.isna(pb) else pb,
+        }
+        total_shares = pd.to_numeric(metrics.get('total_share'), errors='coerce')
+        if pd.isna(total_shares) or total_shares <= 0:
+            total_shares = None
+        self._prefetched[('latest_total_shares', valuation_date)] = total_shares
+
+        # TTM 股息
+        if ttm_valuation_date is not None:
+            div_df = pd.DataFrame(bundle.get('dividends') or [])
+            if not div_df.empty:
+                div_df['cash_div_tax'] = pd.to_numeric(div_df['cash_div_tax'], errors='coerce')
+                div_df['ann_date'] = pd.to_datetime(div_df['ann_date'], format='%Y%m%d', errors='coerce')
+                div_df['end_date'] = pd.to_datetime(div_df['end_date'], format='%Y%m%d', errors='coerce')
+            self._prefetched[('dividends_ttm', ttm_valuation_date)] = div_df
+
+        # 最新报告期与年度报表 (未预取报表时 get_raw_financial_data 回退为单独查询)
+        self._prefetched[('latest_report_end_date', years)] = self._normalize_report_date(bundle.get('latest_report_end_date'))
+        if include_statements:
+            raw_data = {key: _statement_frame(bundle.get(key) or []) for key in ['balance_sheet', 'income_statement', 'cash_flow']}
+            self._prefetched[('raw_financial_data', years)] = raw_data
+
+        print(f"Prefetched valuation data for {self.ts_code} in a single round trip.")
+        return True
@@ -8,6 +8,8 @@ from decimal import Decimal, InvalidOperation # Import Decimal and InvalidOperat
 
 # 假设 NwcCalculator 类在 nwc_calculator.py 中定义
 from nwc_calculator import NwcCalculator
+import statement_columns
+from statement_panel import StatementPanel
 
 class DataProcessor:
     """
@@ -17,7 +19,8 @@ class DataProcessor:
                  input_data: Dict[str, pd.DataFrame], 
                  latest_pe_pb: Optional[Dict[str, Any]] = None,
                  ttm_dividends_df: Optional[pd.DataFrame] = None, # 新增 TTM 股息数据
-                 latest_price: Optional[float] = None): # 新增最新价格
+                 latest_price: Optional[float] = None, # 新增最新价格
+                 cached_state: Optional[Dict[str, Any]] = None):
         """
         初始化 DataProcessor。
         Args:
@@ -26,27 +29,37 @@ class DataProcessor:
             latest_pe_pb (Optional[Dict[str, Any]]): 包含最新 'pe' 和 'pb' 的字典。
             ttm_dividends_df (Optional[pd.DataFrame]): 包含过去12个月股息数据的DataFrame。
             latest_price (Optional[float]): 最新股价。
+            cached_state (Optional[Dict[str, Any]]): get_cacheable_state() 返回的报表处理结果。
+                提供时跳过报表的提取、清洗和历史比率计算，input_data 只需包含 'stock_basic'；
+                PE/PB 和股息率仍按本次传入的行情数据计算。
         """
         self.input_data = input_data
         self.input_latest_pe_pb = latest_pe_pb or {} # 存储传入的 PE/PB
         self.ttm_dividends_df = ttm_dividends_df # 存储 TTM 股息数据
         self.latest_price_for_yield = latest_price # 存储最新价格，用于股息率计算
         self.processed_data: Dict[str, pd.DataFrame] = {}
+        self.statement_panel: Optional[StatementPanel] = None # 处理后报表的对齐宽表 (get_statement_panel)
         self.historical_ratios: Dict[str, Any] = {}
         self.latest_metrics: Dict[str, Any] = {}
         self.basic_info: Dict[str, Any] = {}
         self.latest_balance_sheet: Optional[pd.Series] = None
         self.base_financial_statement_date: Optional[str] = None # 新增属性
         self.warnings: List[str] = []
+        self.statement_warnings: List[str] = [] # 报表处理阶段产生的警告 (随报表结果一起缓存)
 
-        self._process_input_data()
-        self.clean_data()
-        self.calculate_historical_ratios_and_turnovers() # 初始化时即计算
+        self._process_basic_info_and_market_metrics()
+        statement_warnings_start = len(self.warnings)
+        if cached_state is not None:
+            self._restore_statement_state(cached_state)
+        else:
+            self._process_input_data()
+            self.clean_data()
+            self.calculate_historical_ratios_and_turnovers() # 初始化时即计算
+        self.statement_warnings = self.warnings[statement_warnings_start:]
         self._calculate_and_store_ttm_dividend_yield() # 初始化时计算股息率
 
-    def _process_input_data(self):
-        """提取非时间序列信息和最新数据点。"""
-        print("Processing input data...")
+    def _process_basic_info_and_market_metrics(self):
+        """处理股票基本信息和传入的最新 PE/PB (与报表无关，每次初始化都重新处理)。"""
         # 处理股票基本信息 (现在 input_data['stock_basic'] 是一个 dict)
         df_basic = self.input_data.get('stock_basic') 
         # 修改检查方式，直接检查字典是否为真 (非 None 且非空)
@@ -97,10 +110,17 @@ class DataProcessor:
              self.warnings.append(warning_msg); print(f"Warning: {warning_msg}")
         else:
              print(f"  Using provided latest PE: {self.latest_metrics['pe']}, PB: {self.latest_metrics['pb']}")
-        
+
+    def _process_input_data(self):
+        """提取报表中的最新数据点，并准备待清洗的时间序列数据。"""
+        print("Processing input data...")
+        # 只保留列清单 (statement_columns.py) 中各消费方需要的报表列，后续提取、清洗和比率计算只处理这些列
+        statements = {table_name: statement_columns.project_statement(self.input_data.get(table_name), table_name)
+                      for table_name in statement_columns.STATEMENT_TABLES}
+
         # 提取最近年报的 diluted_eps
         self.latest_metrics['latest_annual_diluted_eps'] = None
-        df_is = self.input_data.get('income_statement')
+        df_is = statements['income_statement']
         if df_is is not None and not df_is.empty and 'end_date' in df_is.columns and 'diluted_eps' in df_is.columns:
             try:
                 df_is_copy = df_is.copy() # 操作副本
@@ -138,7 +158,7 @@ class DataProcessor:
         # df_vm = self.input_data.get('valuation_metrics') ... (旧代码移除)
 
         # 提取最新的资产负债表
-        df_bs = self.input_data.get('balance_sheet')
+        df_bs = statements['balance_sheet']
         if df_bs is not None and not df_bs.empty:
             try:
                  if 'end_date' in df_bs.columns:
@@ -160,8 +180,8 @@ class DataProcessor:
 
         # 准备时间序列数据进行清洗 (创建副本)
         for table_name in ['balance_sheet', 'income_statement', 'cash_flow']:
-            if table_name in self.input_data and self.input_data[table_name] is not None:
-                self.processed_data[table_name] = self.input_data[table_name].copy()
+            if statements.get(table_name) is not None:
+                self.processed_data[table_name] = statements[table_name]
             else:
                  warning_msg = f"输入数据中缺少或为空的时间序列表: '{table_name}'。"
                  self.warnings.append(warning_msg); print(f"Warning: {warning_msg}")
@@ -172,6 +192,33 @@ class DataProcessor:
         """返回处理过程中记录的所有警告信息。"""
         return self.warnings
 
+    def get_cacheable_state(self) -> Dict[str, Any]:
+        """
+        导出与行情无关的报表处理结果 (处理后报表、历史比率、最新资产负债表、基准报表日期、最新年报 EPS 及相应警告)，
+        可通过 cached_state 参数恢复，从而跳过报表的获取和清洗。返回副本，调用方可以安全地长期持有。
+        Returns:
+            Dict[str, Any]: 报表处理结果。
+        """
+        return {
+            'processed_data': {name: df.copy() for name, df in self.processed_data.items()},
+            'historical_ratios': dict(self.historical_ratios),
+            'latest_balance_sheet': self.latest_balance_sheet.copy() if self.latest_balance_sheet is not None else None,
+            'base_financial_statement_date': self.base_financial_statement_date,
+            'latest_annual_diluted_eps': self.latest_metrics.get('latest_annual_diluted_eps'),
+            'warnings': list(self.statement_warnings),
+        }
+
+    def _restore_statement_state(self, cached_state: Dict[str, Any]):
+        """从 get_cacheable_state() 的结果恢复报表处理结果 (复制一份，避免修改缓存中的数据)。"""
+        print("Restoring processed statement data from cache...")
+        self.processed_data = {name: df.copy() for name, df in cached_state.get('processed_data', {}).items()}
+        self.historical_ratios = dict(cached_state.get('historical_ratios', {}))
+        latest_bs = cached_state.get('latest_balance_sheet')
+        self.latest_balance_sheet = latest_bs.copy() if latest_bs is not None else None
+        self.base_financial_statement_date = cached_state.get('base_financial_statement_date')
+        self.latest_metrics['latest_annual_diluted_eps'] = cached_state.get('latest_annual_diluted_eps')
+        self.warnings.extend(cached_state.get('warnings', []))
+
     def clean_data(self):
         """
         强化历史时间序列数据的清洗逻辑。
@@ -201,71 +248,86 @@ class DataProcessor:
                  warning_msg = f"表 '{table_name}' 缺少 'end_date' 列，无法按时间排序。"; self.warnings.append(warning_msg); print(f"Warning: {warning_msg}")
 
             numeric_cols = df_to_clean.select_dtypes(include=np.number).columns
-            for col in numeric_cols:
-                if col not in df_to_clean.columns: continue
-                # print(f"  Processing column: {col}") # 减少打印
-
-                # 1. 异常值处理 (替换为 NaN)
-                if df_to_clean[col].notna().sum() >= 4:
-                    q1 = df_to_clean[col].quantile(0.25)
-                    q3 = df_to_clean[col].quantile(0.75)
-                    iqr = q3 - q1
-                    if iqr > 1e-9:
-                        lower_bound = q1 - 1.5 * iqr
-                        upper_bound = q3 + 1.5 * iqr
-                        outliers_mask = (df_to_clean[col] < lower_bound) | (df_to_clean[col] > upper_bound)
-                        num_outliers = outliers_mask.sum()
-                        if num_outliers > 0:
-                            outlier_indices = df_to_clean.index[outliers_mask].tolist()
-                            outlier_dates = df_to_clean.loc[outliers_mask, 'end_date'].dt.strftime('%Y-%m-%d').tolist() if 'end_date' in df_to_clean.columns else ['N/A'] * num_outliers
-                            outlier_values = [round(v, 2) if pd.notna(v) else v for v in df_to_clean.loc[outliers_mask, col].tolist()]
-                            warning_msg_outlier = f"在表 '{table_name}' 的列 '{col}' 中检测到 {num_outliers} 个潜在异常值 (日期: {outlier_dates}, 值: {outlier_values})。已替换为 NaN 进行后续处理。"
-                            self.warnings.append(warning_msg_outlier); print(f"    警告: {warning_msg_outlier}")
-                            df_to_clean.loc[outliers_mask, col] = np.nan
-
-                # 2. 缺失值处理 (NaN)
-                if df_to_clean[col].isnull().any():
-                    # print(f"    处理 {col} 中的 NaN 值") # 减少打印
-                    original_nan_count = df_to_clean[col].isnull().sum()
-                    nan_indices_before = df_to_clean.index[df_to_clean[col].isnull()].tolist()
-                    nan_dates_before = df_to_clean.loc[nan_indices_before, 'end_date'].dt.strftime('%Y-%m-%d').tolist() if 'end_date' in df_to_clean.columns else ['N/A'] * original_nan_count
-
-                    # 策略1: 线性插值
-                    interpolated_count = 0
-                    if table_name in key_financial_items and col in key_financial_items.get(table_name, []) and df_to_clean[col].notna().sum() >= 2:
-                        try:
-                            interpolated_values = df_to_clean[col].interpolate(method='linear', limit_direction='both', limit_area='inside')
-                            df_to_clean[col] = interpolated_values
-                            interpolated_count = original_nan_count - df_to_clean[col].isnull().sum()
-                            # if interpolated_count > 0: print(f"      对 {col} 应用了线性插值，填充了 {interpolated_count} 个 NaN。") # 减少打印
-                        except Exception as e: print(f"      对 {col} 进行插值时出错: {e}")
-
-                    # 策略2: 前向/后向填充
-                    ffill_count = 0; bfill_count = 0
-                    if df_to_clean[col].isnull().any():
-                        filled_ffill = df_to_clean[col].ffill()
-                        ffill_count = df_to_clean[col].isnull().sum() - filled_ffill.isnull().sum()
-                        if ffill_count > 0: df_to_clean[col] = filled_ffill; # print(f"      对 {col} 应用了前向填充，填充了 {ffill_count} 个 NaN。") # 减少打印
-                        
-                        filled_bfill = df_to_clean[col].bfill()
-                        bfill_count = df_to_clean[col].isnull().sum() - filled_bfill.isnull().sum()
-                        if bfill_count > 0: df_to_clean[col] = filled_bfill; # print(f"      对 {col} 应用了后向填充，填充了 {bfill_count} 个 NaN。") # 减少打印
-
-                    # 策略3: 用 0 填充剩余 NaN 并记录警告
-                    if df_to_clean[col].isnull().any():
-                        remaining_nan_count = df_to_clean[col].isnull().sum()
-                        nan_indices_after = df_to_clean.index[df_to_clean[col].isnull()].tolist()
-                        nan_dates_after = df_to_clean.loc[nan_indices_after, 'end_date'].dt.strftime('%Y-%m-%d').tolist() if 'end_date' in df_to_clean.columns else ['N/A'] * remaining_nan_count
-                        warning_msg_fill_zero = f"在表 '{table_name}' 的列 '{col}' 中，有 {remaining_nan_count} 个 NaN 值（日期: {nan_dates_after}）在插值和填充后仍然存在，已用 0 填充。请注意这可能影响计算结果。"
-                        self.warnings.append(warning_msg_fill_zero); print(f"      警告: {warning_msg_fill_zero}")
-                        df_to_clean[col] = df_to_clean[col].fillna(0)
+            if len(numeric_cols) > 0:
+                self._clean_numeric_columns(table_name, df_to_clean, numeric_cols, key_financial_items.get(table_name, []))
             
             self.processed_data[table_name] = df_to_clean 
 
         print("数据清洗完成。")
 
+    def _clean_numeric_columns(self, table_name: str, df_to_clean: pd.DataFrame, numeric_cols: pd.Index, interpolate_cols: List[str]):
+        """
+        按列批量清洗数值列 (结果与逐列处理相同)：
+        1. 异常值：一次 quantile 计算所有列的 Q1/Q3，非空值不少于 4 个且 IQR > 1e-9 的列中超出 1.5 倍 IQR 的值替换为 NaN；
+        2. 缺失值：关键项目线性插值 (仅内部缺口)，然后整体前向/后向填充，仍为空的值用 0 填充。
+        只有实际发生变化的列会写回 df_to_clean 并生成警告 (警告顺序与列顺序一致)。
+        """
+        block = df_to_clean[numeric_cols].astype('float64')
+        values = block.to_numpy(copy=True)
+
+        # 1. 异常值处理 (替换为 NaN)
+        valid_counts = np.count_nonzero(~np.isnan(values), axis=0)
+        quartiles = block.quantile([0.25, 0.75]).to_numpy()
+        q1, q3 = quartiles[0], quartiles[1]
+        iqr = q3 - q1
+        eligible = (valid_counts >= 4) & (iqr > 1e-9)
+        with np.errstate(invalid='ignore'):
+            outliers = ((values < q1 - 1.5 * iqr) | (values > q3 + 1.5 * iqr)) & eligible
+        values[outliers] = np.nan
+
+        # 2. 缺失值处理 (NaN)
+        missing_before = np.isnan(values)
+        has_missing = missing_before.any(axis=0)
+        if has_missing.any():
+            cleaned = pd.DataFrame(values, index=block.index, columns=numeric_cols)
+            # 策略1: 关键项目线性插值 (少于 2 个有效值时不会有内部缺口，结果不变)
+            key_cols = [col for col in numeric_cols[has_missing] if col in interpolate_cols]
+            if key_cols:
+                try:
+                    cleaned[key_cols] = cleaned[key_cols].interpolate(method='linear', limit_direction='both', limit_area='inside')
+                except Exception as e: print(f"      对 {key_cols} 进行插值时出错: {e}")
+            # 策略2: 前向/后向填充
+            cleaned = cleaned.ffill().bfill()
+            values = cleaned.to_numpy(copy=True)
+        remaining_missing = np.isnan(values)
+        # 策略3: 用 0 填充剩余 NaN (下面记录警告)
+        values[remaining_missing] = 0.0
+
+        changed = outliers.any(axis=0) | has_missing
+        if not changed.any():
+            return
+
+        has_end_date = 'end_date' in df_to_clean.columns
+
+        def row_dates(row_mask: np.ndarray) -> List[str]:
+            if not has_end_date:
+                return ['N/A'] * int(row_mask.sum())
+            return df_to_clean.loc[row_mask, 'end_date'].dt.strftime('%Y-%m-%d').tolist()
+
+        for position in np.flatnonzero(changed):
+            col = numeric_cols[position]
+            outliers_mask = outliers[:, position]
+            num_outliers = int(outliers_mask.sum())
+            if num_outliers > 0:
+                outlier_dates = row_dates(outliers_mask)
+                outlier_values = [round(v, 2) if pd.notna(v) else v for v in df_to_clean.loc[outliers_mask, col].tolist()]
+                warning_msg_outlier = f"在表 '{table_name}' 的列 '{col}' 中检测到 {num_outliers} 个潜在异常值 (日期: {outlier_dates}, 值: {outlier_values})。已替换为 NaN 进行后续处理。"
+                self.warnings.append(warning_msg_outlier); print(f"    警告: {warning_msg_outlier}")
+            remaining_mask = remaining_missing[:, position]
+            remaining_nan_count = int(remaining_mask.sum())
+            if remaining_nan_count > 0:
+                nan_dates_after = row_dates(remaining_mask)
+                warning_msg_fill_zero = f"在表 '{table_name}' 的列 '{col}' 中，有 {remaining_nan_count} 个 NaN 值（日期: {nan_dates_after}）在插值和填充后仍然存在，已用 0 填充。请注意这可能影响计算结果。"
+                self.warnings.append(warning_msg_fill_zero); print(f"      警告: {warning_msg_fill_zero}")
+
+        changed_cols = numeric_cols[changed]
+        df_to_clean[changed_cols] = pd.DataFrame(values[:, changed], index=df_to_clean.index, columns=changed_cols)
+
     def _calculate_median_ratio_or_days(self, series1: pd.Series, series2: pd.Series, days_in_year=360) -> Optional[Decimal]: # Use imported Decimal
-        """计算两个 Series 比率或周转天数的中位数，忽略无效值，返回 Decimal 类型。"""
+        """
+        计算两个 Series 比率或周转天数的中位数，忽略无效值，返回 Decimal 类型。
+        逐元素 Decimal 实现：作为 _calculate_median_ratios (float64) 的参考实现，并处理无法转换为 float64 的输入。
+        """
         # from decimal import Decimal, InvalidOperation # No longer needed here as it's imported at the top
         try:
             # 确保输入 Series 中的数据是数值类型，并尝试转换为 Decimal
@@ -333,6 +395,97 @@ class DataProcessor:
             self.warnings.append(warning_msg); print(f"Warning: {warning_msg}")
             return None
 
+    @staticmethod
+    def _aligned_float_pair(series1: pd.Series, series2: pd.Series) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        把分子、分母转换为 float64 并按索引内连接对齐 (与 _calculate_median_ratio_or_days 的对齐方式相同)。
+        Raises:
+            ValueError: 含无法转换为数值的值或无穷值。
+        """
+        s1_aligned, s2_aligned = pd.to_numeric(series1).astype('float64').align(
+            pd.to_numeric(series2).astype('float64'), join='inner')
+        numerators = s1_aligned.to_numpy(dtype='float64')
+        denominators = s2_aligned.to_numpy(dtype='float64')
+        if np.isinf(numerators).any() or np.isinf(denominators).any():
+            raise ValueError("包含无穷值")
+        return numerators, denominators
+
+    def _calculate_median_ratios(self, ratio_inputs: Dict[str, Tuple[pd.Series, pd.Series, Optional[int]]]) -> Dict[str, Optional[Decimal]]:
+        """
+        用 float64 一次计算多个比率/周转天数的中位数，规则与 _calculate_median_ratio_or_days 相同：
+        按索引内连接对齐，分母为零或负值的期间剔除，周转天数只保留 [0, days_in_year * 10) 内的值。
+        每个比率对齐后的分子、分母作为一列放入 (期数 x 比率数) 矩阵，除法、过滤和中位数在矩阵上一次完成，
+        只有最终的中位数转换为 Decimal；警告按 ratio_inputs 的顺序添加，内容与逐个调用 Decimal 实现相同。
+        无法转换为 float64 (非数值或无穷值) 的比率回退到 _calculate_median_ratio_or_days。
+        Args:
+            ratio_inputs (Dict): 比率名 -> (分子, 分母, days_in_year)，days_in_year 为 None 时计算比率。
+        Returns:
+            Dict[str, Optional[Decimal]]: 比率名 -> 中位数 (无法计算时为 None)。
+        """
+        aligned = {}
+        for name, (series1, series2, _) in ratio_inputs.items():
+            try:
+                aligned[name] = self._aligned_float_pair(series1, series2)
+            except (TypeError, ValueError):
+                pass # 由 Decimal 实现计算并给出相应的警告
+
+        names = list(aligned)
+        column_of = {name: j for j, name in enumerate(names)}
+        period_count = max((len(numerators) for numerators, _ in aligned.values()), default=0)
+        numerators = np.full((period_count, len(names)), np.nan)
+        denominators = np.full((period_count, len(names)), np.nan)
+        for j, name in enumerate(names):
+            column_numerators, column_denominators = aligned[name]
+            numerators[:len(column_numerators), j] = column_numerators
+            denominators[:len(column_denominators), j] = column_denominators
+        days = np.array([ratio_inputs[name][2] if ratio_inputs[name][2] else np.nan for name in names], dtype='float64')
+        is_days = ~np.isnan(days)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            has_nonpositive = (denominators <= 0).any(axis=0)
+            valid = ~np.isnan(numerators) & (denominators > 0)
+            values = np.where(valid, numerators * np.where(is_days, days, 1.0) / denominators, np.nan)
+            kept = valid & (~is_days | ((values >= 0) & (values < days * 10)))
+            values[~kept] = np.nan
+            kept_counts = kept.sum(axis=0)
+            medians = np.full(len(names), np.nan)
+            if period_count:
+                ordered = np.sort(values, axis=0) # NaN 排在最后
+                columns = np.arange(len(names))
+                lower = ordered[np.maximum((kept_counts - 1) // 2, 0), columns]
+                upper = ordered[kept_counts // 2, columns]
+                medians = (lower + upper) / 2
+
+        results = {}
+        for name, (series1, series2, days_in_year) in ratio_inputs.items():
+            if name not in column_of:
+                results[name] = self._calculate_median_ratio_or_days(series1, series2, days_in_year=days_in_year)
+                continue
+            j = column_of[name]
+            if has_nonpositive[j]:
+                warning_msg_nonpos = f"计算比率/天数时 ({series1.name}/{series2.name})，分母包含零或负值。"
+                if warning_msg_nonpos not in self.warnings:
+                    self.warnings.append(warning_msg_nonpos)
+            if not valid[:, j].any():
+                s1_name = series1.name if series1.name else 'series1'
+                s2_name = series2.name if series2.name else 'series2'
+                diag_info = [
+                    f"{s1_name} 有效点: {(~np.isnan(numerators[:, j])).sum()}",
+                    f"{s2_name} 有效点: {(~np.isnan(denominators[:, j])).sum()}",
+                    f"{s2_name} >0 点: {(denominators[:, j] > 0).sum()}",
+                    f"对齐长度: {len(aligned[name][0])}",
+                ]
+                warning_msg = f"无法计算历史中位数 ({s1_name}/{s2_name})：缺少有效配对数据。诊断: [{'; '.join(diag_info)}]. 将使用默认值进行预测。"
+                if warning_msg not in self.warnings:
+                    self.warnings.append(warning_msg)
+                results[name] = None
+            elif kept_counts[j] == 0:
+                self.warnings.append(f"计算周转天数时 ({series1.name}/{series2.name})，所有有效值均被过滤。")
+                results[name] = None
+            else:
+                results[name] = Decimal(str(float(medians[j])))
+        return results
+
     def calculate_historical_ratios_and_turnovers(self) -> Dict[str, Any]:
         """
         精确计算历史财务比率和周转天数的中位数。
@@ -349,27 +502,27 @@ class DataProcessor:
             warning_msg = "缺少必要的财务报表数据，无法计算历史比率。"; self.warnings.append(warning_msg); print(f"Error: {warning_msg}")
             return self.historical_ratios
 
-        # 在设置索引前，去除基于 end_date 的重复项，保留最后一条记录
-        # 这可以防止 "ValueError: cannot reindex on an axis with duplicate labels"
-        if 'end_date' in is_df_orig.columns:
-            is_df_orig = is_df_orig.drop_duplicates(subset=['end_date'], keep='last')
-        if 'end_date' in cf_df_orig.columns:
-            cf_df_orig = cf_df_orig.drop_duplicates(subset=['end_date'], keep='last')
-        if 'end_date' in bs_df_orig.columns:
-            bs_df_orig = bs_df_orig.drop_duplicates(subset=['end_date'], keep='last')
-
-        # 确保DataFrame使用end_date作为索引并排序
+        # 三张报表按 end_date 对齐为一个宽表 (同一报告期保留最后一条记录)，以下各项计算都从宽表中取所需字段
         try:
-            is_df = is_df_orig.set_index('end_date').sort_index() if 'end_date' in is_df_orig.columns and not is_df_orig.index.name == 'end_date' else is_df_orig.sort_index()
-            cf_df = cf_df_orig.set_index('end_date').sort_index() if 'end_date' in cf_df_orig.columns and not cf_df_orig.index.name == 'end_date' else cf_df_orig.sort_index()
-            bs_df = bs_df_orig.set_index('end_date').sort_index() if 'end_date' in bs_df_orig.columns and not bs_df_orig.index.name == 'end_date' else bs_df_orig.sort_index()
+            panel = StatementPanel(self.processed_data)
+            missing_tables = [table for table in statement_columns.STATEMENT_TABLES if not panel.has_table(table)]
+            if missing_tables:
+                raise ValueError(f"报表缺少 'end_date': {', '.join(missing_tables)}")
+            self.statement_panel = panel
+            is_df = panel.table('income_statement')
+            bs_df = panel.table('balance_sheet')
         except Exception as e:
             warning_msg = f"设置日期索引时出错: {e}"; self.warnings.append(warning_msg); print(f"Error: {warning_msg}")
             return self.historical_ratios
 
+        # 比率名 -> (分子, 分母, days_in_year)，NWC 计算之后统一由 _calculate_median_ratios 计算中位数
+        ratio_inputs: Dict[str, Tuple[pd.Series, pd.Series, Optional[int]]] = {}
+        def add_median_ratio(name: str, series1: pd.Series, series2: pd.Series, days_in_year: Optional[int] = None):
+            self.historical_ratios[name] = None  # 占位，保持比率的输出顺序
+            ratio_inputs[name] = (series1, series2, days_in_year)
 
         # --- 利润表相关比率 ---
-        self.historical_ratios['cogs_to_revenue_ratio'] = self._calculate_median_ratio_or_days(
+        add_median_ratio('cogs_to_revenue_ratio',
             is_df.get('oper_cost', pd.Series(dtype='float64')), is_df.get('total_revenue', pd.Series(dtype='float64')), days_in_year=None
         )
         
@@ -379,14 +532,14 @@ class DataProcessor:
         if isinstance(sga_rd_exp, (int, float)) and sga_rd_exp == 0 and not any(c in is_df for c in ['sell_exp', 'admin_exp', 'rd_exp']):
              self.historical_ratios['sga_rd_to_revenue_ratio'] = 0.0
         else:
-             self.historical_ratios['sga_rd_to_revenue_ratio'] = self._calculate_median_ratio_or_days(
+             add_median_ratio('sga_rd_to_revenue_ratio',
                  sga_rd_exp, is_df.get('total_revenue', pd.Series()), days_in_year=None
              )
         
         # 计算营业利润率中位数 (需要 EBIT 或 Operating Profit)
         op_profit_col = 'operate_profit' if 'operate_profit' in is_df.columns else 'ebit' # 优先使用 operate_profit
         if op_profit_col in is_df.columns:
-             self.historical_ratios['operating_margin_median'] = self._calculate_median_ratio_or_days(
+             add_median_ratio('operating_margin_median',
                  is_df[op_profit_col], is_df.get('total_revenue', pd.Series()), days_in_year=None
              )
         else:
@@ -396,21 +549,15 @@ class DataProcessor:
 
         # --- D&A 和 Capex 相关比率 ---
         da_cols = ['depr_fa_coga_dpba', 'amort_intang_assets'] #移除了 'use_right_asset_dep'
-        existing_da_cols = [col for col in da_cols if col in cf_df.columns] # cf_df 现在有日期索引
-        
-        total_da_series = pd.Series(dtype=object) # 初始化为空的Series
-        if not is_df.empty: # 确保is_df不为空，从而is_df.index有效
-            total_da_series = pd.Series(Decimal('0.0'), index=is_df.index, dtype=object).rename('total_da') # 使用Decimal和object
-
+        cf_columns = panel.columns('cash_flow')
+        existing_da_cols = [col for col in da_cols if col in cf_columns]
 
         if existing_da_cols:
-             # cf_df 已经设置了 end_date 为索引
-             cf_da_sum = cf_df[existing_da_cols].sum(axis=1, skipna=True)
-             # 使用 update 或者 reindex + fillna 来合并，确保索引对齐
-             total_da_series.update(cf_da_sum) 
-             total_da_series = total_da_series.fillna(Decimal('0.0')).infer_objects(copy=False) # 确保更新后没有NaN, 填充Decimal
+             # 利润表的报告期上加总 D&A 分项，现金流量表缺失的年份为 0
+             total_da_series = panel.select({'cash_flow': existing_da_cols}, rows=['income_statement']).sum(axis=1, skipna=True).rename('total_da')
         else:
-             # 如果现金流量表中没有D&A列，total_da_series将保持为全Decimal('0.0') (基于is_df的索引)
+             # 如果现金流量表中没有D&A列，total_da_series为全 0 (基于利润表的报告期)
+             total_da_series = pd.Series(0.0, index=is_df.index, name='total_da')
              warning_msg = "现金流量表中缺少计算总折旧摊销所需的关键字段（如 depr_fa_coga_dpba, amort_intang_assets）。";
              if warning_msg not in self.warnings: self.warnings.append(warning_msg)
              print(f"Warning: {warning_msg}")
@@ -436,23 +583,18 @@ class DataProcessor:
             print(da_to_revenue_warning_specific)
             self.historical_ratios['da_to_revenue_ratio'] = None 
         else:
-            self.historical_ratios['da_to_revenue_ratio'] = self._calculate_median_ratio_or_days(
+            add_median_ratio('da_to_revenue_ratio',
                 total_da_series, total_revenue_series, days_in_year=None
             )
-            # _calculate_median_ratio_or_days 内部已有 "缺少有效配对数据" 的警告
-            # 如果到这里 self.historical_ratios['da_to_revenue_ratio'] 仍然是 None，
+            # 中位数计算 (_calculate_median_ratios) 内部已有 "缺少有效配对数据" 的警告
+            # 如果最终 self.historical_ratios['da_to_revenue_ratio'] 仍然是 None，
             # 且没有触发上面的 specific warning，则说明是配对问题。
-            # 该情况下的通用警告已在 _calculate_median_ratio_or_days 中处理。
-
-        if 'c_pay_acq_const_fiolta' in cf_df.columns and 'total_revenue' in is_df.columns:
-            cf_indexed = cf_df.set_index('end_date') if 'end_date' in cf_df.columns else cf_df
-            is_indexed = is_df.set_index('end_date') if 'end_date' in is_df.columns else is_df
-            capex_series = cf_indexed['c_pay_acq_const_fiolta'].abs()
-            is_df_merged_capex = is_indexed.join(capex_series.rename('capex_abs'), how='left')
-            capex_abs_aligned = is_df_merged_capex['capex_abs'].fillna(0)
-            total_revenue_aligned = is_df_merged_capex.get('total_revenue', pd.Series())
-            self.historical_ratios['capex_to_revenue_ratio'] = self._calculate_median_ratio_or_days(
-                capex_abs_aligned, total_revenue_aligned, days_in_year=None
+
+        if 'c_pay_acq_const_fiolta' in cf_columns and 'total_revenue' in is_df.columns:
+            # 利润表的报告期上取 Capex (现金流量表缺失的年份为 0)
+            capex_abs_aligned = panel.select({'cash_flow': ['c_pay_acq_const_fiolta']}, rows=['income_statement'])['c_pay_acq_const_fiolta'].abs().fillna(0).rename('capex_abs')
+            add_median_ratio('capex_to_revenue_ratio',
+                capex_abs_aligned, is_df['total_revenue'], days_in_year=None
             )
         else:
             warning_msg = "缺少 Capex 或收入数据，无法计算 Capex/收入比率。"; self.warnings.append(warning_msg); print(f"Warning: {warning_msg}")
@@ -460,51 +602,45 @@ class DataProcessor:
 
         # --- 周转天数 (使用中位数) ---
         if 'accounts_receiv_bill' in bs_df.columns and 'revenue' in is_df.columns:
-             # bs_df 和 is_df 已经以 end_date 为索引
-             bs_merged_ar = pd.merge(bs_df[['accounts_receiv_bill']], is_df[['revenue']], left_index=True, right_index=True, how='inner')
-             self.historical_ratios['accounts_receivable_days'] = self._calculate_median_ratio_or_days(
+             bs_merged_ar = panel.select({'balance_sheet': ['accounts_receiv_bill'], 'income_statement': ['revenue']})
+             add_median_ratio('accounts_receivable_days',
                  bs_merged_ar['accounts_receiv_bill'], bs_merged_ar['revenue'], days_in_year=360
              )
         else: self.historical_ratios['accounts_receivable_days'] = None
 
         if 'inventories' in bs_df.columns and 'oper_cost' in is_df.columns:
-             # bs_df 和 is_df 已经以 end_date 为索引
-             bs_merged_inv = pd.merge(bs_df[['inventories']], is_df[['oper_cost']], left_index=True, right_index=True, how='inner')
-             self.historical_ratios['inventory_days'] = self._calculate_median_ratio_or_days(
+             bs_merged_inv = panel.select({'balance_sheet': ['inventories'], 'income_statement': ['oper_cost']})
+             add_median_ratio('inventory_days',
                  bs_merged_inv['inventories'], bs_merged_inv['oper_cost'], days_in_year=360
              )
         else: self.historical_ratios['inventory_days'] = None
 
         if 'accounts_pay' in bs_df.columns and 'oper_cost' in is_df.columns:
-             # bs_df 和 is_df 已经以 end_date 为索引
-             bs_merged_ap = pd.merge(bs_df[['accounts_pay']], is_df[['oper_cost']], left_index=True, right_index=True, how='inner')
-             self.historical_ratios['accounts_payable_days'] = self._calculate_median_ratio_or_days(
+             bs_merged_ap = panel.select({'balance_sheet': ['accounts_pay'], 'income_statement': ['oper_cost']})
+             add_median_ratio('accounts_payable_days',
                  bs_merged_ap['accounts_pay'], bs_merged_ap['oper_cost'], days_in_year=360
              )
         else: self.historical_ratios['accounts_payable_days'] = None
              
         # --- 其他 NWC 相关比率 (中位数) ---
         if 'total_revenue' in is_df.columns:
-            # bs_df 和 is_df 已经以 end_date 为索引
-            # bs_df 包含所有需要的列，is_df 只需要 total_revenue
-            bs_merged_nwc_ratios = pd.merge(bs_df, is_df[['total_revenue']], left_index=True, right_index=True, how='inner')
+            other_ca_items = ['prepayment', 'oth_cur_assets']
+            adv_receipts_col = 'contract_liab' if 'contract_liab' in bs_df.columns else 'adv_receipts'
+            other_cl_items_to_sum = [adv_receipts_col, 'payroll_payable', 'taxes_payable', 'oth_payable']
+            existing_oca_items = [item for item in other_ca_items if item in bs_df.columns]
+            existing_ocl_items = [item for item in other_cl_items_to_sum if item in bs_df.columns]
+            bs_merged_nwc_ratios = panel.select({'balance_sheet': existing_oca_items + existing_ocl_items, 'income_statement': ['total_revenue']})
             if not bs_merged_nwc_ratios.empty:
-                 other_ca_items = ['prepayment', 'oth_cur_assets']
-                 existing_oca_items = [item for item in other_ca_items if item in bs_merged_nwc_ratios.columns]
                  if existing_oca_items:
                      bs_merged_nwc_ratios['calc_other_ca'] = bs_merged_nwc_ratios[existing_oca_items].sum(axis=1, skipna=True)
-                     self.historical_ratios['other_current_assets_to_revenue_ratio'] = self._calculate_median_ratio_or_days(
+                     add_median_ratio('other_current_assets_to_revenue_ratio',
                          bs_merged_nwc_ratios['calc_other_ca'], bs_merged_nwc_ratios['total_revenue'], days_in_year=None
                      )
                  else: self.historical_ratios['other_current_assets_to_revenue_ratio'] = None
 
-                 adv_receipts_col = 'contract_liab' if 'contract_liab' in bs_merged_nwc_ratios.columns else 'adv_receipts'
-                 other_cl_items_base = ['payroll_payable', 'taxes_payable', 'oth_payable']
-                 other_cl_items_to_sum = [adv_receipts_col] + other_cl_items_base
-                 existing_ocl_items = [item for item in other_cl_items_to_sum if item in bs_merged_nwc_ratios.columns]
                  if existing_ocl_items:
                      bs_merged_nwc_ratios['calc_other_cl'] = bs_merged_nwc_ratios[existing_ocl_items].sum(axis=1, skipna=True)
-                     self.historical_ratios['other_current_liabilities_to_revenue_ratio'] = self._calculate_median_ratio_or_days(
+                     add_median_ratio('other_current_liabilities_to_revenue_ratio',
                          bs_merged_nwc_ratios['calc_other_cl'], bs_merged_nwc_ratios['total_revenue'], days_in_year=None
                      )
                  else: self.historical_ratios['other_current_liabilities_to_revenue_ratio'] = None
@@ -520,15 +656,19 @@ class DataProcessor:
         nwc_calculator = NwcCalculator()
         historical_bs_with_nwc = nwc_calculator.calculate_historical_nwc_and_delta(bs_df) # bs_df is already cleaned and sorted
         self.processed_data['balance_sheet'] = historical_bs_with_nwc # Update with nwc columns
+        nwc_columns = [col for col in ['nwc', 'delta_nwc'] if col in historical_bs_with_nwc.columns]
+        panel.add_columns('balance_sheet', historical_bs_with_nwc[nwc_columns])
 
         if 'nwc' in historical_bs_with_nwc.columns and 'total_revenue' in is_df.columns:
-             # 假设 historical_bs_with_nwc 和 is_df 都以 end_date 为索引
-             bs_merged_nwc = pd.merge(historical_bs_with_nwc[['nwc']], is_df[['total_revenue']], left_index=True, right_index=True, how='inner')
-             self.historical_ratios['nwc_to_revenue_ratio'] = self._calculate_median_ratio_or_days(
+             bs_merged_nwc = panel.select({'balance_sheet': ['nwc'], 'income_statement': ['total_revenue']})
+             add_median_ratio('nwc_to_revenue_ratio',
                  bs_merged_nwc['nwc'], bs_merged_nwc['total_revenue'], days_in_year=None
              )
         else: self.historical_ratios['nwc_to_revenue_ratio'] = None
 
+        # 一次计算以上所有比率和周转天数的中位数
+        self.historical_ratios.update(self._calculate_median_ratios(ratio_inputs))
+
         if 'nwc' in historical_bs_with_nwc.columns and not historical_bs_with_nwc.empty:
              self.historical_ratios['last_historical_nwc'] = historical_bs_with_nwc['nwc'].iloc[-1]
         else: self.historical_ratios['last_historical_nwc'] = None
@@ -653,36 +793,34 @@ class DataProcessor:
         """获取基准财务报表的日期 (YYYY-MM-DD)。"""
         return self.base_financial_statement_date
 
+    def get_statement_panel(self) -> StatementPanel:
+        """返回处理后三张报表的对齐宽表 (计算历史比率时构建；从缓存恢复时按 processed_data 首次调用时构建)。"""
+        if self.statement_panel is None:
+            self.statement_panel = StatementPanel(self.processed_data)
+        return self.statement_panel
+
     def get_latest_actual_ebitda(self) -> Optional[Decimal]:
         """获取最近一个完整财年的实际EBITDA。"""
-        is_df = self.processed_data.get('income_statement')
-        cf_df = self.processed_data.get('cash_flow')
+        panel = self.get_statement_panel()
 
-        if is_df is None or is_df.empty or cf_df is None or cf_df.empty:
+        if not panel.has_table('income_statement') or not panel.has_table('cash_flow'):
             self.warnings.append("无法获取最新实际EBITDA：缺少利润表或现金流量表数据。")
             return None
 
         try:
-            # 确保已排序且日期已转换 (假设 end_date 是 datetime 对象)
-            is_df_sorted = is_df.sort_values(by='end_date', ascending=False)
-            cf_df_sorted = cf_df.sort_values(by='end_date', ascending=False)
-
-            if is_df_sorted.empty:
-                self.warnings.append("无法获取最新实际EBITDA：排序后的利润表为空。")
-                return None
-                
-            latest_is_report = is_df_sorted.iloc[0]
-            latest_is_date = latest_is_report['end_date']
+            # 宽表已按报告期升序排列，最后一行即最新报告期
+            is_columns = panel.columns('income_statement')
+            ebit_col_name = 'operate_profit' if 'operate_profit' in is_columns else 'ebit'
+            is_ebit = panel.select({'income_statement': [ebit_col_name] if ebit_col_name in is_columns else []})
+            latest_is_date = is_ebit.index[-1]
 
-            ebit_col_name = 'operate_profit' if 'operate_profit' in latest_is_report.index else 'ebit'
-            if ebit_col_name not in latest_is_report.index or pd.isna(latest_is_report[ebit_col_name]):
+            if ebit_col_name not in is_ebit.columns or pd.isna(is_ebit[ebit_col_name].iloc[-1]):
                 # 尝试从第二新的报告中获取 EBIT，以防最新的是季度报告且 EBIT 为空
-                if len(is_df_sorted) > 1:
-                    second_latest_is_report = is_df_sorted.iloc[1]
-                    if ebit_col_name in second_latest_is_report.index and pd.notna(second_latest_is_report[ebit_col_name]):
-                        latest_ebit = Decimal(str(second_latest_is_report[ebit_col_name]))
-                        latest_is_date = second_latest_is_report['end_date'] # 更新基准日期
-                        self.warnings.append(f"最新的利润表报告期 {latest_is_report['end_date'].year} 的 '{ebit_col_name}' 为空, 使用了次新报告期 {latest_is_date.year} 的数据。")
+                if len(is_ebit) > 1:
+                    if ebit_col_name in is_ebit.columns and pd.notna(is_ebit[ebit_col_name].iloc[-2]):
+                        latest_ebit = Decimal(str(is_ebit[ebit_col_name].iloc[-2]))
+                        self.warnings.append(f"最新的利润表报告期 {latest_is_date.year} 的 '{ebit_col_name}' 为空, 使用了次新报告期 {is_ebit.index[-2].year} 的数据。")
+                        latest_is_date = is_ebit.index[-2] # 更新基准日期
                     else:
                         self.warnings.append(f"无法获取最新实际EBITDA：利润表中缺少 '{ebit_col_name}' 或其值为NaN（已尝试两个最新报告期）。")
                         return None
@@ -690,26 +828,23 @@ class DataProcessor:
                     self.warnings.append(f"无法获取最新实际EBITDA：利润表中缺少 '{ebit_col_name}' 或其值为NaN。")
                     return None
             else:
-                latest_ebit = Decimal(str(latest_is_report[ebit_col_name]))
+                latest_ebit = Decimal(str(is_ebit[ebit_col_name].iloc[-1]))
 
 
             da_cols = ['depr_fa_coga_dpba', 'amort_intang_assets', 'use_right_asset_dep'] # 根据实际数据列名调整
-            existing_da_cols = [col for col in da_cols if col in cf_df_sorted.columns]
+            existing_da_cols = [col for col in da_cols if col in panel.columns('cash_flow')]
             latest_da = Decimal('0')
 
             if existing_da_cols:
                 # 查找与更新后的 latest_is_date 同年份的现金流量表记录
-                # 确保 cf_df_sorted['end_date'] 是 datetime 类型
-                if not pd.api.types.is_datetime64_any_dtype(cf_df_sorted['end_date']):
-                    cf_df_sorted['end_date'] = pd.to_datetime(cf_df_sorted['end_date'])
-
-                cf_df_latest_year = cf_df_sorted[cf_df_sorted['end_date'].dt.year == latest_is_date.year]
+                cf_da = panel.select({'cash_flow': existing_da_cols})
+                cf_df_latest_year = cf_da[cf_da.index.year == latest_is_date.year]
                 
                 if not cf_df_latest_year.empty:
                     # 如果一年有多条记录（例如季度），通常年报的 D&A 是累计值，或者需要加总
                     # 简单起见，如果有多条，取最新的那条记录的 D&A 值（假设它是年报或累计值）
                     # 更准确的做法是识别年报，或加总四个季度（如果数据是单季）
-                    latest_cf_for_year = cf_df_latest_year.iloc[0] # 取该年最新的记录
+                    latest_cf_for_year = cf_df_latest_year.iloc[-1] # 取该年最新的记录
                     
                     da_values_for_latest_year = []
                     for col in existing_da_cols:
@@ -0,0 +1,170 @@
+from typing import Optional, Dict, Any, List, Tuple
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from data_fetcher import get_shared_engine
+
+# 估值与选股查询依赖的复合索引。
+# 报表按 (ts_code, end_date) 定位年报；行情/估值指标按 (ts_code, trade_date DESC) 取最新一条；
+# 股息按 (ts_code, ann_date) 取 TTM 区间内的公告。
+REQUIRED_INDEXES: List[Dict[str, Any]] = [
+    {'table': 'balance_sheet', 'columns': ['ts_code', 'end_date']},
+    {'table': 'income_statement', 'columns': ['ts_code', 'end_date']},
+    {'table': 'cash_flow', 'columns': ['ts_code', 'end_date']},
+    {'table': 'financial_indicators', 'columns': ['ts_code', 'end_date']},
+    {'table': 'valuation_metrics', 'columns': ['ts_code', 'trade_date DESC']},
+    {'table': 'daily_quotes', 'columns': ['ts_code', 'trade_date DESC']},
+    {'table': 'dividend', 'columns': ['ts_code', 'ann_date']},
+]
+
+# 每个索引的键列 (不含 INCLUDE 列) 逐列由 pg_get_indexdef 还原；INVALID / 未就绪的索引 (例如 CONCURRENTLY 建索引失败留下的)
+# 和部分索引 (带 WHERE 条件) 不能服务一般查询，不计为已满足。
+_INDEX_QUERY = text(
+    "SELECT t.relname, i.relname, ix.indisvalid AND ix.indisready AND ix.indpred IS NULL, "
+    "       ARRAY(SELECT pg_get_indexdef(ix.indexrelid, k, true) "
+    "             FROM generate_series(1, ix.indnkeyatts) AS k ORDER BY k) "
+    "FROM pg_index ix "
+    "JOIN pg_class i ON i.oid = ix.indexrelid "
+    "JOIN pg_class t ON t.oid = ix.indrelid "
+    "JOIN pg_namespace n ON n.oid = t.relnamespace "
+    "WHERE n.nspname = current_schema() AND t.relname = ANY(:tables)"
+)
+
+def _column_name(column_spec: str) -> str:
+    """'trade_date DESC' -> 'trade_date'"""
+    return column_spec.split()[0].strip('"').lower()
+
+def index_name(spec: Dict[str, Any]) -> str:
+    """生成索引名，例如 idx_valuation_metrics_ts_code_trade_date_desc。"""
+    parts = [col.lower().replace(' ', '_') for col in spec['columns']]
+    return f"idx_{spec['table']}_{'_'.join(parts)}"
+
+def drop_index_sql(spec: Dict[str, Any], concurrently: bool = True) -> str:
+    """生成删除 index_name(spec) 的 DROP INDEX 语句 (用于清理建索引失败留下的 INVALID 索引)。"""
+    concurrently_str = "CONCURRENTLY " if concurrently else ""
+    return f"DROP INDEX {concurrently_str}IF EXISTS {index_name(spec)}"
+
+def create_index_sql(spec: Dict[str, Any], concurrently: bool = True) -> str:
+    """生成 CREATE INDEX 语句。CONCURRENTLY 建索引时不锁写入，适合在线上的历史表上执行。"""
+    concurrently_str = "CONCURRENTLY " if concurrently else ""
+    return (f"CREATE INDEX {concurrently_str}IF NOT EXISTS {index_name(spec)} "
+            f"ON {spec['table']} ({', '.join(spec['columns'])})")
+
+def _is_covered(spec: Dict[str, Any], existing_indexes: List[List[str]]) -> bool:
+    """
+    已有索引的前导列与所需列一致即视为满足 (包括主键/唯一约束索引)。
+    B-tree 索引可反向扫描，(ts_code, trade_date) 同样能服务 ORDER BY trade_date DESC LIMIT 1。
+    """
+    required = [_column_name(col) for col in spec['columns']]
+    return any(columns[:len(required)] == required for columns in existing_indexes)
+
+def _inspect_indexes(engine: Engine, specs: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """
+    查询所需索引的状态。
+    Returns:
+        Tuple[List[Dict[str, Any]], List[str]]: (缺失的索引定义, 按 index_name() 命名但不可用的索引名)。
+    """
+    tables = sorted({spec['table'] for spec in specs})
+    with engine.connect() as conn:
+        existing_tables = {
+            row[0] for row in conn.execute(
+                text("SELECT table_name FROM information_schema.tables "
+                     "WHERE table_schema = current_schema() AND table_name = ANY(:tables)"),
+                {'tables': tables}
+            )
+        }
+        indexes_by_table: Dict[str, List[List[str]]] = {}
+        unusable_names = set()
+        for table_name, name, usable, columns in conn.execute(_INDEX_QUERY, {'tables': tables}):
+            if usable:
+                indexes_by_table.setdefault(table_name, []).append([_column_name(col) for col in columns or []])
+            else:
+                unusable_names.add(name)
+
+    missing = []
+    for spec in specs:
+        if spec['table'] not in existing_tables:
+            print(f"索引检查：表 {spec['table']} 不存在，跳过。")
+            continue
+        if not _is_covered(spec, indexes_by_table.get(spec['table'], [])):
+            missing.append(spec)
+    return missing, [index_name(spec) for spec in missing if index_name(spec) in unusable_names]
+
+def find_missing_indexes(engine: Optional[Engine] = None,
+                         specs: Optional[List[Dict[str, Any]]] = None) -> List[Dict[str, Any]]:
+    """
+    检查所需的复合索引是否存在且可用 (INVALID、未就绪的索引和部分索引不计)。
+    Args:
+        engine (Optional[Engine]): 数据库引擎，默认使用共享引擎。
+        specs (Optional[List[Dict[str, Any]]]): 需要检查的索引定义，默认 REQUIRED_INDEXES。
+
+    Returns:
+        List[Dict[str, Any]]: 缺失的索引定义。数据库中不存在的表会被跳过。
+    """
+    engine = engine or get_shared_engine()
+    specs = specs if specs is not None else REQUIRED_INDEXES
+    return _inspect_indexes(engine, specs)[0]
+
+def ensure_indexes(engine: Optional[Engine] = None,
+                   specs: Optional[List[Dict[str, Any]]] = None,
+                   concurrently: bool = True) -> List[str]:
+    """
+    创建缺失的复合索引并重新校验。
+    CREATE INDEX CONCURRENTLY 不能在事务中执行，因此使用 AUTOCOMMIT 连接。
+    Args:
+        engine (Optional[Engine]): 数据库引擎，默认使用共享引擎。
+        specs (Optional[List[Dict[str, Any]]]): 索引定义，默认 REQUIRED_INDEXES。
+        concurrently (bool): 是否使用 CONCURRENTLY 方式建索引。
+
+    Returns:
+        List[str]: 本次创建并校验通过的索引名。
+    """
+    engine = engine or get_shared_engine()
+    specs = specs if specs is not None else REQUIRED_INDEXES
+    missing, invalid_names = _inspect_indexes(engine, specs)
+    if not missing:
+        return []
+
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        for spec in missing:
+            try:
+                # 之前失败留下的同名 INVALID 索引会让 IF NOT EXISTS 跳过创建，先删除
+                if index_name(spec) in invalid_names:
+                    statement = drop_index_sql(spec, concurrently=concurrently)
+                    print(f"正在删除不可用的索引: {statement}")
+                    conn.execute(text(statement))
+                statement = create_index_sql(spec, concurrently=concurrently)
+                print(f"正在创建索引: {statement}")
+                conn.execute(text(statement))
+            except Exception as e:
+                print(f"创建索引 {index_name(spec)} 失败: {e}")
+
+    still_missing, still_invalid = _inspect_indexes(engine, missing)
+    still_missing_names = {index_name(spec) for spec in still_missing}
+    for name in sorted(still_missing_names):
+        if name in still_invalid:
+            print(f"警告：索引 {name} 创建后处于 INVALID 状态 (CONCURRENTLY 建索引失败)，下次执行时会删除后重建。")
+        else:
+            print(f"警告：索引 {name} 创建后校验仍未通过。")
+    return [index_name(spec) for spec in missing if index_name(spec) not in still_missing_names]
+
+def report_missing_indexes(engine: Optional[Engine] = None) -> List[str]:
+    """
+    返回缺失索引对应的 CREATE INDEX 语句，供启动时记录日志或由运维手动执行。
+    Returns:
+        List[str]: CREATE INDEX 语句列表，全部存在时为空列表。
+    """
+    return [create_index_sql(spec) for spec in find_missing_indexes(engine)]
+
+if __name__ == '__main__':
+    import sys
+    if '--create' in sys.argv:
+        created = ensure_indexes()
+        print(f"已创建索引: {created if created else '无'}")
+    else:
+        statements = report_missing_indexes()
+        if statements:
+            print("缺失以下索引 (使用 --create 参数自动创建)：")
+            for statement in statements:
+                print(f"  {statement};")
+        else:
+            print("所需索引均已存在。")
@@ -0,0 +1,226 @@
+import numpy as np
+import pandas as pd
+from typing import Optional, Dict, Any, Union
+
+ArrayLike = Union[float, np.ndarray]
+
+class DcfGridCalculator:
+    """
+    基于同一份财务预测，批量计算终值、现值、企业价值、股权价值和每股价值。
+    所有输入参数 (WACC、退出乘数、永续增长率) 均可为可广播的 NumPy 数组，
+    结果按广播后的形状返回，无效组合以 NaN 表示。
+    计算口径与 TerminalValueCalculator、PresentValueCalculator、EquityBridgeCalculator 保持一致。
+    """
+
+    def __init__(self,
+                 forecast_df: pd.DataFrame,
+                 latest_balance_sheet: Optional[pd.Series],
+                 total_shares: Optional[float],
+                 risk_free_rate: float):
+        """
+        初始化 DcfGridCalculator，预先提取预测期现金流和股权桥梁所需的常量。
+        Args:
+            forecast_df (pd.DataFrame): 财务预测结果，需要 'year', 'ufcf', 'ebitda' 列。
+            latest_balance_sheet (Optional[pd.Series]): 最新资产负债表数据，用于计算净债务等。
+            total_shares (Optional[float]): 总股本 (单位：股)。
+            risk_free_rate (float): 无风险利率，用于限制永续增长率。
+        """
+        if forecast_df is None or forecast_df.empty:
+            raise ValueError("预测数据为空，无法进行批量估值计算。")
+        if 'ufcf' not in forecast_df.columns or 'year' not in forecast_df.columns:
+            raise ValueError("预测数据缺少 'ufcf' 或 'year' 列。")
+
+        valid_rows = pd.to_numeric(forecast_df['year'], errors='coerce').notna()
+        forecast_valid = forecast_df[valid_rows]
+        if forecast_valid.empty:
+            raise ValueError("有效预测数据为空 (检查 'year' 列)。")
+
+        years = pd.to_numeric(forecast_valid['year']).to_numpy(dtype=np.float64)
+        ufcf = pd.to_numeric(forecast_valid['ufcf'], errors='coerce').to_numpy(dtype=np.float64)
+
+        last_row = forecast_df.iloc[-1]
+        last_ebitda = pd.to_numeric(pd.Series([last_row.get('ebitda')]), errors='coerce').iloc[0]
+        last_ufcf = pd.to_numeric(pd.Series([last_row.get('ufcf')]), errors='coerce').iloc[0]
+        self._set_cash_flows(
+            years, ufcf,
+            float(last_ebitda) if pd.notna(last_ebitda) else np.nan,
+            float(last_ufcf) if pd.notna(last_ufcf) else np.nan,
+        )
+        self._set_equity_bridge(latest_balance_sheet, total_shares, risk_free_rate)
+
+    @classmethod
+    def from_forecast_batch(cls,
+                            batch_result: Dict[str, Any],
+                            batch_shape: tuple,
+                            latest_balance_sheet: Optional[pd.Series],
+                            total_shares: Optional[float],
+                            risk_free_rate: ArrayLike) -> 'DcfGridCalculator':
+        """
+        基于 FinancialForecaster.forecast_batch 的结果创建计算器，每个情景对应网格中的一组预测现金流。
+        Args:
+            batch_result (Dict[str, Any]): forecast_batch 的返回值 ('years', 'line_items', 'values')。
+            batch_shape (tuple): 情景在网格中的形状 (例如 (R, 1)、(1, C) 或 (R, C))，其元素个数需等于情景数。
+            latest_balance_sheet (Optional[pd.Series]): 最新资产负债表数据。
+            total_shares (Optional[float]): 总股本 (单位：股)。
+            risk_free_rate (ArrayLike): 无风险利率 (标量或可与网格广播的数组)。
+
+        Returns:
+            DcfGridCalculator: 现金流维度为 batch_shape + (年份,) 的计算器。
+        """
+        values = np.asarray(batch_result['values'], dtype=np.float64)
+        line_items = list(batch_result['line_items'])
+        if values.ndim != 3 or values.shape[0] != int(np.prod(batch_shape)):
+            raise ValueError(f"批量预测结果形状 {values.shape} 与网格形状 {batch_shape} 不匹配。")
+        ufcf = values[..., line_items.index('ufcf')].reshape(tuple(batch_shape) + (values.shape[1],))
+        ebitda = values[..., line_items.index('ebitda')].reshape(tuple(batch_shape) + (values.shape[1],))
+
+        calculator = cls.__new__(cls)
+        calculator._set_cash_flows(np.asarray(batch_result['years'], dtype=np.float64), ufcf, ebitda[..., -1], ufcf[..., -1])
+        calculator._set_equity_bridge(latest_balance_sheet, total_shares, risk_free_rate)
+        return calculator
+
+    def _set_cash_flows(self, years: np.ndarray, ufcf: np.ndarray, last_ebitda: ArrayLike, last_ufcf: ArrayLike):
+        """设置预测期现金流 (最后一个维度为年份) 和终值计算所需的末期 EBITDA/UFCF。"""
+        if np.isnan(ufcf).any() or np.isinf(ufcf).any():
+            raise ValueError("预测期 UFCF 包含无效值 (NaN 或 Inf)。")
+        self.years = years
+        self.ufcf = ufcf
+        self.last_ebitda = last_ebitda
+        self.last_ufcf = last_ufcf
+
+    def _set_equity_bridge(self, latest_balance_sheet: Optional[pd.Series], total_shares: Optional[float], risk_free_rate: ArrayLike):
+        """提取股权桥梁 (净债务、少数股东权益等) 和永续增长率上限所需的常量。无风险利率可为与网格对齐的数组。"""
+        self.risk_free_rate = np.asarray(risk_free_rate, dtype=np.float64) if risk_free_rate is not None else np.float64(0.03)
+
+        self.net_debt = None
+        self.equity_adjustments = None
+        if latest_balance_sheet is not None and not latest_balance_sheet.empty:
+            def _bs(key: str) -> float:
+                return float(latest_balance_sheet.get(key, 0) or 0)
+            total_debt = _bs('lt_borr') + _bs('st_borr') + _bs('bond_payable') + _bs('non_cur_liab_due_1y')
+            self.net_debt = total_debt - _bs('money_cap')
+            self.equity_adjustments = self.net_debt + _bs('minority_int') + _bs('oth_eqt_tools_p_shr')
+
+        self.total_shares = float(total_shares) if total_shares is not None and total_shares > 0 else None
+
+    def calculate_terminal_values(self,
+                                  wacc: ArrayLike,
+                                  method: str = 'exit_multiple',
+                                  exit_multiple: Optional[ArrayLike] = None,
+                                  perpetual_growth_rate: Optional[ArrayLike] = None) -> np.ndarray:
+        """
+        批量计算终值。
+        Args:
+            wacc (ArrayLike): WACC (标量或数组)。
+            method (str): 'exit_multiple' 或 'perpetual_growth'。
+            exit_multiple (Optional[ArrayLike]): 退出乘数 (标量或数组)。
+            perpetual_growth_rate (Optional[ArrayLike]): 永续增长率 (标量或数组)。
+
+        Returns:
+            np.ndarray: 终值数组，无效组合为 NaN。
+        """
+        wacc_arr = np.asarray(wacc, dtype=np.float64)
+        if method == 'exit_multiple':
+            if exit_multiple is None:
+                raise ValueError("使用退出乘数法需要提供有效的正退出乘数。")
+            multiple_arr = np.asarray(exit_multiple, dtype=np.float64)
+            tv = np.where(multiple_arr > 0, self.last_ebitda * multiple_arr, np.nan)
+            # 终值与 WACC 无关，但结果需与 WACC 网格广播对齐
+            return np.broadcast_to(tv, np.broadcast_shapes(tv.shape, wacc_arr.shape)).copy()
+
+        if method == 'perpetual_growth':
+            if perpetual_growth_rate is None:
+                raise ValueError("使用永续增长法需要提供有效的永续增长率。")
+            growth_arr = np.minimum(np.asarray(perpetual_growth_rate, dtype=np.float64), self.risk_free_rate)
+            denominator = wacc_arr - growth_arr
+            invalid = (growth_arr >= wacc_arr) | (np.abs(denominator) < 1e-9) | np.isnan(growth_arr)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                tv = self.last_ufcf * (1.0 + growth_arr) / denominator
+            tv = np.where(np.asarray(self.last_ufcf) <= 0, 0.0, tv)
+            return np.where(invalid, np.nan, tv)
+
+        raise ValueError(f"无效的终值计算方法: {method}")
+
+    def calculate(self,
+                  wacc: ArrayLike,
+                  method: str = 'exit_multiple',
+                  exit_multiple: Optional[ArrayLike] = None,
+                  perpetual_growth_rate: Optional[ArrayLike] = None) -> Dict[str, np.ndarray]:
+        """
+        批量执行终值 → 折现 → 企业价值 → 股权价值 → 每股价值 的计算链。
+        Args:
+            wacc (ArrayLike): WACC (标量或数组)，需在 (0, 1) 之间。
+            method (str): 终值计算方法。
+            exit_multiple (Optional[ArrayLike]): 退出乘数。
+            perpetual_growth_rate (Optional[ArrayLike]): 永续增长率。
+
+        Returns:
+            Dict[str, np.ndarray]: 包含 'terminal_value', 'pv_forecast_ufcf', 'pv_terminal_value',
+                                   'enterprise_value', 'equity_value', 'value_per_share', 'tv_ev_ratio' 的字典。
+        """
+        terminal_value = self.calculate_terminal_values(wacc, method, exit_multiple, perpetual_growth_rate)
+        terminal_value = np.broadcast_to(terminal_value, np.broadcast_shapes(terminal_value.shape, np.shape(self.ufcf)[:-1])).copy()
+        wacc_arr = np.broadcast_to(np.asarray(wacc, dtype=np.float64), terminal_value.shape)
+        wacc_valid = (wacc_arr > 0) & (wacc_arr < 1)
+        safe_wacc = np.where(wacc_valid, wacc_arr, 0.0)
+
+        # 折现因子: (1 + WACC) ^ -year，最后一个维度为预测年份 (批量预测时现金流随网格单元变化)
+        discount_factors = np.power(1.0 + safe_wacc[..., np.newaxis], -self.years)
+        pv_forecast_ufcf = np.sum(discount_factors * self.ufcf, axis=-1)
+        pv_terminal_value = terminal_value * discount_factors[..., -1]
+
+        pv_forecast_ufcf = np.where(wacc_valid, pv_forecast_ufcf, np.nan)
+        pv_terminal_value = np.where(wacc_valid, pv_terminal_value, np.nan)
+        enterprise_value = pv_forecast_ufcf + pv_terminal_value
+
+        if self.equity_adjustments is not None:
+            equity_value = enterprise_value - self.equity_adjustments
+        else:
+            equity_value = np.full_like(enterprise_value, np.nan)
+
+        if self.total_shares is not None:
+            value_per_share = equity_value / self.total_shares
+        else:
+            value_per_share = np.full_like(enterprise_value, np.nan)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            tv_ev_ratio = np.where(enterprise_value != 0, pv_terminal_value / enterprise_value, np.nan)
+
+        return {
+            'terminal_value': terminal_value,
+            'pv_forecast_ufcf': pv_forecast_ufcf,
+            'pv_terminal_value': pv_terminal_value,
+            'enterprise_value': enterprise_value,
+            'equity_value': equity_value,
+            'value_per_share': value_per_share,
+            'tv_ev_ratio': tv_ev_ratio,
+        }
+
+    @staticmethod
+    def ratio_to_base(values: np.ndarray, base: Any) -> np.ndarray:
+        """
+        按正的基数计算比率 (例如 EV/EBITDA、隐含 PE)，基数无效或非正时返回 NaN 数组。
+        Args:
+            values (np.ndarray): 分子数组。
+            base (Any): 基数 (Decimal/float/None)。
+
+        Returns:
+            np.ndarray: 比率数组。
+        """
+        try:
+            base_float = float(base) if base is not None else None
+        except (TypeError, ValueError):
+            base_float = None
+        if base_float is None or not np.isfinite(base_float) or base_float <= 0:
+            return np.full_like(np.asarray(values, dtype=np.float64), np.nan)
+        return np.asarray(values, dtype=np.float64) / base_float
+
+    @staticmethod
+    def to_table(values: np.ndarray) -> list:
+        """将二维数组转换为嵌套列表，NaN/Inf 转为 None，便于 JSON 序列化。"""
+        arr = np.asarray(values, dtype=np.float64)
+        as_object = arr.astype(object)
+        as_object[~np.isfinite(arr)] = None
+        return as_object.tolist()
+
+# End of class DcfGridCalculator
@@ -0,0 +1,94 @@
+import os
+import logging
+import threading
+from typing import Any, Callable, Generic, Optional, Tuple, TypeVar
+
+logger = logging.getLogger(__name__)
+
+# --- 环境变量配置与进程内共享实例的公共工具 ---
+# 各服务模块的配置项 (见 .env.example) 统一通过 env_int / env_float / env_flag 读取，
+# 进程内按需创建的共享对象 (缓存、报表库读取器、进程池等) 统一使用 LazySingleton。
+
+_TRUE_VALUES = ("1", "true", "yes")
+
+T = TypeVar('T')
+
+
+def env_int(name: str, default: int, min_value: Optional[int] = 1) -> int:
+    """
+    读取整数环境变量。
+    Args:
+        name (str): 环境变量名。
+        default (int): 未设置、无法解析或小于 min_value 时使用的默认值。
+        min_value (Optional[int]): 允许的最小值 (默认 1，即只接受正整数)；为 None 时不检查范围。
+    Returns:
+        int: 配置值。
+    """
+    raw = os.getenv(name)
+    if raw is None:
+        return default
+    try:
+        value = int(raw)
+    except (TypeError, ValueError):
+        logger.warning(f"环境变量 {name}={raw!r} 无效，使用默认值 {default}。")
+        return default
+    if min_value is not None and value < min_value:
+        logger.warning(f"环境变量 {name}={value} 小于 {min_value}，使用默认值 {default}。")
+        return default
+    return value
+
+
+def env_float(name: str, default: float) -> float:
+    """读取浮点数环境变量，未设置或无法解析时返回 default。"""
+    raw = os.getenv(name)
+    if raw is None:
+        return default
+    try:
+        return float(raw)
+    except (TypeError, ValueError):
+        logger.warning(f"环境变量 {name}={raw!r} 无效，使用默认值 {default}。")
+        return default
+
+
+def env_flag(name: str, default: bool) -> bool:
+    """读取开关类环境变量：'1'、'true'、'yes' (不区分大小写) 为 True，其他值为 False；未设置时返回 default。"""
+    raw = os.getenv(name)
+    if raw is None:
+        return default
+    return raw.lower() in _TRUE_VALUES
+
+
+class LazySingleton(Generic[T]):
+    """
+    进程内按需创建的共享实例 (双重检查加锁，并发调用时只创建一次)。
+    提供 key 函数时，其返回值变化 (例如配置的目录改变) 会重新创建实例。
+    """
+
+    def __init__(self, factory: Callable[[], T], key: Optional[Callable[[], Any]] = None):
+        """
+        Args:
+            factory (Callable[[], T]): 创建实例的函数。
+            key (Optional[Callable[[], Any]]): 返回实例对应配置的函数，默认实例创建后不再变化。
+        """
+        self._factory = factory
+        self._key = key
+        self._entry: Optional[Tuple[Any, T]] = None
+        self._lock = threading.Lock()
+
+    def get(self) -> T:
+        """返回共享实例，首次调用 (或 key 变化) 时创建。"""
+        key = self._key() if self._key is not None else None
+        entry = self._entry
+        if entry is None or entry[0] != key:
+            with self._lock:
+                entry = self._entry
+                if entry is None or entry[0] != key:
+                    entry = (key, self._factory())
+                    self._entry = entry
+        return entry[1]
+
+    def reset(self) -> Optional[T]:
+        """丢弃共享实例 (下次 get() 时重新创建)，返回被丢弃的实例以便调用方关闭。"""
+        with self._lock:
+            entry, self._entry = self._entry, None
+        return entry[1] if entry is not None else None
@@ -1,3 +1,4 @@
+import os
 import pandas as pd
 import numpy as np
 from typing import Dict, List, Tuple, Any, Optional, Union
@@ -8,17 +9,45 @@ from decimal import Decimal, InvalidOperation
 from nwc_calculator import NwcCalculator
 from fcf_calculator import FcfCalculator
 
+PRECISION_DECIMAL = 'decimal'
+PRECISION_FLOAT64 = 'float64'
+
+# 向量化内核的预测项 (不含 'year')，顺序与 Decimal 路径输出的列顺序一致
+FORECAST_LINE_ITEMS = (
+    'revenue', 'revenue_growth_rate', 'cogs', 'gross_profit', 'sga_expenses', 'rd_expenses',
+    'ebit', 'taxes', 'nopat',
+    'd_a', 'capex', 'accounts_receivable', 'inventories', 'accounts_payable',
+    'other_current_assets', 'other_current_liabilities', 'nwc', 'delta_nwc',
+    'ebitda', 'ufcf',
+)
+
+# 按模式预测的指标: (指标名, historical_ratios 中的键, 缺失时的默认值)
+FORECAST_METRICS = (
+    ('sga_to_revenue_ratio', 'sga_to_revenue_ratio', 0.10),
+    ('rd_to_revenue_ratio', 'rd_to_revenue_ratio', 0.05),
+    ('operating_margin', 'operating_margin_median', 0.15),
+    ('da_to_revenue_ratio', 'da_to_revenue_ratio', 0.05),
+    ('capex_to_revenue_ratio', 'capex_to_revenue_ratio', 0.07),
+    ('accounts_receivable_days', 'accounts_receivable_days', 30),
+    ('inventory_days', 'inventory_days', 60),
+    ('accounts_payable_days', 'accounts_payable_days', 45),
+    ('other_current_assets_to_revenue_ratio', 'other_current_assets_to_revenue_ratio', 0.05),
+    ('other_current_liabilities_to_revenue_ratio', 'other_current_liabilities_to_revenue_ratio', 0.03),
+)
+
 class FinancialForecaster:
     def __init__(self,
                  last_actual_revenue: float,
                  historical_ratios: Dict[str, Any],
-                 forecast_assumptions: Dict[str, Any]):
+                 forecast_assumptions: Dict[str, Any],
+                 precision_mode: Optional[str] = None):
         """
         初始化财务预测器。
         Args:
             last_actual_revenue (float): 最后一个已知实际年度的收入。
             historical_ratios (Dict[str, Any]): 包含历史比率/天数中位数和最后一年 NWC 的字典。
             forecast_assumptions (Dict[str, Any]): 包含用户输入的预测假设的字典。
+            precision_mode (Optional[str]): 'decimal' 或 'float64'，默认读取环境变量 FORECAST_PRECISION_MODE (默认 'decimal')。
         """
         # 确保 last_actual_revenue 是 Decimal 类型
         try:
@@ -36,6 +65,52 @@ class FinancialForecaster:
         self.forecast_years = self.assumptions.get("forecast_years", 5)
         self.forecasted_statements: Dict[str, pd.DataFrame] = {}
 
+        # 计算精度模式: 'decimal' (默认，逐元素 Decimal 计算) 或 'float64' (按年份轴向量化的 NumPy 计算)
+        mode = precision_mode if precision_mode is not None else os.getenv('FORECAST_PRECISION_MODE', PRECISION_DECIMAL)
+        mode = str(mode).lower()
+        if mode not in (PRECISION_DECIMAL, PRECISION_FLOAT64):
+            print(f"Warning: Unknown precision mode '{mode}'. Using '{PRECISION_DECIMAL}'.")
+            mode = PRECISION_DECIMAL
+        self.precision_mode = mode
+
+    def _metric_target_raw(self, metric_name: str, assumptions: Optional[Dict[str, Any]] = None) -> Any:
+        """
+        从预测假设中读取指标目标值。
+        依次尝试 'target_<metric>'、'<metric>_target'、'<metric>_target_value' 三种键名。
+        """
+        assumptions = self.assumptions if assumptions is None else assumptions
+        target_raw = assumptions.get(f'target_{metric_name}') # Pattern like target_operating_margin
+        if target_raw is None:
+             target_raw = assumptions.get(f'{metric_name}_target') # Pattern like operating_margin_target
+        if target_raw is None: 
+             target_raw = assumptions.get(f'{metric_name}_target_value') # Pattern like operating_margin_target_value
+        return target_raw
+
+    def _metric_transition_years(self, metric_name: str, assumptions: Optional[Dict[str, Any]] = None) -> int:
+        """根据指标类型读取过渡期年数，缺失或无效时使用预测期年数。"""
+        assumptions = self.assumptions if assumptions is None else assumptions
+        transition_years_key = f'{metric_name}_transition_years' # Default key
+        if "days" in metric_name: 
+            transition_years_key = 'nwc_days_transition_years'
+        elif "other_current" in metric_name: 
+            transition_years_key = 'other_nwc_ratio_transition_years'
+        elif "operating_margin" in metric_name:
+             transition_years_key = 'op_margin_transition_years'
+        elif metric_name == "sga_to_revenue_ratio":
+             transition_years_key = 'sga_transition_years' # Match fixture key
+        elif metric_name == "rd_to_revenue_ratio":
+             transition_years_key = 'rd_transition_years' # Match fixture key
+        elif "da_to_revenue_ratio" in metric_name:
+             transition_years_key = 'da_ratio_transition_years'
+        elif "capex_to_revenue_ratio" in metric_name:
+             transition_years_key = 'capex_ratio_transition_years'
+        forecast_years = assumptions.get("forecast_years", self.forecast_years)
+        transition_years_input = assumptions.get(transition_years_key, forecast_years)
+        try:
+            return int(transition_years_input) if transition_years_input is not None else int(forecast_years)
+        except (ValueError, TypeError):
+            return int(forecast_years)
+
     def _predict_metric_with_mode(self,
                                   metric_name: str,
                                   base_value: Union[float, Dict[str, float]],
@@ -50,23 +125,7 @@ class FinancialForecaster:
             base_value_decimal = Decimal(str(base_value)) if isinstance(base_value, (int, float)) else (Decimal(base_value) if isinstance(base_value, str) else base_value)
             hist_median_decimal = Decimal(str(hist_median)) if hist_median is not None else None # Convert via str for float inputs
             
-            # Fetch the target value from assumptions
-            # Common key pattern for target values in assumptions is like 'metric_name_target_value' or 'metric_name_target'
-            # Let's try a common pattern; this might need adjustment based on actual assumption keys.
-            target_key = f'{metric_name}_target_value' # Default assumption key pattern
-            if "operating_margin" in metric_name: # Specific key for operating margin
-                target_key = 'op_margin_target_value' 
-            # Add other specific key patterns if necessary, e.g., for NWC days, ratios etc.
-            # Based on test_financial_forecaster.py, assumption keys are like:
-            # 'op_margin_target_value', 'sga_rd_ratio_target_value', 'da_ratio_target_value', etc.
-            # So, a more generic approach for target key might be needed or specific handling.
-            # For now, let's assume a convention like metric_name_target or metric_name_target_value
-            # Update: Check multiple possible key patterns based on test fixtures
-            target_raw = self.assumptions.get(f'target_{metric_name}') # Pattern like target_operating_margin
-            if target_raw is None:
-                 target_raw = self.assumptions.get(f'{metric_name}_target') # Pattern like operating_margin_target
-            if target_raw is None: 
-                 target_raw = self.assumptions.get(f'{metric_name}_target_value') # Pattern like operating_margin_target_value
+            target_raw = self._metric_target_raw(metric_name)
 
             target_decimal = Decimal(str(target_raw)) if target_raw is not None else None # Convert via str
             default_value_decimal = Decimal(str(default_value)) # Convert via str
@@ -77,33 +136,7 @@ class FinancialForecaster:
 
         mode = self.assumptions.get(f'{metric_name}_forecast_mode', 'historical_median')
         # target already fetched and converted to target_decimal
-
-        # Determine transition years key based on metric type
-        transition_years_key = f'{metric_name}_transition_years' # Default key
-        if "days" in metric_name: 
-            transition_years_key = 'nwc_days_transition_years'
-        elif "other_current" in metric_name: 
-            transition_years_key = 'other_nwc_ratio_transition_years'
-        elif "operating_margin" in metric_name:
-             transition_years_key = 'op_margin_transition_years'
-        # Add specific checks for sga and rd transition year keys
-        elif metric_name == "sga_to_revenue_ratio":
-             transition_years_key = 'sga_transition_years' # Match fixture key
-        elif metric_name == "rd_to_revenue_ratio":
-             transition_years_key = 'rd_transition_years' # Match fixture key
-        # Remove or adjust combined key check if SGA/RD are always separate
-        # elif "sga_rd_to_revenue_ratio" in metric_name:
-        #      transition_years_key = 'sga_rd_transition_years'
-        elif "da_to_revenue_ratio" in metric_name:
-             transition_years_key = 'da_ratio_transition_years'
-        elif "capex_to_revenue_ratio" in metric_name:
-             transition_years_key = 'capex_ratio_transition_years'
-        transition_years_input = self.assumptions.get(transition_years_key, self.forecast_years)
-        try:
-            transition_years = int(transition_years_input) if transition_years_input is not None else int(self.forecast_years)
-        except (ValueError, TypeError):
-            transition_years = int(self.forecast_years)
-
+        transition_years = self._metric_transition_years(metric_name)
 
         if hist_median_decimal is None:
              start_value = target_decimal if target_decimal is not None else default_value_decimal
@@ -418,8 +451,279 @@ class FinancialForecaster:
         print("Balance sheet/CF items forecast and final merge completed.")
         return final_forecast_df
 
+    # --- float64 向量化计算内核 ---
+    # 与上面的 Decimal 路径计算口径一致，但以 (情景, 预测年份) 为轴做数组运算，避免逐年 iterrows 和
+    # 逐元素 Decimal(str(...)) 转换。通过 precision_mode='float64' 启用；forecast_batch 在一次计算中
+    # 预测同一股票的多组假设。
+
+    @staticmethod
+    def _to_float(value: Any, default: float) -> float:
+        """将输入转换为 float，None 返回默认值，无法转换时抛出 ValueError (由调用方回退到 Decimal 路径)。"""
+        if value is None:
+            return default
+        result = float(value)
+        if np.isnan(result):
+            raise ValueError(f"NaN input value: {value}")
+        return result
+
+    @staticmethod
+    def _transition_path(start: np.ndarray, target: np.ndarray, transition_years: np.ndarray,
+                         years: np.ndarray, enabled: np.ndarray) -> np.ndarray:
+        """
+        从起始值线性过渡到目标值，不越过目标值。各参数为可广播的数组，enabled 为 False 的情景保持起始值。
+        """
+        safe_years = np.where(enabled, transition_years, 1)
+        safe_target = np.where(enabled, target, start)
+        diff = safe_target - start
+        path = start + diff / safe_years * np.minimum(years, safe_years)
+        path = np.where(diff < 0, np.maximum(safe_target, path), np.minimum(safe_target, path))
+        return np.where(enabled, path, start)
+
+    def _scenario_parameters(self, assumptions: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        解析单组预测假设中与情景相关的标量参数 (CAGR 衰减率、各指标的目标值/过渡期、税率过渡)。
+        Returns:
+            Dict[str, Any]: 参数字典，由 _forecast_kernel 堆叠为按情景排列的数组。
+        """
+        params: Dict[str, Any] = {}
+        decay_rate_input = assumptions.get('revenue_cagr_decay_rate')
+        try:
+            decay_rate = self._to_float(decay_rate_input, 0.1)
+            if not (0 <= decay_rate <= 1):
+                decay_rate = 0.1
+        except (TypeError, ValueError):
+            decay_rate = 0.1
+        params['decay_rate'] = decay_rate
+
+        for metric_name, _, _ in FORECAST_METRICS:
+            target_raw = self._metric_target_raw(metric_name, assumptions)
+            mode = assumptions.get(f'{metric_name}_forecast_mode', 'historical_median')
+            transition_years = self._metric_transition_years(metric_name, assumptions)
+            enabled = mode == 'transition_to_target' and target_raw is not None and transition_years > 0
+            params[metric_name] = (self._to_float(target_raw, np.nan) if enabled else np.nan, transition_years, enabled)
+
+        target_tax_rate_raw = assumptions.get('effective_tax_rate_target')
+        forecast_years = assumptions.get("forecast_years", self.forecast_years)
+        transition_years_input = assumptions.get('transition_years', forecast_years)
+        try:
+            tax_transition_years = int(transition_years_input) if transition_years_input is not None else int(forecast_years)
+        except (ValueError, TypeError):
+            tax_transition_years = int(forecast_years)
+        tax_enabled = target_tax_rate_raw is not None and tax_transition_years > 0
+        params['tax_rate'] = (self._to_float(target_tax_rate_raw, np.nan) if tax_enabled else np.nan,
+                              tax_transition_years, tax_enabled)
+
+        # EBITDA 按目标税率由 NOPAT 反推 EBIT，与 Decimal 路径一致
+        try:
+            ebitda_tax_rate = self._to_float(target_tax_rate_raw, 0.25)
+            if not (0 <= ebitda_tax_rate <= 1):
+                ebitda_tax_rate = 0.25
+        except (TypeError, ValueError):
+            ebitda_tax_rate = 0.25
+        params['ebitda_tax_rate'] = ebitda_tax_rate
+        return params
+
+    @staticmethod
+    def _stack_scenario_parameters(scenarios: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """将多组 _scenario_parameters 的结果堆叠为按情景排列的 (N, 1) 列数组。"""
+        def column(values: List[Any]) -> np.ndarray:
+            return np.asarray(values, dtype=np.float64)[:, np.newaxis]
+
+        stacked: Dict[str, Any] = {
+            'decay_rate': column([sc['decay_rate'] for sc in scenarios]),
+            'ebitda_tax_rate': column([sc['ebitda_tax_rate'] for sc in scenarios]),
+        }
+        for metric_name in [name for name, _, _ in FORECAST_METRICS] + ['tax_rate']:
+            targets, transition_years, enabled = zip(*(sc[metric_name] for sc in scenarios))
+            stacked[metric_name] = (column(targets), column(transition_years), np.asarray(enabled, dtype=bool)[:, np.newaxis])
+        return stacked
+
+    def _forecast_kernel(self, assumption_sets: List[Dict[str, Any]],
+                         line_items: Tuple[str, ...] = FORECAST_LINE_ITEMS) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        对 N 组预测假设执行一次向量化预测。
+        Args:
+            assumption_sets (List[Dict[str, Any]]): 完整的预测假设列表 (预测年数需一致)。
+            line_items (Tuple[str, ...]): 需要输出的预测项，默认全部。
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: (年份数组 (Y,), 预测值数组 (N, Y, len(line_items)))。
+        """
+        forecast_years = {int(a.get('forecast_years', 5)) for a in assumption_sets}
+        if len(forecast_years) != 1:
+            raise ValueError(f"批量预测的各组假设预测年数必须一致: {sorted(forecast_years)}")
+        params = self._stack_scenario_parameters([self._scenario_parameters(a) for a in assumption_sets])
+        return self._forecast_from_parameters(forecast_years.pop(), params, line_items)
+
+    def _forecast_from_parameters(self, forecast_years: int, params: Dict[str, Any],
+                                  line_items: Tuple[str, ...] = FORECAST_LINE_ITEMS) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        按堆叠后的情景参数 (见 _stack_scenario_parameters，各数组第一维为情景) 执行向量化预测。
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: (年份数组 (Y,), 预测值数组 (N, Y, len(line_items)))。
+        """
+        years = np.arange(1, forecast_years + 1, dtype=np.float64)[np.newaxis, :]
+        hr = self.historical_ratios
+
+        def metric_path(metric_name: str, hist_median: float) -> np.ndarray:
+            targets, transition_years, enabled = params[metric_name]
+            return self._transition_path(np.float64(hist_median), targets, transition_years, years, enabled)
+
+        hist = {metric_name: self._to_float(hr.get(hist_key), default) for metric_name, hist_key, default in FORECAST_METRICS}
+
+        # 收入: revenue_t = revenue_0 * Π(1 + g_k)，g_k = CAGR * (1 - decay)^(k-1)
+        last_revenue = float(self.last_actual_revenue)
+        try:
+            historical_cagr = self._to_float(hr.get('historical_revenue_cagr'), 0.05)
+        except (TypeError, ValueError):
+            historical_cagr = 0.05
+        decay_rate = params['decay_rate']
+        growth = historical_cagr * np.power(1.0 - decay_rate, years - 1)
+        revenue = last_revenue * np.cumprod(1.0 + growth, axis=1)
+
+        # 利润表
+        sga = revenue * metric_path('sga_to_revenue_ratio', hist['sga_to_revenue_ratio'])
+        rd = revenue * metric_path('rd_to_revenue_ratio', hist['rd_to_revenue_ratio'])
+        ebit = revenue * metric_path('operating_margin', hist['operating_margin'])
+        cogs = revenue - ebit - sga - rd
+        gross_profit = revenue - cogs
+
+        hist_tax_rate = self._to_float(hr.get('effective_tax_rate', '0.25'), 0.25)
+        tax_rate = np.clip(metric_path('tax_rate', hist_tax_rate), 0.0, 1.0)
+        taxes = np.where(ebit > 0, ebit * tax_rate, 0.0)
+        nopat = ebit * (1.0 - tax_rate)
+
+        # 资产负债表与现金流项目
+        d_a = revenue * metric_path('da_to_revenue_ratio', hist['da_to_revenue_ratio'])
+        capex = revenue * metric_path('capex_to_revenue_ratio', hist['capex_to_revenue_ratio'])
+        accounts_receivable = np.where(revenue > 0, revenue / 360.0 * metric_path('accounts_receivable_days', hist['accounts_receivable_days']), 0.0)
+        inventories = np.where(cogs > 0, cogs / 360.0 * metric_path('inventory_days', hist['inventory_days']), 0.0)
+        accounts_payable = np.where(cogs > 0, cogs / 360.0 * metric_path('accounts_payable_days', hist['accounts_payable_days']), 0.0)
+        other_current_assets = revenue * metric_path('other_current_assets_to_revenue_ratio', hist['other_current_assets_to_revenue_ratio'])
+        other_current_liabilities = revenue * metric_path('other_current_liabilities_to_revenue_ratio', hist['other_current_liabilities_to_revenue_ratio'])
+
+        try:
+            previous_nwc = self._to_float(hr.get('last_actual_nwc'), 0.0)
+        except (TypeError, ValueError):
+            previous_nwc = 0.0
+        nwc = (accounts_receivable + inventories + other_current_assets) - (accounts_payable + other_current_liabilities)
+        delta_nwc = np.diff(nwc, axis=1, prepend=np.full((nwc.shape[0], 1), previous_nwc))
+
+        ebitda_tax_rate = params['ebitda_tax_rate']
+        full_tax = np.abs(1.0 - ebitda_tax_rate) < 1e-9
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ebitda = np.where(full_tax, ebit + d_a, nopat / np.where(full_tax, 1.0, 1.0 - ebitda_tax_rate) + d_a)
+
+        ufcf = nopat + d_a - capex - delta_nwc
+
+        line_item_values = {
+            'revenue': revenue, 'revenue_growth_rate': np.broadcast_to(growth, revenue.shape),
+            'cogs': cogs, 'gross_profit': gross_profit, 'sga_expenses': sga, 'rd_expenses': rd,
+            'ebit': ebit, 'taxes': taxes, 'nopat': nopat, 'd_a': d_a, 'capex': capex,
+            'accounts_receivable': accounts_receivable, 'inventories': inventories, 'accounts_payable': accounts_payable,
+            'other_current_assets': other_current_assets, 'other_current_liabilities': other_current_liabilities,
+            'nwc': nwc, 'delta_nwc': delta_nwc, 'ebitda': ebitda, 'ufcf': ufcf,
+        }
+        output_shape = np.broadcast_shapes(*(np.shape(line_item_values[item]) for item in line_items))
+        values = np.stack([np.broadcast_to(line_item_values[item], output_shape) for item in line_items], axis=-1)
+        return years[0].astype(int), values
+
+    def forecast_batch(self, assumption_sets: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        在一次向量化计算中预测同一股票的多组假设 (例如不同的 CAGR 衰减率、目标营业利润率或资本支出比率)。
+        每组假设覆盖在实例的 forecast_assumptions 之上，未指定的键沿用实例假设。
+        Args:
+            assumption_sets (List[Dict[str, Any]]): N 组假设 (覆盖项)。
+
+        Returns:
+            Dict[str, Any]: {'years': (Y,) 年份数组, 'line_items': 预测项名称列表,
+                             'values': (N, Y, len(line_items)) 的 float64 数组}。
+        Raises:
+            ValueError: 假设列表为空、预测年数不一致或输入无法转换为数值。
+        """
+        if not assumption_sets:
+            raise ValueError("批量预测至少需要一组假设。")
+        merged_sets = [{**self.assumptions, **(overrides or {})} for overrides in assumption_sets]
+        years, values = self._forecast_kernel(merged_sets)
+        return {'years': years, 'line_items': list(FORECAST_LINE_ITEMS), 'values': values}
+
+    def _driver_metric_name(self, assumption_key: str) -> Optional[str]:
+        """根据目标值键 (例如 'target_operating_margin') 找到对应的 FORECAST_METRICS 指标名。"""
+        for metric_name, _, _ in FORECAST_METRICS:
+            if assumption_key in (f'target_{metric_name}', f'{metric_name}_target', f'{metric_name}_target_value'):
+                return metric_name
+        return None
+
+    def forecast_driver_paths(self, driver_values: Dict[str, Any],
+                              line_items: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        按驱动因素的取值数组批量预测 (例如蒙特卡洛抽样得到的数万条路径)。
+        与 forecast_batch 不同，驱动因素直接以数组覆盖实例假设解析出的情景参数，不逐条构造假设字典。
+        目标值类驱动因素按 transition_to_target 模式生效；未覆盖的参数沿用实例假设。
+        Args:
+            driver_values (Dict[str, Any]): 假设键 -> 取值数组，支持 'revenue_cagr_decay_rate'、
+                                            'effective_tax_rate_target' 和各指标的目标值键。各数组长度需一致；
+                                            为空时只预测实例假设这一条路径。
+            line_items (Optional[List[str]]): 需要输出的预测项，默认全部。
+
+        Returns:
+            Dict[str, Any]: 与 forecast_batch 结构相同的结果，'values' 形状为 (N, Y, len(line_items))。
+        Raises:
+            ValueError: 驱动因素键不受支持、数组长度不一致或实例假设无法转换为数值。
+        """
+        line_items = tuple(line_items) if line_items is not None else FORECAST_LINE_ITEMS
+        columns = {key: np.asarray(values, dtype=np.float64).reshape(-1, 1) for key, values in driver_values.items()}
+        path_counts = {column.shape[0] for column in columns.values()}
+        if len(path_counts) > 1:
+            raise ValueError(f"各驱动因素的取值数量必须一致: {sorted(path_counts)}")
+
+        # 未覆盖的参数保持 (1, 1) 形状，由广播复用到所有路径，只有被覆盖的指标按路径计算过渡路径
+        params = self._stack_scenario_parameters([self._scenario_parameters(self.assumptions)])
+        for key, column in columns.items():
+            if key == 'revenue_cagr_decay_rate':
+                params['decay_rate'] = np.where((column >= 0) & (column <= 1), column, 0.1)
+                continue
+            metric_name = 'tax_rate' if key == 'effective_tax_rate_target' else self._driver_metric_name(key)
+            if metric_name is None:
+                raise ValueError(f"不支持的预测驱动因素: {key}")
+            _, transition_years, _ = params[metric_name]
+            params[metric_name] = (column, transition_years, transition_years > 0)
+            if metric_name == 'tax_rate':
+                params['ebitda_tax_rate'] = np.where((column >= 0) & (column <= 1), column, 0.25)
+
+        years, values = self._forecast_from_parameters(int(self.assumptions.get('forecast_years', self.forecast_years)), params, line_items)
+        return {'years': years, 'line_items': list(line_items), 'values': values}
+
+    @staticmethod
+    def batch_scenario_frame(batch_result: Dict[str, Any], scenario_index: int) -> pd.DataFrame:
+        """将 forecast_batch 结果中的单个情景转换为与 get_full_forecast 相同结构的 DataFrame。"""
+        df = pd.DataFrame(batch_result['values'][scenario_index], columns=batch_result['line_items'])
+        df.insert(0, 'year', batch_result['years'])
+        return df
+
+    def _get_full_forecast_float64(self) -> pd.DataFrame:
+        """
+        使用 float64 数组一次性完成收入、利润表、NWC、D&A、资本支出、EBITDA 和 UFCF 的预测。
+        Returns:
+            pd.DataFrame: 与 Decimal 路径列结构一致的预测结果。
+        """
+        years, values = self._forecast_kernel([self.assumptions])
+        final_forecast_df = self.batch_scenario_frame(
+            {'years': years, 'line_items': list(FORECAST_LINE_ITEMS), 'values': values}, 0
+        )
+        self.forecasted_statements['revenue'] = final_forecast_df[['year', 'revenue', 'revenue_growth_rate']].copy()
+        self.forecasted_statements['income_statement'] = final_forecast_df[['year'] + list(FORECAST_LINE_ITEMS[:9])].copy()
+        self.forecasted_statements['final_forecast'] = final_forecast_df
+        return final_forecast_df
+
     def get_full_forecast(self) -> pd.DataFrame:
         """执行完整的预测流程并返回包含所有预测项的 DataFrame。"""
+        if self.precision_mode == PRECISION_FLOAT64:
+            try:
+                return self._get_full_forecast_float64()
+            except (InvalidOperation, TypeError, ValueError) as e:
+                print(f"Warning: float64 forecast kernel failed ({e}). Falling back to Decimal path.")
+                self.forecasted_statements = {}
         self.predict_revenue()
         self.predict_income_statement_items()
         self.predict_balance_sheet_and_cf_items()
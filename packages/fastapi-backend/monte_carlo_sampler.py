@@ -0,0 +1,123 @@
+import numpy as np
+from typing import Optional, Dict, Any, List, Tuple
+
+# 各参数的取值范围 (抽样后截断)，避免分布尾部产生无意义的输入 (例如负的退出乘数或超过 100% 的税率)
+PARAMETER_BOUNDS: Dict[str, Tuple[float, float]] = {
+    'wacc': (1e-6, 1.0 - 1e-6),
+    'beta': (0.0, np.inf),
+    'risk_free_rate': (0.0, 1.0),
+    'market_risk_premium': (0.0, 1.0),
+    'cost_of_debt': (0.0, 1.0),
+    'target_debt_ratio': (0.0, 1.0),
+    'exit_multiple': (1e-6, np.inf),
+    'cagr_decay_rate': (0.0, 1.0),
+    'target_accounts_receivable_days': (0.0, np.inf),
+    'target_inventory_days': (0.0, np.inf),
+    'target_accounts_payable_days': (0.0, np.inf),
+    'target_capex_to_revenue_ratio': (0.0, np.inf),
+    'target_effective_tax_rate': (0.0, 1.0),
+}
+
+def parameter_generators(seed: Optional[int], parameter_names: List[str]) -> Tuple[int, Dict[str, np.random.Generator]]:
+    """
+    为每个参数创建独立的随机数流。
+    每个参数使用由同一种子派生的独立 Generator，因此抽样结果与分块大小、参数的处理顺序无关。
+    Args:
+        seed (Optional[int]): 随机种子，为空时随机生成。
+        parameter_names (List[str]): 参数名列表。
+
+    Returns:
+        Tuple[int, Dict[str, np.random.Generator]]: (实际使用的种子, 参数名 -> Generator)。
+    """
+    seed_sequence = np.random.SeedSequence(seed)
+    names = sorted(parameter_names)
+    generators = {name: np.random.default_rng(child) for name, child in zip(names, seed_sequence.spawn(len(names)))}
+    return int(seed_sequence.entropy), generators
+
+def sample_distribution(rng: np.random.Generator,
+                        spec: Dict[str, Any],
+                        size: int,
+                        base_value: Optional[float] = None,
+                        bounds: Optional[Tuple[float, float]] = None) -> np.ndarray:
+    """
+    按分布定义抽取 size 个样本。
+    Args:
+        rng (np.random.Generator): 随机数生成器。
+        spec (Dict[str, Any]): 分布定义，'distribution' 为 'normal'、'lognormal'、'uniform' 或 'triangular'；
+                               normal/lognormal 使用 'mean' 和 'std' (变量本身的均值和标准差)，
+                               uniform 使用 'low'/'high'，triangular 使用 'low'/'mode'/'high'；
+                               可选 'min_value'/'max_value' 截断样本。
+        size (int): 样本数量。
+        base_value (Optional[float]): 基础估值使用的参数值，未指定 mean/mode 时作为中心。
+        bounds (Optional[Tuple[float, float]]): 参数本身的取值范围。
+
+    Returns:
+        np.ndarray: (size,) 的 float64 样本数组。
+    Raises:
+        ValueError: 分布定义缺少必要参数。
+    """
+    distribution = spec.get('distribution', 'normal')
+    center = spec.get('mode') if distribution == 'triangular' else spec.get('mean')
+    if center is None:
+        center = base_value
+
+    if distribution in ('normal', 'lognormal'):
+        std = spec.get('std')
+        if center is None or std is None:
+            raise ValueError("正态/对数正态分布需要均值 (或基础值) 和标准差。")
+        if distribution == 'normal':
+            samples = rng.normal(center, std, size)
+        else:
+            if center <= 0:
+                raise ValueError("对数正态分布的均值必须为正。")
+            # 由变量本身的均值/标准差换算对数空间参数
+            sigma_squared = np.log1p((std / center) ** 2)
+            samples = rng.lognormal(np.log(center) - sigma_squared / 2.0, np.sqrt(sigma_squared), size)
+    elif distribution == 'uniform':
+        if spec.get('low') is None or spec.get('high') is None:
+            raise ValueError("均匀分布需要 low 和 high。")
+        samples = rng.uniform(spec['low'], spec['high'], size)
+    elif distribution == 'triangular':
+        low, high = spec.get('low'), spec.get('high')
+        if low is None or high is None or center is None:
+            raise ValueError("三角分布需要 low、high 和 mode (或基础值)。")
+        if low == high:
+            samples = np.full(size, float(low))
+        else:
+            samples = rng.triangular(low, min(max(center, low), high), high, size)
+    else:
+        raise ValueError(f"不支持的分布类型: {distribution}")
+
+    samples = np.asarray(samples, dtype=np.float64)
+    lower = spec.get('min_value')
+    upper = spec.get('max_value')
+    if bounds is not None:
+        lower = bounds[0] if lower is None else max(lower, bounds[0])
+        upper = bounds[1] if upper is None else min(upper, bounds[1])
+    if lower is not None or upper is not None:
+        samples = np.clip(samples, -np.inf if lower is None else lower, np.inf if upper is None else upper)
+    return samples
+
+def summarize_distribution(values: np.ndarray,
+                           percentiles: List[float],
+                           histogram_bins: int) -> Optional[Dict[str, Any]]:
+    """
+    汇总模拟结果的分布 (忽略 NaN/Inf)。
+    Returns:
+        Optional[Dict[str, Any]]: 包含 'mean', 'std', 'min', 'max', 'percentiles' ('p5' -> 值) 和
+                                  'histogram' ('bin_edges', 'counts') 的字典；没有有效值时返回 None。
+    """
+    values = np.asarray(values, dtype=np.float64)
+    valid = values[np.isfinite(values)]
+    if valid.size == 0:
+        return None
+    percentile_values = np.percentile(valid, percentiles) if percentiles else []
+    counts, bin_edges = np.histogram(valid, bins=histogram_bins)
+    return {
+        'mean': float(valid.mean()),
+        'std': float(valid.std()),
+        'min': float(valid.min()),
+        'max': float(valid.max()),
+        'percentiles': {f"p{p:g}": float(v) for p, v in zip(percentiles, percentile_values)},
+        'histogram': {'bin_edges': bin_edges.tolist(), 'counts': counts.tolist()},
+    }
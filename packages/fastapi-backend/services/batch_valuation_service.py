@@ -0,0 +1,493 @@
+import os
+import json
+import time
+import logging
+import sys
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from decimal import Decimal
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from env_utils import env_int
+from services.processed_data_cache import get_processed_data_cache
+from services.statement_store import STATEMENT_TABLES, get_statement_store
+
+logger = logging.getLogger(__name__)
+
+# --- 批量估值 (全市场夜间任务) ---
+# 按块 (默认 200 只) 批量获取市场数据和年度报表，每块在独立进程中依次执行
+# DataProcessor → FinancialForecaster → WaccCalculator → TerminalValueCalculator → PresentValueCalculator → EquityBridgeCalculator，
+# 结果按股票一行写入 Parquet/Feather 文件。
+# BATCH_VALUATION_WORKERS: 工作进程数 (默认 CPU 核数)。API 任务始终在独立进程池中执行；
+# 仅命令行 (--workers 1) 和测试在当前进程内顺序执行。
+# BATCH_VALUATION_OUTPUT_DIR: 结果文件目录 (默认 data_cache_backend/batch_valuations)。
+# 只有全市场任务 (未指定 ts_codes) 完成后才更新目录中的 latest.json，筛选器只读取其指向的结果文件；
+# 指定 ts_codes 的部分估值只写出自己的结果文件，不会替换筛选器使用的全市场结果。
+# 进程启动方式沿用 VALUATION_PROCESS_START_METHOD。
+
+DEFAULT_CHUNK_SIZE = 200
+DEFAULT_OUTPUT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "data_cache_backend", "batch_valuations"))
+OUTPUT_FORMATS = ('parquet', 'feather')
+LATEST_POINTER_FILENAME = "latest.json"
+
+# 结果文件的列 (每只股票一行，估值失败时 status='error'，估值列为空)
+RESULT_COLUMNS = [
+    'ts_code', 'name', 'industry', 'status', 'error',
+    'latest_price', 'pe', 'pb', 'value_per_share', 'upside',
+    'enterprise_value', 'equity_value', 'net_debt',
+    'pv_forecast_ufcf', 'pv_terminal_value', 'terminal_value', 'terminal_value_method',
+    'wacc', 'cost_of_equity', 'dcf_implied_diluted_pe', 'tv_to_ev',
+    'base_report_date', 'latest_report_end_date', 'statement_source', 'warning_count', 'warnings',
+]
+
+
+class BatchValuationError(Exception):
+    """Raised when a batch valuation job cannot be started (e.g. empty universe or invalid output path)."""
+    pass
+
+
+def get_output_dir() -> str:
+    """返回批量估值结果目录。"""
+    return os.getenv("BATCH_VALUATION_OUTPUT_DIR", DEFAULT_OUTPUT_DIR)
+
+
+def get_latest_pointer_path() -> str:
+    """返回记录最新全市场估值结果的 latest.json 路径。"""
+    return os.path.join(get_output_dir(), LATEST_POINTER_FILENAME)
+
+
+def publish_latest_results(output_path: str, summary: Dict[str, Any]) -> str:
+    """
+    将全市场估值结果登记为最新结果 (筛选器读取的结果)，先写临时文件再原子替换 latest.json。
+    Args:
+        output_path (str): 结果文件路径。
+        summary (Dict[str, Any]): 任务摘要 ('total', 'succeeded', 'failed')。
+    Returns:
+        str: latest.json 路径。
+    """
+    pointer_path = get_latest_pointer_path()
+    os.makedirs(os.path.dirname(pointer_path), exist_ok=True)
+    pointer = {
+        'output_path': os.path.abspath(output_path),
+        'total': summary.get('total'),
+        'succeeded': summary.get('succeeded'),
+        'failed': summary.get('failed'),
+        'published_at': pd.Timestamp.now().isoformat(),
+    }
+    tmp_path = f"{pointer_path}.tmp.{os.getpid()}"
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(pointer, f, ensure_ascii=False)
+        os.replace(tmp_path, pointer_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return pointer_path
+
+
+def read_latest_pointer() -> Optional[Dict[str, Any]]:
+    """
+    读取 latest.json。
+    Returns:
+        Optional[Dict[str, Any]]: publish_latest_results 写入的内容；尚无全市场结果或文件无效时返回 None。
+    """
+    pointer_path = get_latest_pointer_path()
+    try:
+        with open(pointer_path, encoding='utf-8') as f:
+            pointer = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning(f"无法读取最新批量估值记录 {pointer_path}: {e}")
+        return None
+    return pointer if isinstance(pointer, dict) and pointer.get('output_path') else None
+
+
+def load_universe() -> List[str]:
+    """
+    读取全市场股票代码：优先直接读取本地 stock_basic.feather，不存在时通过 load_stock_basic 从 Tushare 获取。
+    Returns:
+        List[str]: 排序后的股票代码列表。
+    """
+    from services import stock_screener_service
+
+    cache_file_path = os.path.join(stock_screener_service.CACHE_DIR, "stock_basic.feather")
+    if os.path.exists(cache_file_path):
+        stock_basic_df = pd.read_feather(cache_file_path, columns=['ts_code'])
+    else:
+        stock_basic_df = stock_screener_service.load_stock_basic(force_update=False)
+    return sorted(stock_basic_df['ts_code'].dropna().astype(str).unique().tolist())
+
+
+def _to_float(value: Any) -> Optional[float]:
+    """Decimal/NumPy 数值转换为 float，缺失或无效时返回 None。"""
+    if value is None:
+        return None
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if pd.isna(value) else value
+
+
+def _error_row(ts_code: str, error: str, basic: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    row = {column: None for column in RESULT_COLUMNS}
+    row.update({'ts_code': ts_code, 'status': 'error', 'error': error, 'warning_count': 0})
+    if basic:
+        row['name'] = basic.get('name')
+        row['industry'] = basic.get('industry')
+    return row
+
+
+def _value_stock(ts_code: str,
+                 request_dict: Dict[str, Any],
+                 basic: Optional[Dict[str, Any]],
+                 latest_price: Optional[float],
+                 metrics: Dict[str, Any],
+                 dividends_df: pd.DataFrame,
+                 statements: Dict[str, Optional[pd.DataFrame]],
+                 cached_state: Optional[Dict[str, Any]]) -> Tuple[Dict[str, Any], Optional[Dict[str, Any]]]:
+    """
+    对单只股票执行与 /api/v1/valuation 基础估值相同的 DCF 流程 (不含敏感性分析和 LLM)。
+    Returns:
+        Tuple[Dict[str, Any], Optional[Dict[str, Any]]]: (结果行, 新处理得到的可缓存报表状态；使用缓存时为 None)。
+    """
+    from data_processor import DataProcessor
+    from wacc_calculator import WaccCalculator
+    from services.valuation_service import ValuationService
+
+    if not basic:
+        return _error_row(ts_code, f"无法获取股票基本信息: {ts_code}"), None
+    if latest_price is None or latest_price <= 0:
+        return _error_row(ts_code, f"无法获取有效的最新价格: {ts_code}", basic), None
+    if cached_state is None and any(df is None or df.empty for df in statements.values()):
+        return _error_row(ts_code, f"缺少必要的历史财务报表数据: {ts_code}", basic), None
+
+    all_data = {'stock_basic': basic}
+    if cached_state is None:
+        all_data.update({table_name: df.reset_index(drop=True) for table_name, df in statements.items()})
+    processor = DataProcessor(
+        all_data,
+        latest_pe_pb={'pe': metrics.get('pe'), 'pb': metrics.get('pb')},
+        ttm_dividends_df=dividends_df,
+        latest_price=latest_price,
+        cached_state=cached_state
+    )
+    latest_metrics = processor.get_latest_metrics()
+    market_cap_est = WaccCalculator.estimate_market_cap(processor.processed_data, latest_metrics.get('pe'))
+    wacc_calculator = WaccCalculator(financials_dict=processor.processed_data, market_cap=market_cap_est)
+    valuation_service = ValuationService(processed_data_container=processor, wacc_calculator=wacc_calculator, logger_override=logger)
+
+    total_shares = metrics.get('total_share')
+    total_shares_actual = total_shares * 100000000 if total_shares is not None and total_shares > 0 else None
+    details, _, run_warnings = valuation_service.run_single_valuation(
+        request_dict={**request_dict, 'ts_code': ts_code},
+        total_shares_actual=total_shares_actual
+    )
+    warnings = list(dict.fromkeys(processor.get_warnings() + run_warnings))
+    new_state = processor.get_cacheable_state() if cached_state is None else None
+    if details is None:
+        row = _error_row(ts_code, f"基础估值计算失败: {warnings[-1] if warnings else '未知错误'}", basic)
+        row.update({'warning_count': len(warnings), 'warnings': "\n".join(warnings)})
+        return row, new_state
+
+    value_per_share = _to_float(details.value_per_share)
+    implied_pe = None
+    eps = latest_metrics.get('latest_annual_diluted_eps')
+    if value_per_share is not None and isinstance(eps, Decimal) and eps > Decimal('0'):
+        implied_pe = value_per_share / float(eps)
+    enterprise_value = _to_float(details.enterprise_value)
+    pv_terminal_value = _to_float(details.pv_terminal_value)
+    row = {
+        'ts_code': ts_code,
+        'name': basic.get('name'),
+        'industry': basic.get('industry'),
+        'status': 'ok',
+        'error': None,
+        'latest_price': float(latest_price),
+        'pe': _to_float(metrics.get('pe')),
+        'pb': _to_float(metrics.get('pb')),
+        'value_per_share': value_per_share,
+        'upside': value_per_share / float(latest_price) - 1.0 if value_per_share is not None else None,
+        'enterprise_value': enterprise_value,
+        'equity_value': _to_float(details.equity_value),
+        'net_debt': _to_float(details.net_debt),
+        'pv_forecast_ufcf': _to_float(details.pv_forecast_ufcf),
+        'pv_terminal_value': pv_terminal_value,
+        'terminal_value': _to_float(details.terminal_value),
+        'terminal_value_method': details.terminal_value_method_used,
+        'wacc': _to_float(details.wacc_used),
+        'cost_of_equity': _to_float(details.cost_of_equity_used),
+        'dcf_implied_diluted_pe': implied_pe,
+        # 终值现值占企业价值的比例，越高说明估值越依赖预测期之后的假设
+        'tv_to_ev': pv_terminal_value / enterprise_value if pv_terminal_value is not None and enterprise_value else None,
+        'base_report_date': processor.get_base_financial_statement_date(),
+        'latest_report_end_date': None,
+        'statement_source': None,
+        'warning_count': len(warnings),
+        'warnings': "\n".join(warnings) if warnings else None,
+    }
+    return row, new_state
+
+
+def value_chunk(ts_codes: List[str], request_dict: Dict[str, Any], fetcher: Any = None) -> List[Dict[str, Any]]:
+    """
+    批量估值的工作单元 (模块级函数，可在进程池中执行)：对一块股票批量获取数据后逐只估值。
+    报表优先取进程内缓存，其次取持久化报表库，其余股票用一次批量查询获取。
+    Args:
+        ts_codes (List[str]): 本块的股票代码。
+        request_dict (Dict[str, Any]): 估值假设 (StockValuationRequest.model_dump() 的字段，不含 ts_code)。
+        fetcher (Any): 数据获取器 (需提供 get_market_data_for_codes、get_latest_report_end_dates
+                       和 get_raw_financial_data_for_codes)，默认新建 AshareDataFetcher。
+    Returns:
+        List[Dict[str, Any]]: 每只股票一行结果 (列见 RESULT_COLUMNS)，顺序与 ts_codes 一致。
+    """
+    if fetcher is None:
+        from data_fetcher import AshareDataFetcher
+        fetcher = AshareDataFetcher(ts_code='')
+
+    hist_years = max(int(request_dict.get('forecast_years') or 5) + 3, 5)
+    valuation_date = request_dict.get('valuation_date')
+    ttm_valuation_date = valuation_date or pd.Timestamp.now().strftime('%Y-%m-%d')
+
+    market_data = fetcher.get_market_data_for_codes(ts_codes, valuation_date=valuation_date, ttm_valuation_date=ttm_valuation_date)
+    basic_by_code = {}
+    for record in market_data['stock_basic'].to_dict(orient='records'):
+        list_date = record.get('list_date')
+        record['list_date'] = pd.to_datetime(list_date).strftime('%Y-%m-%d') if pd.notna(list_date) else None
+        basic_by_code[record['ts_code']] = record
+    price_by_code = dict(zip(market_data['latest_price']['ts_code'], market_data['latest_price']['close']))
+    metrics_by_code = {}
+    for record in market_data['valuation_metrics'].to_dict(orient='records'):
+        metrics_by_code[record['ts_code']] = {key: (None if pd.isna(value) else value) for key, value in record.items()}
+    dividends = market_data['dividends']
+    dividends_by_code = dict(tuple(dividends.groupby('ts_code', sort=False))) if not dividends.empty else {}
+
+    # 报表: 进程内缓存 → 持久化报表库 → 批量查询
+    latest_dates = fetcher.get_latest_report_end_dates(years=hist_years, ts_codes=ts_codes)
+    processed_data_cache = get_processed_data_cache()
+    statement_store = get_statement_store()
+    cached_states: Dict[str, Dict[str, Any]] = {}
+    sources: Dict[str, str] = {}
+    for code in ts_codes:
+        latest_date = latest_dates.get(code)
+        if latest_date is None:
+            continue
+        if processed_data_cache is not None:
+            state = processed_data_cache.get(processed_data_cache.make_key(code, latest_date, hist_years))
+            if state is not None:
+                cached_states[code], sources[code] = state, 'memory'
+                continue
+        if statement_store is not None:
+            state = statement_store.load_state(code, hist_years, latest_date)
+            if state is not None:
+                cached_states[code], sources[code] = state, 'store'
+    to_fetch = [code for code in ts_codes if code in latest_dates and code not in cached_states]
+    raw_data = fetcher.get_raw_financial_data_for_codes(to_fetch, years=hist_years) if to_fetch else {}
+    grouped = {table_name: dict(tuple(df.groupby('ts_code', sort=False))) if df is not None and not df.empty else {}
+               for table_name, df in raw_data.items()}
+
+    empty_dividends = market_data['dividends'].iloc[0:0]
+    rows = []
+    for code in ts_codes:
+        statements = {table_name: grouped.get(table_name, {}).get(code) for table_name in STATEMENT_TABLES}
+        try:
+            row, new_state = _value_stock(
+                code, request_dict,
+                basic=basic_by_code.get(code),
+                latest_price=_to_float(price_by_code.get(code)),
+                metrics=metrics_by_code.get(code, {}),
+                dividends_df=dividends_by_code.get(code, empty_dividends).reset_index(drop=True),
+                statements=statements,
+                cached_state=cached_states.get(code)
+            )
+        except Exception as e:
+            logger.warning(f"批量估值 {code} 失败: {e}")
+            row, new_state = _error_row(code, f"估值异常: {e}", basic_by_code.get(code)), None
+        if new_state is not None and processed_data_cache is not None:
+            processed_data_cache.put(processed_data_cache.make_key(code, latest_dates.get(code), hist_years), new_state)
+        row['latest_report_end_date'] = latest_dates.get(code)
+        row['statement_source'] = sources.get(code, 'database') if code in latest_dates else None
+        rows.append(row)
+    return rows
+
+
+def _init_worker():
+    """工作进程初始化：丢弃各计算模块逐只股票的 print 输出 (只作用于工作进程自身的 sys.stdout)。"""
+    sys.stdout = open(os.devnull, 'w')
+
+
+def _value_chunk_safely(ts_codes: List[str], request_dict: Dict[str, Any], fetcher: Any = None) -> List[Dict[str, Any]]:
+    """value_chunk 的执行入口：块级失败时整块记为错误行。"""
+    try:
+        return value_chunk(ts_codes, request_dict, fetcher=fetcher)
+    except Exception as e:
+        logger.error(f"批量估值数据块 ({ts_codes[0]}...{ts_codes[-1]}, {len(ts_codes)} 只) 失败: {e}")
+        return [_error_row(code, f"数据块处理失败: {e}") for code in ts_codes]
+
+
+def results_to_frame(rows: List[Dict[str, Any]]) -> pd.DataFrame:
+    """将结果行转换为列顺序固定的 DataFrame，按 ts_code 排序。"""
+    df = pd.DataFrame(rows, columns=RESULT_COLUMNS)
+    for column in RESULT_COLUMNS:
+        if column not in ('ts_code', 'name', 'industry', 'status', 'error', 'terminal_value_method',
+                          'base_report_date', 'latest_report_end_date', 'statement_source', 'warnings'):
+            df[column] = pd.to_numeric(df[column], errors='coerce')
+    df['warning_count'] = df['warning_count'].fillna(0).astype('int32')
+    return df.sort_values('ts_code', kind='stable').reset_index(drop=True)
+
+
+def write_results(df: pd.DataFrame, output_path: str) -> str:
+    """按扩展名 (.parquet 或 .feather/.arrow) 写出结果文件，先写临时文件再原子替换。"""
+    extension = os.path.splitext(output_path)[1].lower()
+    if extension not in ('.parquet', '.feather', '.arrow'):
+        raise BatchValuationError(f"不支持的输出格式: {output_path} (支持 .parquet、.feather)")
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    tmp_path = f"{output_path}.tmp.{os.getpid()}"
+    try:
+        if extension == '.parquet':
+            df.to_parquet(tmp_path, index=False)
+        else:
+            df.to_feather(tmp_path)
+        os.replace(tmp_path, output_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return output_path
+
+
+def default_output_path(output_format: str = 'parquet') -> str:
+    """默认结果文件路径: <输出目录>/valuation_<时间戳>.<格式>。"""
+    if output_format not in OUTPUT_FORMATS:
+        raise BatchValuationError(f"不支持的输出格式: {output_format}，支持: {list(OUTPUT_FORMATS)}")
+    return os.path.join(get_output_dir(), f"valuation_{pd.Timestamp.now().strftime('%Y%m%d_%H%M%S')}.{output_format}")
+
+
+def run_batch_valuation(ts_codes: Optional[List[str]] = None,
+                        request_dict: Optional[Dict[str, Any]] = None,
+                        chunk_size: int = DEFAULT_CHUNK_SIZE,
+                        max_workers: Optional[int] = None,
+                        output_path: Optional[str] = None,
+                        progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None,
+                        fetcher: Any = None,
+                        in_process: bool = False) -> Dict[str, Any]:
+    """
+    对一组股票 (默认全市场) 执行批量 DCF 估值并写出列式结果文件。
+    Args:
+        ts_codes (Optional[List[str]]): 股票代码列表，为空时使用 stock_basic.feather 中的全部股票；
+            只有全市场任务会把结果登记到 latest.json (筛选器使用的结果)。
+        request_dict (Optional[Dict[str, Any]]): 所有股票共用的估值假设 (BatchValuationRequest.assumptions_dict())，为空时全部使用默认值。
+        chunk_size (int): 每块的股票数 (每块一次批量查询、一个进程池任务)。
+        max_workers (Optional[int]): 工作进程数，默认 BATCH_VALUATION_WORKERS (不超过块数)。
+        output_path (Optional[str]): 结果文件路径 (.parquet 或 .feather)，默认写入 get_output_dir()。
+        progress_callback (Optional[Callable]): 每完成一块调用一次，参数为进度字典
+            ('event', 'completed', 'total', 'succeeded', 'failed', 'chunks_completed', 'chunks_total', 'elapsed_seconds')。
+        fetcher (Any): 自定义数据获取器 (测试用)，只能与 in_process=True 一起使用。
+        in_process (bool): 为 True 时在当前进程内顺序执行 (命令行和测试用)；默认始终提交到独立进程池，
+            即使只有一块，以免估值计算占用调用方 (API 服务) 进程。
+    Returns:
+        Dict[str, Any]: 任务摘要 ('total', 'succeeded', 'failed', 'output_path', 'published', 'elapsed_seconds')。
+    Raises:
+        BatchValuationError: 没有可估值的股票、输出路径无效或未在当前进程内执行时指定了 fetcher。
+    """
+    if fetcher is not None and not in_process:
+        raise BatchValuationError("自定义 fetcher 只能在当前进程内执行 (in_process=True)。")
+    started = time.perf_counter()
+    codes = list(dict.fromkeys(ts_codes)) if ts_codes else load_universe()
+    if not codes:
+        raise BatchValuationError("没有需要估值的股票。")
+    if request_dict is None:
+        from api.batch_models import BatchValuationRequest
+        request_dict = BatchValuationRequest().assumptions_dict()
+    request_dict = {key: value for key, value in request_dict.items() if key != 'ts_code'}
+    output_path = output_path or default_output_path()
+    chunk_size = max(int(chunk_size), 1)
+    chunks = [codes[i:i + chunk_size] for i in range(0, len(codes), chunk_size)]
+    workers = max_workers if max_workers is not None else env_int("BATCH_VALUATION_WORKERS", os.cpu_count() or 4)
+    workers = max(1, min(workers, len(chunks)))
+    logger.info(f"批量估值开始: {len(codes)} 只股票，{len(chunks)} 块，"
+                f"{'当前进程内顺序执行' if in_process else f'工作进程数: {workers}'}")
+
+    rows: List[Dict[str, Any]] = []
+    progress = {'succeeded': 0, 'failed': 0, 'chunks_completed': 0}
+
+    def record(chunk_rows: List[Dict[str, Any]]):
+        rows.extend(chunk_rows)
+        progress['chunks_completed'] += 1
+        progress['succeeded'] += sum(1 for row in chunk_rows if row['status'] == 'ok')
+        progress['failed'] += sum(1 for row in chunk_rows if row['status'] != 'ok')
+        if progress_callback is not None:
+            progress_callback({
+                'event': 'progress',
+                'completed': len(rows),
+                'total': len(codes),
+                'succeeded': progress['succeeded'],
+                'failed': progress['failed'],
+                'chunks_completed': progress['chunks_completed'],
+                'chunks_total': len(chunks),
+                'elapsed_seconds': time.perf_counter() - started,
+            })
+
+    if in_process:
+        for chunk in chunks:
+            record(_value_chunk_safely(chunk, request_dict, fetcher))
+    else:
+        start_method = os.getenv("VALUATION_PROCESS_START_METHOD", "spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(start_method),
+                                 initializer=_init_worker) as pool:
+            futures = {pool.submit(_value_chunk_safely, chunk, request_dict): chunk for chunk in chunks}
+            for future in as_completed(futures):
+                try:
+                    chunk_rows = future.result()
+                except Exception as e:
+                    # 工作进程异常退出等无法在块内捕获的错误
+                    chunk_rows = [_error_row(code, f"数据块处理失败: {e}") for code in futures[future]]
+                record(chunk_rows)
+
+    write_results(results_to_frame(rows), output_path)
+    summary = {
+        'total': len(codes),
+        'succeeded': progress['succeeded'],
+        'failed': progress['failed'],
+        'output_path': output_path,
+        'published': not ts_codes,
+        'elapsed_seconds': time.perf_counter() - started,
+    }
+    if summary['published']:
+        publish_latest_results(output_path, summary)
+    logger.info(f"批量估值完成: 成功 {summary['succeeded']} 只，失败 {summary['failed']} 只，"
+                f"耗时 {summary['elapsed_seconds']:.1f}s，结果写入 {output_path}。")
+    return summary
+
+
+if __name__ == '__main__':
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="对指定股票或全市场执行批量 DCF 估值，结果写入 Parquet/Feather 文件。")
+    parser.add_argument('--codes', nargs='*', default=None, help="股票代码，留空则估值 stock_basic.feather 中的全部股票")
+    parser.add_argument('--assumptions', default=None, help="估值假设 JSON 文件 (StockValuationRequest 字段，例如 prediction_years、exit_multiple)")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help="每块的股票数")
+    parser.add_argument('--workers', type=int, default=None, help="工作进程数 (默认 BATCH_VALUATION_WORKERS 或 CPU 核数，1 表示在当前进程内顺序执行)")
+    parser.add_argument('--output', default=None, help="结果文件路径 (.parquet 或 .feather)")
+    args = parser.parse_args()
+
+    assumptions = None
+    if args.assumptions:
+        from api.batch_models import BatchValuationRequest
+        with open(args.assumptions, encoding='utf-8') as f:
+            assumptions = BatchValuationRequest(**json.load(f)).assumptions_dict()
+
+    def print_progress(event: Dict[str, Any]):
+        print(f"[{event['completed']}/{event['total']}] 成功 {event['succeeded']}，失败 {event['failed']}，"
+              f"已用 {event['elapsed_seconds']:.1f}s", flush=True)
+
+    result = run_batch_valuation(ts_codes=args.codes, request_dict=assumptions, chunk_size=args.chunk_size,
+                                 max_workers=args.workers, output_path=args.output, progress_callback=print_progress,
+                                 in_process=args.workers is not None and args.workers <= 1)
+    print(f"完成: 成功 {result['succeeded']} 只，失败 {result['failed']} 只，耗时 {result['elapsed_seconds']:.1f}s，"
+          f"结果: {result['output_path']}")
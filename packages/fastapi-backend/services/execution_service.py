@@ -0,0 +1,181 @@
+import os
+import asyncio
+import logging
+import threading
+import functools
+import multiprocessing
+import weakref
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Any, Callable, Dict
+
+from env_utils import LazySingleton, env_float, env_int
+
+logger = logging.getLogger(__name__)
+
+# --- 执行层配置 (可通过 .env 调整) ---
+# VALUATION_EXECUTOR_MODE: "thread" (默认) 在线程池中运行估值计算；"process" 使用进程池以利用多核。
+# VALUATION_MAX_CONCURRENT: 同时执行的估值计算数量上限 (准入控制)。
+# VALUATION_MAX_QUEUE: 等待准入的请求数上限，超过后直接拒绝 (HTTP 503)。
+# VALUATION_QUEUE_TIMEOUT: 等待准入的最长秒数，超时后拒绝。
+# VALUATION_THREAD_WORKERS / LLM_THREAD_WORKERS / VALUATION_PROCESS_WORKERS: 各执行池的工作者数量。
+_DEFAULT_WORKERS = os.cpu_count() or 4
+
+
+class ExecutionServiceBusyError(Exception):
+    """Raised when a request cannot be admitted because the valuation queue is full."""
+    pass
+
+
+_thread_pools: Dict[str, ThreadPoolExecutor] = {}
+_pool_lock = threading.Lock()
+
+_THREAD_POOL_SIZES = {
+    "valuation": ("VALUATION_THREAD_WORKERS", _DEFAULT_WORKERS),
+    "llm": ("LLM_THREAD_WORKERS", 8),
+    # 批量估值的协调线程 (计算在批量任务自己的进程池中进行)
+    "batch": ("", 1),
+}
+
+
+def get_executor_mode() -> str:
+    """返回估值计算阶段使用的执行模式 ('thread' 或 'process')。"""
+    mode = os.getenv("VALUATION_EXECUTOR_MODE", "thread").lower()
+    return mode if mode in ("thread", "process") else "thread"
+
+
+def get_thread_pool(name: str = "valuation") -> ThreadPoolExecutor:
+    """
+    获取指定名称的线程池 (模块级单例，按需创建)。
+    "valuation" 用于数据库查询与数据处理，"llm" 用于长时间阻塞的 LLM HTTP 调用，
+    两者分开以免慢速 LLM 调用占满估值线程。
+    """
+    pool = _thread_pools.get(name)
+    if pool is not None:
+        return pool
+    with _pool_lock:
+        pool = _thread_pools.get(name)
+        if pool is None:
+            env_name, default_size = _THREAD_POOL_SIZES.get(name, ("", _DEFAULT_WORKERS))
+            max_workers = env_int(env_name, default_size) if env_name else default_size
+            pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"{name}-worker")
+            _thread_pools[name] = pool
+            logger.info(f"线程池 '{name}' 已创建，工作线程数: {max_workers}")
+    return pool
+
+
+def _create_process_pool() -> ProcessPoolExecutor:
+    max_workers = env_int("VALUATION_PROCESS_WORKERS", _DEFAULT_WORKERS)
+    start_method = os.getenv("VALUATION_PROCESS_START_METHOD", "spawn")
+    pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context(start_method))
+    logger.info(f"估值进程池已创建，工作进程数: {max_workers}，启动方式: {start_method}")
+    return pool
+
+
+_shared_process_pool = LazySingleton(_create_process_pool)
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    """获取估值计算进程池 (模块级单例，按需创建)。"""
+    return _shared_process_pool.get()
+
+
+async def run_in_thread(func: Callable[..., Any], *args: Any, pool: str = "valuation", **kwargs: Any) -> Any:
+    """在指定线程池中运行阻塞函数，不阻塞事件循环。"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_thread_pool(pool), functools.partial(func, *args, **kwargs))
+
+
+async def run_valuation_stage(func: Callable[..., Any], *args: Any) -> Any:
+    """
+    按 VALUATION_EXECUTOR_MODE 运行 CPU 密集的估值阶段。
+    进程模式下 func 及其参数、返回值必须可 pickle (模块级函数)。
+    """
+    if get_executor_mode() == "process":
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(get_process_pool(), func, *args)
+    return await run_in_thread(func, *args, pool="valuation")
+
+
+class _AdmissionState:
+    """单个事件循环内的准入状态 (asyncio.Semaphore 绑定于创建它的事件循环)。"""
+
+    def __init__(self, max_concurrent: int):
+        self.semaphore = asyncio.Semaphore(max_concurrent)
+        self.waiting = 0
+        self.active = 0
+
+
+_admission_states: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, _AdmissionState]" = weakref.WeakKeyDictionary()
+
+
+def _get_admission_state() -> _AdmissionState:
+    loop = asyncio.get_running_loop()
+    state = _admission_states.get(loop)
+    if state is None:
+        state = _AdmissionState(env_int("VALUATION_MAX_CONCURRENT", _DEFAULT_WORKERS))
+        _admission_states[loop] = state
+    return state
+
+
+async def _acquire_within(semaphore: asyncio.Semaphore, timeout: float) -> bool:
+    """
+    在 timeout 秒内获取信号量，超时返回 False。
+    不使用 asyncio.wait_for(semaphore.acquire())：Python 3.10 中它可能在许可已被获取后仍抛出超时，导致许可泄漏。
+    这里单独等待 acquire 任务，超时或被取消时若任务已完成则归还许可。
+    """
+    acquire = asyncio.ensure_future(semaphore.acquire())
+    try:
+        await asyncio.wait({acquire}, timeout=timeout)
+    except asyncio.CancelledError:
+        if not acquire.cancel():
+            semaphore.release()
+        raise
+    if acquire.done():
+        return True
+    # 尚未获取：取消后 Semaphore.acquire 不会扣减许可 (已被唤醒时会转交给下一个等待者)
+    acquire.cancel()
+    return False
+
+
+@asynccontextmanager
+async def valuation_admission():
+    """
+    估值请求准入控制。
+    同时执行的估值数受 VALUATION_MAX_CONCURRENT 限制；等待队列超过 VALUATION_MAX_QUEUE
+    或等待超过 VALUATION_QUEUE_TIMEOUT 秒时抛出 ExecutionServiceBusyError。
+    """
+    state = _get_admission_state()
+    max_queue = env_int("VALUATION_MAX_QUEUE", 32)
+    if state.semaphore.locked() and state.waiting >= max_queue:
+        logger.warning(f"估值请求被拒绝：等待队列已满 (waiting={state.waiting}, active={state.active})")
+        raise ExecutionServiceBusyError("估值服务繁忙，等待队列已满，请稍后重试。")
+
+    state.waiting += 1
+    try:
+        acquired = await _acquire_within(state.semaphore, env_float("VALUATION_QUEUE_TIMEOUT", 30.0))
+    finally:
+        state.waiting -= 1
+    if not acquired:
+        logger.warning(f"估值请求等待准入超时 (waiting={state.waiting}, active={state.active})")
+        raise ExecutionServiceBusyError("估值服务繁忙，等待超时，请稍后重试。")
+
+    state.active += 1
+    try:
+        yield
+    finally:
+        state.active -= 1
+        state.semaphore.release()
+
+
+def shutdown_executors(wait: bool = True):
+    """关闭所有执行池 (应用关闭时调用)。"""
+    with _pool_lock:
+        for name, pool in _thread_pools.items():
+            pool.shutdown(wait=wait)
+            logger.info(f"线程池 '{name}' 已关闭。")
+        _thread_pools.clear()
+    process_pool = _shared_process_pool.reset()
+    if process_pool is not None:
+        process_pool.shutdown(wait=wait)
+        logger.info("估值进程池已关闭。")
@@ -0,0 +1,163 @@
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+import pandas as pd
+
+from env_utils import LazySingleton, env_flag, env_int
+
+logger = logging.getLogger(__name__)
+
+# --- 报表处理结果缓存配置 (可通过 .env 调整) ---
+# PROCESSED_DATA_CACHE_ENABLED: 是否启用缓存 (默认 true)。
+# PROCESSED_DATA_CACHE_MAX_ENTRIES: 最多缓存的条目数 (每个条目对应一只股票的一个报告期)。
+# PROCESSED_DATA_CACHE_MAX_MB: 缓存占用内存上限 (按 DataFrame 实际占用估算)。
+# PROCESSED_DATA_CACHE_TTL_SECONDS: 条目有效期 (秒)，用于兜底同一报告期的报表被更正的情况。
+# 缓存位于进程内；VALUATION_EXECUTOR_MODE=process 时每个工作进程各自维护一份。
+
+
+def estimate_size_bytes(value: Any) -> int:
+    """粗略估算对象占用的内存 (DataFrame/Series 按实际占用，容器递归累加，其余按固定开销)。"""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(index=True, deep=True))
+    if isinstance(value, dict):
+        return sum(estimate_size_bytes(k) + estimate_size_bytes(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return sum(estimate_size_bytes(v) for v in value)
+    if isinstance(value, str):
+        return 49 + len(value.encode('utf-8'))
+    return 64
+
+
+class ProcessedDataCache:
+    """
+    进程内的 LRU/TTL 缓存，保存 DataProcessor 的报表处理结果 (DataProcessor.get_cacheable_state())。
+    键为 (ts_code, 最新报告期, 报表回溯年数)：有新报告期入库时键随之变化，旧条目自然失效并被 LRU 淘汰。
+    同时按条目数和估算内存两个上限淘汰最久未使用的条目，并记录命中/未命中/淘汰次数。
+    """
+
+    def __init__(self, max_entries: int = 256, max_bytes: int = 256 * 1024 * 1024, ttl_seconds: float = 6 * 3600):
+        """
+        Args:
+            max_entries (int): 最多缓存的条目数。
+            max_bytes (int): 缓存占用内存上限 (字节)，单个超过上限的条目不会被缓存。
+            ttl_seconds (float): 条目有效期 (秒)，<= 0 表示不过期。
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Hashable, Tuple[float, int, Dict[str, Any]]]" = OrderedDict()
+        self._current_bytes = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+
+    @staticmethod
+    def make_key(ts_code: str, latest_report_end_date: Optional[str], years: int) -> Optional[Tuple[str, str, int]]:
+        """构造缓存键；最新报告期未知时返回 None (不使用缓存)。"""
+        if not ts_code or not isinstance(latest_report_end_date, str) or not latest_report_end_date:
+            return None
+        return (ts_code, latest_report_end_date, int(years))
+
+    def _remove(self, key: Hashable):
+        _, size, _ = self._entries.pop(key)
+        self._current_bytes -= size
+
+    def get(self, key: Optional[Hashable]) -> Optional[Dict[str, Any]]:
+        """
+        查询缓存，命中时将条目移到最近使用的位置。
+        Args:
+            key (Optional[Hashable]): make_key() 返回的键。
+        Returns:
+            Optional[Dict[str, Any]]: 缓存的报表处理结果；未命中或已过期时返回 None。
+        """
+        if key is None:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+            stored_at, _, state = entry
+            if self.ttl_seconds > 0 and time.monotonic() - stored_at > self.ttl_seconds:
+                self._remove(key)
+                self._expirations += 1
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return state
+
+    def contains_stock(self, ts_code: str, years: int) -> bool:
+        """是否缓存了该股票 (相同回溯年数) 的任一报告期，用于决定是否需要预取报表明细。不计入命中统计。"""
+        with self._lock:
+            return any(key[0] == ts_code and key[2] == years for key in self._entries)
+
+    def put(self, key: Optional[Hashable], state: Dict[str, Any]) -> bool:
+        """
+        写入缓存并按条目数和内存上限淘汰最久未使用的条目。
+        Args:
+            key (Optional[Hashable]): make_key() 返回的键，为 None 时不缓存。
+            state (Dict[str, Any]): DataProcessor.get_cacheable_state() 的结果，写入后不应再被修改。
+        Returns:
+            bool: 是否写入成功。
+        """
+        if key is None:
+            return False
+        size = estimate_size_bytes(state)
+        if size > self.max_bytes:
+            logger.warning(f"报表处理结果 {key} 约 {size} 字节，超过缓存上限 {self.max_bytes}，不缓存。")
+            return False
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic(), size, state)
+            self._current_bytes += size
+            while self._entries and (len(self._entries) > self.max_entries or self._current_bytes > self.max_bytes):
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+                self._evictions += 1
+        return True
+
+    def clear(self):
+        """清空缓存 (保留统计计数)。"""
+        with self._lock:
+            self._entries.clear()
+            self._current_bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """返回缓存统计: 条目数、估算内存、命中/未命中/淘汰/过期次数和命中率。"""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._current_bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'ttl_seconds': self.ttl_seconds,
+                'hits': self._hits,
+                'misses': self._misses,
+                'evictions': self._evictions,
+                'expirations': self._expirations,
+                'hit_rate': self._hits / lookups if lookups else None,
+            }
+
+
+_shared_cache = LazySingleton(lambda: ProcessedDataCache(
+    max_entries=env_int("PROCESSED_DATA_CACHE_MAX_ENTRIES", 256),
+    max_bytes=env_int("PROCESSED_DATA_CACHE_MAX_MB", 256) * 1024 * 1024,
+    ttl_seconds=env_int("PROCESSED_DATA_CACHE_TTL_SECONDS", 6 * 3600),
+))
+
+
+def get_processed_data_cache() -> Optional[ProcessedDataCache]:
+    """返回进程内共享的报表处理结果缓存；PROCESSED_DATA_CACHE_ENABLED=false 时返回 None。"""
+    if not env_flag("PROCESSED_DATA_CACHE_ENABLED", True):
+        return None
+    return _shared_cache.get()
@@ -0,0 +1,346 @@
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+
+# --- 筛选条件编译与执行 ---
+# 筛选请求先编译为谓词列表 (区间 / IN)，再在快照预先提取的列数组上逐个计算并原地合并到同一个布尔掩码，
+# 不对 DataFrame 做逐条件的布尔索引复制；每个请求只分配一个掩码和一个临时缓冲区 (与条件数量无关)，
+# 最后只按命中行的位置取出当前页的行。排序使用快照构建时预先计算的各数值列排序排列，请求时不再排序。
+# 低基数的字符串列 (行业、企业性质等) 以 Categorical 存储，并为每个类别预先建立位图 (布尔数组)，
+# 等值/IN 条件直接与位图求交集，分面计数对类别编码做一次 bincount。
+
+# 请求模型中的固定区间字段 (<前缀>_min / <前缀>_max) -> 快照列名
+REQUEST_RANGE_FIELDS = {
+    'pe': 'pe_ttm',  # 历史行为：pe_min/pe_max 作用于 pe_ttm 列
+    'pe_ttm': 'pe_ttm',
+    'pb': 'pb',
+    'ps': 'ps',
+    'ps_ttm': 'ps_ttm',
+    'market_cap': 'market_cap_billion',  # 亿元
+    'dcf_value_per_share': 'dcf_value_per_share',
+    'dcf_upside': 'dcf_upside',
+    'dcf_implied_pe': 'dcf_implied_pe',
+    'dcf_tv_to_ev': 'dcf_tv_to_ev',
+}
+# 排序字段可以使用响应模型中的字段名 (别名) -> 快照列名
+SORT_COLUMN_ALIASES = {
+    'latest_price': 'close',
+    'total_market_cap': 'market_cap_billion',
+}
+# 以 Categorical 存储并建立类别位图索引的列
+CATEGORICAL_COLUMNS = ('industry', 'act_ent_type', 'market', 'area')
+# 请求模型中的等值字段 ('all' 表示不过滤) -> 快照列名
+REQUEST_EQUALS_FIELDS = {
+    'industry': 'industry',
+    'act_ent_type': 'act_ent_type',
+}
+
+
+class ScreenerFilterError(Exception):
+    """Raised when a filter refers to an unknown column or does not fit the column's type."""
+    pass
+
+
+def encode_categorical_columns(df: Optional[pd.DataFrame]) -> Optional[pd.DataFrame]:
+    """
+    将 CATEGORICAL_COLUMNS 中存在的列转换为 Categorical (返回新的 DataFrame，不修改传入的 df)。
+    Args:
+        df (pd.DataFrame): 合并后的筛选数据。
+    Returns:
+        pd.DataFrame: 转换后的数据。
+    """
+    if df is None:
+        return None
+    converted = {column: df[column].astype('category') for column in CATEGORICAL_COLUMNS
+                 if column in df.columns and not isinstance(df[column].dtype, pd.CategoricalDtype)}
+    return df.assign(**converted) if converted else df
+
+
+class CategoryIndex:
+    """
+    Categorical 列的索引：类别编码 (缺失值为 -1) 以及每个类别的行位图。
+    """
+
+    def __init__(self, series: pd.Series):
+        categorical = series.astype('category') if not isinstance(series.dtype, pd.CategoricalDtype) else series
+        self.categories: List = list(categorical.cat.categories)
+        self.codes = np.ascontiguousarray(categorical.cat.codes.to_numpy(dtype=np.int32))
+        self.position = {category: i for i, category in enumerate(self.categories)}
+        self.bitmaps = np.zeros((len(self.categories), len(self.codes)), dtype=bool)
+        valid = self.codes >= 0
+        self.bitmaps[self.codes[valid], np.flatnonzero(valid)] = True
+        self.codes.flags.writeable = False
+        self.bitmaps.flags.writeable = False
+
+    def select(self, values: Iterable, out: np.ndarray):
+        """把取值属于 values 的行写入 out (位图并集；不存在的类别不匹配任何行)。"""
+        selected = [self.position[value] for value in values if value in self.position]
+        if not selected:
+            out[:] = False
+        elif len(selected) == 1:
+            out[:] = self.bitmaps[selected[0]]
+        else:
+            np.any(self.bitmaps[selected], axis=0, out=out)
+
+    def counts(self, mask: np.ndarray) -> Dict:
+        """返回 mask 中各类别的行数 (只包含数量大于 0 的类别，按数量降序)。"""
+        codes = self.codes[mask]
+        counts = np.bincount(codes[codes >= 0], minlength=len(self.categories))
+        nonzero = np.flatnonzero(counts)
+        nonzero = nonzero[np.argsort(-counts[nonzero], kind='stable')]
+        return {self.categories[i]: int(counts[i]) for i in nonzero}
+
+
+class ScreenerColumns:
+    """
+    快照 DataFrame 的列数组视图：数值列转为连续的 float64 数组 (缺失值为 NaN)，其余列为 object 数组。
+    每个数值列同时预先计算升序/降序的排序排列 (argsort，NaN 排在最后，相同值保持快照顺序)；
+    Categorical 列建立 CategoryIndex。
+    随快照构建一次，之后只读，供所有筛选请求共享。
+    """
+
+    def __init__(self, df: Optional[pd.DataFrame]):
+        self.row_count = 0 if df is None else len(df)
+        self.numeric: Dict[str, np.ndarray] = {}
+        self.other: Dict[str, np.ndarray] = {}
+        self.sort_orders: Dict[str, tuple] = {}  # 列名 -> (升序排列, 降序排列)
+        self.categorical: Dict[str, CategoryIndex] = {}
+        if df is None:
+            return
+        for column in df.columns:
+            series = df[column]
+            if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+                array = np.ascontiguousarray(pd.to_numeric(series, errors='coerce').to_numpy(dtype='float64', na_value=np.nan))
+                self.numeric[column] = array
+                # 稳定排序；取负后降序排列中的 NaN 同样排在最后
+                self.sort_orders[column] = (np.argsort(array, kind='stable'), np.argsort(-array, kind='stable'))
+            elif isinstance(series.dtype, pd.CategoricalDtype):
+                self.categorical[column] = CategoryIndex(series)
+            else:
+                self.other[column] = series.to_numpy(dtype=object)
+        arrays = list(self.numeric.values()) + list(self.other.values())
+        arrays += [order for orders in self.sort_orders.values() for order in orders]
+        for array in arrays:
+            array.flags.writeable = False
+
+    def has_column(self, column: str) -> bool:
+        return column in self.numeric or column in self.categorical or column in self.other
+
+    def facet_counts(self, column: str, mask: np.ndarray) -> Dict:
+        """
+        返回 Categorical 列在 mask 选中的行中各类别的数量。
+        Raises:
+            ScreenerFilterError: 列不存在或不是 Categorical 列。
+        """
+        if column not in self.categorical:
+            if self.has_column(column):
+                raise ScreenerFilterError(f"列 '{column}' 不是分类列，不能计算分面。")
+            raise ScreenerFilterError(f"未知的分面列: '{column}'。")
+        return self.categorical[column].counts(mask)
+
+    def sort_order(self, column: str, descending: bool = False) -> np.ndarray:
+        """
+        返回数值列的预计算排序排列 (行位置数组)。
+        Raises:
+            ScreenerFilterError: 列不存在或不是数值列。
+        """
+        column = SORT_COLUMN_ALIASES.get(column, column)
+        if column not in self.sort_orders:
+            if self.has_column(column):
+                raise ScreenerFilterError(f"列 '{column}' 不是数值列，不能用于排序。")
+            raise ScreenerFilterError(f"未知的排序列: '{column}'。")
+        ascending_order, descending_order = self.sort_orders[column]
+        return descending_order if descending else ascending_order
+
+
+class RangePredicate:
+    """lower <= column <= upper (任一端为 None 表示不限)；NaN 不满足条件。"""
+
+    def __init__(self, column: str, lower: Optional[float] = None, upper: Optional[float] = None):
+        self.column = column
+        self.lower = lower
+        self.upper = upper
+
+    def apply(self, columns: ScreenerColumns, mask: np.ndarray, scratch: np.ndarray):
+        if self.column not in columns.numeric:
+            if columns.has_column(self.column):
+                raise ScreenerFilterError(f"列 '{self.column}' 不是数值列，不能使用区间条件。")
+            raise ScreenerFilterError(f"未知的筛选列: '{self.column}'。")
+        values = columns.numeric[self.column]
+        if self.lower is not None:
+            np.greater_equal(values, self.lower, out=scratch)
+            np.logical_and(mask, scratch, out=mask)
+        if self.upper is not None:
+            np.less_equal(values, self.upper, out=scratch)
+            np.logical_and(mask, scratch, out=mask)
+
+    def __repr__(self):
+        return f"RangePredicate({self.column!r}, {self.lower!r}, {self.upper!r})"
+
+
+class InPredicate:
+    """column 取值属于 values；数值列按 float64 比较，其他列按原值比较。required=False 时列不存在则忽略该条件。"""
+
+    def __init__(self, column: str, values: Iterable, required: bool = True):
+        self.column = column
+        self.values = list(values)
+        self.required = required
+
+    def apply(self, columns: ScreenerColumns, mask: np.ndarray, scratch: np.ndarray):
+        if self.column in columns.numeric:
+            try:
+                candidates = np.asarray([float(v) for v in self.values], dtype='float64')
+            except (TypeError, ValueError):
+                raise ScreenerFilterError(f"列 '{self.column}' 是数值列，IN 条件的取值必须是数值: {self.values}")
+            column_values = columns.numeric[self.column]
+        elif self.column in columns.categorical:
+            columns.categorical[self.column].select(self.values, scratch)
+            np.logical_and(mask, scratch, out=mask)
+            return
+        elif self.column in columns.other:
+            candidates = np.asarray(self.values, dtype=object)
+            column_values = columns.other[self.column]
+        elif not self.required:
+            return
+        else:
+            raise ScreenerFilterError(f"未知的筛选列: '{self.column}'。")
+        if len(candidates) == 1:
+            np.equal(column_values, candidates[0], out=scratch)
+        else:
+            scratch[:] = np.isin(column_values, candidates)
+        np.logical_and(mask, scratch, out=mask)
+
+    def __repr__(self):
+        return f"InPredicate({self.column!r}, {self.values!r})"
+
+
+class CompiledScreenerFilter:
+    """编译后的筛选条件：所有谓词的合取 (AND)。"""
+
+    def __init__(self, predicates: List):
+        self.predicates = predicates
+
+    def evaluate(self, columns: ScreenerColumns, exclude_column: Optional[str] = None) -> np.ndarray:
+        """
+        在列数组上计算所有谓词，返回合并后的布尔掩码 (长度为快照行数)。
+        Args:
+            columns (ScreenerColumns): 快照列数组。
+            exclude_column (str): 跳过作用于该列的谓词 (计算该列的分面时使用)。
+        Raises:
+            ScreenerFilterError: 谓词引用了不存在的列或与列类型不符。
+        """
+        mask = np.ones(columns.row_count, dtype=bool)
+        predicates = [p for p in self.predicates if p.column != exclude_column]
+        if not predicates:
+            return mask
+        scratch = np.empty(columns.row_count, dtype=bool)
+        for predicate in predicates:
+            predicate.apply(columns, mask, scratch)
+        return mask
+
+    def facets(self, columns: ScreenerColumns, facet_columns: Iterable[str], mask: Optional[np.ndarray] = None) -> Dict[str, Dict]:
+        """
+        计算分面计数：每个分面列的计数只应用其他列上的条件 (选中某个行业后，仍能看到其他行业的数量)。
+        Args:
+            columns (ScreenerColumns): 快照列数组。
+            facet_columns (Iterable[str]): 分面列 (Categorical 列)。
+            mask (np.ndarray): 已计算好的完整掩码，分面列上没有条件时直接复用。
+        Returns:
+            Dict[str, Dict]: 列名 -> {类别: 数量}。
+        """
+        result = {}
+        for column in facet_columns:
+            if mask is not None and not any(p.column == column for p in self.predicates):
+                column_mask = mask
+            else:
+                column_mask = self.evaluate(columns, exclude_column=column)
+            result[column] = columns.facet_counts(column, column_mask)
+        return result
+
+    def matching_positions(self, columns: ScreenerColumns) -> np.ndarray:
+        """返回满足全部条件的行位置 (升序，即快照中的原始顺序)。"""
+        return np.flatnonzero(self.evaluate(columns))
+
+    def __repr__(self):
+        return f"CompiledScreenerFilter({self.predicates!r})"
+
+
+def page_positions(mask: np.ndarray, start: int, count: int, order: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    返回满足掩码的第 start 到 start+count 条记录的行位置。
+    不排序时按快照顺序；给出排序排列时沿排列分块向后查找命中行，凑够所需条数即停止，
+    无筛选条件 (或条件较宽) 时只需检查当前页附近的行，不必对全部命中行排序。
+    Args:
+        mask (np.ndarray): 筛选掩码。
+        start (int): 起始序号 (从 0 开始)。
+        count (int): 条数。
+        order (np.ndarray): 预计算的排序排列 (可选)。
+    Returns:
+        np.ndarray: 行位置数组。
+    """
+    needed = start + count
+    if order is None:
+        return np.flatnonzero(mask)[start:needed]
+    block_size = max(needed * 2, 1024)
+    hits = []
+    found = 0
+    for block_start in range(0, len(order), block_size):
+        block = order[block_start:block_start + block_size]
+        block_hits = block[mask[block]]
+        hits.append(block_hits)
+        found += len(block_hits)
+        if found >= needed:
+            break
+    if not hits:
+        return np.empty(0, dtype=np.intp)
+    return np.concatenate(hits)[start:needed]
+
+
+def iter_matching_positions(mask: np.ndarray, chunk_size: int, order: Optional[np.ndarray] = None) -> Iterator[np.ndarray]:
+    """
+    按 (排序后的) 顺序分块产出满足掩码的行位置，每块最多 chunk_size 个；
+    每次只检查 chunk_size 个候选行，导出全部结果时内存占用与结果数量无关。
+    Args:
+        mask (np.ndarray): 筛选掩码。
+        chunk_size (int): 每块检查的候选行数。
+        order (np.ndarray): 预计算的排序排列 (可选，默认快照顺序)。
+    Yields:
+        np.ndarray: 行位置数组 (非空)。
+    """
+    row_count = len(mask)
+    for block_start in range(0, row_count, chunk_size):
+        if order is None:
+            block_hits = block_start + np.flatnonzero(mask[block_start:block_start + chunk_size])
+        else:
+            block = order[block_start:block_start + chunk_size]
+            block_hits = block[mask[block]]
+        if len(block_hits):
+            yield block_hits
+
+
+def compile_screener_filters(request) -> CompiledScreenerFilter:
+    """
+    将筛选请求编译为谓词列表：固定的 <字段>_min/<字段>_max 区间字段、industry/act_ent_type 等值字段，
+    以及 filters 中针对任意列的通用区间/IN 条件。
+    Args:
+        request (ApiStockScreenerRequestModel): 筛选请求。
+    Returns:
+        CompiledScreenerFilter: 编译后的筛选条件。
+    """
+    predicates = []
+    for prefix, column in REQUEST_RANGE_FIELDS.items():
+        lower = getattr(request, f"{prefix}_min", None)
+        upper = getattr(request, f"{prefix}_max", None)
+        if lower is not None or upper is not None:
+            predicates.append(RangePredicate(column, lower, upper))
+    for field, column in REQUEST_EQUALS_FIELDS.items():
+        value = getattr(request, field, None)
+        if value is not None and value != 'all':
+            predicates.append(InPredicate(column, [value], required=False))
+    for item in getattr(request, 'filters', None) or []:
+        if item.min is not None or item.max is not None:
+            predicates.append(RangePredicate(item.column, item.min, item.max))
+        if item.values is not None:
+            predicates.append(InPredicate(item.column, item.values))
+    return CompiledScreenerFilter(predicates)
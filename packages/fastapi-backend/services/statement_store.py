@@ -0,0 +1,432 @@
+import os
+import json
+import time
+import zlib
+import logging
+import argparse
+import threading
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from env_utils import LazySingleton, env_flag
+
+logger = logging.getLogger(__name__)
+
+# --- 持久化报表库 ---
+# 离线构建步骤一次性获取并清洗全部股票的三张年度报表，按表和股票代码哈希分桶写入
+# 未压缩的 Arrow IPC (Feather v2) 文件，估值时通过内存映射零拷贝读取，跳过数据库查询和清洗。
+# 目录结构 (默认位于 data_cache_backend/statements，可通过 STATEMENT_STORE_DIR 调整)：
+#   manifest.json                              构建参数、各桶当前文件名、每只股票的最新报告期和行偏移
+#   <table>/part-<bucket>.g<generation>.arrow  每次构建生成新文件，清单切换后再删除旧文件，读取方不会读到半成品
+# STATEMENT_STORE_ENABLED: 估值流程是否读取报表库 (默认 true，清单不存在时自动跳过)。
+
+STATEMENT_TABLES = ('balance_sheet', 'income_statement', 'cash_flow')
+LATEST_BALANCE_SHEET_TABLE = 'latest_balance_sheet'
+STORE_TABLES = STATEMENT_TABLES + (LATEST_BALANCE_SHEET_TABLE,)
+MANIFEST_FILE = 'manifest.json'
+FORMAT_VERSION = 1
+DEFAULT_NUM_BUCKETS = 32
+
+DEFAULT_STORE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "data_cache_backend", "statements"))
+
+
+def get_store_dir() -> str:
+    """返回报表库目录。"""
+    return os.getenv("STATEMENT_STORE_DIR", DEFAULT_STORE_DIR)
+
+
+def bucket_for(ts_code: str, num_buckets: int) -> int:
+    """按股票代码的 CRC32 分桶 (跨进程稳定)。"""
+    return zlib.crc32(ts_code.encode('utf-8')) % num_buckets
+
+
+def annual_window(years: int) -> Tuple[int, int]:
+    """与 AshareDataFetcher.get_raw_financial_data(years) 相同的年报区间 (起始年, 结束年)。"""
+    current_year = pd.Timestamp.now().year
+    return current_year - years, current_year
+
+
+def encode_ratios(ratios: Dict[str, Any]) -> Dict[str, Any]:
+    """将历史比率编码为 JSON (Decimal 保存为字符串以保留全部精度)。"""
+    encoded: Dict[str, Any] = {}
+    for key, value in ratios.items():
+        if value is None or (isinstance(value, float) and pd.isna(value)):
+            encoded[key] = None
+        elif isinstance(value, Decimal):
+            encoded[key] = {'decimal': str(value)}
+        else:
+            encoded[key] = {'float': float(value)}
+    return encoded
+
+
+def decode_ratios(encoded: Dict[str, Any]) -> Dict[str, Any]:
+    """encode_ratios 的逆过程。"""
+    ratios: Dict[str, Any] = {}
+    for key, value in encoded.items():
+        if value is None:
+            ratios[key] = None
+        elif 'decimal' in value:
+            ratios[key] = Decimal(value['decimal'])
+        else:
+            ratios[key] = np.float64(value['float'])
+    return ratios
+
+
+def _write_atomic(path: str, write_func):
+    tmp_path = f"{path}.tmp"
+    write_func(tmp_path)
+    os.replace(tmp_path, path)
+
+
+class StatementStore:
+    """
+    报表库的只读访问器。清单按修改时间自动重新加载；分桶文件不可变，按文件名缓存内存映射后的 Arrow 表，
+    按清单中的行偏移切片 (零拷贝) 后只把单只股票的几行数据转换为 DataFrame。
+    """
+
+    def __init__(self, store_dir: Optional[str] = None):
+        """
+        Args:
+            store_dir (Optional[str]): 报表库目录，默认为 get_store_dir()。
+        """
+        self.store_dir = store_dir or get_store_dir()
+        self._manifest: Optional[Dict[str, Any]] = None
+        self._manifest_mtime: Optional[int] = None
+        self._tables: Dict[str, pa.Table] = {}
+        self._ratio_table: Optional[Tuple[Any, pd.DataFrame]] = None
+        self._lock = threading.Lock()
+
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.store_dir, MANIFEST_FILE)
+
+    def load_manifest(self) -> Optional[Dict[str, Any]]:
+        """读取清单 (文件未变化时返回已加载的副本)；清单不存在或损坏时返回 None。"""
+        try:
+            mtime = os.stat(self.manifest_path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            if self._manifest is not None and self._manifest_mtime == mtime:
+                return self._manifest
+            try:
+                with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                    manifest = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"读取报表库清单 {self.manifest_path} 失败: {e}")
+                return None
+            if manifest.get('format_version') != FORMAT_VERSION:
+                logger.warning(f"报表库清单版本 {manifest.get('format_version')} 与当前版本 {FORMAT_VERSION} 不一致，忽略报表库。")
+                return None
+            self._manifest = manifest
+            self._manifest_mtime = mtime
+            # 旧文件可能已被删除，只保留当前清单引用的表
+            current_files = {name for files in manifest.get('files', {}).values() for name in files.values()}
+            self._tables = {name: table for name, table in self._tables.items() if name in current_files}
+            return manifest
+
+    def _open_table(self, relative_path: str) -> pa.Table:
+        """以内存映射方式打开分桶文件 (Arrow IPC 未压缩，读取不复制数据)。"""
+        with self._lock:
+            table = self._tables.get(relative_path)
+        if table is None:
+            source = pa.memory_map(os.path.join(self.store_dir, relative_path), 'r')
+            table = pa.ipc.open_file(source).read_all()
+            with self._lock:
+                self._tables[relative_path] = table
+        return table
+
+    def _stock_entry(self, ts_code: str, years: int) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        manifest = self.load_manifest()
+        if manifest is None:
+            return None, None
+        if [manifest.get('start_year'), manifest.get('end_year')] != list(annual_window(years)):
+            return manifest, None
+        return manifest, manifest.get('stocks', {}).get(ts_code)
+
+    def covers(self, ts_code: str, years: int) -> bool:
+        """报表库是否包含该股票 (相同年报区间) 的数据。"""
+        return self._stock_entry(ts_code, years)[1] is not None
+
+    def read_table(self, manifest: Dict[str, Any], entry: Dict[str, Any], table_name: str) -> pd.DataFrame:
+        """读取单只股票在某张表中的行 (按清单记录的列和顺序)。"""
+        offset, length = entry['rows'][table_name]
+        relative_path = manifest['files'][table_name][str(entry['bucket'])]
+        sliced = self._open_table(relative_path).slice(offset, length).select(entry['columns'][table_name])
+        return sliced.to_pandas()
+
+    def read_frame(self, manifest: Dict[str, Any], entry: Dict[str, Any], table_name: str) -> pd.DataFrame:
+        """读取单只股票在某张表中的数据，并还原构建时的具名索引。"""
+        df = self.read_table(manifest, entry, table_name)
+        index_column = entry.get('index', {}).get(table_name)
+        return df.set_index(index_column) if index_column else df
+
+    def load_state(self, ts_code: str, years: int, latest_report_end_date: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        读取股票的清洗后报表和历史比率，返回可直接传给 DataProcessor(cached_state=...) 的报表处理结果。
+        Args:
+            ts_code (str): 股票代码。
+            years (int): 报表回溯年数，需与构建报表库时一致。
+            latest_report_end_date (Optional[str]): 数据库中的最新报告期，提供时仅在与报表库一致时返回数据。
+        Returns:
+            Optional[Dict[str, Any]]: 报表处理结果；报表库不包含该股票、年报区间不一致或数据已过期时返回 None。
+        """
+        manifest, entry = self._stock_entry(ts_code, years)
+        if entry is None:
+            return None
+        if latest_report_end_date is not None and entry.get('latest_report_end_date') != latest_report_end_date:
+            logger.info(f"报表库中 {ts_code} 的最新报告期 {entry.get('latest_report_end_date')} 落后于数据库 {latest_report_end_date}，改为从数据库读取。")
+            return None
+        try:
+            processed_data = {table_name: self.read_frame(manifest, entry, table_name) for table_name in STATEMENT_TABLES}
+            latest_bs_df = self.read_table(manifest, entry, LATEST_BALANCE_SHEET_TABLE)
+        except (OSError, KeyError, pa.ArrowException) as e:
+            logger.warning(f"从报表库读取 {ts_code} 失败，改为从数据库读取: {e}")
+            return None
+        eps = entry.get('latest_annual_diluted_eps')
+        return {
+            'processed_data': processed_data,
+            'latest_balance_sheet': latest_bs_df.iloc[0] if not latest_bs_df.empty else None,
+            'base_financial_statement_date': entry.get('base_financial_statement_date'),
+            'latest_annual_diluted_eps': Decimal(eps) if eps is not None else None,
+            'historical_ratios': decode_ratios(entry.get('historical_ratios', {})),
+            'warnings': list(entry.get('warnings', [])),
+        }
+
+    def read_all_statements(self, manifest: Dict[str, Any]) -> Dict[str, pd.DataFrame]:
+        """读取全部股票的清洗后报表：每张表拼接所有分桶 (长格式，含 ts_code 和 end_date 列)。"""
+        statements: Dict[str, pd.DataFrame] = {}
+        for table_name in STATEMENT_TABLES:
+            frames = [self._open_table(relative_path).to_pandas()
+                      for _, relative_path in sorted(manifest['files'][table_name].items(), key=lambda item: int(item[0]))]
+            frames = [df for df in frames if not df.empty]
+            statements[table_name] = pd.concat(frames, ignore_index=True, sort=False) if frames else pd.DataFrame()
+        return statements
+
+    def historical_ratio_table(self) -> Optional[pd.DataFrame]:
+        """
+        全市场历史比率表 (股票 x 比率，见 cross_sectional_ratios.calculate_cross_sectional_ratios)，
+        在全部股票的分桶数据上一次计算，按清单的 generation 缓存，报表库重建后重新计算。
+        Returns:
+            Optional[pd.DataFrame]: 以 ts_code 为索引的比率表；清单不存在或读取失败时返回 None。
+        """
+        from cross_sectional_ratios import calculate_cross_sectional_ratios
+
+        manifest = self.load_manifest()
+        if manifest is None:
+            return None
+        generation = manifest.get('generation')
+        cached = self._ratio_table
+        if cached is not None and cached[0] == generation:
+            return cached[1]
+        try:
+            statements = self.read_all_statements(manifest)
+        except (OSError, KeyError, pa.ArrowException) as e:
+            logger.warning(f"读取报表库全部报表失败，无法计算全市场历史比率: {e}")
+            return None
+        started = time.perf_counter()
+        ratio_table = calculate_cross_sectional_ratios(statements)
+        logger.info(f"全市场历史比率计算完成: {len(ratio_table)} 只股票，耗时 {time.perf_counter() - started:.2f}s。")
+        self._ratio_table = (generation, ratio_table)
+        return ratio_table
+
+
+# 报表库目录配置改变时重新创建读取器
+_shared_store = LazySingleton(StatementStore, key=get_store_dir)
+
+
+def get_statement_store() -> Optional[StatementStore]:
+    """返回进程内共享的报表库读取器；STATEMENT_STORE_ENABLED=false 时返回 None。"""
+    if not env_flag("STATEMENT_STORE_ENABLED", True):
+        return None
+    return _shared_store.get()
+
+
+# --- 构建 ---
+
+def _state_to_frames(state: Dict[str, Any]) -> Tuple[Dict[str, pd.DataFrame], Dict[str, Optional[str]]]:
+    """
+    将 DataProcessor.get_cacheable_state() 的结果拆成各表的 DataFrame (最新资产负债表为单行)。
+    具名索引 (例如计算历史比率后资产负债表以 end_date 为索引) 转为普通列，返回各表的索引列名以便读取时还原。
+    """
+    frames: Dict[str, pd.DataFrame] = {}
+    index_columns: Dict[str, Optional[str]] = {}
+    for table_name in STATEMENT_TABLES:
+        df = state['processed_data'].get(table_name, pd.DataFrame())
+        index_columns[table_name] = df.index.name
+        frames[table_name] = df.reset_index(drop=df.index.name is None)
+    latest_bs = state.get('latest_balance_sheet')
+    frames[LATEST_BALANCE_SHEET_TABLE] = pd.DataFrame([latest_bs.to_dict()]) if latest_bs is not None else pd.DataFrame()
+    index_columns[LATEST_BALANCE_SHEET_TABLE] = None
+    return frames, index_columns
+
+
+def _write_bucket(path: str, frames: List[pd.DataFrame]):
+    """拼接同一桶内各股票的行并写为未压缩的 Arrow IPC 文件 (可内存映射)。"""
+    non_empty = [df for df in frames if not df.empty]
+    combined = pd.concat(non_empty, ignore_index=True, sort=False) if non_empty else pd.DataFrame()
+    table = pa.Table.from_pandas(combined, preserve_index=False)
+
+    def write(tmp_path: str):
+        with pa.OSFile(tmp_path, 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+    _write_atomic(path, write)
+
+
+def build_statement_store(years: int = 8,
+                          ts_codes: Optional[List[str]] = None,
+                          full_rebuild: bool = False,
+                          chunk_size: int = 500,
+                          num_buckets: int = DEFAULT_NUM_BUCKETS,
+                          store_dir: Optional[str] = None,
+                          fetcher: Any = None) -> Dict[str, Any]:
+    """
+    构建或增量更新报表库：只重新获取和清洗最新报告期发生变化 (或新增) 的股票，并只重写这些股票所在的分桶。
+    Args:
+        years (int): 报表回溯年数，需与估值时的 max(forecast_years + 3, 5) 一致才能被估值流程使用。
+        ts_codes (Optional[List[str]]): 只处理这些股票，为空时处理全部股票 (并移除数据库中已没有报表的股票)。
+        full_rebuild (bool): 忽略已有清单，全部重新构建。
+        chunk_size (int): 每次批量查询的股票数。
+        num_buckets (int): 分桶数 (已有清单的分桶数不同时自动全量重建)。
+        store_dir (Optional[str]): 报表库目录，默认为 get_store_dir()。
+        fetcher (Any): 数据获取器 (需提供 get_latest_report_end_dates 和 get_raw_financial_data_for_codes)，默认新建 AshareDataFetcher。
+    Returns:
+        Dict[str, Any]: 构建摘要 ('updated', 'removed', 'skipped', 'unchanged', 'rewritten_buckets', 'elapsed_seconds')。
+    """
+    from data_fetcher import AshareDataFetcher
+    from data_processor import DataProcessor
+
+    started = time.perf_counter()
+    store_dir = store_dir or get_store_dir()
+    os.makedirs(store_dir, exist_ok=True)
+    fetcher = fetcher or AshareDataFetcher(ts_code='')
+    start_year, end_year = annual_window(years)
+
+    store = StatementStore(store_dir)
+    manifest = None if full_rebuild else store.load_manifest()
+    if manifest is not None and (manifest.get('start_year'), manifest.get('end_year'), manifest.get('num_buckets')) != (start_year, end_year, num_buckets):
+        logger.info("报表库的年报区间或分桶数与本次构建不一致，执行全量重建。")
+        manifest = None
+    old_manifest = manifest
+    # 复制每个条目，更新行偏移时不影响读取旧分桶所用的清单
+    stocks: Dict[str, Dict[str, Any]] = {code: dict(entry) for code, entry in old_manifest['stocks'].items()} if old_manifest else {}
+
+    latest_dates = fetcher.get_latest_report_end_dates(years=years, ts_codes=ts_codes)
+    stale_codes = sorted(code for code, end_date in latest_dates.items()
+                         if stocks.get(code, {}).get('latest_report_end_date') != end_date)
+    removed_codes = sorted(set(stocks) - set(latest_dates)) if ts_codes is None else []
+    logger.info(f"报表库增量构建: {len(stale_codes)} 只股票需要更新，{len(removed_codes)} 只需要移除，"
+                f"{len(latest_dates) - len(stale_codes)} 只未变化。")
+
+    new_frames: Dict[str, Dict[str, pd.DataFrame]] = {}
+    skipped: List[str] = []
+    for chunk_start in range(0, len(stale_codes), chunk_size):
+        chunk = stale_codes[chunk_start:chunk_start + chunk_size]
+        raw_data = fetcher.get_raw_financial_data_for_codes(chunk, years=years)
+        grouped = {table_name: dict(tuple(df.groupby('ts_code', sort=False))) if not df.empty else {}
+                   for table_name, df in raw_data.items()}
+        for code in chunk:
+            statements = {table_name: grouped.get(table_name, {}).get(code) for table_name in STATEMENT_TABLES}
+            if any(df is None or df.empty for df in statements.values()):
+                skipped.append(code)
+                continue
+            processor = DataProcessor({'stock_basic': {'ts_code': code},
+                                       **{table_name: df.reset_index(drop=True) for table_name, df in statements.items()}})
+            state = processor.get_cacheable_state()
+            new_frames[code], index_columns = _state_to_frames(state)
+            eps = state.get('latest_annual_diluted_eps')
+            stocks[code] = {
+                'latest_report_end_date': latest_dates[code],
+                'bucket': bucket_for(code, num_buckets),
+                'base_financial_statement_date': state.get('base_financial_statement_date'),
+                'latest_annual_diluted_eps': str(eps) if eps is not None else None,
+                'historical_ratios': encode_ratios(state.get('historical_ratios', {})),
+                'warnings': state.get('warnings', []),
+                'columns': {table_name: [str(col) for col in df.columns] for table_name, df in new_frames[code].items()},
+                'index': index_columns,
+            }
+    for code in removed_codes + skipped:
+        stocks.pop(code, None)
+
+    changed_codes = set(new_frames) | set(removed_codes) | set(skipped)
+    affected_buckets = sorted({bucket_for(code, num_buckets) for code in changed_codes})
+    if old_manifest is None:
+        affected_buckets = list(range(num_buckets))
+    generation = (old_manifest.get('generation', 0) + 1) if old_manifest else 1
+    files: Dict[str, Dict[str, str]] = {table_name: dict(old_manifest['files'][table_name]) if old_manifest else {}
+                                        for table_name in STORE_TABLES}
+    obsolete_files: List[str] = []
+
+    for bucket in affected_buckets:
+        bucket_codes = sorted(code for code, entry in stocks.items() if entry['bucket'] == bucket)
+        for table_name in STORE_TABLES:
+            frames = []
+            offset = 0
+            for code in bucket_codes:
+                if code in new_frames:
+                    df = new_frames[code][table_name]
+                else:
+                    df = store.read_table(old_manifest, old_manifest['stocks'][code], table_name)
+                stocks[code]['rows'] = {**stocks[code].get('rows', {}), table_name: [offset, len(df)]}
+                offset += len(df)
+                frames.append(df)
+            relative_path = os.path.join(table_name, f"part-{bucket:03d}.g{generation}.arrow")
+            os.makedirs(os.path.join(store_dir, table_name), exist_ok=True)
+            _write_bucket(os.path.join(store_dir, relative_path), frames)
+            if str(bucket) in files[table_name]:
+                obsolete_files.append(files[table_name][str(bucket)])
+            files[table_name][str(bucket)] = relative_path
+
+    new_manifest = {
+        'format_version': FORMAT_VERSION,
+        'generation': generation,
+        'built_at': pd.Timestamp.now().isoformat(),
+        'start_year': start_year,
+        'end_year': end_year,
+        'years': years,
+        'num_buckets': num_buckets,
+        'files': files,
+        'stocks': stocks,
+    }
+
+    def write_manifest(tmp_path: str):
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(new_manifest, f, ensure_ascii=False)
+    _write_atomic(os.path.join(store_dir, MANIFEST_FILE), write_manifest)
+
+    # 清单切换后再删除旧文件；已映射旧文件的读取方不受影响
+    for relative_path in obsolete_files:
+        try:
+            os.remove(os.path.join(store_dir, relative_path))
+        except OSError as e:
+            logger.warning(f"删除旧的报表库文件 {relative_path} 失败: {e}")
+
+    summary = {
+        'updated': sorted(new_frames),
+        'removed': removed_codes,
+        'skipped': sorted(skipped),
+        'unchanged': len(latest_dates) - len(stale_codes),
+        'rewritten_buckets': affected_buckets,
+        'elapsed_seconds': time.perf_counter() - started,
+    }
+    logger.info(f"报表库构建完成: 更新 {len(summary['updated'])} 只，移除 {len(removed_codes)} 只，"
+                f"跳过 {len(skipped)} 只 (缺少报表)，重写 {len(affected_buckets)} 个分桶，耗时 {summary['elapsed_seconds']:.1f}s。")
+    return summary
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="构建或增量更新清洗后的年度报表库 (Arrow IPC)。")
+    parser.add_argument('--years', type=int, default=8, help="报表回溯年数，需与估值使用的 max(forecast_years + 3, 5) 一致 (默认 8)")
+    parser.add_argument('--codes', nargs='*', default=None, help="只处理指定股票代码")
+    parser.add_argument('--full', action='store_true', help="忽略已有清单，全量重建")
+    parser.add_argument('--chunk-size', type=int, default=500, help="每次批量查询的股票数")
+    args = parser.parse_args()
+    result = build_statement_store(years=args.years, ts_codes=args.codes, full_rebuild=args.full, chunk_size=args.chunk_size)
+    print(f"更新 {len(result['updated'])} 只，移除 {len(result['removed'])} 只，跳过 {len(result['skipped'])} 只，"
+          f"未变化 {result['unchanged']} 只，耗时 {result['elapsed_seconds']:.1f}s。")
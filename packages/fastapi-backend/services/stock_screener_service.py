@@ -4,6 +4,13 @@ import tushare as ts
 from dotenv import load_dotenv
 from datetime import datetime, timedelta
 import logging
+import threading
+import time
+
+from services import batch_valuation_service
+from services import statement_store
+from services import trading_calendar_service
+from services import screener_filter_engine
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -90,38 +97,21 @@ def get_tushare_pro_api():
 
 def get_latest_valid_trade_date():
     """
-    Gets the most recent valid trading date from Tushare.
-    Tries today and goes back up to 7 days.
+    Gets the most recent trading date whose daily_basic data has been published.
+    Worked out from the locally cached SSE trading calendar and daily_basic cache files;
+    Tushare is only probed (at most once per TRADE_DATE_PROBE_INTERVAL_SECONDS) when the
+    latest open date cannot be decided locally. See services/trading_calendar_service.py.
 
     Returns:
         str: The most recent valid trade date in 'YYYYMMDD' format.
     Raises:
-        StockScreenerServiceError: If API is not initialized or no valid date is found.
+        StockScreenerServiceError: If neither the calendar nor any cached daily data is available.
     """
-    pro = get_tushare_pro_api() # Ensures API is initialized
-
-    for i in range(8): # Check today and previous 7 days
-        date_obj = datetime.now() - timedelta(days=i)
-        potential_trade_date = date_obj.strftime('%Y%m%d')
-        try:
-            df_cal = pro.trade_cal(exchange='SSE', start_date=potential_trade_date, end_date=potential_trade_date)
-            if not df_cal.empty and df_cal['is_open'].iloc[0] == 1:
-                test_ts_code = '000001.SZ'
-                df_check = pro.daily_basic(ts_code=test_ts_code, trade_date=potential_trade_date, fields='ts_code')
-                if not df_check.empty:
-                    logger.info(f"找到最新的有效交易日: {potential_trade_date}")
-                    return potential_trade_date
-                else:
-                    logger.info(f"交易日 {potential_trade_date} 是交易日，但每日指标数据尚未发布，尝试前一天。")
-            else:
-                 logger.info(f"日期 {potential_trade_date} 不是交易日或交易所未开放，尝试前一天。")
-        except Exception as e:
-            logger.warning(f"检查交易日 {potential_trade_date} 时出错: {e}")
-            continue
-
-    logger.error("过去7天内未能找到有效的交易日数据。")
-    raise StockScreenerServiceError("过去7天内未能找到有效的交易日数据。")
-
+    try:
+        return trading_calendar_service.get_trading_calendar().latest_valid_trade_date()
+    except trading_calendar_service.TradingCalendarError as e:
+        logger.error(f"无法确定最新有效交易日: {e}")
+        raise StockScreenerServiceError(str(e))
 
 def load_stock_basic(force_update=False):
     """
@@ -135,7 +125,6 @@ def load_stock_basic(force_update=False):
     Raises:
         StockScreenerServiceError: If an error occurs.
     """
-    pro = get_tushare_pro_api()
     cache_file_path = os.path.join(CACHE_DIR, "stock_basic.feather")
 
     if not force_update and os.path.exists(cache_file_path):
@@ -149,6 +138,7 @@ def load_stock_basic(force_update=False):
             logger.warning(f"从缓存文件 '{cache_file_path}' 加载股票基本信息失败: {e}。将尝试从API获取。")
 
     logger.info("正在从 Tushare API 获取股票基本信息 (stock_basic)...")
+    pro = get_tushare_pro_api() # 仅在需要访问 API 时初始化，缓存命中时可离线使用
     try:
         # 获取所有上市状态的股票，包括上市(L)、暂停上市(P)、退市(D)等
         stock_basic_df = pro.stock_basic(
@@ -181,7 +171,6 @@ def load_daily_basic(trade_date, force_update=False):
     Raises:
         StockScreenerServiceError: If an error occurs.
     """
-    pro = get_tushare_pro_api()
     if not trade_date:
         logger.error("未提供交易日期，无法加载每日行情指标。")
         raise StockScreenerServiceError("未提供交易日期。")
@@ -199,6 +188,7 @@ def load_daily_basic(trade_date, force_update=False):
             logger.warning(f"从缓存文件 '{cache_file_path}' 加载每日行情指标失败: {e}。将尝试从API获取。")
 
     logger.info(f"正在从 Tushare API 获取交易日 {trade_date} 的每日行情指标 (daily_basic)...")
+    pro = get_tushare_pro_api() # 仅在需要访问 API 时初始化，缓存命中时可离线使用
     try:
         daily_basic_fields = 'ts_code,trade_date,close,turnover_rate,turnover_rate_f,volume_ratio,pe,pe_ttm,pb,ps,ps_ttm,dv_ratio,dv_ttm,total_share,float_share,free_share,total_mv,circ_mv'
 
@@ -262,7 +252,8 @@ def get_cache_file_timestamps() -> dict:
     """
     timestamps = {
         "stock_basic": None,
-        "daily_basic": None # This will represent the latest daily_basic file found
+        "daily_basic": None, # This will represent the latest daily_basic file found
+        "dcf_valuation": None # 最新一次全市场批量估值结果 (latest.json 登记时间)
     }
 
     # Stock Basic
@@ -296,8 +287,130 @@ def get_cache_file_timestamps() -> dict:
     except Exception as e_dir:
         logger.error(f"遍历缓存目录 {CACHE_DIR} 以查找每日数据文件时出错: {e_dir}")
 
+    timestamps["dcf_valuation"] = get_dcf_valuation_update_time()
+
     return timestamps
 
+# 批量估值结果列 -> 筛选器列；dcf_upside 按筛选数据的最新收盘价重新计算
+DCF_SCREENER_COLUMNS = {
+    'value_per_share': 'dcf_value_per_share',
+    'dcf_implied_diluted_pe': 'dcf_implied_pe',
+    'tv_to_ev': 'dcf_tv_to_ev',
+    'wacc': 'dcf_wacc',
+    'base_report_date': 'dcf_base_report_date',
+}
+
+_dcf_valuation_cache = {'key': None, 'df': None}
+
+def find_latest_dcf_valuation_file():
+    """
+    返回 latest.json 登记的最新全市场批量估值结果文件 (部分股票的批量估值不会登记，也不会被使用)。
+    Returns:
+        str or None: 文件路径，尚无全市场结果或文件已不存在时返回 None。
+    """
+    pointer = batch_valuation_service.read_latest_pointer()
+    if pointer is None or not os.path.exists(pointer['output_path']):
+        return None
+    return pointer['output_path']
+
+def get_dcf_valuation_update_time():
+    """返回最新全市场批量估值结果的登记时间 (ISO 格式)，没有结果时返回 None。"""
+    pointer = batch_valuation_service.read_latest_pointer()
+    return pointer.get('published_at') if pointer is not None else None
+
+def load_latest_dcf_valuations():
+    """
+    加载最新一次全市场批量估值中估值成功的股票 (按文件路径和修改时间缓存)。
+    Returns:
+        pd.DataFrame: ts_code 和 DCF_SCREENER_COLUMNS 中的筛选器列；没有结果文件时为空 DataFrame。
+    """
+    empty_df = pd.DataFrame(columns=['ts_code'] + list(DCF_SCREENER_COLUMNS.values()))
+    path = find_latest_dcf_valuation_file()
+    if path is None:
+        return empty_df
+    cache_key = (path, os.path.getmtime(path))
+    if _dcf_valuation_cache['key'] == cache_key:
+        return _dcf_valuation_cache['df']
+
+    columns = ['ts_code', 'status'] + list(DCF_SCREENER_COLUMNS)
+    if path.endswith(".parquet"):
+        df = pd.read_parquet(path, columns=columns)
+    else:
+        df = pd.read_feather(path, columns=columns)
+    df = df[df['status'] == 'ok'].drop(columns=['status']).rename(columns=DCF_SCREENER_COLUMNS)
+    df['ts_code'] = df['ts_code'].astype(str)
+    df = df.drop_duplicates('ts_code', keep='last').reset_index(drop=True)
+    logger.info(f"已加载批量估值结果 '{path}'，共 {len(df)} 只股票。")
+    _dcf_valuation_cache.update(key=cache_key, df=df)
+    return df
+
+def merge_dcf_valuations(merged_df):
+    """
+    将最新全市场批量估值结果按 ts_code 左连接到筛选数据，并按当前收盘价计算 dcf_upside (每股价值 / 收盘价 - 1)。
+    加载失败或没有估值结果时 DCF 列为 NaN，不影响其他筛选条件。
+    Args:
+        merged_df (pd.DataFrame): get_merged_stock_data 合并后的数据 (需要 ts_code 和 close 列)。
+    Returns:
+        pd.DataFrame: 增加 DCF 列后的数据。
+    """
+    try:
+        dcf_df = load_latest_dcf_valuations()
+    except Exception as e:
+        logger.warning(f"加载批量估值结果失败，DCF 列将为空: {e}")
+        dcf_df = pd.DataFrame(columns=['ts_code'] + list(DCF_SCREENER_COLUMNS.values()))
+
+    merged_df = merged_df.drop(columns=[col for col in DCF_SCREENER_COLUMNS.values() if col in merged_df.columns])
+    merged_df = pd.merge(merged_df, dcf_df, on='ts_code', how='left')
+    for column in DCF_SCREENER_COLUMNS.values():
+        if column != 'dcf_base_report_date':
+            merged_df[column] = pd.to_numeric(merged_df[column], errors='coerce')
+    close = merged_df['close'] if 'close' in merged_df.columns else pd.Series(float('nan'), index=merged_df.index)
+    merged_df['dcf_upside'] = (merged_df['dcf_value_per_share'] / close.where(close > 0)) - 1
+    return merged_df
+
+# 报表库全市场历史比率 (cross_sectional_ratios 截面一次计算) -> 筛选器列，可用于通用筛选条件和排序
+HISTORICAL_RATIO_SCREENER_COLUMNS = {
+    'historical_revenue_cagr': 'hist_revenue_cagr',
+    'operating_margin_median': 'hist_operating_margin',
+    'cogs_to_revenue_ratio': 'hist_cogs_to_revenue',
+    'capex_to_revenue_ratio': 'hist_capex_to_revenue',
+    'nwc_to_revenue_ratio': 'hist_nwc_to_revenue',
+    'accounts_receivable_days': 'hist_receivable_days',
+    'inventory_days': 'hist_inventory_days',
+    'effective_tax_rate': 'hist_effective_tax_rate',
+}
+
+def get_historical_ratio_key():
+    """报表库清单的 generation (load_manifest 只 stat 清单文件)，用于判断快照中的历史比率列是否过期；报表库不可用时为 None。"""
+    store = statement_store.get_statement_store()
+    manifest = store.load_manifest() if store is not None else None
+    return manifest.get('generation') if manifest is not None else None
+
+def merge_historical_ratios(merged_df):
+    """
+    将报表库的全市场历史比率表 (StatementStore.historical_ratio_table) 按 ts_code 左连接到筛选数据。
+    报表库未启用、尚未构建或计算失败时历史比率列为 NaN，不影响其他筛选条件。
+    Args:
+        merged_df (pd.DataFrame): get_merged_stock_data 合并后的数据 (需要 ts_code 列)。
+    Returns:
+        pd.DataFrame: 增加 HISTORICAL_RATIO_SCREENER_COLUMNS 中各列后的数据。
+    """
+    ratio_df = pd.DataFrame(columns=['ts_code'] + list(HISTORICAL_RATIO_SCREENER_COLUMNS.values()))
+    try:
+        store = statement_store.get_statement_store()
+        ratio_table = store.historical_ratio_table() if store is not None else None
+        if ratio_table is not None:
+            ratio_df = (ratio_table.reindex(columns=list(HISTORICAL_RATIO_SCREENER_COLUMNS))
+                        .rename(columns=HISTORICAL_RATIO_SCREENER_COLUMNS).rename_axis('ts_code').reset_index())
+    except Exception as e:
+        logger.warning(f"加载全市场历史比率失败，历史比率列将为空: {e}")
+
+    merged_df = merged_df.drop(columns=[col for col in HISTORICAL_RATIO_SCREENER_COLUMNS.values() if col in merged_df.columns])
+    merged_df = pd.merge(merged_df, ratio_df, on='ts_code', how='left')
+    for column in HISTORICAL_RATIO_SCREENER_COLUMNS.values():
+        merged_df[column] = pd.to_numeric(merged_df[column], errors='coerce')
+    return merged_df
+
 def get_merged_stock_data(trade_date, force_update_basic=False, force_update_daily=False):
     """
     Loads, merges, and pre-processes stock_basic and daily_basic data.
@@ -376,6 +489,11 @@ def get_merged_stock_data(trade_date, force_update_basic=False, force_update_dai
             merged_df.loc[merged_df['act_ent_type'] == '', 'act_ent_type'] = '未知'
             logger.info(f"处理 'act_ent_type' 字段，将空值替换为'未知'")
 
+        # 连接夜间批量估值结果 (DCF 每股价值、隐含 PE、终值占比)
+        merged_df = merge_dcf_valuations(merged_df)
+        # 连接报表库的全市场历史比率 (收入 CAGR、营业利润率中位数、周转天数等)
+        merged_df = merge_historical_ratios(merged_df)
+
         logger.info("数据预处理完成 (指标转换为数值型，市值单位转换)。")
 
         # Log final sample data for the relevant columns before returning
@@ -397,6 +515,96 @@ def get_merged_stock_data(trade_date, force_update_basic=False, force_update_dai
         logger.error(f"数据合并或预处理时出错: {e}")
         raise StockScreenerServiceError(f"数据合并或预处理时出错: {e}")
 
+class ScreenerSnapshot:
+    """
+    进程内的筛选数据快照：某个交易日合并、预处理完成的全市场 DataFrame。
+    快照构建完成后只读，筛选请求直接在其上计算；更新时整体替换，读取方不会看到构建到一半的数据。
+    columns 为构建时一次性提取的列数组 (数值列为 float64)，供编译后的筛选条件计算掩码。
+    """
+
+    def __init__(self, trade_date, df, dcf_file_key, dcf_update_time, historical_ratio_key=None):
+        self.trade_date = trade_date
+        self.df = df
+        self.columns = screener_filter_engine.ScreenerColumns(df)
+        self.dcf_file_key = dcf_file_key
+        self.historical_ratio_key = historical_ratio_key
+        self.dcf_update_time = dcf_update_time
+        self.built_at = datetime.now().isoformat()
+
+_screener_snapshot = None
+_screener_snapshot_lock = threading.Lock()
+
+def _dcf_file_key():
+    """
+    latest.json 的 (路径, 修改时间)，用于判断快照中的 DCF 列是否过期。
+    每次筛选请求都会调用，只对 latest.json 做一次 stat，不扫描结果目录。
+    """
+    pointer_path = batch_valuation_service.get_latest_pointer_path()
+    try:
+        return (pointer_path, os.stat(pointer_path).st_mtime_ns)
+    except OSError:
+        return None
+
+def _is_current_snapshot(snapshot, trade_date):
+    """快照是否对应该交易日、最新登记的批量估值结果和当前报表库版本。"""
+    return (snapshot is not None and snapshot.trade_date == trade_date and snapshot.dcf_file_key == _dcf_file_key()
+            and snapshot.historical_ratio_key == get_historical_ratio_key())
+
+def _build_screener_snapshot(trade_date, force_update_basic=False, force_update_daily=False):
+    started = time.perf_counter()
+    dcf_file_key = _dcf_file_key()
+    historical_ratio_key = get_historical_ratio_key()
+    df = get_merged_stock_data(trade_date, force_update_basic=force_update_basic, force_update_daily=force_update_daily)
+    # 行业、企业性质等低基数列以 Categorical 存储，筛选时使用类别位图索引
+    df = screener_filter_engine.encode_categorical_columns(df)
+    snapshot = ScreenerSnapshot(trade_date, df, dcf_file_key, get_dcf_valuation_update_time(), historical_ratio_key)
+    logger.info(f"筛选数据快照已构建 (交易日: {trade_date}, {len(df)} 条记录)，耗时 {(time.perf_counter() - started) * 1000:.0f} ms。")
+    return snapshot
+
+def get_screener_snapshot(trade_date):
+    """
+    获取指定交易日的筛选数据快照；快照不存在、交易日不同、批量估值结果或报表库已更新时重新构建。
+    同一时间只有一个线程构建快照，其余请求等待后直接使用新快照。
+    Args:
+        trade_date (str): 交易日 (YYYYMMDD)。
+    Returns:
+        ScreenerSnapshot: 当前快照 (其 df 不可修改)。
+    Raises:
+        StockScreenerServiceError: 构建快照失败。
+    """
+    global _screener_snapshot
+    snapshot = _screener_snapshot
+    if _is_current_snapshot(snapshot, trade_date):
+        return snapshot
+    with _screener_snapshot_lock:
+        snapshot = _screener_snapshot
+        if not _is_current_snapshot(snapshot, trade_date):
+            snapshot = _build_screener_snapshot(trade_date)
+            _screener_snapshot = snapshot
+    return snapshot
+
+def refresh_screener_snapshot(trade_date, force_update_basic=False, force_update_daily=False):
+    """
+    重新构建快照并整体替换 (/update-data 完成后调用)；构建期间的筛选请求继续使用旧快照。
+    Args:
+        trade_date (str): 交易日 (YYYYMMDD)。
+        force_update_basic (bool): 是否强制从 API 更新股票基本信息。
+        force_update_daily (bool): 是否强制从 API 更新每日指标。
+    Returns:
+        ScreenerSnapshot: 新快照。
+    """
+    global _screener_snapshot
+    snapshot = _build_screener_snapshot(trade_date, force_update_basic=force_update_basic, force_update_daily=force_update_daily)
+    with _screener_snapshot_lock:
+        _screener_snapshot = snapshot
+    return snapshot
+
+def clear_screener_snapshot():
+    """丢弃当前快照，下一次筛选请求时重新构建。"""
+    global _screener_snapshot
+    with _screener_snapshot_lock:
+        _screener_snapshot = None
+
 # Example test logic (can be run if this file is executed directly)
 if __name__ == '__main__':
     logger.info("正在测试 stock_screener_service.py 模块功能...")
@@ -0,0 +1,204 @@
+import os
+import time
+import logging
+import threading
+from datetime import datetime
+from typing import Callable, List, Optional
+
+import pandas as pd
+
+from env_utils import LazySingleton, env_int
+
+logger = logging.getLogger(__name__)
+
+# --- 交易日历 ---
+# 上交所完整交易日历一次性从 Tushare 获取并缓存到 data_cache_backend/trade_cal_SSE.feather，
+# 最新有效交易日 (每日指标已发布的最近交易日) 由日历、本地 daily_basic 缓存文件和发布时间推算，
+# 只在无法确定时按间隔向 Tushare 探测一次，普通请求不产生网络调用。
+# TRADE_CALENDAR_MAX_AGE_DAYS: 日历缓存文件的最长使用天数 (默认 30，用于获取交易所临时调整的休市安排)。
+# TRADE_DATE_PUBLISH_HOUR: 当日每日指标的预计发布时间 (小时，默认 17)，此前不把当天视为已发布。
+# TRADE_DATE_PROBE_INTERVAL_SECONDS: 两次远程探测的最小间隔 (秒，默认 1800)。
+
+CALENDAR_EXCHANGE = 'SSE'
+CALENDAR_START_DATE = '19900101'
+
+
+class TradingCalendarError(Exception):
+    """Raised when neither the trading calendar nor any local daily data is available."""
+    pass
+
+
+class TradingCalendar:
+    """
+    基于本地缓存的交易日历和每日指标发布状态推算最新有效交易日。
+    pro_api_factory 只在需要刷新日历或远程探测时调用，离线时使用缓存文件。
+    """
+
+    def __init__(self, cache_dir: str, pro_api_factory: Callable[[], object],
+                 now_func: Callable[[], datetime] = datetime.now):
+        """
+        Args:
+            cache_dir (str): 缓存目录 (日历文件和 daily_basic_<YYYYMMDD>.feather 所在目录)。
+            pro_api_factory (Callable): 返回 Tushare Pro API 对象的函数。
+            now_func (Callable): 返回当前时间的函数 (测试用)。
+        """
+        self.cache_dir = cache_dir
+        self.pro_api_factory = pro_api_factory
+        self.now_func = now_func
+        self._open_dates: Optional[List[str]] = None  # 升序的开市日期 (YYYYMMDD)
+        self._calendar_loaded_at: Optional[float] = None
+        self._published_dates = set()
+        self._unpublished_checked_at = {}  # 交易日 -> 上次探测为未发布的时间 (monotonic)
+        self._lock = threading.Lock()
+
+    @property
+    def calendar_path(self) -> str:
+        return os.path.join(self.cache_dir, f"trade_cal_{CALENDAR_EXCHANGE}.feather")
+
+    def _daily_cache_exists(self, trade_date: str) -> bool:
+        return os.path.exists(os.path.join(self.cache_dir, f"daily_basic_{trade_date}.feather"))
+
+    def _fetch_calendar(self) -> pd.DataFrame:
+        pro = self.pro_api_factory()
+        end_date = f"{self.now_func().year + 1}1231"
+        df = pro.trade_cal(exchange=CALENDAR_EXCHANGE, start_date=CALENDAR_START_DATE, end_date=end_date,
+                           fields='cal_date,is_open')
+        if df is None or df.empty:
+            raise TradingCalendarError("Tushare 返回的交易日历为空。")
+        df = df[['cal_date', 'is_open']].copy()
+        df['cal_date'] = df['cal_date'].astype(str)
+        df['is_open'] = pd.to_numeric(df['is_open'], errors='coerce').fillna(0).astype('int8')
+        df = df.sort_values('cal_date').reset_index(drop=True)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = f"{self.calendar_path}.tmp.{os.getpid()}"
+        df.to_feather(tmp_path)
+        os.replace(tmp_path, self.calendar_path)
+        logger.info(f"交易日历已从 Tushare 更新 ({df['cal_date'].iloc[0]} - {df['cal_date'].iloc[-1]})，缓存到 '{self.calendar_path}'。")
+        return df
+
+    def _calendar_is_stale(self, df: pd.DataFrame) -> bool:
+        today = self.now_func().strftime('%Y%m%d')
+        if df.empty or df['cal_date'].iloc[-1] < today:
+            return True
+        max_age_days = env_int("TRADE_CALENDAR_MAX_AGE_DAYS", 30, min_value=0)
+        age_seconds = time.time() - os.path.getmtime(self.calendar_path)
+        return age_seconds > max_age_days * 86400
+
+    def _load_calendar(self) -> Optional[List[str]]:
+        """加载开市日期列表：优先使用缓存文件，过期或不存在时从 Tushare 刷新；刷新失败时继续使用旧缓存。"""
+        df = None
+        if os.path.exists(self.calendar_path):
+            try:
+                df = pd.read_feather(self.calendar_path)
+            except Exception as e:
+                logger.warning(f"读取交易日历缓存 '{self.calendar_path}' 失败: {e}")
+        if df is None or self._calendar_is_stale(df):
+            try:
+                df = self._fetch_calendar()
+            except Exception as e:
+                if df is None:
+                    logger.warning(f"无法获取交易日历: {e}")
+                    return None
+                logger.warning(f"刷新交易日历失败，继续使用缓存: {e}")
+        return df.loc[df['is_open'] == 1, 'cal_date'].astype(str).tolist()
+
+    def open_dates(self) -> Optional[List[str]]:
+        """返回升序的开市日期列表 (进程内缓存，跨天后重新检查缓存文件)；无法获取时返回 None。"""
+        today = self.now_func().strftime('%Y%m%d')
+        if self._open_dates is not None and self._open_dates and self._open_dates[-1] >= today \
+                and time.monotonic() - self._calendar_loaded_at < 86400:
+            return self._open_dates
+        open_dates = self._load_calendar()
+        if open_dates is not None:
+            self._open_dates = open_dates
+            self._calendar_loaded_at = time.monotonic()
+        return open_dates
+
+    def _probe_published(self, trade_date: str) -> Optional[bool]:
+        """远程探测该交易日的每日指标是否已发布；探测失败返回 None。"""
+        try:
+            pro = self.pro_api_factory()
+            df = pro.daily_basic(ts_code='000001.SZ', trade_date=trade_date, fields='ts_code')
+            return df is not None and not df.empty
+        except Exception as e:
+            logger.warning(f"探测交易日 {trade_date} 的每日指标失败: {e}")
+            return None
+
+    def _is_published(self, trade_date: str) -> bool:
+        """
+        判断交易日的每日指标是否已发布：本地已有缓存文件或此前确认过即为已发布；
+        否则按 TRADE_DATE_PROBE_INTERVAL_SECONDS 的间隔远程探测，探测间隔内视为未发布。
+        """
+        if trade_date in self._published_dates or self._daily_cache_exists(trade_date):
+            self._published_dates.add(trade_date)
+            return True
+        last_checked = self._unpublished_checked_at.get(trade_date)
+        if last_checked is not None and time.monotonic() - last_checked < env_int("TRADE_DATE_PROBE_INTERVAL_SECONDS", 1800, min_value=0):
+            return False
+        published = self._probe_published(trade_date)
+        if published:
+            self._published_dates.add(trade_date)
+            self._unpublished_checked_at.pop(trade_date, None)
+            logger.info(f"交易日 {trade_date} 的每日指标已发布。")
+            return True
+        self._unpublished_checked_at[trade_date] = time.monotonic()
+        return False
+
+    def _latest_cached_daily_date(self) -> Optional[str]:
+        try:
+            dates = [filename[len("daily_basic_"):-len(".feather")] for filename in os.listdir(self.cache_dir)
+                     if filename.startswith("daily_basic_") and filename.endswith(".feather")]
+        except OSError:
+            return None
+        dates = [d for d in dates if len(d) == 8 and d.isdigit()]
+        return max(dates) if dates else None
+
+    def latest_valid_trade_date(self) -> str:
+        """
+        返回每日指标已发布的最近交易日 (YYYYMMDD)。
+        只需判断最近一个开市日：当天在 TRADE_DATE_PUBLISH_HOUR 之前或确认未发布时回退到前一个开市日 (其数据视为已发布)。
+        日历不可用 (离线且无缓存) 时使用本地最新的 daily_basic 缓存文件的日期。
+        Raises:
+            TradingCalendarError: 日历和本地每日指标缓存都不可用。
+        """
+        with self._lock:
+            now = self.now_func()
+            today = now.strftime('%Y%m%d')
+            open_dates = self.open_dates()
+            if not open_dates:
+                cached_date = self._latest_cached_daily_date()
+                if cached_date is None:
+                    raise TradingCalendarError("无法获取交易日历，且本地没有每日指标缓存。")
+                logger.warning(f"交易日历不可用，使用本地最新的每日指标缓存日期 {cached_date}。")
+                return cached_date
+
+            recent = [d for d in open_dates if d <= today][-2:][::-1]
+            if not recent:
+                raise TradingCalendarError(f"交易日历中没有 {today} 之前的开市日期。")
+            if recent[0] == today and now.hour < env_int("TRADE_DATE_PUBLISH_HOUR", 17, min_value=0) and len(recent) > 1:
+                # 当天数据预计尚未发布，前一个开市日视为已发布
+                return recent[1]
+            if len(recent) == 1 or self._is_published(recent[0]):
+                return recent[0]
+            return recent[1]
+
+    def clear(self):
+        """清空进程内的日历和发布状态 (测试或手动刷新用)。"""
+        with self._lock:
+            self._open_dates = None
+            self._calendar_loaded_at = None
+            self._published_dates.clear()
+            self._unpublished_checked_at.clear()
+
+
+def _create_trading_calendar() -> TradingCalendar:
+    from services import stock_screener_service
+    return TradingCalendar(stock_screener_service.CACHE_DIR, stock_screener_service.get_tushare_pro_api)
+
+
+_shared_calendar = LazySingleton(_create_trading_calendar)
+
+
+def get_trading_calendar() -> TradingCalendar:
+    """返回进程内共享的交易日历 (缓存目录与筛选器数据相同，Tushare API 按需初始化)。"""
+    return _shared_calendar.get()
@@ -1,22 +1,26 @@
 import os
 import logging
 import traceback
+import numpy as np
 import pandas as pd
 from typing import Dict, Any, Optional, Tuple, List
-from decimal import Decimal, InvalidOperation
+from decimal import InvalidOperation
 
 # 假设模型和计算器在项目的根目录或可访问的路径
 # 需要根据实际项目结构调整这些导入
 try:
     from data_processor import DataProcessor
-    from financial_forecaster import FinancialForecaster
+    from financial_forecaster import FinancialForecaster, FORECAST_METRICS
     from wacc_calculator import WaccCalculator
     from terminal_value_calculator import TerminalValueCalculator
     from present_value_calculator import PresentValueCalculator
     from equity_bridge_calculator import EquityBridgeCalculator
+    from dcf_grid_calculator import DcfGridCalculator
+    from monte_carlo_sampler import PARAMETER_BOUNDS, parameter_generators, sample_distribution, summarize_distribution
     # 假设 DcfForecastDetails 模型定义在 api.models
     from api.models import DcfForecastDetails, StockValuationRequest # Added StockValuationRequest
-    from api.sensitivity_models import SensitivityAnalysisRequest, SensitivityAnalysisResult, SensitivityAxisInput, MetricType, SUPPORTED_SENSITIVITY_OUTPUT_METRICS
+    from api.sensitivity_models import SensitivityAnalysisRequest, SensitivityAnalysisResult, SensitivityAxisInput, MetricType, SUPPORTED_SENSITIVITY_OUTPUT_METRICS, OPERATING_DRIVER_PARAMETERS
+    from api.monte_carlo_models import MonteCarloConfig, MonteCarloResult, MONTE_CARLO_WACC_PARAMETERS
     from api.utils import regenerate_axis_if_needed # For axis regeneration
 except ImportError as e:
     # 处理潜在的导入错误，例如在不同环境运行时
@@ -29,6 +33,7 @@ except ImportError as e:
     class TerminalValueCalculator: pass #type: ignore
     class PresentValueCalculator: pass #type: ignore
     class EquityBridgeCalculator: pass #type: ignore
+    class DcfGridCalculator: pass #type: ignore
     class DcfForecastDetails: pass #type: ignore
     class StockValuationRequest: pass #type: ignore
     class SensitivityAnalysisRequest: pass #type: ignore
@@ -39,11 +44,32 @@ except ImportError as e:
         TERMINAL_GROWTH_RATE = "perpetual_growth_rate"
         TERMINAL_EBITDA_MULTIPLE = "exit_multiple"
     SUPPORTED_SENSITIVITY_OUTPUT_METRICS = None #type: ignore
+    OPERATING_DRIVER_PARAMETERS = () #type: ignore
+    FORECAST_METRICS = () #type: ignore
+    class MonteCarloConfig: pass #type: ignore
+    class MonteCarloResult: pass #type: ignore
+    MONTE_CARLO_WACC_PARAMETERS = () #type: ignore
+    PARAMETER_BOUNDS = {} #type: ignore
+    def parameter_generators(*args, **kwargs): pass #type: ignore
+    def sample_distribution(*args, **kwargs): pass #type: ignore
+    def summarize_distribution(*args, **kwargs): pass #type: ignore
     def regenerate_axis_if_needed(*args, **kwargs): pass #type: ignore
 
 
 logger = logging.getLogger(__name__)
 
+# 经营驱动因素敏感性轴 → FinancialForecaster 假设键: (目标值键, 预测模式键)
+# 目标值类驱动因素需要切换到 transition_to_target 模式才会生效
+OPERATING_DRIVER_ASSUMPTION_KEYS: Dict[str, Tuple[str, Optional[str]]] = {
+    'cagr_decay_rate': ('revenue_cagr_decay_rate', None),
+    'target_operating_margin': ('target_operating_margin', 'operating_margin_forecast_mode'),
+    'target_capex_to_revenue_ratio': ('target_capex_to_revenue_ratio', 'capex_to_revenue_ratio_forecast_mode'),
+    'target_accounts_receivable_days': ('target_accounts_receivable_days', 'accounts_receivable_days_forecast_mode'),
+    'target_inventory_days': ('target_inventory_days', 'inventory_days_forecast_mode'),
+    'target_accounts_payable_days': ('target_accounts_payable_days', 'accounts_payable_days_forecast_mode'),
+    'target_effective_tax_rate': ('effective_tax_rate_target', None),
+}
+
 # ValuationService class to encapsulate valuation logic
 class ValuationService:
     def __init__(self, 
@@ -54,6 +80,150 @@ class ValuationService:
         self.wacc_calculator = wacc_calculator
         self.logger = logger_override if logger_override else logger # Use override if provided
 
+    def _build_forecaster(self, request_dict: Dict[str, Any], precision_mode: Optional[str] = None) -> FinancialForecaster:
+        """
+        将 API 请求参数映射为 FinancialForecaster 所需的假设并创建预测器。
+        单次估值与敏感性分析共用此步骤，无法获取上一年度收入时抛出 ValueError。
+        """
+        # Extract forecast assumptions, excluding keys not relevant for FinancialForecaster
+        forecast_assumptions_raw = {k: v for k, v in request_dict.items() if k not in ['ts_code', 'market', 'valuation_date', 'sensitivity_analysis']}
+        
+        # Create a mutable copy for potential key mapping
+        forecast_assumptions = forecast_assumptions_raw.copy()
+
+        # Map cagr_decay_rate to revenue_cagr_decay_rate for FinancialForecaster
+        if 'cagr_decay_rate' in forecast_assumptions and forecast_assumptions['cagr_decay_rate'] is not None:
+            self.logger.debug(f"Mapping cagr_decay_rate ({forecast_assumptions['cagr_decay_rate']}) to revenue_cagr_decay_rate.")
+            forecast_assumptions['revenue_cagr_decay_rate'] = forecast_assumptions.pop('cagr_decay_rate')
+
+        # --- Comprehensive mapping for other forecast assumptions ---
+        self.logger.debug(f"Original forecast_assumptions from API: {forecast_assumptions_raw}")
+
+        # Helper to pop and set if key exists
+        def map_key(current_assumptions, api_key, forecaster_key):
+            if api_key in current_assumptions and current_assumptions[api_key] is not None:
+                current_assumptions[forecaster_key] = current_assumptions.pop(api_key)
+                self.logger.debug(f"Mapped API key '{api_key}' to Forecaster key '{forecaster_key}' with value: {current_assumptions[forecaster_key]}")
+            elif api_key in current_assumptions and current_assumptions[api_key] is None: # Pop if None to avoid sending None with old key
+                current_assumptions.pop(api_key)
+
+
+        # Operating Margin
+        map_key(forecast_assumptions, 'op_margin_forecast_mode', 'operating_margin_forecast_mode')
+        map_key(forecast_assumptions, 'target_operating_margin', 'operating_margin_target_value') # Corrected forecaster key
+        map_key(forecast_assumptions, 'op_margin_transition_years', 'op_margin_transition_years') # Key matches, but pop to be clean
+
+        # SGA & RD Ratios (API sends combined, Forecaster expects separate)
+        # We'll apply the combined mode and years to both SGA and RD.
+        # The target combined ratio will be used for both individual target ratios.
+        sga_rd_mode = forecast_assumptions.pop('sga_rd_ratio_forecast_mode', None)
+        sga_rd_target = forecast_assumptions.pop('target_sga_rd_to_revenue_ratio', None)
+        sga_rd_trans_years = forecast_assumptions.pop('sga_rd_transition_years', None)
+
+        if sga_rd_mode is not None:
+            forecast_assumptions['sga_to_revenue_ratio_forecast_mode'] = sga_rd_mode
+            forecast_assumptions['rd_to_revenue_ratio_forecast_mode'] = sga_rd_mode
+            self.logger.debug(f"Mapped sga_rd_ratio_forecast_mode to sga_to_revenue_ratio_forecast_mode and rd_to_revenue_ratio_forecast_mode with value: {sga_rd_mode}")
+        if sga_rd_target is not None:
+            # FinancialForecaster will try target_sga_to_revenue_ratio and target_rd_to_revenue_ratio
+            forecast_assumptions['target_sga_to_revenue_ratio'] = sga_rd_target 
+            forecast_assumptions['target_rd_to_revenue_ratio'] = sga_rd_target
+            self.logger.debug(f"Mapped target_sga_rd_to_revenue_ratio to target_sga_to_revenue_ratio and target_rd_to_revenue_ratio with value: {sga_rd_target}")
+        if sga_rd_trans_years is not None:
+            forecast_assumptions['sga_transition_years'] = sga_rd_trans_years
+            forecast_assumptions['rd_transition_years'] = sga_rd_trans_years
+            self.logger.debug(f"Mapped sga_rd_transition_years to sga_transition_years and rd_transition_years with value: {sga_rd_trans_years}")
+
+        # D&A to Revenue Ratio
+        map_key(forecast_assumptions, 'da_ratio_forecast_mode', 'da_to_revenue_ratio_forecast_mode')
+        map_key(forecast_assumptions, 'target_da_to_revenue_ratio', 'target_da_to_revenue_ratio') # Forecaster will find target_metric_name
+        map_key(forecast_assumptions, 'da_ratio_transition_years', 'da_ratio_transition_years') # Key matches
+
+        # Capex to Revenue Ratio
+        map_key(forecast_assumptions, 'capex_ratio_forecast_mode', 'capex_to_revenue_ratio_forecast_mode')
+        map_key(forecast_assumptions, 'target_capex_to_revenue_ratio', 'target_capex_to_revenue_ratio') # Forecaster will find target_metric_name
+        map_key(forecast_assumptions, 'capex_ratio_transition_years', 'capex_ratio_transition_years') # Key matches
+
+        # NWC Days (AR, Inventory, AP)
+        nwc_days_mode = forecast_assumptions.pop('nwc_days_forecast_mode', None)
+        nwc_days_trans_years = forecast_assumptions.pop('nwc_days_transition_years', None)
+        if nwc_days_mode is not None:
+            forecast_assumptions['accounts_receivable_days_forecast_mode'] = nwc_days_mode
+            forecast_assumptions['inventory_days_forecast_mode'] = nwc_days_mode
+            forecast_assumptions['accounts_payable_days_forecast_mode'] = nwc_days_mode
+            self.logger.debug(f"Mapped nwc_days_forecast_mode to individual day forecast modes with value: {nwc_days_mode}")
+        if nwc_days_trans_years is not None:
+             forecast_assumptions['nwc_days_transition_years'] = nwc_days_trans_years # Forecaster uses this common key
+             self.logger.debug(f"Set nwc_days_transition_years for Forecaster with value: {nwc_days_trans_years}")
+        map_key(forecast_assumptions, 'target_accounts_receivable_days', 'target_accounts_receivable_days')
+        map_key(forecast_assumptions, 'target_inventory_days', 'target_inventory_days')
+        map_key(forecast_assumptions, 'target_accounts_payable_days', 'target_accounts_payable_days')
+
+        # Other NWC Ratios (OCA, OCL)
+        other_nwc_mode = forecast_assumptions.pop('other_nwc_ratio_forecast_mode', None)
+        other_nwc_trans_years = forecast_assumptions.pop('other_nwc_ratio_transition_years', None)
+        if other_nwc_mode is not None:
+            forecast_assumptions['other_current_assets_to_revenue_ratio_forecast_mode'] = other_nwc_mode
+            forecast_assumptions['other_current_liabilities_to_revenue_ratio_forecast_mode'] = other_nwc_mode
+            self.logger.debug(f"Mapped other_nwc_ratio_forecast_mode to individual ratio forecast modes with value: {other_nwc_mode}")
+        if other_nwc_trans_years is not None:
+            forecast_assumptions['other_nwc_ratio_transition_years'] = other_nwc_trans_years # Forecaster uses this common key
+            self.logger.debug(f"Set other_nwc_ratio_transition_years for Forecaster with value: {other_nwc_trans_years}")
+        map_key(forecast_assumptions, 'target_other_current_assets_to_revenue_ratio', 'target_other_current_assets_to_revenue_ratio')
+        map_key(forecast_assumptions, 'target_other_current_liabilities_to_revenue_ratio', 'target_other_current_liabilities_to_revenue_ratio')
+
+        # Effective Tax Rate
+        map_key(forecast_assumptions, 'target_effective_tax_rate', 'effective_tax_rate_target')
+        # Transition years for tax rate uses a general 'transition_years' key in forecaster if present, or defaults to forecast_years.
+        # If a specific transition year for tax is desired from API, it would need a dedicated API field and mapping here.
+        # For now, we rely on the forecaster's default handling or a general 'transition_years' if we decide to pass one.
+        # Example: if request_dict.get('tax_transition_years'): forecast_assumptions['transition_years'] = request_dict['tax_transition_years']
+        # For now, let's assume the forecaster's default (using self.forecast_years if 'transition_years' is not in assumptions) is acceptable for tax rate transition.
+
+        self.logger.debug(f"Final forecast_assumptions for FinancialForecaster: {forecast_assumptions}")
+        # --- End of comprehensive mapping ---
+        
+        last_actual_revenue = None
+        if 'income_statement' in self.processed_data_container.processed_data and \
+           not self.processed_data_container.processed_data['income_statement'].empty and \
+           'revenue' in self.processed_data_container.processed_data['income_statement'].columns:
+            last_actual_revenue = self.processed_data_container.processed_data['income_statement']['revenue'].iloc[-1]
+        
+        if last_actual_revenue is None or pd.isna(last_actual_revenue):
+             raise ValueError("无法获取有效的上一年度实际收入用于财务预测。")
+
+        return FinancialForecaster(
+            last_actual_revenue=last_actual_revenue,
+            historical_ratios=self.processed_data_container.get_historical_ratios(),
+            forecast_assumptions=forecast_assumptions, # Use the potentially modified forecast_assumptions
+            precision_mode=precision_mode
+        )
+
+    def _wacc_params(self, request_dict: Dict[str, Any]) -> Dict[str, Any]:
+        """从请求参数中整理 WaccCalculator 所需的参数 (包括直接指定的 discount_rate)，去除空值。"""
+        # Prepare params for WaccCalculator, including the direct discount_rate if available
+        wacc_params_input = {
+            k: request_dict.get(k) for k in 
+            ['target_debt_ratio', 'cost_of_debt', 'risk_free_rate', 
+             'beta', 'market_risk_premium', 'size_premium', 'discount_rate'] # Added 'discount_rate'
+        }
+        wacc_params_input['tax_rate'] = request_dict.get('target_effective_tax_rate')
+        
+        # Ensure beta is sourced correctly if not in request_dict
+        if wacc_params_input.get('beta') is None:
+            beta_from_metrics = self.processed_data_container.get_latest_metrics().get('beta')
+            if beta_from_metrics is not None:
+                wacc_params_input['beta'] = beta_from_metrics
+        
+        return {k: v for k, v in wacc_params_input.items() if v is not None}
+
+    def _build_forecast(self, request_dict: Dict[str, Any]) -> pd.DataFrame:
+        """执行财务预测，预测失败时抛出 ValueError。"""
+        final_forecast_df = self._build_forecaster(request_dict).get_full_forecast()
+        if final_forecast_df is None or final_forecast_df.empty or 'ufcf' not in final_forecast_df.columns:
+            raise ValueError("财务预测失败或未能生成 UFCF。")
+        return final_forecast_df
+
     def run_single_valuation(self, # Now a method of ValuationService
         request_dict: Dict[str, Any],
         total_shares_actual: Optional[float],
@@ -73,121 +243,7 @@ class ValuationService:
 
         try:
             self.logger.debug("  Running single valuation: Step 3 - Forecasting financials...")
-            # Extract forecast assumptions, excluding keys not relevant for FinancialForecaster
-            forecast_assumptions_raw = {k: v for k, v in request_dict.items() if k not in ['ts_code', 'market', 'valuation_date', 'sensitivity_analysis']}
-            
-            # Create a mutable copy for potential key mapping
-            forecast_assumptions = forecast_assumptions_raw.copy()
-
-            # Map cagr_decay_rate to revenue_cagr_decay_rate for FinancialForecaster
-            if 'cagr_decay_rate' in forecast_assumptions and forecast_assumptions['cagr_decay_rate'] is not None:
-                self.logger.debug(f"Mapping cagr_decay_rate ({forecast_assumptions['cagr_decay_rate']}) to revenue_cagr_decay_rate.")
-                forecast_assumptions['revenue_cagr_decay_rate'] = forecast_assumptions.pop('cagr_decay_rate')
-
-            # --- Comprehensive mapping for other forecast assumptions ---
-            self.logger.debug(f"Original forecast_assumptions from API: {forecast_assumptions_raw}")
-
-            # Helper to pop and set if key exists
-            def map_key(current_assumptions, api_key, forecaster_key):
-                if api_key in current_assumptions and current_assumptions[api_key] is not None:
-                    current_assumptions[forecaster_key] = current_assumptions.pop(api_key)
-                    self.logger.debug(f"Mapped API key '{api_key}' to Forecaster key '{forecaster_key}' with value: {current_assumptions[forecaster_key]}")
-                elif api_key in current_assumptions and current_assumptions[api_key] is None: # Pop if None to avoid sending None with old key
-                    current_assumptions.pop(api_key)
-
-
-            # Operating Margin
-            map_key(forecast_assumptions, 'op_margin_forecast_mode', 'operating_margin_forecast_mode')
-            map_key(forecast_assumptions, 'target_operating_margin', 'operating_margin_target_value') # Corrected forecaster key
-            map_key(forecast_assumptions, 'op_margin_transition_years', 'op_margin_transition_years') # Key matches, but pop to be clean
-
-            # SGA & RD Ratios (API sends combined, Forecaster expects separate)
-            # We'll apply the combined mode and years to both SGA and RD.
-            # The target combined ratio will be used for both individual target ratios.
-            sga_rd_mode = forecast_assumptions.pop('sga_rd_ratio_forecast_mode', None)
-            sga_rd_target = forecast_assumptions.pop('target_sga_rd_to_revenue_ratio', None)
-            sga_rd_trans_years = forecast_assumptions.pop('sga_rd_transition_years', None)
-
-            if sga_rd_mode is not None:
-                forecast_assumptions['sga_to_revenue_ratio_forecast_mode'] = sga_rd_mode
-                forecast_assumptions['rd_to_revenue_ratio_forecast_mode'] = sga_rd_mode
-                self.logger.debug(f"Mapped sga_rd_ratio_forecast_mode to sga_to_revenue_ratio_forecast_mode and rd_to_revenue_ratio_forecast_mode with value: {sga_rd_mode}")
-            if sga_rd_target is not None:
-                # FinancialForecaster will try target_sga_to_revenue_ratio and target_rd_to_revenue_ratio
-                forecast_assumptions['target_sga_to_revenue_ratio'] = sga_rd_target 
-                forecast_assumptions['target_rd_to_revenue_ratio'] = sga_rd_target
-                self.logger.debug(f"Mapped target_sga_rd_to_revenue_ratio to target_sga_to_revenue_ratio and target_rd_to_revenue_ratio with value: {sga_rd_target}")
-            if sga_rd_trans_years is not None:
-                forecast_assumptions['sga_transition_years'] = sga_rd_trans_years
-                forecast_assumptions['rd_transition_years'] = sga_rd_trans_years
-                self.logger.debug(f"Mapped sga_rd_transition_years to sga_transition_years and rd_transition_years with value: {sga_rd_trans_years}")
-
-            # D&A to Revenue Ratio
-            map_key(forecast_assumptions, 'da_ratio_forecast_mode', 'da_to_revenue_ratio_forecast_mode')
-            map_key(forecast_assumptions, 'target_da_to_revenue_ratio', 'target_da_to_revenue_ratio') # Forecaster will find target_metric_name
-            map_key(forecast_assumptions, 'da_ratio_transition_years', 'da_ratio_transition_years') # Key matches
-
-            # Capex to Revenue Ratio
-            map_key(forecast_assumptions, 'capex_ratio_forecast_mode', 'capex_to_revenue_ratio_forecast_mode')
-            map_key(forecast_assumptions, 'target_capex_to_revenue_ratio', 'target_capex_to_revenue_ratio') # Forecaster will find target_metric_name
-            map_key(forecast_assumptions, 'capex_ratio_transition_years', 'capex_ratio_transition_years') # Key matches
-
-            # NWC Days (AR, Inventory, AP)
-            nwc_days_mode = forecast_assumptions.pop('nwc_days_forecast_mode', None)
-            nwc_days_trans_years = forecast_assumptions.pop('nwc_days_transition_years', None)
-            if nwc_days_mode is not None:
-                forecast_assumptions['accounts_receivable_days_forecast_mode'] = nwc_days_mode
-                forecast_assumptions['inventory_days_forecast_mode'] = nwc_days_mode
-                forecast_assumptions['accounts_payable_days_forecast_mode'] = nwc_days_mode
-                self.logger.debug(f"Mapped nwc_days_forecast_mode to individual day forecast modes with value: {nwc_days_mode}")
-            if nwc_days_trans_years is not None:
-                 forecast_assumptions['nwc_days_transition_years'] = nwc_days_trans_years # Forecaster uses this common key
-                 self.logger.debug(f"Set nwc_days_transition_years for Forecaster with value: {nwc_days_trans_years}")
-            map_key(forecast_assumptions, 'target_accounts_receivable_days', 'target_accounts_receivable_days')
-            map_key(forecast_assumptions, 'target_inventory_days', 'target_inventory_days')
-            map_key(forecast_assumptions, 'target_accounts_payable_days', 'target_accounts_payable_days')
-
-            # Other NWC Ratios (OCA, OCL)
-            other_nwc_mode = forecast_assumptions.pop('other_nwc_ratio_forecast_mode', None)
-            other_nwc_trans_years = forecast_assumptions.pop('other_nwc_ratio_transition_years', None)
-            if other_nwc_mode is not None:
-                forecast_assumptions['other_current_assets_to_revenue_ratio_forecast_mode'] = other_nwc_mode
-                forecast_assumptions['other_current_liabilities_to_revenue_ratio_forecast_mode'] = other_nwc_mode
-                self.logger.debug(f"Mapped other_nwc_ratio_forecast_mode to individual ratio forecast modes with value: {other_nwc_mode}")
-            if other_nwc_trans_years is not None:
-                forecast_assumptions['other_nwc_ratio_transition_years'] = other_nwc_trans_years # Forecaster uses this common key
-                self.logger.debug(f"Set other_nwc_ratio_transition_years for Forecaster with value: {other_nwc_trans_years}")
-            map_key(forecast_assumptions, 'target_other_current_assets_to_revenue_ratio', 'target_other_current_assets_to_revenue_ratio')
-            map_key(forecast_assumptions, 'target_other_current_liabilities_to_revenue_ratio', 'target_other_current_liabilities_to_revenue_ratio')
-
-            # Effective Tax Rate
-            map_key(forecast_assumptions, 'target_effective_tax_rate', 'effective_tax_rate_target')
-            # Transition years for tax rate uses a general 'transition_years' key in forecaster if present, or defaults to forecast_years.
-            # If a specific transition year for tax is desired from API, it would need a dedicated API field and mapping here.
-            # For now, we rely on the forecaster's default handling or a general 'transition_years' if we decide to pass one.
-            # Example: if request_dict.get('tax_transition_years'): forecast_assumptions['transition_years'] = request_dict['tax_transition_years']
-            # For now, let's assume the forecaster's default (using self.forecast_years if 'transition_years' is not in assumptions) is acceptable for tax rate transition.
-
-            self.logger.debug(f"Final forecast_assumptions for FinancialForecaster: {forecast_assumptions}")
-            # --- End of comprehensive mapping ---
-            
-            last_actual_revenue = None
-            if 'income_statement' in self.processed_data_container.processed_data and \
-               not self.processed_data_container.processed_data['income_statement'].empty and \
-               'revenue' in self.processed_data_container.processed_data['income_statement'].columns:
-                last_actual_revenue = self.processed_data_container.processed_data['income_statement']['revenue'].iloc[-1]
-            
-            if last_actual_revenue is None or pd.isna(last_actual_revenue):
-                 raise ValueError("无法获取有效的上一年度实际收入用于财务预测。")
-
-            financial_forecaster = FinancialForecaster(
-                last_actual_revenue=last_actual_revenue,
-                historical_ratios=self.processed_data_container.get_historical_ratios(),
-                forecast_assumptions=forecast_assumptions # Use the potentially modified forecast_assumptions
-            )
-            final_forecast_df = financial_forecaster.get_full_forecast()
-            if final_forecast_df is None or final_forecast_df.empty or 'ufcf' not in final_forecast_df.columns:
-                raise ValueError("财务预测失败或未能生成 UFCF。")
+            final_forecast_df = self._build_forecast(request_dict)
             self.logger.debug("  Single valuation: Financial forecast complete.")
 
             self.logger.debug("  Running single valuation: Step 4 - Calculating WACC...")
@@ -198,21 +254,7 @@ class ValuationService:
                 cost_of_equity = None # Simplified when WACC is overridden
                 self.logger.debug(f"  Using overridden WACC: {wacc:.4f}")
             else:
-                # Prepare params for WaccCalculator, including the direct discount_rate if available
-                wacc_params_input = {
-                    k: request_dict.get(k) for k in 
-                    ['target_debt_ratio', 'cost_of_debt', 'risk_free_rate', 
-                     'beta', 'market_risk_premium', 'size_premium', 'discount_rate'] # Added 'discount_rate'
-                }
-                wacc_params_input['tax_rate'] = request_dict.get('target_effective_tax_rate')
-                
-                # Ensure beta is sourced correctly if not in request_dict
-                if wacc_params_input.get('beta') is None:
-                    beta_from_metrics = self.processed_data_container.get_latest_metrics().get('beta')
-                    if beta_from_metrics is not None:
-                        wacc_params_input['beta'] = beta_from_metrics
-                
-                wacc_params_filtered = {k: v for k, v in wacc_params_input.items() if v is not None}
+                wacc_params_filtered = self._wacc_params(request_dict)
                 current_wacc_weight_mode = request_dict.get('wacc_weight_mode', "target")
                 
                 self.logger.debug(f"  Params for WACC calculation: {wacc_params_filtered}")
@@ -294,6 +336,32 @@ class ValuationService:
             local_warnings.append(f"单次估值计算失败: {str(e)}")
             return None, None, local_warnings
 
+    @staticmethod
+    def _driver_overrides(param_name: str, value: float) -> Dict[str, Any]:
+        """将经营驱动因素轴上的一个取值转换为 FinancialForecaster 的假设覆盖项。"""
+        target_key, mode_key = OPERATING_DRIVER_ASSUMPTION_KEYS[param_name]
+        overrides: Dict[str, Any] = {target_key: float(value)}
+        if mode_key is not None:
+            overrides[mode_key] = 'transition_to_target'
+        return overrides
+
+    def _driver_assumption_sets(
+        self,
+        row_driver: Optional[str], row_values: List[float],
+        col_driver: Optional[str], col_values: List[float]
+    ) -> Tuple[List[Dict[str, Any]], Tuple[int, int]]:
+        """
+        生成批量预测所需的假设覆盖列表 (按行优先顺序) 及其在网格中的形状。
+        只有一个轴是经营驱动因素时，预测数量等于该轴长度，另一个轴通过广播复用同一组预测。
+        """
+        if row_driver and col_driver:
+            sets = [{**self._driver_overrides(row_driver, r), **self._driver_overrides(col_driver, c)}
+                    for r in row_values for c in col_values]
+            return sets, (len(row_values), len(col_values))
+        if row_driver:
+            return [self._driver_overrides(row_driver, r) for r in row_values], (len(row_values), 1)
+        return [self._driver_overrides(col_driver, c) for c in col_values], (1, len(col_values))
+
     def run_sensitivity_analysis(
         self,
         sa_request_model: SensitivityAnalysisRequest,
@@ -339,64 +407,115 @@ class ValuationService:
             for metric in output_metrics_to_calculate
         }
 
-        for i, row_val in enumerate(actual_row_values):
-            for j, col_val in enumerate(actual_col_values):
-                self.logger.debug(f"  Running sensitivity case: {row_param}={row_val}, {col_param}={col_val}")
-                temp_request_dict = base_request_dict.copy()
-                override_wacc = None
-                override_exit_multiple = None
-                override_perpetual_growth_rate = None
-
-                if row_param == MetricType.WACC.value: override_wacc = float(row_val)
-                elif row_param == MetricType.TERMINAL_EBITDA_MULTIPLE.value: override_exit_multiple = float(row_val)
-                elif row_param == MetricType.TERMINAL_GROWTH_RATE.value: override_perpetual_growth_rate = float(row_val)
-
-                if col_param == MetricType.WACC.value: override_wacc = float(col_val)
-                elif col_param == MetricType.TERMINAL_EBITDA_MULTIPLE.value: override_exit_multiple = float(col_val)
-                elif col_param == MetricType.TERMINAL_GROWTH_RATE.value: override_perpetual_growth_rate = float(col_val)
-                
-                if override_exit_multiple is not None:
-                    temp_request_dict['terminal_value_method'] = 'exit_multiple'
-                    temp_request_dict['perpetual_growth_rate'] = None
-                elif override_perpetual_growth_rate is not None:
-                    temp_request_dict['terminal_value_method'] = 'perpetual_growth'
-                    temp_request_dict['exit_multiple'] = None
-
-                dcf_details_sens, _, run_warnings_sens = self.run_single_valuation(
-                    request_dict=temp_request_dict,
-                    total_shares_actual=total_shares_actual,
-                    override_wacc=override_wacc,
-                    override_exit_multiple=override_exit_multiple,
-                    override_perpetual_growth_rate=override_perpetual_growth_rate
+        # 行轴为 (R, 1)，列轴为 (1, C)，广播得到整张 R x C 网格
+        row_grid = np.asarray(actual_row_values, dtype=np.float64).reshape(-1, 1)
+        col_grid = np.asarray(actual_col_values, dtype=np.float64).reshape(1, -1)
+        grid_shape = (row_grid.shape[0], col_grid.shape[1])
+        row_is_driver = row_param in OPERATING_DRIVER_PARAMETERS
+        col_is_driver = col_param in OPERATING_DRIVER_PARAMETERS
+
+        try:
+            base_rf = base_request_dict.get('risk_free_rate') or self.wacc_calculator.default_risk_free_rate
+            latest_balance_sheet = self.processed_data_container.get_latest_balance_sheet()
+            if row_is_driver or col_is_driver:
+                # 经营驱动因素轴: 每个驱动因素取值对应一组预测，由批量预测器一次向量化完成
+                forecaster = self._build_forecaster(base_request_dict, precision_mode='float64')
+                assumption_sets, batch_shape = self._driver_assumption_sets(
+                    row_param if row_is_driver else None, actual_row_values,
+                    col_param if col_is_driver else None, actual_col_values
                 )
-                sensitivity_warnings.extend(run_warnings_sens)
-                
-                if dcf_details_sens:
-                    result_tables["value_per_share"][i][j] = dcf_details_sens.value_per_share
-                    result_tables["enterprise_value"][i][j] = dcf_details_sens.enterprise_value
-                    result_tables["equity_value"][i][j] = dcf_details_sens.equity_value
-                    if dcf_details_sens.enterprise_value and dcf_details_sens.enterprise_value != 0:
-                        result_tables["tv_ev_ratio"][i][j] = (dcf_details_sens.pv_terminal_value or 0) / dcf_details_sens.enterprise_value
-                    else:
-                        result_tables["tv_ev_ratio"][i][j] = None
-                    
-                    result_tables["dcf_implied_pe"][i][j] = dcf_details_sens.dcf_implied_diluted_pe
-
-                    base_actual_ebitda = base_latest_metrics.get('latest_actual_ebitda')
-                    if base_actual_ebitda and isinstance(base_actual_ebitda, Decimal) and base_actual_ebitda > Decimal('0'):
-                        if dcf_details_sens.enterprise_value is not None:
-                            try:
-                                result_tables["ev_ebitda"][i][j] = float(Decimal(str(dcf_details_sens.enterprise_value)) / base_actual_ebitda)
-                            except (InvalidOperation, TypeError, ZeroDivisionError) as e_calc:
-                                self.logger.warning(f"Error calculating EV/EBITDA for sensitivity: EV={dcf_details_sens.enterprise_value}, BaseEBITDA={base_actual_ebitda}. Error: {e_calc}")
-                                result_tables["ev_ebitda"][i][j] = None
-                        else:
-                            result_tables["ev_ebitda"][i][j] = None
-                    else:
-                        result_tables["ev_ebitda"][i][j] = None
-                        # Warning already added by regenerate_axis_if_needed or main logic if base_actual_ebitda is problematic
-                else:
-                    self.logger.warning(f"  Sensitivity case failed for {row_param}={row_val}, {col_param}={col_val}")
+                grid_calculator = DcfGridCalculator.from_forecast_batch(
+                    forecaster.forecast_batch(assumption_sets), batch_shape,
+                    latest_balance_sheet=latest_balance_sheet,
+                    total_shares=total_shares_actual,
+                    risk_free_rate=float(base_rf)
+                )
+            else:
+                # 敏感性轴只涉及 WACC 与终值参数，财务预测对所有单元格相同，只需计算一次
+                forecast_df = self._build_forecast(base_request_dict)
+                grid_calculator = DcfGridCalculator(
+                    forecast_df=forecast_df,
+                    latest_balance_sheet=latest_balance_sheet,
+                    total_shares=total_shares_actual,
+                    risk_free_rate=float(base_rf)
+                )
+        except Exception as e:
+            self.logger.error(f"Sensitivity analysis forecast failed: {e}\n{traceback.format_exc()}")
+            sensitivity_warnings.append(f"敏感性分析财务预测失败: {str(e)}")
+            return None, sensitivity_warnings
+
+        def axis_grid(param_name: str) -> Optional[np.ndarray]:
+            if row_param == param_name:
+                return np.broadcast_to(row_grid, grid_shape)
+            if col_param == param_name:
+                return np.broadcast_to(col_grid, grid_shape)
+            return None
+
+        wacc_grid = axis_grid(MetricType.WACC.value)
+        exit_multiple_grid = axis_grid(MetricType.TERMINAL_EBITDA_MULTIPLE.value)
+        growth_grid = axis_grid(MetricType.TERMINAL_GROWTH_RATE.value)
+
+        tax_rate_grid = axis_grid('target_effective_tax_rate')
+        if wacc_grid is None and tax_rate_grid is not None:
+            # 目标税率同时影响预测期税率和税后债务成本，与完整估值一致，按每个单元格的税率重新计算 WACC
+            wacc_grid, _ = self.wacc_calculator.get_wacc_and_ke_vectorized(
+                {**self._wacc_params(base_request_dict), 'tax_rate': tax_rate_grid},
+                base_request_dict.get('wacc_weight_mode') or 'target'
+            )
+            wacc_grid = np.broadcast_to(wacc_grid, grid_shape)
+        if wacc_grid is None:
+            base_wacc = base_dcf_details.wacc_used if base_dcf_details else None
+            if base_wacc is None:
+                sensitivity_warnings.append("基础 WACC 不可用，无法进行敏感性分析。")
+                return None, sensitivity_warnings
+            wacc_grid = np.full(grid_shape, float(base_wacc))
+
+        if exit_multiple_grid is not None:
+            tv_method = 'exit_multiple'
+        elif growth_grid is not None:
+            tv_method = 'perpetual_growth'
+        else:
+            tv_method = base_request_dict.get('terminal_value_method', 'exit_multiple')
+            if tv_method == 'exit_multiple':
+                exit_multiple_value = base_request_dict.get('exit_multiple')
+                if exit_multiple_value is None or exit_multiple_value <= 0:
+                    exit_multiple_value = float(os.getenv('DEFAULT_EXIT_MULTIPLE', '8.0'))
+                    sensitivity_warnings.append(f"敏感性分析中退出乘数无效或未提供，使用默认值: {exit_multiple_value}")
+                exit_multiple_grid = np.full(grid_shape, float(exit_multiple_value))
+            else:
+                growth_value = base_request_dict.get('perpetual_growth_rate')
+                if growth_value is None:
+                    growth_value = float(os.getenv('DEFAULT_PERPETUAL_GROWTH_RATE', '0.025'))
+                    sensitivity_warnings.append(f"敏感性分析中永续增长率无效或未提供，使用默认值: {growth_value:.3f}")
+                growth_grid = np.full(grid_shape, float(growth_value))
+
+        try:
+            grid_results = grid_calculator.calculate(
+                wacc=wacc_grid,
+                method=tv_method,
+                exit_multiple=exit_multiple_grid,
+                perpetual_growth_rate=growth_grid
+            )
+        except Exception as e:
+            self.logger.error(f"Vectorized sensitivity calculation failed: {e}\n{traceback.format_exc()}")
+            sensitivity_warnings.append(f"敏感性分析计算失败: {str(e)}")
+            return None, sensitivity_warnings
+
+        grid_results['ev_ebitda'] = DcfGridCalculator.ratio_to_base(
+            grid_results['enterprise_value'], base_latest_metrics.get('latest_actual_ebitda')
+        )
+        grid_results['dcf_implied_pe'] = DcfGridCalculator.ratio_to_base(
+            grid_results['value_per_share'], base_latest_metrics.get('latest_annual_diluted_eps')
+        )
+
+        for metric in output_metrics_to_calculate:
+            if metric in grid_results:
+                result_tables[metric] = DcfGridCalculator.to_table(grid_results[metric])
+
+        failed_cells = int(np.isnan(grid_results['enterprise_value']).sum())
+        if failed_cells:
+            self.logger.warning(f"  {failed_cells} sensitivity cases produced no valid result for {row_param} x {col_param}")
+            sensitivity_warnings.append(f"敏感性分析中有 {failed_cells} 个参数组合无法得到有效结果 (例如永续增长率不小于 WACC)。")
 
         sensitivity_result_obj = SensitivityAnalysisResult(
             row_parameter=row_param,
@@ -407,3 +526,169 @@ class ValuationService:
         )
         self.logger.info("Sensitivity analysis in service complete.")
         return sensitivity_result_obj, sensitivity_warnings
+
+    def _monte_carlo_base_values(self, base_request_dict: Dict[str, Any], base_dcf_details: DcfForecastDetails) -> Dict[str, Optional[float]]:
+        """
+        各模拟参数在基础估值中的取值，作为分布未指定 mean/mode 时的中心。
+        WACC 输入缺失时使用 WaccCalculator 的默认值；经营驱动因素未设置目标值时使用对应的历史中位数。
+        """
+        wacc_params = self._wacc_params(base_request_dict)
+        wacc_defaults = {
+            'beta': self.wacc_calculator.default_beta,
+            'risk_free_rate': self.wacc_calculator.default_risk_free_rate,
+            'market_risk_premium': self.wacc_calculator.default_market_risk_premium,
+            'size_premium': self.wacc_calculator.default_size_premium,
+            'cost_of_debt': self.wacc_calculator.default_cost_of_debt_pretax,
+            'target_debt_ratio': self.wacc_calculator.default_target_debt_ratio,
+        }
+        base_values: Dict[str, Any] = {name: wacc_params.get(name, default) for name, default in wacc_defaults.items()}
+        base_values['wacc'] = base_dcf_details.wacc_used
+        base_values['exit_multiple'] = base_dcf_details.exit_multiple_used
+        base_values['perpetual_growth_rate'] = base_dcf_details.perpetual_growth_rate_used
+
+        historical_ratios = self.processed_data_container.get_historical_ratios() or {}
+        historical_keys = {f'target_{metric_name}': hist_key for metric_name, hist_key, _ in FORECAST_METRICS}
+        historical_keys['target_effective_tax_rate'] = 'effective_tax_rate'
+        for param_name in OPERATING_DRIVER_PARAMETERS:
+            value = base_request_dict.get(param_name)
+            if value is None and param_name in historical_keys:
+                value = historical_ratios.get(historical_keys[param_name])
+            base_values[param_name] = value
+
+        result: Dict[str, Optional[float]] = {}
+        for name, value in base_values.items():
+            try:
+                result[name] = float(value) if value is not None else None
+            except (TypeError, ValueError, InvalidOperation):
+                result[name] = None
+        return result
+
+    def run_monte_carlo_simulation(
+        self,
+        mc_config: MonteCarloConfig,
+        base_dcf_details: DcfForecastDetails,
+        base_request_dict: Dict[str, Any],
+        total_shares_actual: Optional[float],
+        latest_price: Optional[float] = None
+    ) -> Tuple[Optional[MonteCarloResult], List[str]]:
+        """
+        蒙特卡洛估值：按配置的分布对 WACC 输入、终值参数和经营驱动因素抽样，
+        分批执行 财务预测 → 终值 → 现值 → 股权价值 的向量化计算链，汇总每股价值和企业价值的分布。
+        每个参数使用独立的随机数流，结果只取决于种子和配置，与分批大小无关。
+        Args:
+            mc_config (MonteCarloConfig): 模拟配置 (路径数、种子、分批大小、分布定义等)。
+            base_dcf_details (DcfForecastDetails): 基础估值结果，提供 WACC、终值方法和终值参数的基础值。
+            base_request_dict (Dict[str, Any]): 基础估值的请求参数。
+            total_shares_actual (Optional[float]): 总股本 (单位：股)。
+            latest_price (Optional[float]): 最新股价，用于计算上涨概率。
+
+        Returns:
+            Tuple[Optional[MonteCarloResult], List[str]]: 模拟结果 (失败时为 None) 和警告列表。
+        """
+        self.logger.info(f"Starting Monte Carlo simulation in service ({mc_config.num_simulations} paths)...")
+        mc_warnings: List[str] = []
+        specs = {name: spec.model_dump() for name, spec in mc_config.distributions.items()}
+        param_names = sorted(specs)
+
+        tv_method = base_dcf_details.terminal_value_method_used or base_request_dict.get('terminal_value_method', 'exit_multiple')
+        inactive_tv_param = 'perpetual_growth_rate' if tv_method == 'exit_multiple' else 'exit_multiple'
+        if inactive_tv_param in specs:
+            param_names.remove(inactive_tv_param)
+            mc_warnings.append(f"基础估值使用 {tv_method} 终值方法，忽略参数 {inactive_tv_param} 的分布。")
+
+        wacc_params = self._wacc_params(base_request_dict)
+        wacc_weight_mode = base_request_dict.get('wacc_weight_mode') or 'target'
+        wacc_components = [name for name in param_names if name in MONTE_CARLO_WACC_PARAMETERS and name != 'wacc']
+        if 'wacc' in param_names and wacc_components:
+            mc_warnings.append(f"已直接对 WACC 抽样，忽略 WACC 输入参数 {wacc_components} 的分布。")
+        elif wacc_params.get('discount_rate') is not None and wacc_components:
+            mc_warnings.append(f"请求直接指定了贴现率，WACC 输入参数 {wacc_components} 的分布不影响结果。")
+        # 目标税率同时影响预测期税率和税后债务成本
+        recompute_wacc = 'wacc' not in param_names and (wacc_components or 'target_effective_tax_rate' in param_names)
+        driver_params = [name for name in param_names if name in OPERATING_DRIVER_PARAMETERS]
+
+        seed, generators = parameter_generators(mc_config.seed, param_names)
+        base_values = self._monte_carlo_base_values(base_request_dict, base_dcf_details)
+        base_rf = float(base_request_dict.get('risk_free_rate') or self.wacc_calculator.default_risk_free_rate)
+        exit_multiple = base_dcf_details.exit_multiple_used
+        growth_rate = base_dcf_details.perpetual_growth_rate_used
+
+        num_simulations = mc_config.num_simulations
+        outputs = {key: np.full(num_simulations, np.nan) for key in ('value_per_share', 'enterprise_value')}
+        try:
+            if base_dcf_details.wacc_used is None and not ('wacc' in param_names or recompute_wacc):
+                raise ValueError("基础 WACC 不可用。")
+            forecaster = self._build_forecaster(base_request_dict, precision_mode='float64')
+            latest_balance_sheet = self.processed_data_container.get_latest_balance_sheet()
+            line_items = ['ebitda', 'ufcf']
+            # 未抽样经营驱动因素时，所有路径共用一组预测现金流
+            shared_batch = None if driver_params else forecaster.forecast_driver_paths({}, line_items=line_items)
+
+            for start in range(0, num_simulations, mc_config.chunk_size):
+                size = min(mc_config.chunk_size, num_simulations - start)
+                samples = {
+                    name: sample_distribution(generators[name], specs[name], size, base_values.get(name), PARAMETER_BOUNDS.get(name))
+                    for name in param_names
+                }
+
+                if 'wacc' in samples:
+                    wacc = samples['wacc']
+                elif recompute_wacc:
+                    wacc_inputs = {**wacc_params, **{name: samples[name] for name in wacc_components}}
+                    if 'target_effective_tax_rate' in samples:
+                        wacc_inputs['tax_rate'] = samples['target_effective_tax_rate']
+                    wacc, _ = self.wacc_calculator.get_wacc_and_ke_vectorized(wacc_inputs, wacc_weight_mode)
+                else:
+                    wacc = np.full(size, float(base_dcf_details.wacc_used))
+
+                batch = shared_batch if shared_batch is not None else forecaster.forecast_driver_paths(
+                    {OPERATING_DRIVER_ASSUMPTION_KEYS[name][0]: samples[name] for name in driver_params},
+                    line_items=line_items
+                )
+                grid_calculator = DcfGridCalculator.from_forecast_batch(
+                    batch, (batch['values'].shape[0],),
+                    latest_balance_sheet=latest_balance_sheet,
+                    total_shares=total_shares_actual,
+                    risk_free_rate=samples.get('risk_free_rate', base_rf)
+                )
+                results = grid_calculator.calculate(
+                    wacc=np.broadcast_to(wacc, (size,)),
+                    method=tv_method,
+                    exit_multiple=samples.get('exit_multiple', exit_multiple) if tv_method == 'exit_multiple' else None,
+                    perpetual_growth_rate=samples.get('perpetual_growth_rate', growth_rate) if tv_method == 'perpetual_growth' else None
+                )
+                for key, values in outputs.items():
+                    values[start:start + size] = np.broadcast_to(results[key], (size,))
+        except Exception as e:
+            self.logger.error(f"Monte Carlo simulation failed: {e}\n{traceback.format_exc()}")
+            mc_warnings.append(f"蒙特卡洛模拟失败: {str(e)}")
+            return None, mc_warnings
+
+        statistics = {}
+        for key, values in outputs.items():
+            summary = summarize_distribution(values, mc_config.percentiles, mc_config.histogram_bins)
+            if summary is not None:
+                statistics[key] = summary
+
+        value_per_share = outputs['value_per_share']
+        valid_paths = np.isfinite(value_per_share)
+        num_valid_paths = int(valid_paths.sum())
+        if num_valid_paths < num_simulations:
+            mc_warnings.append(f"蒙特卡洛模拟中有 {num_simulations - num_valid_paths} 条路径无法得到有效每股价值 (例如 WACC 无效或永续增长率不小于 WACC)。")
+        probability_of_upside = None
+        if num_valid_paths and latest_price is not None and latest_price > 0:
+            probability_of_upside = float(np.mean(value_per_share[valid_paths] > float(latest_price)))
+
+        mc_result = MonteCarloResult(
+            num_simulations=num_simulations,
+            num_valid_paths=num_valid_paths,
+            seed=seed,
+            sampled_parameters=param_names,
+            terminal_value_method=tv_method,
+            latest_price=latest_price,
+            base_value_per_share=base_dcf_details.value_per_share,
+            probability_of_upside=probability_of_upside,
+            statistics=statistics
+        )
+        self.logger.info(f"Monte Carlo simulation in service complete ({num_valid_paths}/{num_simulations} valid paths).")
+        return mc_result, mc_warnings
@@ -0,0 +1,98 @@
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+# 各报表消费方实际读取的列 (列清单)。
+# 数据获取 (AshareDataFetcher) 只查询、DataProcessor 只保留和清洗这些列的并集；
+# 修改任一消费方读取的报表列时需要同步更新这里 (tests/test_statement_columns.py 会检查)。
+
+STATEMENT_TABLES = ('balance_sheet', 'income_statement', 'cash_flow')
+
+# 所有报表都保留的标识列
+STATEMENT_KEY_COLUMNS = ['ts_code', 'ann_date', 'end_date']
+
+CONSUMER_STATEMENT_COLUMNS: Dict[str, Dict[str, List[str]]] = {
+    # 最新年报 EPS、历史比率/周转天数、NWC 相关项目、最新 EBITDA 以及清洗时插值的关键项目
+    'DataProcessor': {
+        'balance_sheet': [
+            'total_cur_assets', 'total_cur_liab', 'money_cap', 'st_borr', 'non_cur_liab_due_1y',
+            'accounts_receiv_bill', 'inventories', 'accounts_pay', 'prepayment', 'oth_cur_assets',
+            'contract_liab', 'adv_receipts', 'payroll_payable', 'taxes_payable', 'oth_payable',
+        ],
+        'income_statement': [
+            'end_type', 'diluted_eps', 'total_revenue', 'revenue', 'oper_cost', 'sell_exp', 'admin_exp', 'rd_exp',
+            'operate_profit', 'ebit', 'total_profit', 'income_tax',
+        ],
+        'cash_flow': [
+            'depr_fa_coga_dpba', 'amort_intang_assets', 'use_right_asset_dep', 'lt_amort_deferred_exp',
+            'c_pay_acq_const_fiolta', 'c_paid_goods_s',
+        ],
+    },
+    # 历史 NWC
+    'NwcCalculator': {
+        'balance_sheet': ['total_cur_assets', 'money_cap', 'total_cur_liab', 'st_borr', 'non_cur_liab_due_1y'],
+    },
+    # 市值估算 (净利润) 和债务市值
+    'WaccCalculator': {
+        'balance_sheet': ['lt_borr', 'st_borr', 'bond_payable', 'non_cur_liab_due_1y', 'total_liab'],
+        'income_statement': ['n_income'],
+    },
+    # 净债务、少数股东权益和优先股 (最新资产负债表)
+    'EquityBridgeCalculator': {
+        'balance_sheet': ['money_cap', 'st_borr', 'lt_borr', 'bond_payable', 'non_cur_liab_due_1y',
+                          'minority_int', 'oth_eqt_tools_p_shr'],
+    },
+    # 只使用 DataProcessor 计算的历史比率，不直接读取报表
+    'FinancialForecaster': {},
+    # 估值响应中的历史财务摘要 (api/utils.py)
+    'build_historical_financial_summary': {
+        'balance_sheet': [
+            'total_assets', 'total_liab', 'total_hldr_eqy_exc_min_int', 'total_cur_assets', 'total_cur_liab',
+            'money_cap', 'accounts_receiv_bill', 'inventories', 'fix_assets_total', 'st_borr', 'lt_borr',
+        ],
+        'income_statement': ['total_revenue', 'oper_cost', 'operate_profit', 'n_income', 'rd_exp'],
+        'cash_flow': ['n_cashflow_act', 'n_cashflow_inv_act', 'n_cashflow_fin_act'],
+    },
+    # 金融类公司判断 (api/main.py)
+    'valuation_endpoint': {
+        'balance_sheet': ['comp_type'],
+    },
+}
+
+
+def required_statement_columns() -> Dict[str, List[str]]:
+    """
+    返回各报表需要的列 (标识列 + 所有消费方列清单的并集，保持声明顺序)。
+    Returns:
+        Dict[str, List[str]]: 报表名 -> 列名列表。
+    """
+    required = {}
+    for table in STATEMENT_TABLES:
+        columns = list(STATEMENT_KEY_COLUMNS)
+        for consumer_columns in CONSUMER_STATEMENT_COLUMNS.values():
+            for column in consumer_columns.get(table, []):
+                if column not in columns:
+                    columns.append(column)
+        required[table] = columns
+    return required
+
+
+REQUIRED_STATEMENT_COLUMNS = required_statement_columns()
+
+
+def project_statement(df: Optional[pd.DataFrame], table: str) -> Optional[pd.DataFrame]:
+    """
+    只保留报表中列清单需要的列 (保持原列顺序)；df 为 None 或不是已知报表时原样返回。
+    Args:
+        df (pd.DataFrame): 报表数据。
+        table (str): 报表名 ('balance_sheet'、'income_statement' 或 'cash_flow')。
+    Returns:
+        pd.DataFrame: 投影后的报表 (新的 DataFrame)。
+    """
+    if df is None or table not in REQUIRED_STATEMENT_COLUMNS:
+        return df
+    required = set(REQUIRED_STATEMENT_COLUMNS[table])
+    columns = [column for column in df.columns if column in required]
+    if len(columns) == len(df.columns):
+        return df.copy()
+    return df[columns].copy()
@@ -0,0 +1,90 @@
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from statement_columns import STATEMENT_TABLES
+
+
+class StatementPanel:
+    """
+    三张报表按报告期 (end_date) 对齐的宽表，供历史比率、NWC、EBITDA 和历史财务摘要共用，避免各处重复排序和合并。
+    data 的行为报告期 (升序)，列为 (报表名, 字段) 的 MultiIndex；每张报表同一报告期只保留最后一条记录。
+    各报表实际存在的报告期单独记录，select() 只返回相应报表都存在的报告期，
+    因此与先对各报表 set_index('end_date') 再按索引 merge(how='inner') 的结果相同。
+    keys 为 ['ts_code', 'end_date'] 时可以容纳多只股票的长格式报表 (行按股票、报告期排序)。
+    """
+
+    def __init__(self, statements: Dict[str, Optional[pd.DataFrame]], keys: Optional[List[str]] = None):
+        """
+        Args:
+            statements (Dict[str, pd.DataFrame]): 报表名 -> 报表 (键为列或索引)；
+                为 None、为空或缺少键的报表视为不存在。
+            keys (Optional[List[str]]): 行键，默认为 ['end_date']。
+        """
+        keys = keys or ['end_date']
+        frames = {}
+        for table in STATEMENT_TABLES:
+            df = statements.get(table)
+            if df is None or df.empty:
+                continue
+            if all(key in df.columns for key in keys) and list(df.index.names) != keys:
+                df = df.drop_duplicates(subset=keys, keep='last').set_index(keys)
+            elif list(df.index.names) == keys:
+                df = df[~df.index.duplicated(keep='last')]
+            else:
+                continue
+            frames[table] = df
+
+        self.dtypes: Dict[str, pd.Series] = {table: df.dtypes for table, df in frames.items()}
+        if frames:
+            self.data = pd.concat(frames, axis=1, join='outer').sort_index()
+        else:
+            index = pd.MultiIndex.from_arrays([[]] * len(keys), names=keys) if len(keys) > 1 else pd.Index([], name=keys[0])
+            self.data = pd.DataFrame(index=index, columns=pd.MultiIndex.from_tuples([], names=[None, None]))
+        self.data.index.names = keys
+        self._present: Dict[str, np.ndarray] = {table: self.data.index.isin(df.index) for table, df in frames.items()}
+
+    def has_table(self, table: str) -> bool:
+        return table in self._present
+
+    def columns(self, table: str) -> List[str]:
+        """报表的字段列表 (报表不存在时为空)。"""
+        return list(self.dtypes[table].index) if table in self.dtypes else []
+
+    def select(self, fields: Dict[str, List[str]], rows: Optional[List[str]] = None) -> pd.DataFrame:
+        """
+        取多张报表的指定字段，列名为字段名，以 end_date 为索引 (升序)。
+        Args:
+            fields (Dict[str, List[str]]): 报表名 -> 字段列表 (字段须存在)。
+            rows (Optional[List[str]]): 决定返回哪些报告期的报表，为空时为 fields 中的全部报表
+                (即 inner merge)；其他报表在这些报告期缺失的值为 NaN (即 left join)。
+        Returns:
+            pd.DataFrame: 新的 DataFrame；报表在所选报告期都存在时恢复其原有 dtype。
+        """
+        row_mask = np.ones(len(self.data), dtype=bool)
+        for table in (fields if rows is None else rows):
+            row_mask &= self._present[table]
+        parts = []
+        for table, columns in fields.items():
+            part = self.data[table].loc[row_mask, columns]
+            if self._present[table][row_mask].all():
+                part = part.astype(self.dtypes[table][columns], copy=False)
+            parts.append(part)
+        if len(parts) == 1:
+            return parts[0]
+        if not parts:
+            return pd.DataFrame(index=self.data.index[row_mask])
+        return pd.concat(parts, axis=1)
+
+    def table(self, table: str) -> pd.DataFrame:
+        """报表在其全部报告期上的所有字段 (与原报表 drop_duplicates + set_index('end_date') + sort_index 相同)。"""
+        return self.select({table: self.columns(table)})
+
+    def add_columns(self, table: str, df: pd.DataFrame):
+        """
+        把以 end_date 为索引、按该报表报告期计算的新字段 (如 NWC) 加入宽表。
+        """
+        for column in df.columns:
+            self.data[(table, column)] = df[column].reindex(self.data.index)
+        self.dtypes[table] = pd.concat([self.dtypes[table].drop(list(df.columns), errors='ignore'), df.dtypes])
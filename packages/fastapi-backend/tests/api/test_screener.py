@@ -0,0 +1,142 @@
+import pandas as pd
+import pytest
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+
+from api.main import app
+from services import stock_screener_service
+
+client = TestClient(app)
+
+MOCK_MERGED_DF = pd.DataFrame({
+    'ts_code': ['000001.SZ', '600000.SH', '300750.SZ'],
+    'name': ['平安银行', '浦发银行', '宁德时代'],
+    'close': [10.0, 8.0, 200.0],
+    'pe_ttm': [5.0, 4.0, 20.0],
+    'market_cap_billion': [2000.0, 2400.0, 9000.0],
+    'dcf_value_per_share': [15.0, 6.0, None],
+    'dcf_upside': [0.5, -0.25, None],
+    'dcf_implied_pe': [8.0, 3.0, None],
+    'dcf_tv_to_ev': [0.55, 0.7, None],
+})
+
+@pytest.fixture(autouse=True)
+def reset_snapshot():
+    stock_screener_service.clear_screener_snapshot()
+    yield
+    stock_screener_service.clear_screener_snapshot()
+
+@patch('services.stock_screener_service._dcf_file_key', return_value=None)
+@patch('services.stock_screener_service.get_dcf_valuation_update_time', return_value='2024-06-28T02:00:00')
+@patch('services.stock_screener_service.get_merged_stock_data', return_value=MOCK_MERGED_DF)
+@patch('services.stock_screener_service.get_latest_valid_trade_date', return_value='20240628')
+def test_screener_filters_on_dcf_columns(mock_trade_date, mock_merged, mock_dcf_time, mock_dcf_key):
+    response = client.post("/api/v1/screener/stocks", json={'dcf_upside_min': 0.0})
+    assert response.status_code == 200
+    data = response.json()
+    assert data['total'] == 1
+    assert data['results'][0]['ts_code'] == '000001.SZ'
+    assert data['results'][0]['dcf_value_per_share'] == 15.0
+    assert data['last_dcf_update_time'] == '2024-06-28T02:00:00'
+
+    response = client.post("/api/v1/screener/stocks", json={'dcf_tv_to_ev_max': 0.8, 'dcf_implied_pe_max': 5.0})
+    assert [r['ts_code'] for r in response.json()['results']] == ['600000.SH']
+    # 同一交易日的请求复用快照，不再重新合并
+    assert mock_merged.call_count == 1
+
+@patch('services.stock_screener_service._dcf_file_key', return_value=None)
+@patch('services.stock_screener_service.get_dcf_valuation_update_time', return_value=None)
+@patch('services.stock_screener_service.get_merged_stock_data', return_value=MOCK_MERGED_DF)
+@patch('services.stock_screener_service.get_latest_valid_trade_date', return_value='20240628')
+def test_screener_generic_filters(mock_trade_date, mock_merged, mock_dcf_time, mock_dcf_key):
+    response = client.post("/api/v1/screener/stocks", json={
+        'filters': [{'column': 'close', 'max': 100.0}, {'column': 'ts_code', 'values': ['600000.SH', '300750.SZ']}],
+    })
+    assert response.status_code == 200
+    assert [r['ts_code'] for r in response.json()['results']] == ['600000.SH']
+
+    response = client.post("/api/v1/screener/stocks", json={'filters': [{'column': 'no_such_column', 'min': 1.0}]})
+    assert response.status_code == 400
+    assert 'no_such_column' in response.json()['detail']
+
+@patch('services.stock_screener_service._dcf_file_key', return_value=None)
+@patch('services.stock_screener_service.get_dcf_valuation_update_time', return_value=None)
+@patch('services.stock_screener_service.get_merged_stock_data', return_value=MOCK_MERGED_DF)
+@patch('services.stock_screener_service.get_latest_valid_trade_date', return_value='20240628')
+def test_screener_sorting(mock_trade_date, mock_merged, mock_dcf_time, mock_dcf_key):
+    response = client.post("/api/v1/screener/stocks", json={'sort_by': 'total_market_cap', 'sort_order': 'desc'})
+    assert [r['ts_code'] for r in response.json()['results']] == ['300750.SZ', '600000.SH', '000001.SZ']
+
+    # NaN 排在最后；分页沿排序结果进行
+    response = client.post("/api/v1/screener/stocks", json={'sort_by': 'dcf_upside', 'page': 1, 'page_size': 2})
+    data = response.json()
+    assert data['total'] == 3
+    assert [r['ts_code'] for r in data['results']] == ['600000.SH', '000001.SZ']
+    response = client.post("/api/v1/screener/stocks", json={'sort_by': 'dcf_upside', 'page': 2, 'page_size': 2})
+    assert [r['ts_code'] for r in response.json()['results']] == ['300750.SZ']
+
+    response = client.post("/api/v1/screener/stocks", json={'sort_by': 'name'})
+    assert response.status_code == 400
+
+@patch('services.stock_screener_service._dcf_file_key', return_value=None)
+@patch('services.stock_screener_service.get_dcf_valuation_update_time', return_value=None)
+@patch('services.stock_screener_service.get_merged_stock_data',
+       return_value=MOCK_MERGED_DF.assign(industry=['银行', '银行', '电池']))
+@patch('services.stock_screener_service.get_latest_valid_trade_date', return_value='20240628')
+def test_screener_industry_filter_and_facets(mock_trade_date, mock_merged, mock_dcf_time, mock_dcf_key):
+    response = client.post("/api/v1/screener/stocks", json={'industry': '银行', 'pe_max': 4.5, 'facets': ['industry']})
+    assert response.status_code == 200
+    data = response.json()
+    assert [r['ts_code'] for r in data['results']] == ['600000.SH']
+    assert data['results'][0]['industry'] == '银行'
+    assert data['facets'] == {'industry': {'银行': 1}}
+
+    # 行业分面不受行业条件本身影响
+    response = client.post("/api/v1/screener/stocks", json={'industry': '电池', 'facets': ['industry']})
+    assert response.json()['facets'] == {'industry': {'银行': 2, '电池': 1}}
+
+@patch('services.stock_screener_service._dcf_file_key', return_value=None)
+@patch('services.stock_screener_service.get_dcf_valuation_update_time', return_value=None)
+@patch('services.stock_screener_service.get_merged_stock_data', return_value=MOCK_MERGED_DF)
+@patch('services.stock_screener_service.get_latest_valid_trade_date', return_value='20240628')
+def test_screener_arrow_response(mock_trade_date, mock_merged, mock_dcf_time, mock_dcf_key):
+    import pyarrow as pa
+    response = client.post("/api/v1/screener/stocks", json={'response_format': 'arrow', 'sort_by': 'close', 'page_size': 2})
+    assert response.status_code == 200
+    assert response.headers['content-type'] == 'application/vnd.apache.arrow.stream'
+    assert response.headers['x-total-count'] == '3'
+    table = pa.ipc.open_stream(response.content).read_all()
+    assert table.column('ts_code').to_pylist() == ['600000.SH', '000001.SZ']
+    assert table.column('dcf_upside').to_pylist() == [-0.25, 0.5]
+
+@patch('services.stock_screener_service._dcf_file_key', return_value=None)
+@patch('services.stock_screener_service.get_dcf_valuation_update_time', return_value=None)
+@patch('services.stock_screener_service.get_merged_stock_data', return_value=MOCK_MERGED_DF)
+@patch('services.stock_screener_service.get_latest_valid_trade_date', return_value='20240628')
+def test_screener_export_streams_all_matches(mock_trade_date, mock_merged, mock_dcf_time, mock_dcf_key):
+    import io
+    import json
+    import pyarrow as pa
+    body = {'pe_max': 10.0, 'sort_by': 'close', 'sort_order': 'desc', 'chunk_size': 1}
+
+    response = client.post("/api/v1/screener/export", json={**body, 'format': 'ndjson'})
+    assert response.status_code == 200
+    assert response.headers['x-total-count'] == '2'
+    records = [json.loads(line) for line in response.text.splitlines()]
+    assert [r['ts_code'] for r in records] == ['000001.SZ', '600000.SH']
+    assert records[0]['market_cap_billion'] == 2000.0
+
+    response = client.post("/api/v1/screener/export", json={**body, 'format': 'csv'})
+    assert 'attachment; filename="screener_20240628.csv"' == response.headers['content-disposition']
+    exported = pd.read_csv(io.BytesIO(response.content), encoding='utf-8-sig')
+    assert exported['ts_code'].tolist() == ['000001.SZ', '600000.SH']
+    assert exported['name'].tolist() == ['平安银行', '浦发银行']
+
+    response = client.post("/api/v1/screener/export", json={**body, 'format': 'arrow'})
+    table = pa.ipc.open_stream(response.content).read_all()
+    assert table.column('ts_code').to_pylist() == ['000001.SZ', '600000.SH']
+    assert json.loads(table.schema.metadata[b'total']) == 2
+
+    response = client.post("/api/v1/screener/export", json={'format': 'arrow', 'pe_min': 1000})
+    assert pa.ipc.open_stream(response.content).read_all().num_rows == 0
+    assert client.post("/api/v1/screener/export", json={'sort_by': 'missing'}).status_code == 400
@@ -0,0 +1,39 @@
+import json
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from api import screener_serialization
+from api.models import ApiScreenedStockModel
+
+PAGE_DF = pd.DataFrame({
+    'ts_code': ['000001.SZ', '600000.SH', '300750.SZ'],
+    'name': ['平安银行', None, '宁德时代'],
+    'close': [10.0, np.inf, 200.0],
+    'pe_ttm': [5.0, np.nan, -np.inf],
+    'market_cap_billion': [2000.0, 2400.0, 9000.0],
+    'industry': pd.Categorical(['银行', '银行', None]),
+    'total_share': [1, 2, 3],
+    'dcf_base_report_date': ['2024-12-31', None, None],
+    'unrelated_column': ['x', 'y', 'z'],
+})
+
+def test_records_match_pydantic_model_output():
+    expected = [ApiScreenedStockModel(**{k: (None if isinstance(v, float) and not np.isfinite(v) else v)
+                                         for k, v in row.items()}).model_dump(by_alias=True, mode='json')
+                for row in PAGE_DF.astype(object).where(PAGE_DF.notna(), None).to_dict(orient='records')]
+    records = screener_serialization.screened_stock_records(PAGE_DF)
+    assert records == expected
+    assert list(records[0]) == list(expected[0])
+
+def test_json_fallback_without_orjson(monkeypatch):
+    payload = {'results': screener_serialization.screened_stock_records(PAGE_DF), 'total': 3}
+    fast = screener_serialization.dumps(payload)
+    monkeypatch.setattr(screener_serialization, 'orjson', None)
+    assert json.loads(screener_serialization.dumps(payload)) == json.loads(fast)
+
+def test_arrow_table_matches_json_records():
+    table = screener_serialization.screened_stock_arrow_table(PAGE_DF, metadata={'total': 3, 'page': 1})
+    assert table.to_pylist() == screener_serialization.screened_stock_records(PAGE_DF)
+    assert table.schema.field('close').type == pa.float64()
+    assert table.schema.field('area').type == pa.string()
+    assert json.loads(table.schema.metadata[b'total']) == 3
@@ -0,0 +1,51 @@
+"""
+Shared fixtures for the backend unit tests.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+from decimal import localcontext
+
+@pytest.fixture
+def decimal_precision():
+    """其他测试模块会在导入时修改全局 Decimal 精度，参考结果使用默认的 28 位精度计算。"""
+    with localcontext() as ctx:
+        ctx.prec = 28
+        yield
+
+@pytest.fixture
+def no_data_stores(monkeypatch):
+    """关闭处理结果缓存和报表库，估值流程只使用测试提供的报表。"""
+    monkeypatch.setenv("PROCESSED_DATA_CACHE_ENABLED", "false")
+    monkeypatch.setenv("STATEMENT_STORE_ENABLED", "false")
+
+def _make_statements(ts_code: str = '600000.SH', scale: float = 1.0, last_year: int = 2024):
+    """五个年度 (截至 last_year) 的三张报表，金额随 scale 放大，按 end_date 倒序 (与数据库返回顺序一致)。"""
+    years = list(range(last_year - 4, last_year + 1))
+    dates = pd.to_datetime([f"{y}-12-31" for y in years])
+    n = len(years)
+    rng = np.random.default_rng(len(ts_code) + int(scale))
+    revenue = scale * np.linspace(100, 160, n) * 1e8
+    income = pd.DataFrame({
+        'ts_code': ts_code, 'end_date': dates, 'revenue': revenue, 'total_revenue': revenue,
+        'oper_cost': revenue * 0.6, 'sell_exp': revenue * 0.05, 'admin_exp': revenue * 0.04, 'rd_exp': revenue * 0.02,
+        'operate_profit': revenue * 0.2, 'income_tax': revenue * 0.03, 'total_profit': revenue * 0.2,
+        'n_income': revenue * 0.15, 'diluted_eps': np.linspace(0.5, 0.9, n),
+    })
+    balance = pd.DataFrame({
+        'ts_code': ts_code, 'end_date': dates, 'accounts_receiv_bill': revenue * 0.2, 'inventories': revenue * 0.15,
+        'accounts_pay': revenue * 0.1, 'total_cur_assets': revenue * 0.8, 'total_cur_liab': revenue * 0.5,
+        'money_cap': revenue * 0.3 + rng.normal(0, 1e6, n), 'st_borr': revenue * 0.05, 'lt_borr': revenue * 0.1,
+        'non_cur_liab_due_1y': revenue * 0.01, 'total_assets': revenue * 2.0, 'total_liab': revenue * 1.1, 'comp_type': '1',
+    })
+    cash_flow = pd.DataFrame({
+        'ts_code': ts_code, 'end_date': dates, 'depr_fa_coga_dpba': revenue * 0.04, 'amort_intang_assets': revenue * 0.01,
+        'c_pay_acq_const_fiolta': revenue * 0.07, 'n_cashflow_act': revenue * 0.18,
+    })
+    return {name: df.iloc[::-1].reset_index(drop=True)
+            for name, df in [('balance_sheet', balance), ('income_statement', income), ('cash_flow', cash_flow)]}
+
+@pytest.fixture
+def make_statements():
+    """返回报表工厂 make_statements(ts_code='600000.SH', scale=1.0, last_year=2024)。"""
+    return _make_statements
@@ -0,0 +1,118 @@
+"""
+Unit tests for the whole-market batch valuation job.
+"""
+import sys
+from concurrent.futures import Future
+import pandas as pd
+import pytest
+from data_processor import DataProcessor
+from wacc_calculator import WaccCalculator
+from services.valuation_service import ValuationService
+import services.batch_valuation_service as batch_valuation_service
+from services.batch_valuation_service import run_batch_valuation, read_latest_pointer, RESULT_COLUMNS, BatchValuationError
+from api.batch_models import BatchValuationRequest
+
+pytestmark = pytest.mark.usefixtures("decimal_precision", "no_data_stores")
+
+class FakeFetcher:
+    def __init__(self, stocks, prices):
+        self.stocks = stocks
+        self.prices = prices
+        self.market_calls = []
+
+    def get_market_data_for_codes(self, ts_codes, valuation_date=None, ttm_valuation_date=None):
+        self.market_calls.append(list(ts_codes))
+        return {
+            'stock_basic': pd.DataFrame([{'ts_code': c, 'name': f"name-{c}", 'industry': '制造', 'list_date': '20100101'} for c in ts_codes]),
+            'latest_price': pd.DataFrame([{'ts_code': c, 'close': self.prices[c]} for c in ts_codes if c in self.prices]),
+            'valuation_metrics': pd.DataFrame([{'ts_code': c, 'pe': 12.0, 'pb': 1.5, 'total_share': 50.0} for c in ts_codes]),
+            'dividends': pd.DataFrame(columns=['ts_code', 'end_date', 'cash_div_tax', 'ann_date', 'div_proc']),
+        }
+
+    def get_latest_report_end_dates(self, years=5, ts_codes=None):
+        return {code: '2024-12-31' for code in ts_codes if code in self.stocks}
+
+    def get_raw_financial_data_for_codes(self, ts_codes, years=5):
+        return {name: pd.concat([self.stocks[code][name] for code in ts_codes], ignore_index=True)
+                for name in ('balance_sheet', 'income_statement', 'cash_flow')}
+
+def test_batch_valuation_matches_single_stock_pipeline(tmp_path, make_statements):
+    stocks = {code: make_statements(code, scale) for code, scale in [('000001.SZ', 1.0), ('600000.SH', 3.0), ('300750.SZ', 7.0)]}
+    prices = {'000001.SZ': 10.0, '600000.SH': 25.0, '300750.SZ': 60.0, '000002.SZ': 8.0}
+    fetcher = FakeFetcher(stocks, prices)
+    assumptions = BatchValuationRequest(prediction_years=5, exit_multiple=8.0).assumptions_dict()
+    events = []
+    output_path = str(tmp_path / "valuation.parquet")
+
+    summary = run_batch_valuation(ts_codes=['600000.SH', '000001.SZ', '300750.SZ', '000002.SZ'], request_dict=assumptions,
+                                  chunk_size=2, output_path=output_path, progress_callback=events.append,
+                                  fetcher=fetcher, in_process=True)
+
+    assert summary['total'] == 4 and summary['succeeded'] == 3 and summary['failed'] == 1
+    assert summary['published'] is False
+    assert fetcher.market_calls == [['600000.SH', '000001.SZ'], ['300750.SZ', '000002.SZ']]
+    assert [e['completed'] for e in events] == [2, 4]
+    result = pd.read_parquet(output_path)
+    assert list(result.columns) == RESULT_COLUMNS
+    assert result['ts_code'].tolist() == sorted(prices)
+    failed = result.set_index('ts_code').loc['000002.SZ']
+    assert failed['status'] == 'error' and '报表' in failed['error']
+
+    # 与单只股票流程的基础估值一致
+    statements = stocks['600000.SH']
+    processor = DataProcessor({'stock_basic': {'ts_code': '600000.SH'}, **{k: v.copy() for k, v in statements.items()}},
+                              latest_pe_pb={'pe': 12.0, 'pb': 1.5}, latest_price=25.0)
+    wacc_calculator = WaccCalculator(processor.processed_data, WaccCalculator.estimate_market_cap(processor.processed_data, 12.0))
+    details, _, _ = ValuationService(processor, wacc_calculator).run_single_valuation({**assumptions, 'ts_code': '600000.SH'}, 50.0 * 1e8)
+    row = result.set_index('ts_code').loc['600000.SH']
+    assert row['status'] == 'ok' and row['statement_source'] == 'database'
+    assert row['value_per_share'] == pytest.approx(details.value_per_share, rel=1e-12)
+    assert row['upside'] == pytest.approx(details.value_per_share / 25.0 - 1.0)
+    assert row['wacc'] == pytest.approx(details.wacc_used)
+
+def test_batch_valuation_always_uses_worker_processes_by_default(tmp_path, monkeypatch):
+    pools = []
+
+    class InlinePool:
+        """记录进程池参数，在当前线程执行任务 (不真正启动进程)。"""
+        def __init__(self, max_workers, mp_context, initializer):
+            pools.append({'max_workers': max_workers, 'initializer': initializer, 'submitted': []})
+        def __enter__(self):
+            return self
+        def __exit__(self, *exc):
+            return False
+        def submit(self, func, *args):
+            pools[-1]['submitted'].append(func)
+            future = Future()
+            future.set_result([batch_valuation_service._error_row(code, 'stub') for code in args[0]])
+            return future
+
+    monkeypatch.setattr(batch_valuation_service, 'ProcessPoolExecutor', InlinePool)
+    stdout = sys.stdout
+    summary = run_batch_valuation(ts_codes=['000001.SZ'], request_dict={}, max_workers=1,
+                                  output_path=str(tmp_path / "valuation.parquet"))
+
+    # 单块、单进程也提交到进程池；stdout 只在工作进程初始化时替换
+    assert summary['failed'] == 1 and sys.stdout is stdout
+    assert pools == [{'max_workers': 1, 'initializer': batch_valuation_service._init_worker,
+                      'submitted': [batch_valuation_service._value_chunk_safely]}]
+    with pytest.raises(BatchValuationError):
+        run_batch_valuation(ts_codes=['000001.SZ'], request_dict={}, fetcher=object(), output_path=str(tmp_path / "x.parquet"))
+
+def test_only_whole_market_runs_are_published(tmp_path, monkeypatch, make_statements):
+    monkeypatch.setenv("BATCH_VALUATION_OUTPUT_DIR", str(tmp_path))
+    monkeypatch.setattr(batch_valuation_service, 'load_universe', lambda: ['000001.SZ', '600000.SH'])
+    fetcher = FakeFetcher({code: make_statements(code, 1.0) for code in ('000001.SZ', '600000.SH')},
+                          {'000001.SZ': 10.0, '600000.SH': 25.0})
+
+    full_path = str(tmp_path / "valuation_full.parquet")
+    summary = run_batch_valuation(request_dict={}, output_path=full_path, fetcher=fetcher, in_process=True)
+    assert summary['published'] is True
+    pointer = read_latest_pointer()
+    assert pointer['output_path'] == full_path and pointer['total'] == 2 and pointer['succeeded'] == 2
+
+    # 指定股票的部分估值不替换筛选器使用的全市场结果
+    summary = run_batch_valuation(ts_codes=['600000.SH'], request_dict={}, output_path=str(tmp_path / "valuation_partial.parquet"),
+                                  fetcher=fetcher, in_process=True)
+    assert summary['published'] is False
+    assert read_latest_pointer() == pointer
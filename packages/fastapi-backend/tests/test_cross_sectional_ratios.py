@@ -0,0 +1,103 @@
+"""
+Unit tests for the cross-sectional (whole-market) historical ratio computation.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+from data_processor import DataProcessor
+from cross_sectional_ratios import RATIO_COLUMNS, calculate_cross_sectional_ratios
+
+pytestmark = pytest.mark.usefixtures("decimal_precision")
+
+def _dates(years):
+    return pd.to_datetime([f"{y}-12-31" for y in years])
+
+def _statements(ts_code, seed, years=range(2019, 2025), balance_years=None, cash_flow_years=None,
+                drop=(), extra=None):
+    rng = np.random.default_rng(seed)
+    years = list(years)
+    balance_years = list(balance_years or years)
+    cash_flow_years = list(cash_flow_years or years)
+    revenue = np.linspace(100, 100 + 15 * len(years), len(years)) * (1 + rng.uniform(-0.1, 0.1, len(years))) * 1e8
+    income = pd.DataFrame({
+        'ts_code': ts_code, 'end_date': _dates(years), 'revenue': revenue, 'total_revenue': revenue,
+        'oper_cost': revenue * rng.uniform(0.5, 0.7, len(years)), 'sell_exp': revenue * 0.05, 'admin_exp': revenue * 0.04,
+        'rd_exp': revenue * 0.02, 'operate_profit': revenue * rng.uniform(0.1, 0.2, len(years)), 'ebit': revenue * 0.18,
+        'income_tax': revenue * 0.03, 'total_profit': revenue * rng.uniform(0.12, 0.2, len(years)),
+        'n_income': revenue * 0.15, 'diluted_eps': np.linspace(0.5, 0.9, len(years)),
+    })
+    base = np.linspace(100, 100 + 15 * len(balance_years), len(balance_years)) * 1e8
+    n = len(balance_years)
+    balance = pd.DataFrame({
+        'ts_code': ts_code, 'end_date': _dates(balance_years), 'accounts_receiv_bill': base * rng.uniform(0.15, 0.25, n),
+        'inventories': base * rng.uniform(0.1, 0.2, n), 'accounts_pay': base * 0.1, 'prepayment': base * 0.02,
+        'oth_cur_assets': base * 0.01, 'adv_receipts': base * 0.03, 'contract_liab': base * 0.04,
+        'payroll_payable': base * 0.01, 'taxes_payable': base * 0.005, 'oth_payable': base * 0.02,
+        'total_cur_assets': base * 0.8, 'money_cap': base * rng.uniform(0.2, 0.3, n), 'total_cur_liab': base * 0.5,
+        'st_borr': base * 0.05, 'non_cur_liab_due_1y': base * 0.01, 'lt_borr': base * 0.1, 'comp_type': '1',
+    })
+    m = len(cash_flow_years)
+    cash_flow = pd.DataFrame({
+        'ts_code': ts_code, 'end_date': _dates(cash_flow_years), 'depr_fa_coga_dpba': base[:m] * 0.04,
+        'amort_intang_assets': base[:m] * 0.01, 'c_pay_acq_const_fiolta': -base[:m] * 0.07, 'n_cashflow_act': base[:m] * 0.18,
+    })
+    statements = {'balance_sheet': balance, 'income_statement': income, 'cash_flow': cash_flow}
+    for table, column in drop:
+        statements[table] = statements[table].drop(columns=[column])
+    for (table, column), values in (extra or {}).items():
+        statements[table][column] = values
+    # 数据库按 end_date 倒序返回
+    return {name: df.iloc[::-1].reset_index(drop=True) for name, df in statements.items()}
+
+STOCKS = {
+    '000001.SZ': _statements('000001.SZ', 1),
+    # 三张报表的报告期不一致，没有营业利润和合同负债
+    '000002.SZ': _statements('000002.SZ', 2, balance_years=range(2018, 2025), cash_flow_years=range(2020, 2024),
+                             drop=[('income_statement', 'operate_profit'), ('balance_sheet', 'contract_liab')]),
+    # 只有两年数据 (回退到全部年份 CAGR)，没有 Capex、D&A、NWC 分项和其他流动资产
+    '600000.SH': _statements('600000.SH', 3, years=range(2023, 2025),
+                             drop=[('cash_flow', 'c_pay_acq_const_fiolta'), ('cash_flow', 'depr_fa_coga_dpba'),
+                                   ('cash_flow', 'amort_intang_assets'), ('balance_sheet', 'non_cur_liab_due_1y'),
+                                   ('balance_sheet', 'prepayment'), ('balance_sheet', 'oth_cur_assets')]),
+    # 利润总额为零、营业成本为负的年份
+    '600519.SH': _statements('600519.SH', 4, extra={('income_statement', 'total_profit'): [0.0, 5e9, 6e9, 0.0, 7e9, 8e9],
+                                                    ('income_statement', 'oper_cost'): [-1e9, 5e9, 6e9, 7e9, 8e9, 9e9]}),
+    # 只有一年数据 (无法计算 CAGR)
+    '300750.SZ': _statements('300750.SZ', 5, years=[2024]),
+}
+
+def _processed(statements):
+    return DataProcessor({'stock_basic': {'ts_code': 'x'}, **{k: v.copy() for k, v in statements.items()}}, {'pe': 10.0, 'pb': 1.0})
+
+def _long_format(processors):
+    return {table: pd.concat([processor.processed_data[table].reset_index(drop=processor.processed_data[table].index.name is None)
+                              for processor in processors], ignore_index=True, sort=False)
+            for table in ('balance_sheet', 'income_statement', 'cash_flow')}
+
+def test_matches_per_stock_processor():
+    processors = {code: _processed(statements) for code, statements in STOCKS.items()}
+    table = calculate_cross_sectional_ratios(_long_format(processors.values()))
+    assert list(table.columns) == RATIO_COLUMNS
+    assert list(table.index) == sorted(STOCKS) and table.index.name == 'ts_code'
+    assert (table.dtypes == 'float64').all()
+
+    for code, processor in processors.items():
+        expected = processor.get_historical_ratios()
+        assert list(expected) == RATIO_COLUMNS
+        for name in RATIO_COLUMNS:
+            value = table.at[code, name]
+            if expected[name] is None:
+                assert np.isnan(value), f"{code} {name}: {value}"
+            else:
+                assert value == pytest.approx(float(expected[name]), rel=1e-9), f"{code} {name}"
+    assert np.isnan(table.at['300750.SZ', 'historical_revenue_cagr'])
+    assert np.isnan(table.at['600000.SH', 'capex_to_revenue_ratio'])
+
+def test_only_stocks_with_all_statements():
+    processors = [_processed(STOCKS['000001.SZ']), _processed(STOCKS['600519.SH'])]
+    statements = _long_format(processors)
+    statements['cash_flow'] = statements['cash_flow'][statements['cash_flow']['ts_code'] != '600519.SH']
+    assert list(calculate_cross_sectional_ratios(statements).index) == ['000001.SZ']
+
+    empty = calculate_cross_sectional_ratios({**statements, 'cash_flow': pd.DataFrame()})
+    assert empty.empty and list(empty.columns) == RATIO_COLUMNS
@@ -0,0 +1,228 @@
+"""
+Unit tests for the shared engine registry and bulk prefetch in data_fetcher.
+"""
+import pytest
+import pandas as pd
+from unittest.mock import patch, MagicMock
+import data_fetcher
+from data_fetcher import AshareDataFetcher, get_shared_engine, dispose_engines
+
+@pytest.fixture(autouse=True)
+def clean_registry():
+    data_fetcher._engine_registry.clear()
+    yield
+    data_fetcher._engine_registry.clear()
+
+@patch('data_fetcher.create_engine')
+def test_fetchers_share_one_pooled_engine(mock_create_engine, monkeypatch):
+    monkeypatch.setenv('DB_POOL_SIZE', '7')
+    monkeypatch.setenv('DB_MAX_OVERFLOW', '3')
+    monkeypatch.setenv('DB_POOL_RECYCLE', '600')
+    monkeypatch.setenv('DB_POOL_PRE_PING', 'false')
+
+    fetcher_a = AshareDataFetcher('000001.SZ')
+    fetcher_b = AshareDataFetcher('600000.SH')
+
+    assert fetcher_a.engine is fetcher_b.engine
+    assert mock_create_engine.call_count == 1
+    _, kwargs = mock_create_engine.call_args
+    assert kwargs['pool_size'] == 7
+    assert kwargs['max_overflow'] == 3
+    assert kwargs['pool_recycle'] == 600
+    assert kwargs['pool_pre_ping'] is False
+    # 连接测试只在首次创建时执行
+    assert mock_create_engine.return_value.connect.call_count == 1
+
+@patch('data_fetcher.create_engine')
+def test_engines_are_keyed_by_url_and_disposed(mock_create_engine):
+    mock_create_engine.side_effect = lambda url, **kwargs: MagicMock(name=url)
+    engine_a = get_shared_engine('postgresql://u:p@host-a:5432/db')
+    engine_b = get_shared_engine('postgresql://u:p@host-b:5432/db')
+    assert engine_a is not engine_b
+    assert get_shared_engine('postgresql://u:p@host-a:5432/db') is engine_a
+
+    dispose_engines()
+    engine_a.dispose.assert_called_once_with(close=True)
+    engine_b.dispose.assert_called_once_with(close=True)
+    assert data_fetcher._engine_registry == {}
+
+def _make_fetcher_with_connection(execute_side_effect):
+    """构造一个数据库连接被 mock 的 AshareDataFetcher。"""
+    with patch('data_fetcher.create_engine') as mock_create_engine:
+        engine = mock_create_engine.return_value
+        engine.url = 'postgresql://u:p@localhost:5432/test'
+        fetcher = AshareDataFetcher('000001.SZ')
+    conn = MagicMock()
+    conn.execute.side_effect = execute_side_effect
+    engine.connect.return_value.__enter__.return_value = conn
+    engine.connect.reset_mock()
+    return fetcher, engine, conn
+
+def test_prefetch_valuation_data_serves_getters_from_one_query():
+    bundle_row = MagicMock()
+    bundle_row._asdict.return_value = {
+        'stock_basic': {'ts_code': '000001.SZ', 'name': '平安银行', 'industry': '银行', 'list_date': '19910403'},
+        'latest_close': 12.5,
+        'valuation_metrics': {'pe': 6.5, 'pb': 0.8, 'total_share': 194.06},
+        'balance_sheet': [{'ts_code': '000001.SZ', 'end_date': '20231231', 'money_cap': 10.0},
+                          {'ts_code': '000001.SZ', 'end_date': '20221231', 'money_cap': 8.0}],
+        'income_statement': [{'ts_code': '000001.SZ', 'end_date': '20231231', 'revenue': 100.0}],
+        'cash_flow': [{'ts_code': '000001.SZ', 'end_date': '20231231', 'depr_fa_coga_dpba': 5.0}],
+        'dividends': [{'ts_code': '000001.SZ', 'end_date': '20231231', 'ann_date': '20240315', 'cash_div_tax': '0.5', 'div_proc': '实施'}],
+    }
+    schema_rows = [('balance_sheet', 'ts_code'), ('balance_sheet', 'end_date'), ('balance_sheet', 'money_cap'),
+                   ('income_statement', 'ts_code'), ('income_statement', 'end_date'), ('income_statement', 'revenue'),
+                   ('cash_flow', 'ts_code'), ('cash_flow', 'end_date'), ('cash_flow', 'depr_fa_coga_dpba')]
+    bundle_result = MagicMock()
+    bundle_result.fetchone.return_value = bundle_row
+    fetcher, engine, conn = _make_fetcher_with_connection([iter(schema_rows), bundle_result])
+    data_fetcher._table_columns_cache.clear()
+
+    assert fetcher.prefetch_valuation_data(years=8, valuation_date=None, ttm_valuation_date='2024-06-30') is True
+
+    # 一个连接，表结构查询 + 一次批量查询
+    assert engine.connect.call_count == 1
+    assert conn.execute.call_count == 2
+    bundle_sql = str(conn.execute.call_args_list[1][0][0])
+    assert 'SELECT *' not in bundle_sql
+    assert 'SELECT ts_code, end_date, money_cap FROM balance_sheet' in bundle_sql
+
+    assert fetcher.get_stock_info()['list_date'] == '1991-04-03'
+    assert fetcher.get_latest_price() == 12.5
+    assert fetcher.get_latest_pe_pb(None) == {'pe': 6.5, 'pb': 0.8}
+    assert fetcher.get_latest_total_shares(None) == pytest.approx(194.06)
+    dividends = fetcher.get_dividends_ttm('2024-06-30')
+    assert dividends['cash_div_tax'].tolist() == [0.5]
+    raw = fetcher.get_raw_financial_data(years=8)
+    assert raw['balance_sheet']['money_cap'].tolist() == [10.0, 8.0]
+    assert str(raw['income_statement']['end_date'].dtype).startswith('datetime64')
+    # getter 均未再访问数据库
+    assert engine.connect.call_count == 1
+    data_fetcher._table_columns_cache.clear()
+
+def test_prefetch_without_statements_only_reads_latest_report_date():
+    bundle_row = MagicMock()
+    bundle_row._asdict.return_value = {
+        'stock_basic': {'ts_code': '000001.SZ', 'name': '平安银行'},
+        'latest_close': 12.5,
+        'valuation_metrics': {'pe': 6.5, 'pb': 0.8, 'total_share': 194.06},
+        'latest_report_end_date': '20231231',
+        'dividends': None,
+    }
+    bundle_result = MagicMock()
+    bundle_result.fetchone.return_value = bundle_row
+    fetcher, engine, conn = _make_fetcher_with_connection([bundle_result])
+
+    assert fetcher.prefetch_valuation_data(years=8, include_statements=False) is True
+    # 不查询表结构，也不聚合报表明细
+    assert conn.execute.call_count == 1
+    bundle_sql = str(conn.execute.call_args_list[0][0][0])
+    assert 'json_agg(t' not in bundle_sql
+    assert 'MAX(end_date) FROM balance_sheet' in bundle_sql
+    assert fetcher.get_latest_report_end_date(years=8) == '2023-12-31'
+    assert ('raw_financial_data', 8) not in fetcher._prefetched
+
+def test_prefetch_failure_falls_back_to_individual_queries():
+    fetcher, engine, conn = _make_fetcher_with_connection(RuntimeError("json_agg not supported"))
+    assert fetcher.prefetch_valuation_data(years=5) is False
+    assert fetcher._prefetched == {}
+
+def test_statement_queries_use_sargable_end_date_predicates():
+    data_fetcher._table_columns_cache.clear()
+    fetcher, engine, conn = _make_fetcher_with_connection(lambda *args, **kwargs: iter([]))
+    fetcher.get_raw_financial_data(years=3)
+    # 1 次 information_schema 查询 + 3 张报表
+    assert conn.execute.call_count == 4
+    current_year = pd.Timestamp.now().year
+    for call in conn.execute.call_args_list[1:]:
+        sql, params = str(call[0][0]), call[0][1]
+        assert 'SELECT *' not in sql
+        assert 'EXTRACT' not in sql
+        assert 'end_date IN' in sql
+        assert params['annual_end_dates'] == [f"{y}1231" for y in range(current_year - 3, current_year + 1)]
+    data_fetcher._table_columns_cache.clear()
+
+def test_bulk_statement_queries_for_store_build():
+    from decimal import Decimal
+    data_fetcher._table_columns_cache.clear()
+    schema_rows = [(t, c) for t in ('balance_sheet', 'income_statement', 'cash_flow') for c in ('ts_code', 'end_date', 'revenue')]
+    statement_row = MagicMock()
+    statement_row._asdict.return_value = {'ts_code': '000001.SZ', 'end_date': '20231231', 'revenue': Decimal('12.5')}
+    fetcher, engine, conn = _make_fetcher_with_connection(
+        [iter([('000001.SZ', '20231231'), ('600000.SH', None)]), iter(schema_rows),
+         iter([statement_row]), iter([statement_row]), iter([statement_row])])
+
+    assert fetcher.get_latest_report_end_dates(years=8, ts_codes=['000001.SZ', '600000.SH']) == {'000001.SZ': '2023-12-31'}
+    assert 'UNION ALL' in str(conn.execute.call_args_list[0][0][0])
+    raw = fetcher.get_raw_financial_data_for_codes(['000001.SZ'], years=8)
+    assert raw['income_statement']['revenue'].dtype == 'float64'
+    assert 'WHERE ts_code IN' in str(conn.execute.call_args_list[2][0][0])
+    data_fetcher._table_columns_cache.clear()
+
+def test_all_statement_fetch_paths_return_the_same_dtypes():
+    from decimal import Decimal
+    columns = ('ts_code', 'end_date', 'total_cur_assets', 'money_cap', 'comp_type')
+    schema_rows = [(t, c) for t in ('balance_sheet', 'income_statement', 'cash_flow') for c in columns]
+    # psycopg2 将 NUMERIC 返回为 Decimal；json_agg 返回 JSON 数字 (整数值解析为 int)
+    db_records = [{'ts_code': '000001.SZ', 'end_date': '20231231', 'total_cur_assets': Decimal('250000000000'),
+                   'money_cap': Decimal('12.5'), 'comp_type': '1'},
+                  {'ts_code': '000001.SZ', 'end_date': '20221231', 'total_cur_assets': Decimal('1.5E8'),
+                   'money_cap': None, 'comp_type': '1'}]
+    json_records = [{'ts_code': '000001.SZ', 'end_date': '2023-12-31', 'total_cur_assets': 250000000000,
+                     'money_cap': 12.5, 'comp_type': '1'},
+                    {'ts_code': '000001.SZ', 'end_date': '2022-12-31', 'total_cur_assets': 150000000,
+                     'money_cap': None, 'comp_type': '1'}]
+
+    def db_rows():
+        rows = []
+        for record in db_records:
+            row = MagicMock()
+            row._asdict.return_value = dict(record)
+            rows.append(row)
+        return iter(rows)
+
+    def fresh_fetcher(execute_side_effect):
+        data_fetcher._engine_registry.clear()
+        data_fetcher._table_columns_cache.clear()
+        return _make_fetcher_with_connection(execute_side_effect)[0]
+
+    fallback = fresh_fetcher([iter(schema_rows), db_rows(), db_rows(), db_rows()]).get_raw_financial_data(years=8)
+    bulk = fresh_fetcher([iter(schema_rows), db_rows(), db_rows(), db_rows()]).get_raw_financial_data_for_codes(['000001.SZ'], years=8)
+
+    bundle_row = MagicMock()
+    bundle_row._asdict.return_value = {'balance_sheet': json_records, 'income_statement': json_records, 'cash_flow': json_records}
+    bundle_result = MagicMock()
+    bundle_result.fetchone.return_value = bundle_row
+    fetcher = fresh_fetcher([iter(schema_rows), bundle_result])
+    assert fetcher.prefetch_valuation_data(years=8) is True
+    prefetched = fetcher.get_raw_financial_data(years=8)
+
+    for key in ('balance_sheet', 'income_statement', 'cash_flow'):
+        assert fallback[key]['total_cur_assets'].dtype == 'float64' and fallback[key]['money_cap'].dtype == 'float64'
+        pd.testing.assert_frame_equal(fallback[key], prefetched[key])
+        pd.testing.assert_frame_equal(bulk[key], prefetched[key])
+    data_fetcher._table_columns_cache.clear()
+
+def test_bulk_market_data_for_batch_valuation():
+    from decimal import Decimal
+    def rows(*records):
+        result = []
+        for record in records:
+            row = MagicMock()
+            row._asdict.return_value = record
+            result.append(row)
+        return iter(result)
+    fetcher, engine, conn = _make_fetcher_with_connection([
+        rows({'ts_code': '000001.SZ', 'name': '平安银行'}),
+        rows({'ts_code': '000001.SZ', 'close': Decimal('12.5')}),
+        rows({'ts_code': '000001.SZ', 'pe': Decimal('6.5'), 'pb': None, 'total_share': Decimal('194.06')}),
+        rows({'ts_code': '000001.SZ', 'end_date': '20231231', 'cash_div_tax': '0.285', 'ann_date': '20240315', 'div_proc': '实施'}),
+    ])
+
+    data = fetcher.get_market_data_for_codes(['000001.SZ', '600000.SH'], valuation_date='2024-06-28', ttm_valuation_date='2024-06-28')
+    assert conn.execute.call_count == 4
+    assert 'DISTINCT ON (ts_code)' in str(conn.execute.call_args_list[1][0][0])
+    assert conn.execute.call_args_list[3][0][1]['div_start_date'] == '20230628'
+    assert data['latest_price']['close'].tolist() == [12.5]
+    assert data['valuation_metrics']['pe'].dtype == 'float64' and pd.isna(data['valuation_metrics']['pb'].iloc[0])
+    assert data['dividends']['ann_date'].iloc[0] == pd.Timestamp('2024-03-15')
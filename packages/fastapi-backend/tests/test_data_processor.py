@@ -185,6 +185,29 @@ def test_clean_data_handles_nans_and_outliers(mock_raw_financial_data, mock_stoc
     # 5. 检查全为 NaN 的列是否被填充为 0
     assert (balance_df['adv_receipts'] == 0).all() # This assumes 'adv_receipts' is still a column after processing
 
+def test_clean_data_only_touches_and_reports_changed_columns():
+    """批量清洗：未变化的列保持原样 (含整数列 dtype)，只为发生变化的列生成警告"""
+    dates = pd.to_datetime(['2021-12-31', '2022-12-31', '2023-12-31', '2024-12-31', '2020-12-31'])
+    wide = {f'item_{i}': [100.0 + i, 101.0 + i, 102.0 + i, 103.0 + i, 99.0 + i] for i in range(200)}
+    income = pd.DataFrame({'ts_code': '000001.SZ', 'end_date': dates, 'revenue': [110.0, np.nan, 130.0, 140.0, 100.0],
+                           'share_count': [10, 11, 12, 13, 9], 'spike': [1.0, 2.0, 3.0, 500.0, 1.5],
+                           'empty': np.nan, **wide})
+    processor = object.__new__(DataProcessor)
+    processor.processed_data = {'income_statement': income}
+    processor.warnings = []
+    processor.clean_data()
+
+    cleaned = processor.processed_data['income_statement']
+    assert cleaned['end_date'].is_monotonic_increasing
+    assert cleaned['share_count'].dtype == np.int64
+    assert cleaned['revenue'].tolist() == [100.0, 110.0, 120.0, 130.0, 140.0]  # 关键项目内部缺口线性插值
+    assert cleaned['spike'].tolist() == [1.5, 1.0, 2.0, 3.0, 3.0]  # 异常值替换后前向填充
+    assert (cleaned['empty'] == 0).all()
+    assert cleaned[list(wide)].equals(income[list(wide)])
+    assert len(processor.warnings) == 2
+    assert "'spike'" in processor.warnings[0] and "2024-12-31" in processor.warnings[0] and "500.0" in processor.warnings[0]
+    assert "'empty'" in processor.warnings[1] and "已用 0 填充" in processor.warnings[1]
+
 # --- Tests for calculate_historical_ratios_and_turnovers ---
 
 # Removed tests for private method _get_avg_bs_item
@@ -315,6 +338,44 @@ def test_calculate_ratios_insufficient_data(mock_stock_basic_info):
     assert len(processor.get_warnings()) > 0 # Expect warnings due to limited data
 
 
+@pytest.mark.usefixtures("decimal_precision")  # 其他测试可能修改了全局 Decimal 精度
+def test_float_median_ratios_match_decimal_reference():
+    """float64 批量中位数与 Decimal 参考实现的结果和警告一致"""
+    rng = np.random.default_rng(7)
+    dates = pd.to_datetime([f"{y}-12-31" for y in range(2015, 2025)])
+    def series(name, values, index=dates):
+        return pd.Series(values, index=index, name=name)
+    revenue = series('total_revenue', rng.uniform(50, 500, len(dates)) * 1e8)
+    ratio_inputs = {
+        'plain': (series('oper_cost', revenue * rng.uniform(0.4, 0.8, len(dates))), revenue, None),
+        'odd_inner_join': (series('inventories', rng.uniform(1, 90, 7) * 1e8, dates[3:]), revenue, 360),
+        'nonpositive_and_nan': (series('accounts_pay', [np.nan, 5.0, 7.0, -3.0, 9.0, 11.0, np.nan, 4.0, 6.0, 8.0]),
+                                series('oper_cost', [10.0, 0.0, -2.0, 20.0, 30.0, np.nan, 15.0, 12.0, 18.0, 25.0]), 360),
+        'decimal_objects': (series('nwc', [Decimal(str(v)) for v in rng.uniform(-20, 80, len(dates))], dates).astype(object),
+                            series('total_revenue', [None] + [Decimal(str(v)) for v in rng.uniform(100, 200, len(dates) - 1)]), None),
+        'all_filtered': (series('accounts_receiv_bill', [-1.0] * len(dates)), revenue, 360),
+        'no_pairs': (series('capex_abs', [1.0] * 3, dates[:3]), series('total_revenue', [2.0] * 3, dates[5:8]), None),
+        'not_numeric': (series('oper_cost', ['x'] * len(dates)), revenue, None),
+    }
+
+    reference = object.__new__(DataProcessor)
+    reference.warnings = []
+    expected = {name: reference._calculate_median_ratio_or_days(s1, s2, days_in_year=days)
+                for name, (s1, s2, days) in ratio_inputs.items()}
+    processor = object.__new__(DataProcessor)
+    processor.warnings = []
+    results = processor._calculate_median_ratios(ratio_inputs)
+
+    assert list(results) == list(ratio_inputs)
+    for name, value in expected.items():
+        if value is None:
+            assert results[name] is None, name
+        else:
+            assert isinstance(results[name], Decimal)
+            assert float(results[name]) == pytest.approx(float(value), rel=1e-12), name
+    assert expected['plain'] is not None and expected['all_filtered'] is None and expected['no_pairs'] is None
+    assert processor.warnings == reference.warnings
+
 def test_get_basic_info(mock_raw_financial_data, mock_stock_basic_info):
     input_data = mock_raw_financial_data.copy()
     input_data['stock_basic'] = mock_stock_basic_info
@@ -424,3 +485,32 @@ def test_warning_generation(mock_raw_financial_data, mock_stock_basic_info):
     # Simply passing raw_data_no_basic simulates the missing key.
     processor3 = DataProcessor(raw_data_no_basic, latest_pe_pb_data)
     assert any("缺少 'stock_basic' 表" in w for w in processor3.get_warnings())
+
+def test_restore_from_cached_state_skips_statement_processing(mock_raw_financial_data, mock_stock_basic_info, monkeypatch):
+    """从缓存的报表处理结果恢复时不再清洗报表，PE/PB 和股息率按本次行情重新计算"""
+    input_data = mock_raw_financial_data.copy()
+    input_data['stock_basic'] = mock_stock_basic_info
+    dividends = pd.DataFrame({'cash_div_tax': [0.5, 0.3]})
+    original = DataProcessor(input_data, {'pe': 10.0, 'pb': 1.0}, ttm_dividends_df=dividends, latest_price=16.0)
+    cached_state = original.get_cacheable_state()
+
+    def fail(*args, **kwargs):
+        raise AssertionError("报表处理不应被再次执行")
+    monkeypatch.setattr(DataProcessor, 'clean_data', fail)
+    monkeypatch.setattr(DataProcessor, 'calculate_historical_ratios_and_turnovers', fail)
+
+    restored = DataProcessor({'stock_basic': mock_stock_basic_info}, {'pe': 12.0, 'pb': 1.5},
+                             ttm_dividends_df=dividends.copy(), latest_price=20.0, cached_state=cached_state)
+
+    for name, df in original.get_processed_data().items():
+        pd.testing.assert_frame_equal(restored.get_processed_data()[name], df)
+    assert restored.get_historical_ratios() == original.get_historical_ratios()
+    pd.testing.assert_series_equal(restored.get_latest_balance_sheet(), original.get_latest_balance_sheet())
+    assert restored.get_base_financial_statement_date() == original.get_base_financial_statement_date()
+    assert restored.statement_warnings == original.statement_warnings
+    assert restored.get_latest_metrics()['pe'] == 12.0
+    assert restored.get_latest_metrics()['dividend_yield'] == Decimal('0.8') / Decimal('20.0')
+
+    # 恢复出的数据是副本，修改不会影响缓存
+    restored.get_processed_data()['income_statement'].loc[:, 'revenue'] = 0
+    assert (cached_state['processed_data']['income_statement']['revenue'] != 0).all()
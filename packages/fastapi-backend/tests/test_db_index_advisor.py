@@ -0,0 +1,86 @@
+"""
+Unit tests for db_index_advisor (composite index verification and creation).
+"""
+from unittest.mock import MagicMock
+import db_index_advisor
+from db_index_advisor import (
+    REQUIRED_INDEXES, find_missing_indexes, ensure_indexes, report_missing_indexes, create_index_sql, index_name
+)
+
+ALL_TABLES = sorted({spec['table'] for spec in REQUIRED_INDEXES})
+
+def _make_engine(index_rows_sequence, tables=ALL_TABLES):
+    """每次检查索引时依次返回表列表和 pg_index 目录行。"""
+    engine = MagicMock()
+    conn = engine.connect.return_value.__enter__.return_value
+    side_effects = []
+    for index_rows in index_rows_sequence:
+        side_effects.append(iter([(t,) for t in tables]))
+        side_effects.append(iter(index_rows))
+    conn.execute.side_effect = side_effects
+    ddl_conn = engine.connect.return_value.execution_options.return_value.__enter__.return_value
+    return engine, ddl_conn
+
+# (表名, 索引名, indisvalid AND indisready AND 非部分索引, 键列 (pg_get_indexdef 逐列还原，不含 INCLUDE 列))
+FULL_INDEX_ROWS = [
+    ('balance_sheet', 'balance_sheet_pkey', True, ['ts_code', 'end_date']),
+    ('income_statement', 'idx_is', True, ['ts_code', 'end_date', 'ann_date']),
+    ('cash_flow', 'idx_cf', True, ['ts_code', 'end_date']),
+    ('financial_indicators', 'idx_fi', True, ['ts_code', 'end_date']),
+    # 升序索引可反向扫描，同样满足 trade_date DESC
+    ('valuation_metrics', 'idx_vm', True, ['ts_code', 'trade_date']),
+    ('daily_quotes', 'idx_dq', True, ['ts_code', 'trade_date DESC']),
+    ('dividend', 'idx_div', True, ['ts_code', 'ann_date']),
+]
+
+def test_all_indexes_present():
+    engine, _ = _make_engine([FULL_INDEX_ROWS])
+    assert find_missing_indexes(engine) == []
+
+def test_reports_wrong_column_order_and_missing_tables():
+    rows = [r for r in FULL_INDEX_ROWS if r[0] != 'dividend']
+    rows[0] = ('balance_sheet', 'bad', True, ['end_date', 'ts_code'])
+    engine, _ = _make_engine([rows], tables=[t for t in ALL_TABLES if t != 'daily_quotes'])
+    missing = find_missing_indexes(engine)
+    assert [spec['table'] for spec in missing] == ['balance_sheet', 'dividend']
+
+def test_report_and_create_missing_indexes(monkeypatch):
+    rows = [r for r in FULL_INDEX_ROWS if r[0] != 'valuation_metrics']
+    engine, _ = _make_engine([rows])
+    monkeypatch.setattr(db_index_advisor, 'get_shared_engine', lambda: engine)
+    assert report_missing_indexes() == [
+        'CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_valuation_metrics_ts_code_trade_date_desc '
+        'ON valuation_metrics (ts_code, trade_date DESC)'
+    ]
+
+    created_row = ('valuation_metrics', 'idx_valuation_metrics_ts_code_trade_date_desc', True, ['ts_code', 'trade_date DESC'])
+    engine, ddl_conn = _make_engine([rows, [created_row]])
+    assert ensure_indexes(engine) == ['idx_valuation_metrics_ts_code_trade_date_desc']
+    engine.connect.return_value.execution_options.assert_called_once_with(isolation_level="AUTOCOMMIT")
+    assert ddl_conn.execute.call_count == 1
+    assert str(ddl_conn.execute.call_args[0][0]) == create_index_sql(
+        {'table': 'valuation_metrics', 'columns': ['ts_code', 'trade_date DESC']})
+
+def test_invalid_and_partial_indexes_do_not_count():
+    rows = [r for r in FULL_INDEX_ROWS if r[0] not in ('cash_flow', 'dividend')]
+    rows.append(('cash_flow', 'idx_cash_flow_ts_code_end_date', False, ['ts_code', 'end_date']))
+    rows.append(('dividend', 'idx_div_partial', False, ['ts_code', 'ann_date']))
+    engine, _ = _make_engine([rows])
+    assert [spec['table'] for spec in find_missing_indexes(engine)] == ['cash_flow', 'dividend']
+
+def test_ensure_rebuilds_invalid_index_left_by_failed_build():
+    invalid_row = ('cash_flow', 'idx_cash_flow_ts_code_end_date', False, ['ts_code', 'end_date'])
+    rows = [r for r in FULL_INDEX_ROWS if r[0] != 'cash_flow'] + [invalid_row]
+    spec = {'table': 'cash_flow', 'columns': ['ts_code', 'end_date']}
+
+    engine, ddl_conn = _make_engine([rows, [invalid_row[:2] + (True,) + invalid_row[3:]]])
+    assert ensure_indexes(engine) == ['idx_cash_flow_ts_code_end_date']
+    assert [str(call[0][0]) for call in ddl_conn.execute.call_args_list] == [
+        'DROP INDEX CONCURRENTLY IF EXISTS idx_cash_flow_ts_code_end_date', create_index_sql(spec)]
+
+    # 重建后仍为 INVALID 时不报告为已创建
+    engine, _ = _make_engine([rows, [invalid_row]])
+    assert ensure_indexes(engine) == []
+
+def test_index_name():
+    assert index_name({'table': 'dividend', 'columns': ['ts_code', 'ann_date']}) == 'idx_dividend_ts_code_ann_date'
@@ -0,0 +1,93 @@
+"""
+Unit tests for DcfGridCalculator.
+向量化网格计算结果应与逐个调用 TerminalValueCalculator / PresentValueCalculator / EquityBridgeCalculator 的结果一致。
+"""
+import pytest
+import numpy as np
+import pandas as pd
+from dcf_grid_calculator import DcfGridCalculator
+from terminal_value_calculator import TerminalValueCalculator
+from present_value_calculator import PresentValueCalculator
+from equity_bridge_calculator import EquityBridgeCalculator
+
+@pytest.fixture
+def forecast_df():
+    """提供一个简单的 5 年预测结果。"""
+    return pd.DataFrame({
+        'year': [1, 2, 3, 4, 5],
+        'ufcf': [100.0, 110.0, 121.0, 133.1, 146.41],
+        'ebitda': [200.0, 215.0, 230.0, 250.0, 270.0],
+    })
+
+@pytest.fixture
+def latest_balance_sheet():
+    return pd.Series({
+        'lt_borr': 300.0, 'st_borr': 100.0, 'bond_payable': 50.0, 'non_cur_liab_due_1y': 20.0,
+        'money_cap': 150.0, 'minority_int': 30.0, 'oth_eqt_tools_p_shr': 10.0,
+    })
+
+@pytest.fixture
+def grid_calculator(forecast_df, latest_balance_sheet):
+    return DcfGridCalculator(forecast_df, latest_balance_sheet, total_shares=1000.0, risk_free_rate=0.03)
+
+def _scalar_valuation(forecast_df, latest_balance_sheet, wacc, method, exit_multiple=None, growth=None):
+    tv, tv_err = TerminalValueCalculator(risk_free_rate=0.03).calculate_terminal_value(
+        forecast_df.iloc[-1], wacc=wacc, method=method,
+        exit_multiple=exit_multiple, perpetual_growth_rate=growth
+    )
+    if tv_err:
+        return None
+    pv_ufcf, pv_tv, _, pv_err = PresentValueCalculator().calculate_present_values(forecast_df, tv, wacc)
+    assert pv_err is None
+    ev = pv_ufcf + pv_tv
+    _, equity, vps, _ = EquityBridgeCalculator().calculate_equity_value(ev, latest_balance_sheet, 1000.0)
+    return {'enterprise_value': ev, 'equity_value': equity, 'value_per_share': vps,
+            'pv_terminal_value': pv_tv, 'terminal_value': tv}
+
+def test_exit_multiple_grid_matches_scalar_path(grid_calculator, forecast_df, latest_balance_sheet):
+    waccs = np.array([0.07, 0.08, 0.09]).reshape(-1, 1)
+    multiples = np.array([6.0, 8.0, 10.0, 12.0]).reshape(1, -1)
+    results = grid_calculator.calculate(wacc=waccs, method='exit_multiple', exit_multiple=multiples)
+
+    assert results['enterprise_value'].shape == (3, 4)
+    for i, w in enumerate(waccs[:, 0]):
+        for j, m in enumerate(multiples[0, :]):
+            expected = _scalar_valuation(forecast_df, latest_balance_sheet, w, 'exit_multiple', exit_multiple=m)
+            for key, value in expected.items():
+                assert results[key][i, j] == pytest.approx(value, rel=1e-9)
+            assert results['tv_ev_ratio'][i, j] == pytest.approx(expected['pv_terminal_value'] / expected['enterprise_value'])
+
+def test_perpetual_growth_grid_matches_scalar_path_and_flags_invalid_cells(grid_calculator, forecast_df, latest_balance_sheet):
+    waccs = np.array([0.02, 0.08, 0.1]).reshape(-1, 1)
+    growths = np.array([0.01, 0.025, 0.05]).reshape(1, -1) # 0.05 会被无风险利率 0.03 限制
+    results = grid_calculator.calculate(wacc=waccs, method='perpetual_growth', perpetual_growth_rate=growths)
+
+    for i, w in enumerate(waccs[:, 0]):
+        for j, g in enumerate(growths[0, :]):
+            expected = _scalar_valuation(forecast_df, latest_balance_sheet, w, 'perpetual_growth', growth=g)
+            if expected is None:
+                assert np.isnan(results['enterprise_value'][i, j])
+            else:
+                assert results['value_per_share'][i, j] == pytest.approx(expected['value_per_share'], rel=1e-9)
+    # WACC 0.02 小于所有有效增长率 → 整行无效
+    assert np.isnan(results['enterprise_value'][0, 1:]).all()
+
+def test_non_positive_last_ufcf_gives_zero_terminal_value(latest_balance_sheet):
+    df = pd.DataFrame({'year': [1, 2], 'ufcf': [10.0, -5.0], 'ebitda': [20.0, 25.0]})
+    calc = DcfGridCalculator(df, latest_balance_sheet, total_shares=100.0, risk_free_rate=0.03)
+    tv = calc.calculate_terminal_values(wacc=np.array([0.08, 0.09]), method='perpetual_growth', perpetual_growth_rate=0.02)
+    assert tv.tolist() == [0.0, 0.0]
+
+def test_invalid_wacc_and_missing_shares(forecast_df, latest_balance_sheet):
+    calc = DcfGridCalculator(forecast_df, latest_balance_sheet, total_shares=None, risk_free_rate=0.03)
+    results = calc.calculate(wacc=np.array([0.0, 0.08, 1.2]), method='exit_multiple', exit_multiple=8.0)
+    assert np.isnan(results['enterprise_value'][[0, 2]]).all()
+    assert not np.isnan(results['enterprise_value'][1])
+    assert np.isnan(results['value_per_share']).all()
+
+def test_ratio_to_base_and_to_table():
+    values = np.array([[10.0, np.nan], [20.0, np.inf]])
+    ratios = DcfGridCalculator.ratio_to_base(values, 2)
+    assert DcfGridCalculator.to_table(ratios) == [[5.0, None], [10.0, None]]
+    assert np.isnan(DcfGridCalculator.ratio_to_base(values, 0)).all()
+    assert np.isnan(DcfGridCalculator.ratio_to_base(values, None)).all()
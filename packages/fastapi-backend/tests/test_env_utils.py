@@ -0,0 +1,46 @@
+"""
+Unit tests for the shared environment-variable and lazy-singleton helpers.
+"""
+import threading
+from env_utils import LazySingleton, env_flag, env_float, env_int
+
+
+def test_env_int_range_and_invalid_values(monkeypatch):
+    monkeypatch.delenv("TEST_ENV_INT", raising=False)
+    assert env_int("TEST_ENV_INT", 5) == 5
+    for raw, min_value, expected in [("8", 1, 8), ("0", 1, 5), ("0", 0, 0), ("-1", 0, 5), ("-1", None, -1), ("x", None, 5)]:
+        monkeypatch.setenv("TEST_ENV_INT", raw)
+        assert env_int("TEST_ENV_INT", 5, min_value=min_value) == expected
+
+
+def test_env_float_and_flag(monkeypatch):
+    monkeypatch.setenv("TEST_ENV_FLOAT", "0.5")
+    assert env_float("TEST_ENV_FLOAT", 1.0) == 0.5
+    monkeypatch.setenv("TEST_ENV_FLOAT", "abc")
+    assert env_float("TEST_ENV_FLOAT", 1.0) == 1.0
+
+    monkeypatch.delenv("TEST_ENV_FLAG", raising=False)
+    assert env_flag("TEST_ENV_FLAG", True) is True
+    for raw, expected in [("1", True), ("TRUE", True), ("yes", True), ("false", False), ("", False), ("0", False)]:
+        monkeypatch.setenv("TEST_ENV_FLAG", raw)
+        assert env_flag("TEST_ENV_FLAG", True) is expected
+
+
+def test_lazy_singleton_creates_once_and_recreates_on_key_change():
+    created = []
+    key = ['a']
+    singleton = LazySingleton(lambda: created.append(object()) or created[-1], key=lambda: key[0])
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(singleton.get())) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(created) == 1 and all(result is created[0] for result in results)
+
+    key[0] = 'b'
+    assert singleton.get() is created[1]
+    assert singleton.reset() is created[1]
+    assert singleton.reset() is None
+    assert singleton.get() is created[2]
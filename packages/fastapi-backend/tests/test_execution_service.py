@@ -0,0 +1,110 @@
+"""
+Unit tests for the valuation execution layer (thread pools and admission control).
+"""
+import asyncio
+import threading
+import pytest
+from services import execution_service
+
+
+def test_run_in_thread_runs_off_event_loop():
+    async def scenario():
+        loop_thread = threading.get_ident()
+        worker_thread = await execution_service.run_in_thread(threading.get_ident)
+        return loop_thread, worker_thread
+
+    loop_thread, worker_thread = asyncio.run(scenario())
+    assert loop_thread != worker_thread
+
+
+def test_admission_rejects_when_queue_full(monkeypatch):
+    monkeypatch.setenv("VALUATION_MAX_CONCURRENT", "1")
+    monkeypatch.setenv("VALUATION_MAX_QUEUE", "1")
+    monkeypatch.setenv("VALUATION_QUEUE_TIMEOUT", "5")
+
+    async def scenario():
+        release = asyncio.Event()
+        entered = asyncio.Event()
+
+        async def hold_slot():
+            async with execution_service.valuation_admission():
+                entered.set()
+                await release.wait()
+
+        async def queued():
+            async with execution_service.valuation_admission():
+                return "admitted"
+
+        holder = asyncio.create_task(hold_slot())
+        await entered.wait()
+        waiter = asyncio.create_task(queued())
+        await asyncio.sleep(0) # 让 waiter 进入等待队列
+
+        with pytest.raises(execution_service.ExecutionServiceBusyError):
+            async with execution_service.valuation_admission():
+                pass
+
+        release.set()
+        await holder
+        return await waiter
+
+    assert asyncio.run(scenario()) == "admitted"
+
+
+def test_admission_times_out(monkeypatch):
+    monkeypatch.setenv("VALUATION_MAX_CONCURRENT", "1")
+    monkeypatch.setenv("VALUATION_QUEUE_TIMEOUT", "0.05")
+
+    async def scenario():
+        async with execution_service.valuation_admission():
+            with pytest.raises(execution_service.ExecutionServiceBusyError):
+                async with execution_service.valuation_admission():
+                    pass
+
+    asyncio.run(scenario())
+
+
+def test_admission_timeout_racing_release_does_not_leak_permit(monkeypatch):
+    monkeypatch.setenv("VALUATION_MAX_CONCURRENT", "1")
+    monkeypatch.setenv("VALUATION_QUEUE_TIMEOUT", "0.01")
+
+    async def scenario():
+        outcomes = set()
+        for _ in range(20):
+            state = execution_service._get_admission_state()
+            await state.semaphore.acquire()
+            # 持有者在等待者超时的同一时刻释放许可
+            asyncio.get_running_loop().call_later(0.01, state.semaphore.release)
+            try:
+                async with execution_service.valuation_admission():
+                    outcomes.add("admitted")
+            except execution_service.ExecutionServiceBusyError:
+                outcomes.add("busy")
+            await asyncio.sleep(0.02)
+            assert not state.semaphore.locked()
+        return outcomes
+
+    assert asyncio.run(scenario())
+
+
+def test_cancelled_admission_waiter_does_not_leak_permit(monkeypatch):
+    monkeypatch.setenv("VALUATION_MAX_CONCURRENT", "1")
+    monkeypatch.setenv("VALUATION_QUEUE_TIMEOUT", "5")
+
+    async def scenario():
+        state = execution_service._get_admission_state()
+        await state.semaphore.acquire()
+
+        async def queued():
+            async with execution_service.valuation_admission():
+                pass
+
+        waiter = asyncio.create_task(queued())
+        await asyncio.sleep(0)
+        state.semaphore.release()
+        waiter.cancel() # 许可已转交给 waiter 但其尚未恢复运行
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert not state.semaphore.locked()
+
+    asyncio.run(scenario())
@@ -275,3 +275,126 @@ def test_get_full_forecast_structure(forecaster_historical_mode):
 # - 测试边界情况 (例如 forecast_years = 1, transition_years = 0 or >= forecast_years)
 # - 测试当历史比率为 0 或负数时的处理 (FinancialForecaster should handle gracefully or DataProcessor should clean)
 # - 测试当 target_ratios is None or empty for target_mode (should default to historical)
+
+# --- float64 向量化内核与 Decimal 路径的一致性 ---
+
+FLOAT64_RTOL = 1e-9
+
+def _forecast_both_modes(last_actual_revenue, historical_ratios, assumptions):
+    # 调用方需使用 decimal_precision fixture (其他测试模块会在导入时修改全局 Decimal 精度)
+    decimal_df = FinancialForecaster(last_actual_revenue, historical_ratios, assumptions, precision_mode='decimal').get_full_forecast()
+    float_df = FinancialForecaster(last_actual_revenue, historical_ratios, assumptions, precision_mode='float64').get_full_forecast()
+    return decimal_df, float_df
+
+@pytest.mark.usefixtures("decimal_precision")
+@pytest.mark.parametrize("assumptions_fixture", [
+    "sample_forecast_assumptions_historical_mode", "sample_forecast_assumptions_target_mode"
+])
+def test_float64_kernel_matches_decimal_path(request, sample_historical_ratios, assumptions_fixture):
+    """float64 内核的结果应在容差内与 Decimal 路径一致，列顺序和类型相同。"""
+    assumptions = request.getfixturevalue(assumptions_fixture)
+    decimal_df, float_df = _forecast_both_modes(Decimal('1000'), sample_historical_ratios, assumptions)
+
+    assert list(float_df.columns) == list(decimal_df.columns)
+    assert float_df['year'].tolist() == decimal_df['year'].tolist()
+    for col in decimal_df.columns:
+        if col == 'year':
+            continue
+        assert float_df[col].dtype == np.float64
+        np.testing.assert_allclose(float_df[col].to_numpy(), decimal_df[col].to_numpy(dtype=float),
+                                   rtol=FLOAT64_RTOL, atol=1e-9, err_msg=col)
+
+@pytest.mark.usefixtures("decimal_precision")
+def test_float64_kernel_matches_decimal_path_on_edge_cases(sample_historical_ratios):
+    """负营业利润、过渡期为 0、过渡期长于预测期以及缺失历史值时保持一致。"""
+    ratios = dict(sample_historical_ratios)
+    ratios['operating_margin_median'] = -0.05 # EBIT 为负，所得税为 0
+    ratios.pop('last_actual_nwc')
+    ratios['historical_revenue_cagr'] = None
+    assumptions = {
+        "forecast_years": 7,
+        "revenue_cagr_decay_rate": 0.5,
+        "effective_tax_rate_target": 0.3,
+        "transition_years": 0,
+        "operating_margin_forecast_mode": "transition_to_target",
+        "target_operating_margin": 0.12,
+        "op_margin_transition_years": 10,
+        "accounts_receivable_days_forecast_mode": "transition_to_target",
+        "accounts_receivable_days_target": 20,
+        "nwc_days_transition_years": 2,
+    }
+    decimal_df, float_df = _forecast_both_modes(2500.5, ratios, assumptions)
+    for col in decimal_df.columns:
+        np.testing.assert_allclose(float_df[col].to_numpy(dtype=float), decimal_df[col].to_numpy(dtype=float),
+                                   rtol=FLOAT64_RTOL, atol=1e-9, err_msg=col)
+
+def test_precision_mode_from_environment(monkeypatch, sample_historical_ratios, sample_forecast_assumptions_historical_mode):
+    monkeypatch.setenv('FORECAST_PRECISION_MODE', 'float64')
+    forecaster = FinancialForecaster(Decimal('1000'), sample_historical_ratios, sample_forecast_assumptions_historical_mode)
+    assert forecaster.precision_mode == 'float64'
+    monkeypatch.setenv('FORECAST_PRECISION_MODE', 'bogus')
+    forecaster = FinancialForecaster(Decimal('1000'), sample_historical_ratios, sample_forecast_assumptions_historical_mode)
+    assert forecaster.precision_mode == 'decimal'
+
+def test_float64_kernel_falls_back_to_decimal_on_invalid_input(sample_historical_ratios, sample_forecast_assumptions_historical_mode):
+    ratios = dict(sample_historical_ratios)
+    ratios['da_to_revenue_ratio'] = float('nan')
+    forecaster = FinancialForecaster(Decimal('1000'), ratios, sample_forecast_assumptions_historical_mode, precision_mode='float64')
+    full_forecast_df = forecaster.get_full_forecast()
+    assert len(full_forecast_df) == 5
+    assert 'ufcf' in full_forecast_df.columns
+
+@pytest.mark.usefixtures("decimal_precision")
+def test_forecast_batch_matches_individual_forecasts(sample_historical_ratios, sample_forecast_assumptions_target_mode):
+    """批量预测的每个情景应与以相同假设单独运行 Decimal 路径的结果一致。"""
+    overrides = [
+        {},
+        {"revenue_cagr_decay_rate": 0.2},
+        {"target_operating_margin": 0.25, "op_margin_transition_years": 5},
+        {"capex_to_revenue_ratio_forecast_mode": "historical_median"},
+        {"target_capex_to_revenue_ratio": 0.12, "capex_ratio_transition_years": 2, "effective_tax_rate_target": 0.15},
+    ]
+    forecaster = FinancialForecaster(Decimal('1000'), sample_historical_ratios, sample_forecast_assumptions_target_mode)
+    batch = forecaster.forecast_batch(overrides)
+
+    assert batch['values'].shape == (len(overrides), 5, len(batch['line_items']))
+    assert batch['years'].tolist() == [1, 2, 3, 4, 5]
+    for i, override in enumerate(overrides):
+        assumptions = {**sample_forecast_assumptions_target_mode, **override}
+        decimal_df, _ = _forecast_both_modes(Decimal('1000'), sample_historical_ratios, assumptions)
+        scenario_df = FinancialForecaster.batch_scenario_frame(batch, i)
+        assert list(scenario_df.columns) == list(decimal_df.columns)
+        for col in batch['line_items']:
+            np.testing.assert_allclose(scenario_df[col].to_numpy(), decimal_df[col].to_numpy(dtype=float),
+                                       rtol=FLOAT64_RTOL, atol=1e-9, err_msg=f"scenario {i} {col}")
+
+def test_forecast_batch_rejects_inconsistent_years(forecaster_historical_mode):
+    with pytest.raises(ValueError):
+        forecaster_historical_mode.forecast_batch([{"forecast_years": 5}, {"forecast_years": 7}])
+    with pytest.raises(ValueError):
+        forecaster_historical_mode.forecast_batch([])
+
+def test_forecast_driver_paths_matches_forecast_batch(sample_historical_ratios, sample_forecast_assumptions_historical_mode):
+    """按驱动因素数组预测的每条路径应与对应的 forecast_batch 情景一致。"""
+    forecaster = FinancialForecaster(Decimal('1000'), sample_historical_ratios, sample_forecast_assumptions_historical_mode)
+    decays = np.array([0.0, 0.15, 0.4])
+    margins = np.array([0.10, 0.18, 0.25])
+    tax_rates = np.array([0.15, 0.25, 0.30])
+    paths = forecaster.forecast_driver_paths({
+        'revenue_cagr_decay_rate': decays,
+        'target_operating_margin': margins,
+        'effective_tax_rate_target': tax_rates,
+    }, line_items=['revenue', 'ebitda', 'ufcf'])
+    batch = forecaster.forecast_batch([
+        {'revenue_cagr_decay_rate': d, 'target_operating_margin': m, 'operating_margin_forecast_mode': 'transition_to_target',
+         'effective_tax_rate_target': t}
+        for d, m, t in zip(decays, margins, tax_rates)
+    ])
+
+    assert paths['values'].shape == (3, 5, 3)
+    for j, item in enumerate(paths['line_items']):
+        np.testing.assert_allclose(paths['values'][..., j], batch['values'][..., batch['line_items'].index(item)], rtol=1e-12)
+    # 不传驱动因素时只预测实例假设这一条路径
+    assert forecaster.forecast_driver_paths({})['values'].shape == (1, 5, len(batch['line_items']))
+    with pytest.raises(ValueError):
+        forecaster.forecast_driver_paths({'unknown_driver': [0.1]})
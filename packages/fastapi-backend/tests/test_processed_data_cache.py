@@ -0,0 +1,46 @@
+"""
+Unit tests for the per-stock processed statement data cache.
+"""
+import pandas as pd
+from unittest.mock import patch
+from services.processed_data_cache import ProcessedDataCache, estimate_size_bytes
+
+def _state(rows: int = 5):
+    return {'processed_data': {'income_statement': pd.DataFrame({'revenue': range(rows)})},
+            'historical_ratios': {'cogs_to_revenue_ratio': 0.6}, 'warnings': []}
+
+def test_hits_misses_and_lru_eviction():
+    cache = ProcessedDataCache(max_entries=2)
+    key_a = cache.make_key('000001.SZ', '2024-12-31', 8)
+    key_b = cache.make_key('600000.SH', '2024-12-31', 8)
+    key_c = cache.make_key('000002.SZ', '2024-12-31', 8)
+    assert cache.get(key_a) is None
+    cache.put(key_a, _state())
+    cache.put(key_b, _state())
+    assert cache.get(key_a) is not None  # a 变为最近使用
+    cache.put(key_c, _state())  # 淘汰最久未使用的 b
+
+    assert cache.get(key_b) is None
+    assert cache.contains_stock('000001.SZ', 8) and not cache.contains_stock('000001.SZ', 5)
+    stats = cache.stats()
+    assert (stats['entries'], stats['hits'], stats['misses'], stats['evictions']) == (2, 1, 2, 1)
+
+def test_new_report_date_or_unknown_date_misses():
+    cache = ProcessedDataCache()
+    cache.put(cache.make_key('000001.SZ', '2023-12-31', 8), _state())
+    assert cache.get(cache.make_key('000001.SZ', '2024-12-31', 8)) is None
+    assert cache.make_key('000001.SZ', None, 8) is None
+    assert cache.put(None, _state()) is False
+
+def test_memory_bound_and_ttl():
+    entry_size = estimate_size_bytes(_state(1000))
+    cache = ProcessedDataCache(max_entries=100, max_bytes=int(entry_size * 2.5), ttl_seconds=60)
+    for i in range(3):
+        cache.put(cache.make_key(f'00000{i}.SZ', '2024-12-31', 8), _state(1000))
+    assert cache.stats()['entries'] == 2
+    assert cache.stats()['bytes'] <= cache.max_bytes
+    assert cache.put(cache.make_key('big.SZ', '2024-12-31', 8), _state(100000)) is False
+
+    with patch('services.processed_data_cache.time.monotonic', return_value=10 ** 9):
+        assert cache.get(cache.make_key('000002.SZ', '2024-12-31', 8)) is None
+    assert cache.stats()['expirations'] == 1
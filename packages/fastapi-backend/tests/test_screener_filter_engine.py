@@ -0,0 +1,127 @@
+"""
+Unit tests for the compiled screener filter engine.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+from api.models import ApiStockScreenerRequestModel
+from services.screener_filter_engine import (
+    ScreenerColumns, RangePredicate, InPredicate, CompiledScreenerFilter,
+    ScreenerFilterError, compile_screener_filters, page_positions, encode_categorical_columns,
+    iter_matching_positions,
+)
+
+def _snapshot_df(rows=2000, seed=7):
+    rng = np.random.default_rng(seed)
+    pe = rng.uniform(-20, 80, rows)
+    pe[rng.random(rows) < 0.1] = np.nan
+    return pd.DataFrame({
+        'ts_code': [f"{i:06d}.SZ" for i in range(rows)],
+        'industry': rng.choice(['银行', '白酒', '电池', None], rows),
+        'pe_ttm': pe,
+        'pb': rng.uniform(0.3, 10, rows),
+        'market_cap_billion': rng.uniform(10, 5000, rows),
+        'list_year': rng.integers(1991, 2024, rows),
+        'dv_ttm': np.where(rng.random(rows) < 0.3, np.nan, rng.uniform(0, 8, rows)),
+    })
+
+def test_compiled_filter_matches_chained_boolean_indexing():
+    df = _snapshot_df()
+    request = ApiStockScreenerRequestModel(
+        pe_min=0, pe_max=30, market_cap_min=100, industry='银行',
+        filters=[{'column': 'dv_ttm', 'min': 3.0}, {'column': 'list_year', 'values': list(range(1995, 2015))}],
+    )
+    positions = compile_screener_filters(request).matching_positions(ScreenerColumns(df))
+
+    expected = df[df['pe_ttm'].notna() & (df['pe_ttm'] >= 0)]
+    expected = expected[expected['pe_ttm'] <= 30]
+    expected = expected[expected['market_cap_billion'] >= 100]
+    expected = expected[expected['industry'] == '银行']
+    expected = expected[expected['dv_ttm'].notna() & (expected['dv_ttm'] >= 3.0)]
+    expected = expected[expected['list_year'].isin(range(1995, 2015))]
+    assert len(expected) > 0
+    assert df.iloc[positions]['ts_code'].tolist() == expected['ts_code'].tolist()
+
+def test_no_predicates_selects_every_row_and_all_is_ignored():
+    df = _snapshot_df(rows=20)
+    compiled = compile_screener_filters(ApiStockScreenerRequestModel(industry='all'))
+    assert compiled.predicates == []
+    assert compiled.matching_positions(ScreenerColumns(df)).tolist() == list(range(20))
+
+def test_string_in_predicate_and_missing_optional_column():
+    df = _snapshot_df(rows=50)
+    columns = ScreenerColumns(df)
+    positions = CompiledScreenerFilter([InPredicate('industry', ['白酒', '电池'])]).matching_positions(columns)
+    assert positions.tolist() == np.flatnonzero(df['industry'].isin(['白酒', '电池']).to_numpy()).tolist()
+    # act_ent_type 列不存在时，与原实现一样忽略请求中的企业性质条件
+    request = ApiStockScreenerRequestModel(act_ent_type='地方国企')
+    assert len(compile_screener_filters(request).matching_positions(columns)) == 50
+
+def test_invalid_filters_raise():
+    columns = ScreenerColumns(_snapshot_df(rows=10))
+    with pytest.raises(ScreenerFilterError, match='未知'):
+        CompiledScreenerFilter([RangePredicate('no_such_column', 1.0)]).evaluate(columns)
+    with pytest.raises(ScreenerFilterError, match='不是数值列'):
+        CompiledScreenerFilter([RangePredicate('industry', 1.0)]).evaluate(columns)
+    with pytest.raises(ScreenerFilterError, match='数值'):
+        CompiledScreenerFilter([InPredicate('pb', ['abc'])]).evaluate(columns)
+
+def test_column_arrays_are_extracted_once_and_read_only():
+    columns = ScreenerColumns(_snapshot_df(rows=10))
+    assert columns.numeric['list_year'].dtype == np.float64
+    assert not columns.numeric['pb'].flags.writeable
+    assert 'industry' in columns.other and 'industry' not in columns.numeric
+
+@pytest.mark.parametrize('descending', [False, True])
+def test_sorted_pages_match_sort_values(descending):
+    df = _snapshot_df()
+    columns = ScreenerColumns(df)
+    request = ApiStockScreenerRequestModel(pb_max=5.0)
+    mask = compile_screener_filters(request).evaluate(columns)
+    order = columns.sort_order('pe_ttm', descending=descending)
+
+    expected = df[df['pb'] <= 5.0].sort_values('pe_ttm', ascending=not descending, na_position='last', kind='stable')
+    pages = [page_positions(mask, start, 50, order) for start in range(0, len(expected) + 50, 50)]
+    assert df.iloc[np.concatenate(pages)]['ts_code'].tolist() == expected['ts_code'].tolist()
+    assert len(pages[-1]) == 0
+
+def test_sort_order_uses_response_aliases_and_rejects_non_numeric():
+    columns = ScreenerColumns(_snapshot_df(rows=30))
+    assert columns.sort_order('total_market_cap') is columns.sort_order('market_cap_billion')
+    assert not columns.sort_order('pb', descending=True).flags.writeable
+    with pytest.raises(ScreenerFilterError, match='不是数值列'):
+        columns.sort_order('industry')
+    with pytest.raises(ScreenerFilterError, match='未知'):
+        columns.sort_order('no_such_column')
+
+def test_categorical_bitmap_index_and_facets():
+    raw = _snapshot_df()
+    df = encode_categorical_columns(raw)
+    assert isinstance(df['industry'].dtype, pd.CategoricalDtype) and raw['industry'].dtype == object
+    columns = ScreenerColumns(df)
+    assert 'industry' in columns.categorical and 'industry' not in columns.other
+
+    request = ApiStockScreenerRequestModel(pb_max=5.0, filters=[{'column': 'industry', 'values': ['白酒', '电池', '不存在']}])
+    compiled = compile_screener_filters(request)
+    mask = compiled.evaluate(columns)
+    expected = (raw['pb'] <= 5.0) & raw['industry'].isin(['白酒', '电池'])
+    assert mask.tolist() == expected.tolist()
+    # 与未编码 (object 列) 的结果一致
+    assert compiled.evaluate(ScreenerColumns(raw)).tolist() == mask.tolist()
+
+    facets = compiled.facets(columns, ['industry'], mask=mask)
+    # 行业分面只应用其他列上的条件
+    assert facets['industry'] == raw.loc[raw['pb'] <= 5.0, 'industry'].value_counts().to_dict()
+    assert list(facets['industry'].values()) == sorted(facets['industry'].values(), reverse=True)
+    with pytest.raises(ScreenerFilterError, match='不是分类列'):
+        compiled.facets(columns, ['pb'])
+
+def test_iter_matching_positions_covers_all_matches_in_chunks():
+    df = _snapshot_df()
+    columns = ScreenerColumns(df)
+    mask = compile_screener_filters(ApiStockScreenerRequestModel(pe_min=10)).evaluate(columns)
+    order = columns.sort_order('market_cap_billion', descending=True)
+    chunks = list(iter_matching_positions(mask, 128, order))
+    assert all(0 < len(chunk) <= 128 for chunk in chunks)
+    assert np.concatenate(chunks).tolist() == page_positions(mask, 0, len(df), order).tolist()
+    assert np.concatenate(list(iter_matching_positions(mask, 128))).tolist() == np.flatnonzero(mask).tolist()
@@ -0,0 +1,88 @@
+"""
+Unit tests for the per-consumer statement column manifests.
+"""
+import os
+import re
+import numpy as np
+import pandas as pd
+import pytest
+import statement_columns
+from data_processor import DataProcessor
+from wacc_calculator import WaccCalculator
+from services.valuation_service import ValuationService
+from api.batch_models import BatchValuationRequest
+from api.utils import build_historical_financial_summary
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 列清单中的消费方 -> 读取报表列的源文件
+CONSUMER_SOURCES = {
+    'DataProcessor': 'data_processor.py',
+    'NwcCalculator': 'nwc_calculator.py',
+    'WaccCalculator': 'wacc_calculator.py',
+    'EquityBridgeCalculator': 'equity_bridge_calculator.py',
+    'FinancialForecaster': 'financial_forecaster.py',
+    'build_historical_financial_summary': os.path.join('api', 'utils.py'),
+    'valuation_endpoint': os.path.join('api', 'main.py'),
+}
+
+pytestmark = pytest.mark.usefixtures("decimal_precision", "no_data_stores")
+
+def _with_unused_columns(statements):
+    """加入没有消费方读取的列 (其中含缺失值，会产生清洗警告)。"""
+    result = {}
+    for name, df in statements.items():
+        df = df.copy()
+        df['unused_amount'] = np.where(np.arange(len(df)) % 2 == 0, np.nan, 1.0e8)
+        df['unused_flag'] = 'Y'
+        result[name] = df
+    return result
+
+def _run_pipeline(statements):
+    processor = DataProcessor({'stock_basic': {'ts_code': '600000.SH'}, **{k: v.copy() for k, v in statements.items()}},
+                              latest_pe_pb={'pe': 12.0, 'pb': 1.5}, latest_price=25.0)
+    wacc_calculator = WaccCalculator(processor.processed_data, WaccCalculator.estimate_market_cap(processor.processed_data, 12.0))
+    assumptions = BatchValuationRequest(prediction_years=5, exit_multiple=8.0).assumptions_dict()
+    details, forecast_df, _ = ValuationService(processor, wacc_calculator).run_single_valuation(
+        {**assumptions, 'ts_code': '600000.SH'}, 50.0 * 1e8)
+    return processor, details, forecast_df, build_historical_financial_summary(processor)
+
+def test_manifest_columns_are_read_by_their_consumers():
+    for consumer, tables in statement_columns.CONSUMER_STATEMENT_COLUMNS.items():
+        with open(os.path.join(BACKEND_DIR, CONSUMER_SOURCES[consumer]), encoding='utf-8') as f:
+            source = f.read()
+        for table, columns in tables.items():
+            assert table in statement_columns.STATEMENT_TABLES
+            for column in columns:
+                assert re.search(rf"['\"]{column}['\"]", source), f"{consumer} 未读取列清单中的 {table}.{column}"
+
+def test_required_columns_are_union_of_consumer_manifests():
+    required = statement_columns.REQUIRED_STATEMENT_COLUMNS
+    for table in statement_columns.STATEMENT_TABLES:
+        expected = set(statement_columns.STATEMENT_KEY_COLUMNS)
+        for tables in statement_columns.CONSUMER_STATEMENT_COLUMNS.values():
+            expected.update(tables.get(table, []))
+        assert set(required[table]) == expected
+        assert len(required[table]) == len(expected)
+
+def test_project_statement_keeps_manifest_columns_in_input_order(make_statements):
+    df = _with_unused_columns(make_statements())['balance_sheet']
+    projected = statement_columns.project_statement(df, 'balance_sheet')
+    assert list(projected.columns) == [c for c in df.columns if not c.startswith('unused_')]
+    assert projected is not df
+    assert statement_columns.project_statement(None, 'balance_sheet') is None
+
+def test_unused_columns_do_not_change_valuation(make_statements):
+    statements = make_statements()
+    expected_processor, expected_details, expected_forecast, expected_summary = _run_pipeline(statements)
+    processor, details, forecast_df, summary = _run_pipeline(_with_unused_columns(statements))
+
+    for table in statement_columns.STATEMENT_TABLES:
+        assert not any(c.startswith('unused_') for c in processor.processed_data[table].columns)
+        pd.testing.assert_frame_equal(processor.processed_data[table], expected_processor.processed_data[table])
+    assert processor.warnings == expected_processor.warnings
+    assert processor.historical_ratios == expected_processor.historical_ratios
+    assert details.value_per_share == expected_details.value_per_share
+    assert details.wacc_used == expected_details.wacc_used
+    pd.testing.assert_frame_equal(forecast_df, expected_forecast)
+    assert summary == expected_summary
@@ -0,0 +1,51 @@
+"""
+Unit tests for the aligned statement panel.
+"""
+import numpy as np
+import pandas as pd
+from data_processor import DataProcessor
+from statement_panel import StatementPanel
+from api.utils import build_historical_financial_summary
+
+def _dates(*years):
+    return pd.to_datetime([f"{y}-12-31" for y in years])
+
+def _statements():
+    income = pd.DataFrame({'end_date': _dates(2021, 2022, 2023, 2024), 'total_revenue': [100, 120, 140, 160],
+                           'oper_cost': [60.0, 70.0, 80.0, 95.0], 'operate_profit': [20.0, 25.0, 30.0, 35.0]})
+    balance = pd.DataFrame({'end_date': _dates(2024, 2020, 2021, 2022, 2023), 'accounts_receiv_bill': [35.0, 18.0, 20.0, 25.0, 30.0],
+                            'inventories': [45, 30, 33, 38, 40], 'total_cur_assets': [200.0, 150.0, 160.0, 170.0, 185.0],
+                            'money_cap': [20.0, 10.0, 12.0, 15.0, 18.0], 'total_cur_liab': [90.0, 70.0, 75.0, 80.0, 85.0],
+                            'st_borr': [8.0, 5.0, 6.0, 7.0, 7.5], 'non_cur_liab_due_1y': [1.0, 1.0, 1.0, 1.0, 1.0]})
+    cash_flow = pd.DataFrame({'end_date': _dates(2021, 2022, 2023, 2023), 'depr_fa_coga_dpba': [5.0, 6.0, 7.0, 7.5],
+                              'amort_intang_assets': [1.0, 1.0, 1.0, 1.2], 'c_pay_acq_const_fiolta': [-8.0, -9.0, -10.0, -11.0]})
+    return {'balance_sheet': balance, 'income_statement': income, 'cash_flow': cash_flow}
+
+def test_select_matches_indexed_merges():
+    statements = _statements()
+    panel = StatementPanel(statements)
+    assert panel.data.index.is_monotonic_increasing and panel.data.index.name == 'end_date'
+
+    balance = statements['balance_sheet'].set_index('end_date').sort_index()
+    income = statements['income_statement'].set_index('end_date').sort_index()
+    cash_flow = statements['cash_flow'].drop_duplicates(subset=['end_date'], keep='last').set_index('end_date').sort_index()
+    pd.testing.assert_frame_equal(panel.table('balance_sheet'), balance, check_freq=False)  # 整数列恢复原 dtype
+    pd.testing.assert_frame_equal(panel.table('cash_flow'), cash_flow, check_freq=False)  # 同一报告期保留最后一条
+
+    expected_inner = pd.merge(balance[['inventories']], income[['oper_cost']], left_index=True, right_index=True, how='inner')
+    pd.testing.assert_frame_equal(panel.select({'balance_sheet': ['inventories'], 'income_statement': ['oper_cost']}), expected_inner, check_freq=False)
+
+    expected_left = income[[]].join(cash_flow['c_pay_acq_const_fiolta'], how='left')
+    left = panel.select({'cash_flow': ['c_pay_acq_const_fiolta']}, rows=['income_statement'])
+    pd.testing.assert_frame_equal(left, expected_left, check_freq=False)
+    assert np.isnan(left['c_pay_acq_const_fiolta'].iloc[-1])
+
+def test_restored_processor_rebuilds_panel_for_ebitda_and_summary():
+    processor = DataProcessor({'stock_basic': {'ts_code': 'x'}, **_statements()}, {'pe': 10.0, 'pb': 1.0})
+    assert 'nwc' in processor.get_statement_panel().columns('balance_sheet')
+    restored = DataProcessor({'stock_basic': {'ts_code': 'x'}}, {'pe': 10.0, 'pb': 1.0}, cached_state=processor.get_cacheable_state())
+    assert restored.statement_panel is None
+
+    assert restored.get_latest_actual_ebitda() == processor.get_latest_actual_ebitda()
+    assert build_historical_financial_summary(restored) == build_historical_financial_summary(processor)
+    assert 'nwc' in restored.get_statement_panel().columns('balance_sheet')
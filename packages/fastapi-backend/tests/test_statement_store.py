@@ -0,0 +1,112 @@
+"""
+Unit tests for the persistent columnar statement store.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+from data_processor import DataProcessor
+from services import statement_store
+from services.statement_store import StatementStore, build_statement_store
+
+pytestmark = pytest.mark.usefixtures("decimal_precision")
+
+class FakeFetcher:
+    def __init__(self, stocks):
+        self.stocks = stocks
+        self.fetched = []
+
+    def get_latest_report_end_dates(self, years=5, ts_codes=None):
+        codes = ts_codes if ts_codes is not None else list(self.stocks)
+        return {code: self.stocks[code]['balance_sheet']['end_date'].max().strftime('%Y-%m-%d') for code in codes if code in self.stocks}
+
+    def get_raw_financial_data_for_codes(self, ts_codes, years=5):
+        self.fetched.extend(ts_codes)
+        return {name: pd.concat([self.stocks[code][name] for code in ts_codes], ignore_index=True)
+                for name in ('balance_sheet', 'income_statement', 'cash_flow')}
+
+def _direct(statements):
+    return DataProcessor({'stock_basic': {'ts_code': 'x'}, **{k: v.copy() for k, v in statements.items()}}, {'pe': 10.0, 'pb': 1.0})
+
+def test_build_and_load_matches_direct_processing(tmp_path, make_statements):
+    stocks = {code: make_statements(code, scale) for code, scale in [('000001.SZ', 1.0), ('600000.SH', 3.0), ('300750.SZ', 7.0)]}
+    fetcher = FakeFetcher(stocks)
+    summary = build_statement_store(years=8, store_dir=str(tmp_path), num_buckets=4, fetcher=fetcher)
+    assert summary['updated'] == sorted(stocks)
+
+    store = StatementStore(str(tmp_path))
+    for code, statements in stocks.items():
+        direct = _direct(statements)
+        state = store.load_state(code, 8, latest_report_end_date='2024-12-31')
+        restored = DataProcessor({'stock_basic': {'ts_code': 'x'}}, {'pe': 10.0, 'pb': 1.0}, cached_state=state)
+        for name, df in direct.get_processed_data().items():
+            expected = df if df.index.name else df.reset_index(drop=True)
+            pd.testing.assert_frame_equal(restored.get_processed_data()[name], expected, check_dtype=False, check_freq=False)
+        assert restored.get_historical_ratios() == direct.get_historical_ratios()
+        assert restored.get_latest_metrics()['latest_annual_diluted_eps'] == direct.get_latest_metrics()['latest_annual_diluted_eps']
+        assert restored.get_latest_balance_sheet()['money_cap'] == direct.get_latest_balance_sheet()['money_cap']
+        assert restored.get_base_financial_statement_date() == '2024-12-31'
+        assert restored.get_warnings() == direct.get_warnings()
+
+    # 数据库报告期更新或回溯年数不同时不使用报表库
+    assert store.load_state('000001.SZ', 8, latest_report_end_date='2025-12-31') is None
+    assert store.load_state('000001.SZ', 5) is None
+    assert store.load_state('688981.SH', 8) is None
+
+def test_incremental_rebuild_only_touches_changed_stocks(tmp_path, make_statements):
+    codes = [f"{i:06d}.SZ" for i in range(12)]
+    stocks = {code: make_statements(code, 1.0 + i) for i, code in enumerate(codes)}
+    fetcher = FakeFetcher(stocks)
+    build_statement_store(years=8, store_dir=str(tmp_path), num_buckets=8, fetcher=fetcher)
+
+    fetcher.fetched = []
+    assert build_statement_store(years=8, store_dir=str(tmp_path), num_buckets=8, fetcher=fetcher)['updated'] == []
+    assert fetcher.fetched == []
+
+    changed = codes[3]
+    stocks[changed] = make_statements(changed, 50.0, last_year=2025)
+    del stocks[codes[5]]
+    fetcher.fetched = []
+    summary = build_statement_store(years=8, store_dir=str(tmp_path), num_buckets=8, fetcher=fetcher)
+    assert fetcher.fetched == [changed]
+    assert summary['removed'] == [codes[5]]
+    assert set(summary['rewritten_buckets']) == {statement_store.bucket_for(changed, 8), statement_store.bucket_for(codes[5], 8)}
+
+    store = StatementStore(str(tmp_path))
+    assert store.load_state(codes[5], 8) is None
+    assert store.load_state(changed, 8)['base_financial_statement_date'] == '2025-12-31'
+    for code in codes:
+        if code in (changed, codes[5]):
+            continue
+        state = store.load_state(code, 8)
+        pd.testing.assert_frame_equal(state['processed_data']['income_statement'],
+                                      _direct(stocks[code]).get_processed_data()['income_statement'].reset_index(drop=True),
+                                      check_dtype=False)
+    # 旧版本的分桶文件已删除
+    manifest = store.load_manifest()
+    current = {path for files in manifest['files'].values() for path in files.values()}
+    on_disk = {str(p.relative_to(tmp_path)) for p in tmp_path.rglob('*.arrow')}
+    assert on_disk == current
+
+def test_historical_ratio_table_is_computed_once_per_generation(tmp_path, make_statements):
+    stocks = {code: make_statements(code, scale) for code, scale in [('000001.SZ', 1.0), ('600000.SH', 3.0), ('300750.SZ', 7.0)]}
+    fetcher = FakeFetcher(stocks)
+    build_statement_store(years=8, store_dir=str(tmp_path), num_buckets=4, fetcher=fetcher)
+
+    store = StatementStore(str(tmp_path))
+    table = store.historical_ratio_table()
+    assert list(table.index) == sorted(stocks)
+    for code, statements in stocks.items():
+        for name, value in _direct(statements).get_historical_ratios().items():
+            if value is None:
+                assert np.isnan(table.at[code, name])
+            else:
+                assert table.at[code, name] == pytest.approx(float(value), rel=1e-9)
+    assert store.historical_ratio_table() is table
+
+    stocks['600000.SH'] = make_statements('600000.SH', 9.0, last_year=2025)
+    build_statement_store(years=8, store_dir=str(tmp_path), num_buckets=4, fetcher=fetcher)
+    rebuilt = store.historical_ratio_table()
+    assert rebuilt is not table
+    expected = _direct(stocks['600000.SH']).get_historical_ratios()['historical_revenue_cagr']
+    assert rebuilt.at['600000.SH', 'historical_revenue_cagr'] == pytest.approx(float(expected), rel=1e-9)
+    assert StatementStore(str(tmp_path / 'missing')).historical_ratio_table() is None
@@ -0,0 +1,140 @@
+"""
+Unit tests for the stock screener data service.
+"""
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from services import stock_screener_service
+from services.batch_valuation_service import RESULT_COLUMNS, results_to_frame, write_results, publish_latest_results
+
+@pytest.fixture
+def valuation_dir(tmp_path, monkeypatch, no_data_stores):
+    monkeypatch.setenv("BATCH_VALUATION_OUTPUT_DIR", str(tmp_path))
+    stock_screener_service._dcf_valuation_cache.update(key=None, df=None)
+    yield tmp_path
+    stock_screener_service._dcf_valuation_cache.update(key=None, df=None)
+
+def _result_row(ts_code, status='ok', value_per_share=None):
+    row = {column: None for column in RESULT_COLUMNS}
+    row.update({'ts_code': ts_code, 'status': status, 'value_per_share': value_per_share, 'warning_count': 0,
+                'dcf_implied_diluted_pe': 15.0, 'tv_to_ev': 0.6, 'wacc': 0.08, 'base_report_date': '2024-12-31'})
+    return row
+
+def _write_run(valuation_dir, filename, rows, publish=True):
+    """写出一次批量估值结果；全市场任务 (publish=True) 同时登记到 latest.json。"""
+    path = os.path.join(valuation_dir, filename)
+    write_results(results_to_frame(rows), path)
+    if publish:
+        publish_latest_results(path, {'total': len(rows)})
+    return path
+
+def test_merge_dcf_valuations_uses_latest_batch_file(valuation_dir):
+    merged = pd.DataFrame({'ts_code': ['000001.SZ', '600000.SH', '300750.SZ'], 'close': [10.0, 0.0, 50.0]})
+    # 没有批量估值结果时 DCF 列为空
+    empty = stock_screener_service.merge_dcf_valuations(merged)
+    assert empty['dcf_upside'].isna().all() and stock_screener_service.get_dcf_valuation_update_time() is None
+
+    _write_run(valuation_dir, "valuation_20240101_000000.feather", [_result_row('000001.SZ', value_per_share=5.0)])
+    _write_run(valuation_dir, "valuation_20240102_000000.parquet", [
+        _result_row('000001.SZ', value_per_share=12.0),
+        _result_row('600000.SH', value_per_share=8.0),
+        _result_row('300750.SZ', status='error'),
+    ])
+
+    result = stock_screener_service.merge_dcf_valuations(merged).set_index('ts_code')
+    assert result.loc['000001.SZ', 'dcf_value_per_share'] == 12.0
+    assert result.loc['000001.SZ', 'dcf_upside'] == pytest.approx(0.2)
+    # 收盘价无效时不计算上涨空间；估值失败的股票不带 DCF 列
+    assert np.isnan(result.loc['600000.SH', 'dcf_upside'])
+    assert np.isnan(result.loc['300750.SZ', 'dcf_value_per_share'])
+    assert result.loc['000001.SZ', 'dcf_tv_to_ev'] == 0.6
+    assert result.loc['000001.SZ', 'dcf_base_report_date'] == '2024-12-31'
+    assert stock_screener_service.get_dcf_valuation_update_time() is not None
+
+def test_screener_snapshot_is_built_once_per_trade_date_and_swapped_on_refresh(valuation_dir, monkeypatch):
+    builds = []
+    def fake_merge(trade_date, force_update_basic=False, force_update_daily=False):
+        builds.append(trade_date)
+        return pd.DataFrame({'ts_code': ['000001.SZ'], 'close': [float(len(builds))]})
+    monkeypatch.setattr(stock_screener_service, 'get_merged_stock_data', fake_merge)
+    stock_screener_service.clear_screener_snapshot()
+
+    first = stock_screener_service.get_screener_snapshot('20240627')
+    assert stock_screener_service.get_screener_snapshot('20240627') is first
+    assert builds == ['20240627']
+
+    refreshed = stock_screener_service.refresh_screener_snapshot('20240627')
+    assert refreshed is not first and stock_screener_service.get_screener_snapshot('20240627') is refreshed
+    # 旧快照的数据不受替换影响
+    assert first.df['close'].iloc[0] == 1.0 and refreshed.df['close'].iloc[0] == 2.0
+
+    # 新交易日或新登记的全市场估值结果都会触发重建，未登记的部分估值结果不会
+    stock_screener_service.get_screener_snapshot('20240628')
+    _write_run(valuation_dir, "valuation_20240627_000000.parquet", [_result_row('000001.SZ', value_per_share=4.0)], publish=False)
+    assert stock_screener_service.get_screener_snapshot('20240628').dcf_update_time is None
+    _write_run(valuation_dir, "valuation_20240628_000000.parquet", [_result_row('000001.SZ', value_per_share=5.0)])
+    latest = stock_screener_service.get_screener_snapshot('20240628')
+    assert builds == ['20240627', '20240627', '20240628', '20240628']
+    assert latest.dcf_update_time is not None
+    stock_screener_service.clear_screener_snapshot()
+
+def test_partial_batch_run_does_not_replace_whole_market_results(valuation_dir):
+    merged = pd.DataFrame({'ts_code': ['000001.SZ', '600000.SH'], 'close': [10.0, 4.0]})
+    full_path = _write_run(valuation_dir, "valuation_20240102_000000.parquet", [
+        _result_row('000001.SZ', value_per_share=12.0), _result_row('600000.SH', value_per_share=8.0)])
+    # 之后只估值一只股票的任务写出更新的结果文件，但不登记到 latest.json
+    partial_path = _write_run(valuation_dir, "valuation_20240103_000000.parquet",
+                              [_result_row('000001.SZ', value_per_share=20.0)], publish=False)
+    os.utime(full_path, (1, 1))
+    assert os.path.getmtime(partial_path) > os.path.getmtime(full_path)
+
+    assert stock_screener_service.find_latest_dcf_valuation_file() == full_path
+    result = stock_screener_service.merge_dcf_valuations(merged).set_index('ts_code')
+    assert result['dcf_value_per_share'].tolist() == [12.0, 8.0]
+    assert result.loc['600000.SH', 'dcf_upside'] == pytest.approx(1.0)
+
+class FakeStatementStore:
+    def __init__(self, generation, ratio_table):
+        self.generation = generation
+        self.ratio_table = ratio_table
+
+    def load_manifest(self):
+        return {'generation': self.generation}
+
+    def historical_ratio_table(self):
+        return self.ratio_table
+
+def test_historical_ratios_from_statement_store_are_joined_into_snapshot(valuation_dir, monkeypatch):
+    ratio_table = pd.DataFrame({'historical_revenue_cagr': [0.12, np.nan], 'operating_margin_median': [0.2, 0.1],
+                                'last_historical_nwc': [1.0e8, 2.0e8]},
+                               index=pd.Index(['000001.SZ', '600000.SH'], name='ts_code'))
+    store = FakeStatementStore(1, ratio_table)
+    monkeypatch.setattr(stock_screener_service.statement_store, 'get_statement_store', lambda: store)
+    merged = pd.DataFrame({'ts_code': ['000001.SZ', '600000.SH', '300750.SZ'], 'close': [10.0, 4.0, 50.0]})
+
+    result = stock_screener_service.merge_historical_ratios(merged).set_index('ts_code')
+    assert result.loc['000001.SZ', 'hist_revenue_cagr'] == 0.12
+    assert result['hist_operating_margin'].tolist()[:2] == [0.2, 0.1]
+    assert np.isnan(result.loc['300750.SZ', 'hist_operating_margin']) and np.isnan(result.loc['600000.SH', 'hist_revenue_cagr'])
+    # 未构建的比率列为 NaN，绝对金额 (last_historical_nwc) 不进入筛选器
+    assert result['hist_inventory_days'].isna().all() and 'last_historical_nwc' not in result.columns
+
+    # 报表库重建 (generation 变化) 后快照重新构建
+    builds = []
+    def fake_merge(trade_date, force_update_basic=False, force_update_daily=False):
+        builds.append(trade_date)
+        return stock_screener_service.merge_historical_ratios(merged)
+    monkeypatch.setattr(stock_screener_service, 'get_merged_stock_data', fake_merge)
+    stock_screener_service.clear_screener_snapshot()
+    first = stock_screener_service.get_screener_snapshot('20240627')
+    assert stock_screener_service.get_screener_snapshot('20240627') is first
+    store.generation, store.ratio_table = 2, ratio_table.assign(historical_revenue_cagr=[0.3, 0.05])
+    rebuilt = stock_screener_service.get_screener_snapshot('20240627')
+    assert len(builds) == 2 and rebuilt.historical_ratio_key == 2
+    assert rebuilt.df.set_index('ts_code').loc['600000.SH', 'hist_revenue_cagr'] == 0.05
+
+    # 报表库不可用时历史比率列为空
+    monkeypatch.setattr(stock_screener_service.statement_store, 'get_statement_store', lambda: None)
+    assert stock_screener_service.merge_historical_ratios(merged)['hist_revenue_cagr'].isna().all()
+    stock_screener_service.clear_screener_snapshot()
@@ -0,0 +1,67 @@
+"""
+Unit tests for the cached trading calendar.
+"""
+import os
+from datetime import datetime
+import pandas as pd
+import pytest
+from services.trading_calendar_service import TradingCalendar, TradingCalendarError
+
+class FakePro:
+    def __init__(self, published=()):
+        self.published = set(published)
+        self.trade_cal_calls = 0
+        self.daily_basic_calls = []
+
+    def trade_cal(self, exchange, start_date, end_date, fields=None):
+        self.trade_cal_calls += 1
+        dates = pd.date_range('2024-06-01', end_date, freq='D')
+        return pd.DataFrame({'cal_date': dates.strftime('%Y%m%d'), 'is_open': (dates.dayofweek < 5).astype(int)})
+
+    def daily_basic(self, ts_code, trade_date, fields):
+        self.daily_basic_calls.append(trade_date)
+        return pd.DataFrame({'ts_code': [ts_code]} if trade_date in self.published else {'ts_code': []})
+
+def _calendar(tmp_path, pro, now):
+    return TradingCalendar(str(tmp_path), lambda: pro, now_func=lambda: now)
+
+def test_calendar_is_fetched_once_and_reused_from_file(tmp_path):
+    pro = FakePro()
+    # 周六：最近开市日为周五，按日历直接判断 (周五非当天，需要确认发布状态)
+    calendar = _calendar(tmp_path, pro, datetime(2024, 6, 29, 10))
+    pd.DataFrame().to_feather(os.path.join(tmp_path, "daily_basic_20240628.feather"))
+    assert calendar.latest_valid_trade_date() == '20240628'
+    assert pro.trade_cal_calls == 1 and pro.daily_basic_calls == []
+
+    other_process = _calendar(tmp_path, pro, datetime(2024, 6, 29, 11))
+    assert other_process.latest_valid_trade_date() == '20240628'
+    assert pro.trade_cal_calls == 1
+
+def test_today_before_publish_hour_uses_previous_open_date(tmp_path, monkeypatch):
+    monkeypatch.setenv("TRADE_DATE_PUBLISH_HOUR", "17")
+    pro = FakePro(published={'20240627', '20240628'})
+    calendar = _calendar(tmp_path, pro, datetime(2024, 6, 28, 9, 30))
+    assert calendar.latest_valid_trade_date() == '20240627'
+    assert pro.daily_basic_calls == []
+
+def test_remote_probe_is_rate_limited(tmp_path, monkeypatch):
+    monkeypatch.setenv("TRADE_DATE_PROBE_INTERVAL_SECONDS", "3600")
+    pro = FakePro(published=set())
+    calendar = _calendar(tmp_path, pro, datetime(2024, 6, 28, 18))
+    assert calendar.latest_valid_trade_date() == '20240627'
+    assert calendar.latest_valid_trade_date() == '20240627'
+    assert pro.daily_basic_calls == ['20240628']
+
+    # 数据发布后 (例如 /update-data 写入了缓存文件) 无需探测即可识别
+    pd.DataFrame().to_feather(os.path.join(tmp_path, "daily_basic_20240628.feather"))
+    assert calendar.latest_valid_trade_date() == '20240628'
+    assert pro.daily_basic_calls == ['20240628']
+
+def test_offline_falls_back_to_local_daily_cache(tmp_path):
+    def offline():
+        raise RuntimeError("network unreachable")
+    calendar = TradingCalendar(str(tmp_path), offline, now_func=lambda: datetime(2024, 6, 28, 18))
+    with pytest.raises(TradingCalendarError):
+        calendar.latest_valid_trade_date()
+    pd.DataFrame().to_feather(os.path.join(tmp_path, "daily_basic_20240626.feather"))
+    assert calendar.latest_valid_trade_date() == '20240626'
@@ -0,0 +1,182 @@
+"""
+Unit tests for ValuationService sensitivity analysis on operating driver axes and Monte Carlo simulation.
+经营驱动因素网格 (批量预测 + 向量化 DCF) 应与逐单元格调用 run_single_valuation 的结果一致。
+"""
+import logging
+import pytest
+import numpy as np
+import pandas as pd
+from unittest.mock import MagicMock
+from services.valuation_service import ValuationService
+from api.models import DcfForecastDetails
+from api.sensitivity_models import SensitivityAnalysisRequest, SensitivityAxisInput
+from api.monte_carlo_models import MonteCarloConfig
+from wacc_calculator import WaccCalculator
+
+pytestmark = pytest.mark.usefixtures("decimal_precision")
+
+@pytest.fixture
+def valuation_service():
+    container = MagicMock()
+    container.processed_data = {'income_statement': pd.DataFrame({'revenue': [900.0, 1000.0]})}
+    container.get_historical_ratios.return_value = {
+        'historical_revenue_cagr': 0.12, 'operating_margin_median': 0.15,
+        'sga_to_revenue_ratio': 0.10, 'rd_to_revenue_ratio': 0.05,
+        'da_to_revenue_ratio': 0.05, 'capex_to_revenue_ratio': 0.08, 'effective_tax_rate': 0.25,
+        'accounts_receivable_days': 75, 'inventory_days': 180, 'accounts_payable_days': 90,
+        'other_current_assets_to_revenue_ratio': 0.05, 'other_current_liabilities_to_revenue_ratio': 0.03,
+        'last_actual_nwc': 378.33,
+    }
+    container.get_latest_balance_sheet.return_value = pd.Series({
+        'lt_borr': 300.0, 'st_borr': 100.0, 'money_cap': 150.0, 'minority_int': 30.0,
+    })
+    wacc_calculator = MagicMock()
+    wacc_calculator.default_risk_free_rate = 0.03
+    return ValuationService(container, wacc_calculator, logger_override=logging.getLogger("test"))
+
+@pytest.fixture
+def base_request_dict():
+    return {
+        'ts_code': '000001.SZ', 'forecast_years': 5, 'cagr_decay_rate': 0.1,
+        'op_margin_forecast_mode': 'historical_median', 'target_operating_margin': None,
+        'capex_ratio_forecast_mode': 'historical_median', 'target_capex_to_revenue_ratio': None,
+        'target_effective_tax_rate': 0.25, 'risk_free_rate': 0.03,
+        'terminal_value_method': 'exit_multiple', 'exit_multiple': 8.0,
+    }
+
+def _run_sensitivity(service, base_request_dict, row_axis, col_axis, base_wacc=0.09):
+    base_details = DcfForecastDetails(wacc_used=base_wacc, exit_multiple_used=8.0, terminal_value_method_used='exit_multiple')
+    sa_request = SensitivityAnalysisRequest(row_axis=row_axis, column_axis=col_axis)
+    return service.run_sensitivity_analysis(
+        sa_request, base_details, base_request_dict, total_shares_actual=100.0,
+        base_latest_metrics={'latest_actual_ebitda': 200.0, 'latest_annual_diluted_eps': 0.5}
+    )
+
+def _expected_value_per_share(service, base_request_dict, overrides, wacc, exit_multiple=None):
+    request_dict = {**base_request_dict, **overrides}
+    details, _, _ = service.run_single_valuation(request_dict, 100.0, override_wacc=wacc, override_exit_multiple=exit_multiple)
+    return details.value_per_share
+
+def test_driver_by_driver_grid_matches_single_valuations(valuation_service, base_request_dict):
+    margins = [0.10, 0.15, 0.20]
+    decays = [0.0, 0.1, 0.3]
+    result, warnings = _run_sensitivity(
+        valuation_service, base_request_dict,
+        SensitivityAxisInput(parameter_name='target_operating_margin', values=margins),
+        SensitivityAxisInput(parameter_name='cagr_decay_rate', values=decays),
+    )
+    assert result is not None, warnings
+    table = result.result_tables['value_per_share']
+    for i, margin in enumerate(margins):
+        for j, decay in enumerate(decays):
+            expected = _expected_value_per_share(
+                valuation_service, base_request_dict,
+                {'op_margin_forecast_mode': 'transition_to_target', 'target_operating_margin': margin, 'cagr_decay_rate': decay},
+                wacc=0.09
+            )
+            assert table[i][j] == pytest.approx(expected, rel=1e-9)
+
+def test_driver_by_wacc_grid_matches_single_valuations(valuation_service, base_request_dict):
+    capex_ratios = [0.05, 0.08, 0.12]
+    waccs = [0.08, 0.10]
+    result, warnings = _run_sensitivity(
+        valuation_service, base_request_dict,
+        SensitivityAxisInput(parameter_name='target_capex_to_revenue_ratio', values=capex_ratios),
+        SensitivityAxisInput(parameter_name='wacc', values=waccs),
+    )
+    assert result is not None, warnings
+    table = np.array(result.result_tables['enterprise_value'], dtype=float)
+    assert table.shape == (3, 2)
+    for i, ratio in enumerate(capex_ratios):
+        for j, wacc in enumerate(waccs):
+            request_dict = {**base_request_dict, 'capex_ratio_forecast_mode': 'transition_to_target',
+                            'target_capex_to_revenue_ratio': ratio}
+            details, _, _ = valuation_service.run_single_valuation(request_dict, 100.0, override_wacc=wacc)
+            assert table[i, j] == pytest.approx(details.enterprise_value, rel=1e-9)
+    # 资本支出比率越高，企业价值越低
+    assert (np.diff(table[:, 0]) < 0).all()
+
+@pytest.fixture
+def mc_valuation_service(valuation_service):
+    """使用真实 WaccCalculator 的服务，按 WACC 输入 (包括目标税率) 重新计算 WACC。"""
+    valuation_service.processed_data_container.get_latest_metrics.return_value = {}
+    valuation_service.wacc_calculator = WaccCalculator(financials_dict={}, market_cap=None)
+    return valuation_service
+
+def test_tax_rate_axis_regenerates_around_request_value(mc_valuation_service, base_request_dict):
+    result, warnings = _run_sensitivity(
+        mc_valuation_service, base_request_dict,
+        SensitivityAxisInput(parameter_name='target_effective_tax_rate', values=[], step=0.05, points=3),
+        SensitivityAxisInput(parameter_name='exit_multiple', values=[6.0, 8.0]),
+    )
+    assert result is not None, warnings
+    assert result.row_values == [pytest.approx(0.20), pytest.approx(0.25), pytest.approx(0.30)]
+    expected = _expected_value_per_share(mc_valuation_service, base_request_dict, {'target_effective_tax_rate': 0.30}, wacc=None, exit_multiple=6.0)
+    assert result.result_tables['value_per_share'][2][0] == pytest.approx(expected, rel=1e-9)
+
+def test_tax_rate_axis_recomputes_wacc_like_full_valuation(mc_valuation_service, base_request_dict):
+    request_dict = {**base_request_dict, 'beta': 1.1, 'target_debt_ratio': 0.4, 'cost_of_debt': 0.05}
+    tax_rates = [0.15, 0.25, 0.40]
+    result, warnings = _run_sensitivity(
+        mc_valuation_service, request_dict,
+        SensitivityAxisInput(parameter_name='target_effective_tax_rate', values=tax_rates),
+        SensitivityAxisInput(parameter_name='exit_multiple', values=[6.0, 8.0]),
+    )
+    assert result is not None, warnings
+    for i, tax_rate in enumerate(tax_rates):
+        for j, exit_multiple in enumerate([6.0, 8.0]):
+            details, _, _ = mc_valuation_service.run_single_valuation(
+                {**request_dict, 'target_effective_tax_rate': tax_rate}, 100.0, override_exit_multiple=exit_multiple)
+            assert result.result_tables['value_per_share'][i][j] == pytest.approx(details.value_per_share, rel=1e-9)
+
+def _run_monte_carlo(service, base_request_dict, **config):
+    base_details = DcfForecastDetails(wacc_used=0.09, exit_multiple_used=8.0, terminal_value_method_used='exit_multiple', value_per_share=10.0)
+    return service.run_monte_carlo_simulation(
+        MonteCarloConfig(**config), base_details, base_request_dict, total_shares_actual=100.0, latest_price=10.0
+    )
+
+def test_monte_carlo_degenerate_distributions_match_single_valuation(mc_valuation_service, base_request_dict):
+    result, warnings = _run_monte_carlo(
+        mc_valuation_service, base_request_dict, num_simulations=300, chunk_size=100, seed=1,
+        distributions={
+            'beta': {'distribution': 'normal', 'mean': 1.2, 'std': 0.0},
+            'target_operating_margin': {'distribution': 'uniform', 'low': 0.18, 'high': 0.18},
+            'exit_multiple': {'distribution': 'triangular', 'low': 9.0, 'high': 9.0},
+        }
+    )
+    assert result is not None, warnings
+    request_dict = {**base_request_dict, 'beta': 1.2, 'op_margin_forecast_mode': 'transition_to_target', 'target_operating_margin': 0.18}
+    expected, _, _ = mc_valuation_service.run_single_valuation(request_dict, 100.0, override_exit_multiple=9.0)
+    summary = result.statistics['value_per_share']
+    assert result.num_valid_paths == 300
+    assert summary.mean == pytest.approx(expected.value_per_share, rel=1e-6)
+    assert summary.std == pytest.approx(0.0, abs=1e-9)
+    assert result.probability_of_upside == float(expected.value_per_share > 10.0)
+
+def test_monte_carlo_is_reproducible_and_chunk_invariant(mc_valuation_service, base_request_dict):
+    distributions = {
+        'wacc': {'distribution': 'normal', 'std': 0.01},
+        'exit_multiple': {'distribution': 'lognormal', 'std': 1.5},
+        'cagr_decay_rate': {'distribution': 'uniform', 'low': 0.0, 'high': 0.3},
+        'perpetual_growth_rate': {'distribution': 'normal', 'mean': 0.02, 'std': 0.005},
+    }
+    small_chunks, warnings = _run_monte_carlo(mc_valuation_service, base_request_dict, num_simulations=1000, chunk_size=100,
+                                              seed=7, distributions=distributions)
+    one_chunk, _ = _run_monte_carlo(mc_valuation_service, base_request_dict, num_simulations=1000, chunk_size=5000,
+                                    seed=7, distributions=distributions)
+    other_seed, _ = _run_monte_carlo(mc_valuation_service, base_request_dict, num_simulations=1000, seed=8,
+                                     distributions=distributions)
+
+    assert small_chunks.model_dump() == one_chunk.model_dump()
+    assert other_seed.statistics['value_per_share'].mean != small_chunks.statistics['value_per_share'].mean
+    assert small_chunks.sampled_parameters == ['cagr_decay_rate', 'exit_multiple', 'wacc']
+    assert any('perpetual_growth_rate' in w for w in warnings) # 与终值方法不一致的参数被忽略
+    vps = small_chunks.statistics['value_per_share']
+    assert sum(vps.histogram.counts) == small_chunks.num_valid_paths
+    assert vps.percentiles['p5'] <= vps.percentiles['p50'] <= vps.percentiles['p95']
+
+def test_monte_carlo_config_rejects_unknown_parameters():
+    with pytest.raises(ValueError):
+        MonteCarloConfig(distributions={'not_a_parameter': {'distribution': 'normal', 'std': 0.1}})
+    with pytest.raises(ValueError):
+        MonteCarloConfig(distributions={'beta': {'distribution': 'uniform', 'low': 1.5, 'high': 0.5}})
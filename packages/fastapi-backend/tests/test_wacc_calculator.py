@@ -3,6 +3,7 @@ Unit tests for WACC Calculator.
 """
 import pytest
 from decimal import Decimal, getcontext
+import numpy as np
 import pandas as pd
 from unittest.mock import patch
 import os
@@ -290,3 +291,27 @@ def test_calculate_wacc_market_zero_total_capital(sample_financials_dict, capsys
     assert "无法获取有效债务数据（有息或总负债），市场价值债务将视为零。" in captured_no_debt.out # 调整断言以匹配实际输出
     # Compare as float
     assert wacc_no_debt == pytest.approx(0.08)
+
+def test_get_wacc_and_ke_vectorized_matches_scalar_path(sample_financials_dict, default_wacc_params):
+    """向量化 WACC 应与逐个调用 get_wacc_and_ke 的结果一致，无效组合为 NaN。"""
+    calculator = WaccCalculator(financials_dict=sample_financials_dict, market_cap=Decimal('1000'))
+    betas = np.array([0.8, 1.1, 1.5, -2.0])
+    debt_ratios = np.array([0.2, 0.4, 1.5, 0.4]) # 1.5 无效，回退为默认目标债务比率
+    params = {k: float(v) for k, v in default_wacc_params.items()}
+    wacc, ke = calculator.get_wacc_and_ke_vectorized({**params, 'beta': betas, 'target_debt_ratio': debt_ratios})
+
+    for i in range(len(betas)):
+        expected_wacc, expected_ke = calculator.get_wacc_and_ke({**params, 'beta': betas[i], 'target_debt_ratio': debt_ratios[i]})
+        if expected_wacc is None:
+            assert np.isnan(wacc[i])
+        else:
+            assert wacc[i] == pytest.approx(expected_wacc, rel=1e-6)
+            assert ke[i] == pytest.approx(expected_ke, rel=1e-6)
+    assert np.isnan(wacc[3]) and np.isnan(ke[3]) # beta 为负导致 Ke 非正
+
+    market_wacc, _ = calculator.get_wacc_and_ke_vectorized({**params, 'beta': betas[:2]}, wacc_weight_mode="market")
+    expected_market_wacc, _ = calculator.get_wacc_and_ke({**params, 'beta': betas[1]}, wacc_weight_mode="market")
+    assert market_wacc[1] == pytest.approx(expected_market_wacc, rel=1e-6)
+
+    direct_wacc, _ = calculator.get_wacc_and_ke_vectorized({**params, 'beta': betas, 'discount_rate': 0.085})
+    assert direct_wacc.tolist() == [0.085] * 4
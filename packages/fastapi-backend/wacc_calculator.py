@@ -7,6 +7,27 @@ from decimal import Decimal, InvalidOperation
 class WaccCalculator:
     """负责计算加权平均资本成本 (WACC) 和股权成本 (Ke)"""
 
+    @staticmethod
+    def estimate_market_cap(financials_dict: Dict[str, pd.DataFrame], pe: Any) -> Optional[float]:
+        """
+        用 PE × 最近一期归母净利润估算市值 (单位：亿元)，作为构造 WaccCalculator 的 market_cap。
+        Args:
+            financials_dict (Dict[str, pd.DataFrame]): 处理后的财务数据，需要 'income_statement' 的 'n_income' 列。
+            pe (Any): 最新 PE。
+        Returns:
+            Optional[float]: 估算市值 (亿元)；PE 缺失或净利润缺失/非正时返回 None。
+        """
+        income_df = financials_dict.get('income_statement') if isinstance(financials_dict, dict) else None
+        if not pe or pd.isna(pe) or income_df is None or income_df.empty:
+            return None
+        if 'n_income' not in income_df.columns:
+            print("Warning: 'n_income' column not found in income_statement for market cap estimation.")
+            return None
+        last_income = income_df['n_income'].iloc[-1]
+        if pd.notna(last_income) and last_income > 0:
+            return float(pe) * float(last_income) / 100000000
+        return None
+
     def __init__(self, financials_dict: Dict[str, pd.DataFrame], market_cap: Optional[float]):
         """
         初始化 WaccCalculator。
@@ -174,6 +195,55 @@ class WaccCalculator:
             print(f"计算 WACC 和 Ke 时出错: {e}")
             return None, None
 
+    def get_wacc_and_ke_vectorized(self, params: Dict[str, Any] = {}, wacc_weight_mode: str = "target") -> Tuple[np.ndarray, np.ndarray]:
+        """
+        get_wacc_and_ke 的 float64 向量化版本，用于蒙特卡洛模拟等批量场景。
+        参数值可以是标量或可广播的 NumPy 数组，缺失时使用与 get_wacc_and_ke 相同的默认值；
+        无效的债务比率/税率逐元素回退为默认值，无效的 Ke 或 WACC 以 NaN 表示。
+        Args:
+            params (dict): 与 get_wacc_and_ke 相同的参数键，值可为数组。
+            wacc_weight_mode (str): 'target' 或 'market'。
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: (wacc, cost_of_equity) 数组，形状为各参数广播后的形状。
+        """
+        def param_array(key: str, default: Decimal) -> np.ndarray:
+            value = params.get(key)
+            return np.asarray(float(default) if value is None else value, dtype=np.float64)
+
+        cost_of_equity = (param_array('risk_free_rate', self.default_risk_free_rate)
+                          + param_array('beta', self.default_beta) * param_array('market_risk_premium', self.default_market_risk_premium)
+                          + param_array('size_premium', self.default_size_premium))
+        cost_of_equity = np.where(np.isfinite(cost_of_equity) & (cost_of_equity > 0), cost_of_equity, np.nan)
+
+        direct_wacc_raw = params.get('discount_rate')
+        if direct_wacc_raw is not None:
+            try:
+                direct_wacc = float(direct_wacc_raw)
+                if 0 < direct_wacc < 1:
+                    return np.full(cost_of_equity.shape, direct_wacc), cost_of_equity
+                print(f"警告: 前端提供的 WACC ({direct_wacc_raw}) 无效，将继续计算WACC。")
+            except (TypeError, ValueError):
+                print(f"警告: 前端提供的 WACC ({direct_wacc_raw}) 格式错误，将继续计算WACC。")
+
+        if wacc_weight_mode == "market":
+            debt_mv, equity_mv = self._get_market_value_debt_and_equity()
+            if debt_mv is None or equity_mv is None or debt_mv + equity_mv <= Decimal('0'):
+                print("警告: 无法获取市场价值权重，向量化 WACC 计算失败。")
+                return np.full(cost_of_equity.shape, np.nan), cost_of_equity
+            debt_ratio = np.asarray(float(debt_mv / (debt_mv + equity_mv)))
+        else:
+            debt_ratio = param_array('target_debt_ratio', self.default_target_debt_ratio)
+            debt_ratio = np.where((debt_ratio >= 0) & (debt_ratio <= 1), debt_ratio, float(self.default_target_debt_ratio))
+
+        tax_rate = param_array('tax_rate', self.default_tax_rate)
+        tax_rate = np.where((tax_rate >= 0) & (tax_rate <= 1), tax_rate, float(self.default_tax_rate))
+        cost_of_debt_after_tax = param_array('cost_of_debt', self.default_cost_of_debt_pretax) * (1.0 - tax_rate)
+
+        wacc = (1.0 - debt_ratio) * cost_of_equity + debt_ratio * cost_of_debt_after_tax
+        wacc = np.where(np.isfinite(wacc) & (wacc > 0) & (wacc < 1), wacc, np.nan)
+        return wacc, cost_of_equity
+
     def _get_market_value_debt_and_equity(self) -> Tuple[Optional[Decimal], Optional[Decimal]]:
         """
         获取债务和股权的市场价值（股权价值即为市值）。